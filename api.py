@@ -2,26 +2,62 @@
 API 接口层
 定义所有 RESTful API 端点
 """
-from fastapi import APIRouter, HTTPException, Query, status
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Optional, Union
+import asyncio
 import uuid
 
 from models import (
     FacilityCreate, FacilityUpdate, FacilityResponse, FacilityTreeResponse,
     MetricCreate, MetricUpdate, MetricResponse, MetricValueCreate, MetricValueResponse,
+    MetricValueCreatedResponse, MetricValueBatchCreate, MetricValueBatchResponse, MetricValueAcceptedResponse,
+    MetricLatestQuery, MetricAggregateResponse,
+    MetricColumnarExportQuery, FacilityImportRequest, FacilityImportResponse, DeletionJobResponse,
     FacilityType, TreeQueryParams
 )
-from service import FacilityService, MetricService
-from database import db
+from async_database import AsyncDatabase
+from ingest import IngestBuffer, IngestBufferFull, IngestBufferClosed
+from spool import IngestSpool, IngestSpoolUnavailable
+from service import (
+    FacilityService, MetricService, NotFoundError, EXPORT_FORMATS, COLUMNAR_EXPORT_MEDIA_TYPES,
+    encode_values_cursor, decode_values_cursor, parse_aggregate_functions
+)
 
 
 # 创建路由
 facilities_router = APIRouter(prefix="/api/facilities", tags=["设施管理"])
 metrics_router = APIRouter(prefix="/api/metrics", tags=["指标管理"])
+deletions_router = APIRouter(prefix="/api/deletions", tags=["删除任务"])
+
+
+# ==================== 依赖注入 ====================
+# 数据库与服务实例在 main.py 的 lifespan 中创建并挂载到 app.state
+
+async def get_async_db(request: Request) -> AsyncDatabase:
+    """获取异步数据库实例"""
+    return request.app.state.async_db
+
+
+async def get_facility_service(request: Request) -> FacilityService:
+    """获取设施服务实例"""
+    return request.app.state.facility_service
+
+
+async def get_metric_service(request: Request) -> MetricService:
+    """获取指标服务实例"""
+    return request.app.state.metric_service
+
+
+async def get_ingest_buffer(request: Request) -> Optional[IngestBuffer]:
+    """获取指标值写缓冲，未启用写缓冲模式（INGEST_MODE=sync）时为 None"""
+    return request.app.state.ingest_buffer
+
 
-# 创建服务实例
-facility_service = FacilityService(db)
-metric_service = MetricService(db)
+async def get_ingest_spool(request: Request) -> Optional[IngestSpool]:
+    """获取指标值落盘缓冲，未配置 INGEST_SPOOL_DIR 时为 None"""
+    return request.app.state.ingest_spool
 
 
 # ==================== 设施管理 API ====================
@@ -33,7 +69,11 @@ metric_service = MetricService(db)
     summary="创建设施",
     description="创建新的设施，支持数据中心、房间、传感器类型"
 )
-async def create_facility(facility_data: FacilityCreate):
+async def create_facility(
+    facility_data: FacilityCreate,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     创建新的设施
 
@@ -43,7 +83,7 @@ async def create_facility(facility_data: FacilityCreate):
     - **description**: 设施描述（可选）
     """
     try:
-        return facility_service.create_facility(facility_data)
+        return await async_db.run(facility_service.create_facility, facility_data)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -51,6 +91,72 @@ async def create_facility(facility_data: FacilityCreate):
         )
 
 
+@facilities_router.post(
+    "/import",
+    response_model=FacilityImportResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="批量导入设施层级",
+    description="在一个事务中批量创建嵌套的数据中心/房间/传感器层级及其指标"
+)
+async def import_facilities(
+    request: FacilityImportRequest,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    批量导入设施层级
+
+    - **parent_id**: 挂载点设施ID（可选），为空则导入为顶级设施
+    - **facilities**: 设施树列表，每个节点包含 name、facility_type、description、metrics 和 children
+
+    层级规则和名称重复在写入前整体校验，任一失败则不创建任何设施或指标
+    """
+    try:
+        return await async_db.run(facility_service.import_facilities, request)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"导入设施失败：{str(e)}"
+        )
+
+
+@facilities_router.post(
+    "/import/csv",
+    response_model=FacilityImportResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="从 CSV 批量导入设施层级",
+    description="请求体为 CSV 文本，每行以 path 列指定一个设施，可附带一个指标"
+)
+async def import_facilities_csv(
+    request: Request,
+    parent_id: Optional[uuid.UUID] = Query(None, description="挂载点设施ID，为空则导入为顶级设施"),
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    从 CSV 批量导入设施层级
+
+    - **path**: 设施路径（如 数据中心A/房间1/传感器X），缺失的上级设施自动创建，类型按层数推断
+    - **description**: 设施描述（可选）
+    - **metric** / **unit** / **data_type** / **metric_description** / **retention_days**: 该设施下的一个指标（可选）
+    - **parent_id**: 查询参数，挂载点设施ID（可选）
+    """
+    try:
+        text = (await request.body()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="导入设施失败：CSV 必须使用 UTF-8 编码"
+        )
+    try:
+        return await async_db.run(facility_service.import_facilities_csv, text, parent_id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"导入设施失败：{str(e)}"
+        )
+
+
 @facilities_router.get(
     "",
     response_model=List[FacilityResponse],
@@ -61,14 +167,16 @@ async def get_all_facilities(
     facility_type: Optional[FacilityType] = Query(
         None,
         description="过滤设施类型"
-    )
+    ),
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
 ):
     """
     获取所有设施列表
 
     - **facility_type**: 可选，按设施类型过滤
     """
-    return facility_service.get_all_facilities(facility_type)
+    return await async_db.run(facility_service.get_all_facilities, facility_type)
 
 
 @facilities_router.get(
@@ -81,7 +189,9 @@ async def get_facility_tree(
     root_id: Optional[uuid.UUID] = Query(None, description="根节点ID"),
     facility_type: Optional[FacilityType] = Query(None, description="过滤设施类型"),
     include_metrics: bool = Query(True, description="是否包含指标信息"),
-    max_depth: Optional[int] = Query(None, description="最大深度限制")
+    max_depth: Optional[int] = Query(None, description="最大深度限制"),
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
 ):
     """
     获取设施树形结构
@@ -97,7 +207,7 @@ async def get_facility_tree(
         include_metrics=include_metrics,
         max_depth=max_depth
     )
-    return facility_service.get_facility_tree(params)
+    return await async_db.run(facility_service.get_facility_tree, params)
 
 
 @facilities_router.get(
@@ -106,13 +216,17 @@ async def get_facility_tree(
     summary="获取单个设施",
     description="根据ID获取设施详情"
 )
-async def get_facility(facility_id: uuid.UUID):
+async def get_facility(
+    facility_id: uuid.UUID,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     获取单个设施详情
 
     - **facility_id**: 设施ID
     """
-    facility = facility_service.get_facility(facility_id)
+    facility = await async_db.run(facility_service.get_facility, facility_id)
     if not facility:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -127,21 +241,25 @@ async def get_facility(facility_id: uuid.UUID):
     summary="获取子设施",
     description="获取设施的直接子设施列表"
 )
-async def get_facility_children(facility_id: uuid.UUID):
+async def get_facility_children(
+    facility_id: uuid.UUID,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     获取设施的直接子设施
 
     - **facility_id**: 父设施ID
     """
     # 验证设施是否存在
-    facility = facility_service.get_facility(facility_id)
+    facility = await async_db.run(facility_service.get_facility, facility_id)
     if not facility:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"父设施不存在：ID 为 {facility_id} 的设施未找到"
         )
 
-    return facility_service.get_facility_children(facility_id)
+    return await async_db.run(facility_service.get_facility_children, facility_id)
 
 
 @facilities_router.patch(
@@ -152,7 +270,9 @@ async def get_facility_children(facility_id: uuid.UUID):
 )
 async def update_facility(
     facility_id: uuid.UUID,
-    facility_data: FacilityUpdate
+    facility_data: FacilityUpdate,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
 ):
     """
     更新设施信息
@@ -161,7 +281,7 @@ async def update_facility(
     - **name**: 新的设施名称（可选）
     - **description**: 新的设施描述（可选）
     """
-    facility = facility_service.update_facility(facility_id, facility_data)
+    facility = await async_db.run(facility_service.update_facility, facility_id, facility_data)
     if not facility:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -172,24 +292,31 @@ async def update_facility(
 
 @facilities_router.delete(
     "/{facility_id}",
-    status_code=status.HTTP_204_NO_CONTENT,
+    response_model=DeletionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="删除设施",
-    description="删除设施（级联删除子设施和关联指标）"
+    description="删除设施及其子设施和关联指标，历史数据由后台删除任务分批清理"
 )
-async def delete_facility(facility_id: uuid.UUID):
+async def delete_facility(
+    facility_id: uuid.UUID,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     删除设施
 
     - **facility_id**: 设施ID
 
-    注意：此操作将级联删除所有子设施和关联指标
+    注意：此操作将级联删除所有子设施和关联指标，删除后立即不可见；
+    指标的历史数据在后台分批清理，可通过 GET /api/deletions/{id} 查询进度
     """
-    success = facility_service.delete_facility(facility_id)
-    if not success:
+    job = await async_db.run(facility_service.delete_facility, facility_id)
+    if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"删除失败：设施不存在，ID 为 {facility_id}"
         )
+    return job
 
 
 # ==================== 指标管理 API ====================
@@ -201,7 +328,11 @@ async def delete_facility(facility_id: uuid.UUID):
     summary="创建指标",
     description="为设施创建新的指标"
 )
-async def create_metric(metric_data: MetricCreate):
+async def create_metric(
+    metric_data: MetricCreate,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     创建新的指标
 
@@ -212,7 +343,7 @@ async def create_metric(metric_data: MetricCreate):
     - **description**: 指标描述（可选）
     """
     try:
-        return metric_service.create_metric(metric_data)
+        return await async_db.run(metric_service.create_metric, metric_data)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -226,9 +357,12 @@ async def create_metric(metric_data: MetricCreate):
     summary="获取所有指标",
     description="获取所有指标列表"
 )
-async def get_all_metrics():
+async def get_all_metrics(
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """获取所有指标列表"""
-    return metric_service.get_all_metrics()
+    return await async_db.run(metric_service.get_all_metrics)
 
 
 @metrics_router.get(
@@ -237,14 +371,18 @@ async def get_all_metrics():
     summary="获取设施的指标",
     description="获取指定设施的所有指标"
 )
-async def get_facility_metrics(facility_id: uuid.UUID):
+async def get_facility_metrics(
+    facility_id: uuid.UUID,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     获取指定设施的所有指标
 
     - **facility_id**: 设施ID
     """
     try:
-        return metric_service.get_metrics_by_facility(facility_id)
+        return await async_db.run(metric_service.get_metrics_by_facility, facility_id)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -258,13 +396,17 @@ async def get_facility_metrics(facility_id: uuid.UUID):
     summary="获取单个指标",
     description="根据ID获取指标详情"
 )
-async def get_metric(metric_id: uuid.UUID):
+async def get_metric(
+    metric_id: uuid.UUID,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     获取单个指标详情
 
     - **metric_id**: 指标ID
     """
-    metric = metric_service.get_metric(metric_id)
+    metric = await async_db.run(metric_service.get_metric, metric_id)
     if not metric:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -281,7 +423,9 @@ async def get_metric(metric_id: uuid.UUID):
 )
 async def update_metric(
     metric_id: uuid.UUID,
-    metric_data: MetricUpdate
+    metric_data: MetricUpdate,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
 ):
     """
     更新指标信息
@@ -291,7 +435,7 @@ async def update_metric(
     - **unit**: 新的指标单位（可选）
     - **description**: 新的指标描述（可选）
     """
-    metric = metric_service.update_metric(metric_id, metric_data)
+    metric = await async_db.run(metric_service.update_metric, metric_id, metric_data)
     if not metric:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -302,62 +446,251 @@ async def update_metric(
 
 @metrics_router.delete(
     "/{metric_id}",
-    status_code=status.HTTP_204_NO_CONTENT,
+    response_model=DeletionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="删除指标",
-    description="删除指标及其历史数据"
+    description="删除指标，历史数据由后台删除任务分批清理"
 )
-async def delete_metric(metric_id: uuid.UUID):
+async def delete_metric(
+    metric_id: uuid.UUID,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     删除指标
 
     - **metric_id**: 指标ID
 
-    注意：此操作将删除该指标的所有历史数据
+    注意：此操作将删除该指标的所有历史数据，指标立即不可见，历史数据在后台分批清理
     """
-    success = metric_service.delete_metric(metric_id)
-    if not success:
+    job = await async_db.run(metric_service.delete_metric, metric_id)
+    if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"删除失败：指标不存在，ID 为 {metric_id}"
         )
+    return job
 
 
 # ==================== 指标值管理 API ====================
 
 @metrics_router.post(
     "/values",
-    response_model=MetricValueResponse,
+    response_model=Union[MetricValueCreatedResponse, MetricValueAcceptedResponse],
     status_code=status.HTTP_201_CREATED,
+    responses={
+        200: {"model": MetricValueCreatedResponse, "description": "重复提交：未写入新记录，返回首次写入的记录"},
+        202: {"model": MetricValueAcceptedResponse, "description": "写缓冲模式：已进入写入队列；或数据库不可用：已写入落盘缓冲"},
+        429: {"description": "写缓冲模式：写入队列已满，按 Retry-After 重试"},
+        503: {"description": "服务正在关闭，或数据库不可用且落盘缓冲已满，按 Retry-After 重试"}
+    },
     summary="记录指标值",
-    description="为指标记录新的数值"
+    description="为指标记录新的数值；启用写缓冲模式时进入队列后立即返回 202，由后台批量写入；"
+                "启用落盘缓冲时数据库不可用或写入超出延迟预算的读数写入本地缓冲后返回 202，由后台回放"
 )
-async def create_metric_value(value_data: MetricValueCreate):
+async def create_metric_value(
+    value_data: MetricValueCreate,
+    response: Response,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db),
+    ingest_buffer: Optional[IngestBuffer] = Depends(get_ingest_buffer),
+    ingest_spool: Optional[IngestSpool] = Depends(get_ingest_spool),
+    idempotency_key: Optional[str] = Header(
+        None,
+        min_length=1,
+        max_length=128,
+        description="幂等键，与请求体中的 idempotency_key 等效（两者都提供时以请求体为准）"
+    )
+):
     """
     记录指标值
 
     - **metric_id**: 指标ID（必填）
     - **value**: 指标值（必填）
     - **timestamp**: 时间戳（可选，默认当前时间）
+    - **idempotency_key**: 幂等键（可选，也可通过 Idempotency-Key 请求头提供）
+
+    以相同幂等键重试时不会重复写入，返回 200 及首次写入的记录（duplicate 为 true）。
+    写缓冲模式（INGEST_MODE=buffered）下不等待写入数据库，指标不存在或取值与类型不符的记录在写入时丢弃。
+    启用落盘缓冲（INGEST_SPOOL_DIR）时，读数的记录 ID 在写入前预先分配；数据库异常、写入超过
+    INGEST_SPOOL_LATENCY_BUDGET 秒或缓冲尚未回放完时写入本地缓冲并返回 202，回放时按记录 ID 跳过已写入的读数，
+    校验失败的记录同样丢弃
     """
+    if idempotency_key is not None and value_data.idempotency_key is None:
+        value_data = value_data.model_copy(update={"idempotency_key": idempotency_key})
+
+    if ingest_buffer is not None:
+        try:
+            accepted = ingest_buffer.submit(value_data)
+        except IngestBufferFull as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"记录指标值失败：{str(e)}",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except IngestBufferClosed as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"记录指标值失败：{str(e)}",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return MetricValueAcceptedResponse(
+            metric_id=accepted.metric_id,
+            value=accepted.value,
+            timestamp=accepted.timestamp,
+            queued=ingest_buffer.stats()["queued"]
+        )
+
+    result = None
+    value_id = None
     try:
-        return metric_service.create_metric_value(value_data)
+        if ingest_spool is None:
+            result = await async_db.run(metric_service.create_metric_value, value_data)
+        else:
+            value_data, value_id = ingest_spool.prepare(value_data)
+            if not ingest_spool.active:
+                # 超时后数据库线程中的写入仍会继续，成功时回放按记录 ID 跳过
+                result = await asyncio.wait_for(
+                    async_db.run(metric_service.create_metric_value, value_data, value_id),
+                    ingest_spool.latency_budget
+                )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"记录指标值失败：{str(e)}"
         )
+    except Exception as e:
+        if ingest_spool is None:
+            raise
+        ingest_spool.record_fallback(e)
+
+    if result is None:
+        try:
+            await ingest_spool.append([value_data], [value_id])
+        except IngestSpoolUnavailable as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"记录指标值失败：{str(e)}",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return MetricValueAcceptedResponse(
+            metric_id=value_data.metric_id,
+            value=value_data.value,
+            timestamp=value_data.timestamp,
+            queued=ingest_spool.stats()["pending_records"]
+        )
+    if result.duplicate:
+        response.status_code = status.HTTP_200_OK
+    return result
+
+
+@metrics_router.post(
+    "/values/batch",
+    response_model=MetricValueBatchResponse,
+    summary="批量记录指标值",
+    description="一次请求批量记录多条指标值，返回逐条处理结果"
+)
+async def create_metric_values(
+    batch: MetricValueBatchCreate,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    批量记录指标值
+
+    - **items**: 指标值列表（1-10000 条），每项格式与单条记录接口相同
+
+    不存在的指标对应的记录会被跳过并在结果中标记失败，其余记录在同一事务中写入；
+    幂等键已写入过的记录（包括同一批次内的重复）计为成功并标记 duplicate，不重复写入
+    """
+    return await async_db.run(metric_service.create_metric_values, batch)
+
+
+@metrics_router.post(
+    "/values/latest",
+    response_model=List[MetricValueResponse],
+    summary="批量获取指标最新值",
+    description="一次查询返回多个指标的最新数值记录"
+)
+async def get_latest_metric_values(
+    query: MetricLatestQuery,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    批量获取指标最新值
+
+    - **metric_ids**: 指标ID列表（1-50000 个）
+
+    按请求顺序返回，不存在或暂无数据的指标会被省略
+    """
+    return await async_db.run(metric_service.get_latest_metric_values, query)
+
+
+@metrics_router.post(
+    "/values/export",
+    response_class=StreamingResponse,
+    summary="列式导出多个指标的历史值",
+    description="将指标列表或设施子树下所有指标的历史值导出为 Arrow IPC 流或 Parquet 文件"
+)
+async def export_metric_values_columnar(
+    query: MetricColumnarExportQuery,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    列式导出多个指标的历史值
+
+    - **metric_ids**: 指标ID列表（1-10000 个），与 facility_id 二选一
+    - **facility_id**: 设施ID，导出该设施及其所有后代设施的全部指标
+    - **start** / **end**: 可选，导出时间范围 [start, end)
+    - **format**: 导出格式（arrow/parquet，默认 arrow）
+
+    列为 metric_id、timestamp、value、value_text，可直接用 pyarrow / pandas 读取；
+    需要服务端安装 pyarrow
+    """
+    try:
+        chunks = await async_db.run(metric_service.export_metric_values_columnar, query)
+    except ImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"导出指标历史值失败：{str(e)}"
+        )
+    except NotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"导出指标历史值失败：{str(e)}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"导出指标历史值失败：{str(e)}"
+        )
+
+    return StreamingResponse(
+        async_db.stream(chunks),
+        media_type=COLUMNAR_EXPORT_MEDIA_TYPES[query.format],
+        headers={"Content-Disposition": f'attachment; filename="metrics.{query.format.value}"'}
+    )
 
 
 @metrics_router.get(
     "/{metric_id}/values",
     response_model=List[MetricValueResponse],
     summary="获取指标历史值",
-    description="获取指标的历史数值记录"
+    description="获取指标的历史数值记录，支持偏移分页和游标分页"
 )
 async def get_metric_values(
     metric_id: uuid.UUID,
+    response: Response,
     limit: int = Query(100, ge=1, le=1000, description="返回记录数量限制"),
-    offset: int = Query(0, ge=0, description="偏移量")
+    offset: int = Query(0, ge=0, description="偏移量"),
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一页响应头 X-Next-Cursor"),
+    before: Optional[datetime] = Query(None, description="只返回早于该时间的记录"),
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
 ):
     """
     获取指标的历史数值记录
@@ -365,15 +698,128 @@ async def get_metric_values(
     - **metric_id**: 指标ID
     - **limit**: 返回记录数量限制（1-1000，默认100）
     - **offset**: 偏移量（默认0）
+    - **cursor**: 可选，分页游标；每页满 limit 条时响应头 X-Next-Cursor 返回下一页游标
+    - **before**: 可选，时间上界；使用 cursor 或 before 时忽略 offset
+
+    深度翻页请使用 cursor，其查询代价与页码无关
     """
+    before_id = None
+    if cursor:
+        try:
+            before, before_id = decode_values_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"获取指标历史值失败：{str(e)}"
+            )
+
     try:
-        return metric_service.get_metric_values(metric_id, limit, offset)
+        values = await async_db.run(
+            metric_service.get_metric_values,
+            metric_id, limit, offset,
+            before=before,
+            before_id=before_id
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"获取指标历史值失败：{str(e)}"
         )
 
+    if len(values) == limit:
+        response.headers["X-Next-Cursor"] = encode_values_cursor(values[-1])
+    return values
+
+
+@metrics_router.get(
+    "/{metric_id}/values/export",
+    response_class=StreamingResponse,
+    summary="导出指标历史值",
+    description="以 NDJSON 或 CSV 流式导出指标在时间范围内的全部历史值"
+)
+async def export_metric_values(
+    metric_id: uuid.UUID,
+    export_format: str = Query("ndjson", alias="format", description="导出格式：ndjson 或 csv"),
+    start: Optional[datetime] = Query(None, description="起始时间（含），默认不限"),
+    end: Optional[datetime] = Query(None, description="结束时间（不含），默认不限"),
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    流式导出指标历史值
+
+    - **metric_id**: 指标ID
+    - **format**: 导出格式（ndjson/csv，默认 ndjson），字段为 id、metric_id、timestamp、value
+    - **start** / **end**: 可选，导出时间范围 [start, end)
+
+    记录按时间升序输出，边从数据库读取边发送，导出量不受单页 1000 条的限制
+    """
+    try:
+        chunks = await async_db.run(
+            metric_service.export_metric_values,
+            metric_id, export_format, start, end
+        )
+    except NotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"导出指标历史值失败：{str(e)}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"导出指标历史值失败：{str(e)}"
+        )
+
+    return StreamingResponse(
+        async_db.stream(chunks),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="metric-{metric_id}.{export_format}"'}
+    )
+
+
+@metrics_router.get(
+    "/{metric_id}/values/aggregate",
+    response_model=MetricAggregateResponse,
+    response_model_exclude_none=True,
+    summary="聚合指标历史值",
+    description="在数据库中按时间桶聚合指标历史值，返回紧凑的时间序列"
+)
+async def aggregate_metric_values(
+    metric_id: uuid.UUID,
+    start: Optional[datetime] = Query(None, description="起始时间（含），默认为 end 前 24 小时"),
+    end: Optional[datetime] = Query(None, description="结束时间（不含），默认为当前时间"),
+    bucket: str = Query("5m", description="时间桶大小，如 30s、5m、1h、1d"),
+    fn: str = Query("avg,min,max,count", description="聚合函数，逗号分隔：avg,min,max,sum,count"),
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    按时间桶聚合指标历史值
+
+    - **metric_id**: 指标ID
+    - **start** / **end**: 可选，查询时间范围 [start, end)
+    - **bucket**: 时间桶大小（默认5m），单次查询最多 10000 个时间桶
+    - **fn**: 聚合函数列表（默认 avg,min,max,count）
+
+    仅返回有数据的时间桶；string 类型指标只有 count 有意义
+    """
+    try:
+        functions = parse_aggregate_functions(fn)
+        return await async_db.run(
+            metric_service.aggregate_metric_values,
+            metric_id, bucket, functions, start, end
+        )
+    except NotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"聚合指标历史值失败：{str(e)}"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"聚合指标历史值失败：{str(e)}"
+        )
+
 
 @metrics_router.get(
     "/{metric_id}/values/latest",
@@ -381,28 +827,73 @@ async def get_metric_values(
     summary="获取指标最新值",
     description="获取指标的最新数值记录"
 )
-async def get_latest_metric_value(metric_id: uuid.UUID):
+async def get_latest_metric_value(
+    metric_id: uuid.UUID,
+    metric_service: MetricService = Depends(get_metric_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
     """
     获取指标的最新数值记录
 
     - **metric_id**: 指标ID
     """
-    # 验证指标是否存在
-    metric = metric_service.get_metric(metric_id)
+    value = await async_db.run(metric_service.get_latest_metric_value, metric_id)
+    if value:
+        return value
+
+    # 仅在没有最新值时才区分指标不存在与暂无数据
+    metric = await async_db.run(metric_service.get_metric, metric_id)
     if not metric:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"指标不存在：ID 为 {metric_id} 的指标未找到"
         )
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"暂无数据：指标 {metric_id} 还没有记录任何数值"
+    )
+
+
+# ==================== 删除任务 API ====================
 
-    value = metric_service.get_latest_metric_value(metric_id)
-    if not value:
+@deletions_router.get(
+    "",
+    response_model=List[DeletionJobResponse],
+    summary="获取未完成的删除任务",
+    description="获取等待或正在后台清理历史数据的删除任务"
+)
+async def get_active_deletion_jobs(
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """获取尚未完成的删除任务（按创建时间排序）"""
+    return await async_db.run(facility_service.get_active_deletion_jobs)
+
+
+@deletions_router.get(
+    "/{job_id}",
+    response_model=DeletionJobResponse,
+    summary="获取删除任务进度",
+    description="查询删除设施或指标后后台清理历史数据的进度"
+)
+async def get_deletion_job(
+    job_id: uuid.UUID,
+    facility_service: FacilityService = Depends(get_facility_service),
+    async_db: AsyncDatabase = Depends(get_async_db)
+):
+    """
+    获取删除任务进度
+
+    - **job_id**: 删除设施或指标时返回的任务ID
+    """
+    job = await async_db.run(facility_service.get_deletion_job, job_id)
+    if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"暂无数据：指标 {metric_id} 还没有记录任何数值"
+            detail=f"删除任务不存在：ID 为 {job_id}"
         )
-    return value
+    return job
 
 
 # 导出所有路由
-__all__ = ["facilities_router", "metrics_router"]
+__all__ = ["facilities_router", "metrics_router", "deletions_router"]
@@ -0,0 +1,79 @@
+"""
+异步数据库层
+将同步的数据库调用移出事件循环，供 async 路由使用
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, TypeVar
+import asyncio
+import functools
+
+from storage import Storage
+
+
+T = TypeVar("T")
+
+
+class AsyncDatabase:
+    """
+    异步数据库访问类
+
+    在专用线程池中执行同步的数据库（及依赖数据库的服务层）调用，线程数为连接数加等待队列长度，
+    查询进行期间事件循环可以继续处理其他请求；并发数超过线程数时在线程池队列中等待，
+    等待超时由连接池抛出 PoolTimeoutError。存储后端的所有方法都可以直接以 await 方式调用：
+
+        facility = await async_db.get_facility(facility_id)
+        tree = await async_db.run(facility_service.get_facility_tree, params)
+        async for chunk in async_db.stream(metric_service.export_metric_values(metric_id)):
+            ...
+    """
+
+    def __init__(self, database: Storage, max_workers: Optional[int] = None):
+        self.db = database
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or database.max_concurrency,
+            thread_name_prefix="db"
+        )
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """在数据库线程池中执行同步调用并等待结果"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def stream(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """
+        在数据库线程池中逐项推进同步迭代器（如流式读取的游标），供 StreamingResponse 使用
+
+        迭代结束、出错或客户端断开时，等正在执行的读取完成后在线程池中关闭迭代器，
+        释放其占用的数据库连接；关闭动作不在已取消的任务中等待
+        """
+        sentinel = object()
+        future = None
+        try:
+            while True:
+                future = self._executor.submit(next, iterator, sentinel)
+                item = await asyncio.wrap_future(future)
+                if item is sentinel:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                if future is None:
+                    self._executor.submit(close)
+                else:
+                    future.add_done_callback(lambda _: self._executor.submit(close))
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args: Any, **kwargs: Any) -> Any:
+            return await self.run(attr, *args, **kwargs)
+
+        return method
+
+    def shutdown(self):
+        """关闭线程池，取消尚未开始的调用"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
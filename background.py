@@ -0,0 +1,51 @@
+"""
+后台任务层
+周期执行的后台任务共用的执行与停止逻辑
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Any
+import asyncio
+import threading
+
+
+class BackgroundManager(ABC):
+    """
+    周期执行的后台任务基类
+
+    - 子类实现 run_once（在线程池中执行），分批处理时在批次之间检查 stopping，停止后在当前批次结束时返回
+    - stop() 后等待间隔立即结束，run_forever 在当前一轮完成后返回，关闭时可直接 await 该任务
+    """
+
+    # 日志中的任务名
+    name = "Background"
+
+    def __init__(self):
+        self._stopping = threading.Event()
+
+    @property
+    def stopping(self) -> bool:
+        """是否已调用 stop()"""
+        return self._stopping.is_set()
+
+    @abstractmethod
+    def run_once(self) -> Dict[str, Any]:
+        """执行一轮任务，返回执行摘要"""
+
+    def _should_report(self, summary: Dict[str, Any]) -> bool:
+        """本轮摘要是否需要打印（默认有任一非空结果时打印）"""
+        return any(summary.values())
+
+    def stop(self):
+        """通知后台循环停止：正在执行的一轮在当前批次结束后返回，未完成的部分在下次启动时继续"""
+        self._stopping.set()
+
+    async def run_forever(self, interval_seconds: float):
+        """后台循环执行任务（在线程池中运行，不阻塞事件循环）"""
+        while not self._stopping.is_set():
+            try:
+                summary = await asyncio.to_thread(self.run_once)
+                if self._should_report(summary):
+                    print(f"{self.name} run finished: {summary}")
+            except Exception as e:
+                print(f"{self.name} run failed: {e}")
+            await asyncio.to_thread(self._stopping.wait, interval_seconds)
@@ -0,0 +1,70 @@
+"""
+冷数据压缩层
+将数值型指标超过一定天数的明细按时间窗口压缩为块，降低明细表的存储与索引开销
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+import os
+
+from background import BackgroundManager
+from storage import Storage, NUMERIC_DATA_TYPES, COMPACTION_WINDOW_SECONDS
+
+
+class CompactionManager(BackgroundManager):
+    """
+    冷数据压缩任务执行类
+
+    - 早于 after_days 天的已关闭窗口逐个压缩，每个 (指标, 窗口) 是一个独立事务，窗口之间可暂停
+    - 文本型指标不压缩；压缩后迟到的数据先写入明细表，下一轮与已有的块合并
+    - 查询、导出与聚合透明地合并明细与压缩块，汇总表与最新值表不受影响
+    """
+
+    name = "Compaction"
+
+    def __init__(
+        self,
+        db: Storage,
+        after_days: Optional[int] = None,
+        pause_seconds: Optional[float] = None
+    ):
+        super().__init__()
+        self.db = db
+        # 明细保留多少天后压缩，0 表示不压缩
+        if after_days is None:
+            after_days = int(os.getenv("VALUE_COMPACTION_AFTER_DAYS", "0"))
+        self.after_days = after_days
+        # 每个窗口之间的暂停时间（秒）
+        if pause_seconds is None:
+            pause_seconds = float(os.getenv("COMPACTION_PAUSE_SECONDS", "0.05"))
+        self.pause_seconds = pause_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """压缩所有数值型指标中早于 after_days 天的明细，返回执行摘要；stop() 后在当前窗口结束时返回"""
+        summary = {"blocks": 0, "values": 0}
+        if not self.enabled:
+            return summary
+        before = (now or datetime.utcnow()) - timedelta(days=self.after_days)
+        for metric in self.db.get_all_metrics():
+            if metric["data_type"] not in NUMERIC_DATA_TYPES:
+                continue
+            after = None
+            while not self.stopping:
+                result = self.db.compact_metric_values(metric["id"], before, after)
+                if result is None:
+                    break
+                summary["blocks"] += 1
+                summary["values"] += result["values"]
+                after = datetime.fromisoformat(result["block_start"]) + timedelta(seconds=COMPACTION_WINDOW_SECONDS)
+                if self.pause_seconds:
+                    # 暂停期间调用 stop() 时立即结束等待
+                    self._stopping.wait(self.pause_seconds)
+            if self.stopping:
+                break
+        return summary
+
+    def _should_report(self, summary: Dict[str, Any]) -> bool:
+        return bool(summary["blocks"])
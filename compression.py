@@ -0,0 +1,178 @@
+"""
+压缩编码层
+Gorilla 风格的时序数据块编码：时间戳按二阶差分（delta-of-delta）、数值按与前一个值异或（XOR）后变长编码，
+用于把已关闭时间窗口内的数值型明细压缩为一个数据块冷存储
+"""
+from typing import List, Sequence, Tuple
+import struct
+
+
+# 块格式版本号，写在每个块的第一个字节，解码时校验
+BLOCK_FORMAT_VERSION = 1
+
+# 块头：格式版本号、记录数
+_HEADER = struct.Struct(">BI")
+_DOUBLE = struct.Struct(">d")
+_UINT64 = struct.Struct(">Q")
+
+_MASK64 = (1 << 64) - 1
+
+# 二阶差分的分档 (前缀, 前缀位数, 取值位数)：取值加上偏移后按无符号数存储，
+# 例如 7 位可表示 [-63, 64]；超出所有分档时写前缀 1111 和 64 位补码
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+_DOD_OVERFLOW_PREFIX = (0b1111, 4)
+
+
+class _BitWriter:
+    """按位追加写入，累积满 64 位后成批转为字节，避免在一个大整数上反复移位"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, bits: int):
+        """写入 value 的低 bits 位（调用方保证 value 不超出 bits 位）"""
+        self._acc = (self._acc << bits) | value
+        self._bits += bits
+        if self._bits >= 64:
+            keep = self._bits % 8
+            self._buffer += (self._acc >> keep).to_bytes((self._bits - keep) // 8, "big")
+            self._acc &= (1 << keep) - 1
+            self._bits = keep
+
+    def getvalue(self) -> bytes:
+        """补齐到整字节后返回全部数据"""
+        pad = -self._bits % 8
+        tail = (self._acc << pad).to_bytes((self._bits + pad) // 8, "big")
+        return bytes(self._buffer) + tail
+
+
+class _BitReader:
+    """按位顺序读取，每次从数据中补充 8 个字节"""
+
+    def __init__(self, data: bytes, offset: int):
+        self._data = data
+        self._pos = offset
+        self._acc = 0
+        self._bits = 0
+
+    def read(self, bits: int) -> int:
+        """读取 bits 位并按无符号数返回"""
+        while self._bits < bits:
+            chunk = self._data[self._pos:self._pos + 8]
+            if not chunk:
+                raise ValueError("压缩块数据不完整")
+            self._acc = (self._acc << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+            self._pos += len(chunk)
+            self._bits += 8 * len(chunk)
+        self._bits -= bits
+        value = self._acc >> self._bits
+        self._acc &= (1 << self._bits) - 1
+        return value
+
+
+def _float_bits(value: float) -> int:
+    return _UINT64.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_float(bits: int) -> float:
+    return _DOUBLE.unpack(_UINT64.pack(bits))[0]
+
+
+def encode_block(points: Sequence[Tuple[int, float]]) -> bytes:
+    """
+    将 (时间戳秒数, 数值) 列表编码为一个压缩块
+
+    - 第一条记录原样写入 64 位时间戳和 64 位浮点数
+    - 之后每条记录的时间戳写入与上一间隔的差值（二阶差分）：等间隔采样时只占 1 位，轻微抖动占 9 位
+    - 数值与前一个值按位异或：值不变时只占 1 位；有效位落在上一个窗口内时只写有效位，否则另写前导零个数与有效位长度
+    记录应按时间升序排列（乱序也能正确编码，只是压缩率下降）
+    """
+    writer = _BitWriter()
+    previous_time = previous_delta = previous_bits = 0
+    previous_leading = previous_trailing = -1
+    for index, (timestamp, value) in enumerate(points):
+        bits = _float_bits(float(value))
+        if index == 0:
+            writer.write(timestamp & _MASK64, 64)
+            writer.write(bits, 64)
+            previous_time, previous_bits = timestamp, bits
+            continue
+
+        delta = timestamp - previous_time
+        dod = delta - previous_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                offset = (1 << (value_bits - 1)) - 1
+                if -offset <= dod <= offset + 1:
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod + offset, value_bits)
+                    break
+            else:
+                writer.write(*_DOD_OVERFLOW_PREFIX)
+                writer.write(dod & _MASK64, 64)
+        previous_time, previous_delta = timestamp, delta
+
+        xor = bits ^ previous_bits
+        previous_bits = bits
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        # 前导零个数用 5 位存储，最多记 31 个
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if previous_leading >= 0 and leading >= previous_leading and trailing >= previous_trailing:
+            writer.write(0b10, 2)
+            writer.write(xor >> previous_trailing, 64 - previous_leading - previous_trailing)
+            continue
+        meaningful = 64 - leading - trailing
+        writer.write(0b11, 2)
+        writer.write(leading, 5)
+        writer.write(meaningful - 1, 6)
+        writer.write(xor >> trailing, meaningful)
+        previous_leading, previous_trailing = leading, trailing
+
+    return _HEADER.pack(BLOCK_FORMAT_VERSION, len(points)) + writer.getvalue()
+
+
+def decode_block(data: bytes) -> List[Tuple[int, float]]:
+    """将压缩块解码为 (时间戳秒数, 数值) 列表，顺序与编码时一致"""
+    if len(data) < _HEADER.size:
+        raise ValueError("压缩块数据不完整")
+    version, count = _HEADER.unpack_from(data)
+    if version != BLOCK_FORMAT_VERSION:
+        raise ValueError(f"不支持的压缩块格式版本：{version}")
+
+    reader = _BitReader(data, _HEADER.size)
+    points: List[Tuple[int, float]] = []
+    timestamp = delta = bits = 0
+    leading = trailing = 0
+    for index in range(count):
+        if index == 0:
+            timestamp = reader.read(64)
+            if timestamp >> 63:
+                timestamp -= 1 << 64
+            bits = reader.read(64)
+            points.append((timestamp, _bits_float(bits)))
+            continue
+
+        if reader.read(1):
+            for _, _, value_bits in _DOD_BUCKETS:
+                if not reader.read(1):
+                    delta += reader.read(value_bits) - ((1 << (value_bits - 1)) - 1)
+                    break
+            else:
+                dod = reader.read(64)
+                delta += dod - (1 << 64) if dod >> 63 else dod
+        timestamp += delta
+
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                trailing = 64 - leading - (reader.read(6) + 1)
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        points.append((timestamp, _bits_float(bits)))
+    return points
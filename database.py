@@ -3,16 +3,119 @@
 使用 MySQL 作为数据库，支持设施和指标的 CRUD 操作
 """
 import mysql.connector
-from mysql.connector import pooling
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from contextlib import contextmanager
+import heapq
+import itertools
+import json
 import uuid
 import os
 
+from pool import ConnectionPool
+from storage import (
+    Storage, BATCH_CHUNK_SIZE, EXPORT_BATCH_SIZE, EPOCH, ROLLUP_LEVELS, PARTITION_PREMAKE_MONTHS,
+    DELETION_BATCH_SIZE, COMPACTION_WINDOW_SECONDS, new_deletion_job, index_dedup_keys, mark_duplicates,
+    parse_timestamp, floor_timestamp, plan_aggregate_segments, merge_bucket_row,
+    encode_metric_value, decode_metric_value, compute_facility_paths, build_hierarchy_rows,
+    rollup_buckets, latest_value_rows, uuid7,
+    encode_value_block, block_value_rows, select_block_page, aggregate_block_rows
+)
 
-class Database:
-    """数据库管理类"""
+
+# 数据库结构版本迁移：(版本号, 说明, 迁移方法名)，新的结构变更以新版本追加到末尾
+SCHEMA_MIGRATIONS = [
+    (1, "基础表结构", "_init_schema"),
+    (2, "UUID 主键与外键改为 BINARY(16)", "_migrate_binary_ids"),
+    (3, "指标明细与汇总改由后台删除任务清理", "_init_deletion_jobs"),
+    (4, "指标值去重键表", "_init_value_dedup_keys"),
+    (5, "指标值压缩块表", "_init_value_blocks"),
+]
+MIGRATION_LOCK_NAME = "facility_schema_migration"
+# 等待其他 worker 完成迁移的最长时间（秒）
+MIGRATION_LOCK_TIMEOUT = 60
+
+# 按月分区的兜底分区名
+FUTURE_PARTITION = "p_future"
+
+# 以 BINARY(16) 存储的 UUID 列 {表名: [(列名, 是否可空)]}
+BINARY_ID_COLUMNS = {
+    "facilities": [("id", False), ("parent_id", True)],
+    "metrics": [("id", False), ("facility_id", False)],
+    "metric_values": [("id", False), ("metric_id", False)],
+    **{table: [("metric_id", False)] for table, _ in ROLLUP_LEVELS},
+    "metric_latest": [("metric_id", False), ("value_id", False)],
+}
+
+# BINARY(16) 迁移期间的影子列后缀与回填进度表：影子列回填完成后与原列交换
+BINARY_ID_SHADOW_SUFFIX = "_bin"
+BINARY_ID_PROGRESS_TABLE = "binary_id_backfill"
+
+# 按指标存储的大表，删除指标时不再级联删除，由后台删除任务分批清理
+PURGED_METRIC_TABLES = ("metric_values",) + tuple(table for table, _ in ROLLUP_LEVELS)
+
+# 各表引用 metrics / facilities 的外键 (表名, 列名, 引用表)，BINARY(16) 迁移时先删除再重建
+ID_FOREIGN_KEYS = [
+    ("facilities", "parent_id", "facilities"),
+    ("metrics", "facility_id", "facilities"),
+    ("metric_values", "metric_id", "metrics"),
+    *[(table, "metric_id", "metrics") for table, _ in ROLLUP_LEVELS],
+    ("metric_latest", "metric_id", "metrics"),
+]
+
+
+def uuid_to_bin(value: Optional[str]) -> Optional[bytes]:
+    """将 UUID 字符串转换为 BINARY(16) 存储形式"""
+    return uuid.UUID(str(value)).bytes if value is not None else None
+
+
+def bin_to_uuid(value: Optional[bytes]) -> Optional[str]:
+    """将 BINARY(16) 存储形式还原为 UUID 字符串"""
+    return str(uuid.UUID(bytes=bytes(value))) if value is not None else None
+
+
+def _keyset_condition(keys: List[str], operator: str, values: Optional[List[Any]]) -> Tuple[str, List[Any]]:
+    """
+    生成按 (keys...) 字典序与 values 比较的条件：operator 为 ">"（之后）或 "<="（不超过）
+
+    展开为逐列比较的 OR 形式，使复合主键上的范围条件可以走主键索引；values 为 None 时不限制
+    """
+    if values is None:
+        return "TRUE", []
+    clauses = []
+    params: List[Any] = []
+    for position, key in enumerate(keys):
+        last = position == len(keys) - 1
+        comparison = operator if last else operator[0]
+        clauses.append(" AND ".join([f"{prefix} = %s" for prefix in keys[:position]] + [f"{key} {comparison} %s"]))
+        params.extend(values[:position + 1])
+    return "(" + " OR ".join(f"({clause})" for clause in clauses) + ")", params
+
+
+def month_start(value: datetime) -> datetime:
+    """返回 value 所在月份的第一天零点"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """返回 value（月初）之后第 months 个月的月初"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """按月分区的分区名，如 p202401"""
+    return f"p{month:%Y%m}"
+
+
+class Database(Storage):
+    """
+    数据库管理类（MySQL 存储后端）
+
+    所有 UUID 主键与外键以 BINARY(16) 存储，比 VARCHAR(36) 少一半以上的字节，二级索引随之缩小；
+    参数在进入 SQL 前由 uuid_to_bin 转换，查询结果由 _convert_datetime 还原为 UUID 字符串，
+    对外接口仍使用 UUID 字符串。物化路径 id_path 仍为文本
+    """
 
     def __init__(
         self,
@@ -20,7 +123,8 @@ class Database:
         port: int = 3306,
         user: str = None,
         password: str = None,
-        database: str = None
+        database: str = None,
+        partitioning: str = None
     ):
         # 从环境变量或使用默认值
         self.host = host or os.getenv("MYSQL_HOST", "localhost")
@@ -28,90 +132,988 @@ class Database:
         self.user = user or os.getenv("MYSQL_USER", "root")
         self.password = password or os.getenv("MYSQL_PASSWORD", "zsl123456")
         self.database = database or os.getenv("MYSQL_DATABASE", "facilities_db")
+        # 新建 metric_values 表时的分区方式：none 或 monthly（按月范围分区）
+        self.partitioning = partitioning or os.getenv("METRIC_VALUES_PARTITIONING", "none")
+        self.metric_values_partitioned = False
+
+        # 创建连接池，容量与等待策略可通过环境变量配置
+        self.pool = ConnectionPool(
+            self._connect,
+            min_size=int(os.getenv("MYSQL_POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("MYSQL_POOL_MAX_SIZE", "10")),
+            timeout=float(os.getenv("MYSQL_POOL_TIMEOUT", "5")),
+            max_waiters=int(os.getenv("MYSQL_POOL_MAX_WAITERS", "32")),
+            recycle=float(os.getenv("MYSQL_POOL_RECYCLE", "3600")),
+            validate_after=float(os.getenv("MYSQL_POOL_VALIDATE_AFTER", "30")),
+            idle_timeout=float(os.getenv("MYSQL_POOL_IDLE_TIMEOUT", "300"))
+        )
+        # 并发执行数据库调用的线程数：占满连接后多出的线程在连接池等待队列中排队
+        self.max_concurrency = self.pool.max_size + self.pool.max_waiters
+        # 流式导出时服务器等待客户端读取的超时时间（秒），客户端下载较慢时避免连接被服务器断开
+        self.export_write_timeout = int(os.getenv("MYSQL_EXPORT_WRITE_TIMEOUT", "600"))
+
+    def migrate(self) -> List[int]:
+        """
+        执行尚未应用的结构迁移，返回本次应用的版本号
 
-        # 创建连接池
-        self.connection_pool = pooling.MySQLConnectionPool(
-            pool_name="facility_pool",
-            pool_size=5,
+        已应用的版本记录在 schema_migrations 表中，已是最新版本时只需一次查询；
+        多个 worker 同时启动时通过 GET_LOCK 串行执行迁移
+        """
+        latest = SCHEMA_MIGRATIONS[-1][0]
+        applied = []
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            if self._get_schema_version(cursor) < latest:
+                cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+                if cursor.fetchone()[0] != 1:
+                    raise RuntimeError(
+                        f"等待结构迁移锁超过 {MIGRATION_LOCK_TIMEOUT} 秒，可能有其他实例正在执行迁移，请稍后重启"
+                    )
+                try:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version INT PRIMARY KEY,
+                            name VARCHAR(255) NOT NULL,
+                            applied_at DATETIME NOT NULL
+                        )
+                    """)
+                    # 持有锁后重新读取，其他 worker 可能已完成迁移
+                    current = self._get_schema_version(cursor)
+                    for version, name, method in SCHEMA_MIGRATIONS:
+                        if version <= current:
+                            continue
+                        getattr(self, method)(cursor)
+                        cursor.execute(
+                            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                            (version, name, datetime.utcnow())
+                        )
+                        conn.commit()
+                        applied.append(version)
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+                    cursor.fetchone()
+
+            self.metric_values_partitioned = bool(self._get_partitions(cursor, "metric_values"))
+        return applied
+
+    def _get_schema_version(self, cursor) -> int:
+        """获取已应用的最高结构版本，尚未建立版本表时返回 0"""
+        try:
+            cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        except mysql.connector.Error as err:
+            if err.errno == 1146:  # ER_NO_SUCH_TABLE
+                return 0
+            raise
+        row = cursor.fetchone()
+        return row[0] or 0
+
+    def _connect(self):
+        """建立一个新的数据库连接"""
+        return mysql.connector.connect(
             host=self.host,
             port=self.port,
             user=self.user,
             password=self.password,
-            database=self.database
+            database=self.database,
+            autocommit=False
         )
-        self._init_db()
 
     @contextmanager
     def get_conn(self):
-        """获取数据库连接的上下文管理器"""
-        conn = self.connection_pool.get_connection()
+        """获取数据库连接的上下文管理器（连接池满时排队等待，超时抛出 PoolTimeoutError）"""
+        conn = self.pool.acquire()
+        discard = False
         try:
             yield conn
             conn.commit()
         except Exception:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                # 连接已损坏，不再放回连接池
+                discard = True
             raise
         finally:
-            conn.close()
+            self.pool.release(conn, discard=discard)
 
-    def _init_db(self):
-        """初始化数据库表结构"""
-        with self.get_conn() as conn:
-            cursor = conn.cursor()
-            # 创建设施表
+    def _init_schema(self, cursor):
+        """版本 1：基础表结构（设施、指标、指标值、汇总表、最新值表及索引），兼容升级旧版本表"""
+        # 创建设施表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS facilities (
+                id VARCHAR(36) PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                facility_type VARCHAR(100) NOT NULL,
+                parent_id VARCHAR(36),
+                description TEXT,
+                path VARCHAR(1024),
+                id_path VARCHAR(512) CHARACTER SET ascii,
+                depth INT NOT NULL DEFAULT 0,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL,
+                FOREIGN KEY (parent_id) REFERENCES facilities(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 旧版本的 facilities 表没有物化路径列，补充后按层级回填
+        if "id_path" not in self._get_table_columns(cursor, "facilities"):
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS facilities (
-                    id VARCHAR(36) PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    facility_type VARCHAR(100) NOT NULL,
-                    parent_id VARCHAR(36),
-                    description TEXT,
-                    created_at DATETIME NOT NULL,
-                    updated_at DATETIME NOT NULL,
-                    FOREIGN KEY (parent_id) REFERENCES facilities(id) ON DELETE CASCADE
-                )
+                ALTER TABLE facilities
+                    ADD COLUMN path VARCHAR(1024) AFTER description,
+                    ADD COLUMN id_path VARCHAR(512) CHARACTER SET ascii AFTER path,
+                    ADD COLUMN depth INT NOT NULL DEFAULT 0 AFTER id_path
             """)
+            self._backfill_facility_paths(cursor)
 
-            # 创建指标表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS metrics (
-                    id VARCHAR(36) PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    unit VARCHAR(50),
-                    data_type VARCHAR(50) NOT NULL DEFAULT 'float',
-                    description TEXT,
-                    facility_id VARCHAR(36) NOT NULL,
-                    created_at DATETIME NOT NULL,
-                    updated_at DATETIME NOT NULL,
-                    FOREIGN KEY (facility_id) REFERENCES facilities(id) ON DELETE CASCADE
+        # 创建指标表
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                id VARCHAR(36) PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                unit VARCHAR(50),
+                data_type VARCHAR(50) NOT NULL DEFAULT 'float',
+                description TEXT,
+                facility_id VARCHAR(36) NOT NULL,
+                retention_days INT NULL,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL,
+                FOREIGN KEY (facility_id) REFERENCES facilities(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 创建指标值表（用于存储时序数据）
+        if self.partitioning == "monthly":
+            # 分区表不支持外键，且主键必须包含分区列；删除指标时由应用层清理明细
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS metric_values (
+                    id VARCHAR(36) NOT NULL,
+                    metric_id VARCHAR(36) NOT NULL,
+                    value_num DOUBLE NULL,
+                    value_text TEXT NULL,
+                    timestamp DATETIME NOT NULL,
+                    PRIMARY KEY (id, timestamp)
+                )
+                PARTITION BY RANGE COLUMNS(timestamp) (
+                    {self._monthly_partition_definitions(datetime.utcnow(), PARTITION_PREMAKE_MONTHS)}
                 )
             """)
-
-            # 创建指标值表（用于存储时序数据）
+        else:
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS metric_values (
                     id VARCHAR(36) PRIMARY KEY,
                     metric_id VARCHAR(36) NOT NULL,
-                    value TEXT NOT NULL,
+                    value_num DOUBLE NULL,
+                    value_text TEXT NULL,
                     timestamp DATETIME NOT NULL,
                     FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
                 )
             """)
+        self.metric_values_partitioned = bool(self._get_partitions(cursor, "metric_values"))
 
-            # 创建索引以提高查询性能
-            # MySQL 不支持 IF NOT EXISTS，需要先检查或忽略错误
-            for index_sql in [
-                "CREATE INDEX idx_facilities_parent_id ON facilities(parent_id)",
-                "CREATE INDEX idx_facilities_type ON facilities(facility_type)",
-                "CREATE INDEX idx_metrics_facility_id ON metrics(facility_id)",
-                "CREATE INDEX idx_metric_values_metric_id ON metric_values(metric_id)"
-            ]:
-                try:
-                    cursor.execute(index_sql)
-                except mysql.connector.Error as err:
-                    # 忽略索引已存在的错误
-                    if err.errno != 1061:  # ER_DUP_KEYNAME
-                        raise
+        # 创建指标值汇总表（按时间粒度预聚合，随写入增量维护）
+        for table, _ in ROLLUP_LEVELS:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    metric_id VARCHAR(36) NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    count BIGINT NOT NULL,
+                    count_num BIGINT NOT NULL,
+                    sum DOUBLE NULL,
+                    min DOUBLE NULL,
+                    max DOUBLE NULL,
+                    PRIMARY KEY (metric_id, bucket_start),
+                    FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+                )
+            """)
+
+        # 创建指标最新值表（写入时 upsert，最新值查询为主键查找）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metric_latest (
+                metric_id VARCHAR(36) PRIMARY KEY,
+                value_id VARCHAR(36) NOT NULL,
+                value_num DOUBLE NULL,
+                value_text TEXT NULL,
+                timestamp DATETIME NOT NULL,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 旧版本的 metric_values 使用 TEXT 类型的 value 列，补充类型化存储列
+        self._prepare_typed_value_columns(cursor)
+
+        # 旧版本的 metrics 表没有按指标配置的保留天数
+        if "retention_days" not in self._get_table_columns(cursor, "metrics"):
+            cursor.execute("ALTER TABLE metrics ADD COLUMN retention_days INT NULL AFTER facility_id")
+
+        # 创建索引以提高查询性能
+        # MySQL 不支持 IF NOT EXISTS，需要先检查或忽略错误
+        for index_sql in [
+            "CREATE INDEX idx_facilities_parent_id ON facilities(parent_id)",
+            "CREATE INDEX idx_facilities_type ON facilities(facility_type)",
+            # 物化路径前缀索引，子树查询为一次索引范围扫描
+            "CREATE INDEX idx_facilities_id_path ON facilities(id_path)",
+            "CREATE INDEX idx_metrics_facility_id ON metrics(facility_id)",
+            # 复合索引同时服务于按指标过滤、按时间排序以及游标分页
+            "CREATE INDEX idx_metric_values_metric_ts ON metric_values(metric_id, timestamp)"
+        ]:
+            try:
+                cursor.execute(index_sql)
+            except mysql.connector.Error as err:
+                # 忽略索引已存在的错误
+                if err.errno != 1061:  # ER_DUP_KEYNAME
+                    raise
+
+        # 旧版的单列索引已被复合索引覆盖，删除以减少写入开销
+        try:
+            cursor.execute("DROP INDEX idx_metric_values_metric_id ON metric_values")
+        except mysql.connector.Error as err:
+            if err.errno != 1091:  # ER_CANT_DROP_FIELD_OR_KEY
+                raise
+
+    def _get_table_columns(self, cursor, table: str) -> List[str]:
+        """获取表的列名列表"""
+        cursor.execute(
+            """
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            """,
+            (table,)
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def _backfill_facility_paths(self, cursor):
+        """根据 parent_id 在内存中计算所有设施的物化路径并批量写回"""
+        cursor.execute("SELECT id, name, parent_id FROM facilities")
+        facilities = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        paths = compute_facility_paths(facilities)
+        rows = [(*paths[facility_id], facility_id) for facility_id in facilities]
+        for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+            cursor.executemany(
+                "UPDATE facilities SET path = %s, id_path = %s, depth = %s WHERE id = %s",
+                rows[start:start + BATCH_CHUNK_SIZE]
+            )
+
+    def _prepare_typed_value_columns(self, cursor):
+        """
+        为旧版 metric_values 表添加 value_num / value_text 列
+
+        旧的 value 列改为可空并保留，已有数据由 migrate_legacy_values 分批迁移，
+        迁移期间读取时会回退到旧列
+        """
+        columns = self._get_table_columns(cursor, "metric_values")
+        if "value" not in columns or "value_num" in columns:
+            return
+        cursor.execute("""
+            ALTER TABLE metric_values
+                ADD COLUMN value_num DOUBLE NULL AFTER metric_id,
+                ADD COLUMN value_text TEXT NULL AFTER value_num,
+                MODIFY COLUMN value TEXT NULL
+        """)
+
+    def _migrate_binary_ids(self, cursor):
+        """
+        版本 2：UUID 主键与外键由 VARCHAR(36) 改为 BINARY(16)
+
+        不做整表类型转换，也不在一个事务中更新全表：
+        1. 为待转换的列添加可空的 BINARY(16) 影子列（追加列只改元数据），并建触发器使写入同步填充影子列
+        2. 按主键范围分批回填影子列，每批一个短事务（见 backfill_binary_ids，由 migrate_ids.py 在升级前执行）
+        3. 删除外键，每张表一条 ALTER（LOCK=NONE，不阻塞读写）删除原列、影子列改名为原列并重建主键与索引，
+           完成后删除该表的触发器，最后重建外键
+        启动时只执行第 3 步：影子列仍有未回填的行时拒绝交换并报错，不在启动过程中回填。
+        新建的空表没有需要回填的数据，直接修改列类型，不需要影子列与触发器（也就不需要 TRIGGER 权限）
+        """
+        pending = self._pending_binary_id_columns(cursor)
+        if not pending:
+            return
+        shadowed = self._shadowed_binary_id_tables(cursor, pending)
+        unfinished = self._unfinished_binary_id_tables(cursor, shadowed)
+        if unfinished:
+            raise RuntimeError(
+                f"UUID 列尚未回填到 BINARY(16) 影子列：{', '.join(unfinished)}。"
+                "请先执行 python migrate_ids.py 完成回填后再启动"
+            )
+        self._swap_binary_id_columns(cursor, pending, shadowed)
+
+    def _pending_binary_id_columns(self, cursor) -> Dict[str, List[Tuple[str, bool]]]:
+        """获取尚未转换为 BINARY(16) 的 UUID 列 {表名: [(列名, 是否可空)]}，不存在的表不在结果中"""
+        pending = {}
+        for table, columns in BINARY_ID_COLUMNS.items():
+            cursor.execute(
+                """
+                SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+                """,
+                (table,)
+            )
+            column_types = {name: data_type.lower() for name, data_type in cursor.fetchall()}
+            table_pending = [
+                (column, nullable) for column, nullable in columns
+                if column in column_types and column_types[column] != "binary"
+            ]
+            if table_pending:
+                pending[table] = table_pending
+        return pending
+
+    def _shadowed_binary_id_tables(
+        self,
+        cursor,
+        pending: Dict[str, List[Tuple[str, bool]]]
+    ) -> Dict[str, List[Tuple[str, bool]]]:
+        """待转换的表中需要经影子列回填的表：已有数据或已添加过影子列，其余为可直接修改列类型的空表"""
+        shadowed = {}
+        for table, columns in pending.items():
+            if columns[0][0] + BINARY_ID_SHADOW_SUFFIX in self._get_table_columns(cursor, table):
+                shadowed[table] = columns
+                continue
+            cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+            if cursor.fetchall():
+                shadowed[table] = columns
+        return shadowed
+
+    def _unfinished_binary_id_tables(self, cursor, shadowed: Dict[str, List[Tuple[str, bool]]]) -> List[str]:
+        """需要影子列的表中尚未添加影子列、或影子列仍有未回填行（原列非空而影子列为空）的表"""
+        unfinished = []
+        for table, columns in shadowed.items():
+            existing = set(self._get_table_columns(cursor, table))
+            if any(column + BINARY_ID_SHADOW_SUFFIX not in existing for column, _ in columns):
+                unfinished.append(table)
+                continue
+            missing = " OR ".join(
+                f"({column} IS NOT NULL AND {column}{BINARY_ID_SHADOW_SUFFIX} IS NULL)" for column, _ in columns
+            )
+            cursor.execute(f"SELECT 1 FROM {table} WHERE {missing} LIMIT 1")
+            if cursor.fetchall():
+                unfinished.append(table)
+        return unfinished
+
+    def _prepare_binary_id_columns(self, cursor, pending: Dict[str, List[Tuple[str, bool]]]):
+        """
+        添加影子列、同步触发器与回填进度表（已存在的跳过，可重复执行）
+
+        触发器在写入与更新原列时用 UUID_TO_BIN 填充影子列，回填期间旧版本服务可以继续写入
+        """
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {BINARY_ID_PROGRESS_TABLE} (
+                table_name VARCHAR(64) PRIMARY KEY,
+                last_key TEXT NULL,
+                completed_at DATETIME NULL
+            )
+        """)
+        cursor.execute(
+            """
+            SELECT TRIGGER_NAME FROM information_schema.TRIGGERS
+            WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME LIKE %s
+            """,
+            (f"%{BINARY_ID_SHADOW_SUFFIX}_sync_%",)
+        )
+        triggers = {row[0] for row in cursor.fetchall()}
+        for table, columns in pending.items():
+            existing = set(self._get_table_columns(cursor, table))
+            missing = [column for column, _ in columns if column + BINARY_ID_SHADOW_SUFFIX not in existing]
+            if missing:
+                cursor.execute(f"ALTER TABLE {table} " + ", ".join(
+                    f"ADD COLUMN {column}{BINARY_ID_SHADOW_SUFFIX} BINARY(16) NULL" for column in missing
+                ))
+            assignments = ", ".join(
+                f"NEW.{column}{BINARY_ID_SHADOW_SUFFIX} = UUID_TO_BIN(NEW.{column})" for column, _ in columns
+            )
+            for event in ("INSERT", "UPDATE"):
+                trigger = f"{table}{BINARY_ID_SHADOW_SUFFIX}_sync_{event.lower()}"
+                if trigger not in triggers:
+                    cursor.execute(
+                        f"CREATE TRIGGER {trigger} BEFORE {event} ON {table} FOR EACH ROW SET {assignments}"
+                    )
+
+    def backfill_binary_ids(self, batch_size: int = 5000) -> int:
+        """
+        将 VARCHAR(36) 的 UUID 列分批回填到 BINARY(16) 影子列，返回本次回填的行数
+
+        每张表按主键顺序推进，每批在独立事务中更新一段主键范围并保存进度，中断后从上次位置继续；
+        回填完成的表由触发器保持同步，不再重复扫描。在旧版本服务运行期间执行（migrate_ids.py），
+        升级后启动时的结构迁移只做列交换
+        """
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            pending = self._shadowed_binary_id_tables(cursor, self._pending_binary_id_columns(cursor))
+            if not pending:
+                return 0
+            self._prepare_binary_id_columns(cursor, pending)
+            cursor.execute(f"SELECT table_name, last_key, completed_at FROM {BINARY_ID_PROGRESS_TABLE}")
+            progress = {table: (last_key, completed_at) for table, last_key, completed_at in cursor.fetchall()}
+
+        backfilled = 0
+        for table, columns in pending.items():
+            last_key, completed_at = progress.get(table, (None, None))
+            if completed_at is None:
+                backfilled += self._backfill_binary_id_table(
+                    table, columns, json.loads(last_key) if last_key else None, batch_size
+                )
+        return backfilled
+
+    def _backfill_binary_id_table(
+        self,
+        table: str,
+        columns: List[Tuple[str, bool]],
+        last_key: Optional[List[Any]],
+        batch_size: int
+    ) -> int:
+        """从 last_key 之后按主键范围分批回填一张表的影子列，完成后在进度表中标记"""
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            keys = self._get_index_columns(cursor, table).get("PRIMARY", (False, []))[1]
+        key_list = ", ".join(keys)
+        assignments = ", ".join(
+            f"{column}{BINARY_ID_SHADOW_SUFFIX} = UUID_TO_BIN({column})" for column, _ in columns
+        )
+
+        backfilled = 0
+        while True:
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                after, after_params = _keyset_condition(keys, ">", last_key)
+                cursor.execute(
+                    f"SELECT {key_list} FROM {table} WHERE {after} ORDER BY {key_list} LIMIT 1 OFFSET %s",
+                    (*after_params, batch_size - 1)
+                )
+                row = cursor.fetchone()
+                upper, upper_params = _keyset_condition(keys, "<=", list(row) if row else None)
+                cursor.execute(
+                    f"UPDATE {table} SET {assignments} WHERE {after} AND {upper}",
+                    (*after_params, *upper_params)
+                )
+                backfilled += cursor.rowcount
+                last_key = list(row) if row else last_key
+                cursor.execute(
+                    f"""
+                    INSERT INTO {BINARY_ID_PROGRESS_TABLE} (table_name, last_key, completed_at) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE last_key = VALUES(last_key), completed_at = VALUES(completed_at)
+                    """,
+                    (table, json.dumps(last_key, default=str) if last_key else None, None if row else datetime.utcnow())
+                )
+            if row is None:
+                return backfilled
+
+    def _get_index_columns(self, cursor, table: str) -> Dict[str, Tuple[bool, List[str]]]:
+        """获取表上的索引 {索引名: (是否唯一, [列名])}，主键的索引名为 PRIMARY"""
+        cursor.execute(
+            """
+            SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX
+            """,
+            (table,)
+        )
+        indexes: Dict[str, Tuple[bool, List[str]]] = {}
+        for name, non_unique, column in cursor.fetchall():
+            indexes.setdefault(name, (not non_unique, []))[1].append(column)
+        return indexes
+
+    def _swap_binary_id_columns(
+        self,
+        cursor,
+        pending: Dict[str, List[Tuple[str, bool]]],
+        shadowed: Dict[str, List[Tuple[str, bool]]]
+    ):
+        """
+        用回填完成的影子列替换原列
+
+        每张表一条 ALTER：删除引用原列的主键与索引和原列本身，影子列改名为原列并恢复原列的可空性，
+        再按原定义重建主键与索引。LOCK=NONE 使改动在线完成，期间不阻塞读写；
+        ALTER 执行期间的并发写入仍由触发器填充影子列，ALTER 完成后才删除该表的触发器。
+        没有影子列的空表直接修改列类型
+        """
+        tables = sorted({table for table, _, _ in ID_FOREIGN_KEYS})
+        placeholders = ", ".join(["%s"] * len(tables))
+        cursor.execute(
+            f"""
+            SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+            """,
+            tables
+        )
+        for table, constraint in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY `{constraint}`")
+
+        for table, columns in pending.items():
+            if table not in shadowed:
+                cursor.execute(f"ALTER TABLE {table} " + ", ".join(
+                    f"MODIFY COLUMN {column} BINARY(16) {'NULL' if nullable else 'NOT NULL'}" for column, nullable in columns
+                ))
+                continue
+            swapped = {column for column, _ in columns}
+            indexes = {
+                name: definition for name, definition in self._get_index_columns(cursor, table).items()
+                if swapped & set(definition[1])
+            }
+            clauses = [
+                "DROP PRIMARY KEY" if name == "PRIMARY" else f"DROP INDEX `{name}`" for name in indexes
+            ]
+            for column, nullable in columns:
+                clauses.append(f"DROP COLUMN {column}")
+                clauses.append(
+                    f"CHANGE COLUMN {column}{BINARY_ID_SHADOW_SUFFIX} {column} BINARY(16) {'NULL' if nullable else 'NOT NULL'}"
+                )
+            for name, (unique, index_columns) in indexes.items():
+                column_list = ", ".join(index_columns)
+                if name == "PRIMARY":
+                    clauses.append(f"ADD PRIMARY KEY ({column_list})")
+                else:
+                    clauses.append(f"ADD {'UNIQUE ' if unique else ''}INDEX `{name}` ({column_list})")
+            cursor.execute(f"ALTER TABLE {table} {', '.join(clauses)}, LOCK=NONE")
+            for event in ("insert", "update"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}{BINARY_ID_SHADOW_SUFFIX}_sync_{event}")
+
+        # 数据已由原外键约束保证一致，重建外键时跳过校验，改为只改元数据的在线操作
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        try:
+            # 分区表不支持外键，删除指标时由应用层清理明细
+            partitioned = bool(self._get_partitions(cursor, "metric_values"))
+            for table, column, referenced in ID_FOREIGN_KEYS:
+                if table == "metric_values" and partitioned:
+                    continue
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {referenced}(id) ON DELETE CASCADE"
+                )
+        finally:
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.execute(f"DROP TABLE IF EXISTS {BINARY_ID_PROGRESS_TABLE}")
+
+    def _init_deletion_jobs(self, cursor):
+        """
+        版本 3：删除明细表与汇总表上的级联外键，新增删除任务表
+
+        删除数据中心时级联删除数百万行明细会在一个事务中长时间持有锁；改为删除设施与指标后
+        记录删除任务，由后台按指标分批清理。已删除指标的残留数据不会被查询到（查询前均校验指标存在）
+        """
+        placeholders = ", ".join(["%s"] * len(PURGED_METRIC_TABLES))
+        cursor.execute(
+            f"""
+            SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+            """,
+            PURGED_METRIC_TABLES
+        )
+        for table, constraint in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY `{constraint}`")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS deletion_jobs (
+                id BINARY(16) PRIMARY KEY,
+                target_type VARCHAR(20) NOT NULL,
+                target_id BINARY(16) NOT NULL,
+                target_name VARCHAR(1024) NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                metrics_total INT NOT NULL,
+                metrics_done INT NOT NULL DEFAULT 0,
+                rows_deleted BIGINT NOT NULL DEFAULT 0,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL,
+                finished_at DATETIME NULL,
+                INDEX idx_deletion_jobs_status (status, created_at)
+            )
+        """)
+        # 删除任务中尚未清理完的指标，清理完一个删除一行
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS deletion_job_metrics (
+                job_id BINARY(16) NOT NULL,
+                metric_id BINARY(16) NOT NULL,
+                PRIMARY KEY (job_id, metric_id)
+            )
+        """)
+
+    def _init_value_dedup_keys(self, cursor):
+        """
+        版本 4：指标值去重键表
+
+        客户端重试时以相同的去重键重复提交，主键 (metric_id, key_hash) 保证同一读数只写入一次。
+        去重键单独建表，不受 metric_values 分区对唯一索引的限制，也不给明细表增加索引；
+        过期的去重键（包括已删除指标遗留的键）由数据保留任务按 created_at 分批清理
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metric_value_keys (
+                metric_id BINARY(16) NOT NULL,
+                key_hash BINARY(16) NOT NULL,
+                value_id BINARY(16) NOT NULL,
+                timestamp DATETIME NOT NULL,
+                created_at DATETIME NOT NULL,
+                PRIMARY KEY (metric_id, key_hash),
+                INDEX idx_metric_value_keys_created (created_at)
+            )
+        """)
+
+    def _init_value_blocks(self, cursor):
+        """
+        版本 5：指标值压缩块表
+
+        数值型指标已关闭时间窗口内的明细压缩为块后从 metric_values 删除，每个 (指标, 窗口) 一个块，
+        value_ids 按块内顺序保存原记录 ID（每条 16 字节）；块表不分区，过期的块由数据保留任务按 last_timestamp 整块删除
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metric_value_blocks (
+                metric_id BINARY(16) NOT NULL,
+                block_start DATETIME NOT NULL,
+                first_timestamp DATETIME NOT NULL,
+                last_timestamp DATETIME NOT NULL,
+                value_count INT NOT NULL,
+                data MEDIUMBLOB NOT NULL,
+                value_ids MEDIUMBLOB NOT NULL,
+                PRIMARY KEY (metric_id, block_start)
+            )
+        """)
+
+    def migrate_legacy_values(self, batch_size: int = 5000) -> int:
+        """
+        将旧版 TEXT 类型的指标值分批迁移到类型化列，返回本次迁移的记录数
+
+        每批在独立事务中完成，可随时中断后重新执行；全部迁移完成后删除旧的 value 列。
+        无法按指标数据类型解析的旧数据保留为文本
+        """
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            if "value" not in self._get_table_columns(cursor, "metric_values"):
+                return 0
+
+        # 按主键顺序推进，每批只扫描一段主键范围
+        migrated = 0
+        last_id = b""
+        while True:
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT mv.id, mv.value, m.data_type
+                    FROM metric_values mv
+                    JOIN metrics m ON m.id = mv.metric_id
+                    WHERE mv.id > %s
+                    ORDER BY mv.id
+                    LIMIT %s
+                    """,
+                    (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                rows = [row for row in rows if row[1] is not None]
+
+                updates = []
+                for value_id, value, data_type in rows:
+                    try:
+                        value_num, value_text = encode_metric_value(value, data_type)
+                    except ValueError:
+                        value_num, value_text = None, value
+                    updates.append((value_num, value_text, value_id))
+                if updates:
+                    cursor.executemany(
+                        "UPDATE metric_values SET value_num = %s, value_text = %s, value = NULL WHERE id = %s",
+                        updates
+                    )
+                    migrated += len(updates)
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("ALTER TABLE metric_values DROP COLUMN value")
+
+        return migrated
+
+    # ==================== 分区与数据保留 ====================
+
+    def _monthly_partition_definitions(self, start: datetime, months_ahead: int) -> str:
+        """生成从 start 所在月份起的按月分区定义，最后附加 MAXVALUE 兜底分区"""
+        month = month_start(start)
+        definitions = []
+        for _ in range(months_ahead + 1):
+            next_month = add_months(month, 1)
+            definitions.append(
+                f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month:%Y-%m-%d}')"
+            )
+            month = next_month
+        definitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+        return ",\n".join(definitions)
+
+    def _get_partitions(self, cursor, table: str) -> List[Tuple[str, Optional[datetime]]]:
+        """获取表的范围分区列表 [(分区名, 上界)]，MAXVALUE 分区的上界为 None；未分区时返回空列表"""
+        cursor.execute(
+            """
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            (table,)
+        )
+        partitions = []
+        for name, description in cursor.fetchall():
+            if description == "MAXVALUE":
+                partitions.append((name, None))
+            else:
+                partitions.append((name, parse_timestamp(description.strip("'"))))
+        return partitions
+
+    def ensure_metric_value_partitions(self, months_ahead: int = PARTITION_PREMAKE_MONTHS) -> List[str]:
+        """
+        预先创建从当前月份起未来 months_ahead 个月的分区，返回新建的分区名
+
+        新分区从 MAXVALUE 兜底分区中拆出，兜底分区为空时拆分只修改元数据
+        """
+        if not self.metric_values_partitioned:
+            return []
+
+        created = []
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            partitions = self._get_partitions(cursor, "metric_values")
+            bounds = [bound for _, bound in partitions if bound is not None]
+            if not bounds:
+                return []
+            month = bounds[-1]
+            target = add_months(month_start(datetime.utcnow()), months_ahead + 1)
+            while month < target:
+                next_month = add_months(month, 1)
+                name = partition_name(month)
+                cursor.execute(f"""
+                    ALTER TABLE metric_values REORGANIZE PARTITION {FUTURE_PARTITION} INTO (
+                        PARTITION {name} VALUES LESS THAN ('{next_month:%Y-%m-%d}'),
+                        PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)
+                    )
+                """)
+                created.append(name)
+                month = next_month
+        return created
+
+    def drop_metric_value_partitions(self, before: datetime) -> List[str]:
+        """删除上界不晚于 before 的分区（其中数据全部早于 before），返回被删除的分区名"""
+        if not self.metric_values_partitioned:
+            return []
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            expired = [
+                name for name, bound in self._get_partitions(cursor, "metric_values")
+                if bound is not None and bound <= before
+            ]
+            if expired:
+                cursor.execute(f"ALTER TABLE metric_values DROP PARTITION {', '.join(expired)}")
+        return expired
+
+    def get_metric_retention_overrides(self) -> Dict[str, int]:
+        """获取单独配置了保留天数的指标 {指标ID: 保留天数}"""
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, retention_days FROM metrics WHERE retention_days IS NOT NULL")
+            return {bin_to_uuid(row[0]): int(row[1]) for row in cursor.fetchall()}
+
+    def purge_metric_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """
+        分批删除早于 before 的明细数据，返回删除的记录数
+
+        指定 metric_id 时只清理该指标，否则清理所有未单独配置保留天数的指标；
+        每批在独立事务中完成，避免长事务持有大量行锁
+        """
+        if metric_id is not None:
+            sql = "DELETE FROM metric_values WHERE metric_id = %s AND timestamp < %s LIMIT %s"
+            params = (uuid_to_bin(metric_id), before, batch_size)
+        else:
+            sql = """
+                DELETE FROM metric_values
+                WHERE timestamp < %s
+                  AND metric_id IN (SELECT id FROM metrics WHERE retention_days IS NULL)
+                LIMIT %s
+            """
+            params = (before, batch_size)
+
+        deleted = 0
+        while True:
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+
+    def purge_value_dedup_keys(self, before: datetime, batch_size: int = 5000) -> int:
+        """分批删除早于 before 登记的指标值去重键，返回删除的键数量"""
+        deleted = 0
+        while True:
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM metric_value_keys WHERE created_at < %s LIMIT %s", (before, batch_size))
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+
+    # ==================== 压缩冷存储 ====================
+
+    def compact_metric_values(
+        self,
+        metric_id: str,
+        before: datetime,
+        after: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        将指标在 [after, before) 内最早一个仍有数值型明细的已关闭时间窗口压缩为块
+
+        在一个事务中以 FOR UPDATE 锁定窗口内的明细和已有的块（窗口压缩后迟到的数据），合并后重新编码，
+        再删除明细；记录 ID 随块保存，压缩前后不变。value_num 为空的记录（未迁移的旧数据）保留在明细表中
+        """
+        before = floor_timestamp(before, COMPACTION_WINDOW_SECONDS)
+        metric_key = uuid_to_bin(metric_id)
+        conditions = "metric_id = %s AND timestamp < %s AND value_num IS NOT NULL"
+        params: List[Any] = [metric_key, before]
+        if after is not None:
+            conditions += " AND timestamp >= %s"
+            params.append(after)
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT timestamp FROM metric_values WHERE {conditions} ORDER BY timestamp LIMIT 1", params)
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            window_start = floor_timestamp(row[0], COMPACTION_WINDOW_SECONDS)
+            window = (metric_key, window_start, window_start + timedelta(seconds=COMPACTION_WINDOW_SECONDS))
+
+            cursor.execute(
+                """
+                SELECT id, timestamp, value_num FROM metric_values
+                WHERE metric_id = %s AND timestamp >= %s AND timestamp < %s AND value_num IS NOT NULL
+                ORDER BY timestamp, id
+                FOR UPDATE
+                """,
+                window
+            )
+            raw = [(bin_to_uuid(value_id), timestamp, value_num) for value_id, timestamp, value_num in cursor.fetchall()]
+            cursor.execute(
+                "SELECT data, value_ids FROM metric_value_blocks WHERE metric_id = %s AND block_start = %s FOR UPDATE",
+                window[:2]
+            )
+            block = cursor.fetchone()
+            points = sorted(
+                (block_value_rows(*block) if block else []) + raw,
+                key=lambda point: (point[1], point[0])
+            )
+            if not points:
+                # 探测之后、加锁读取之前，窗口内的明细已被数据保留或删除任务清理
+                return None
+            cursor.execute(
+                """
+                INSERT INTO metric_value_blocks (
+                    metric_id, block_start, first_timestamp, last_timestamp, value_count, data, value_ids
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    first_timestamp = VALUES(first_timestamp),
+                    last_timestamp = VALUES(last_timestamp),
+                    value_count = VALUES(value_count),
+                    data = VALUES(data),
+                    value_ids = VALUES(value_ids)
+                """,
+                (*window[:2], points[0][1], points[-1][1], len(points), *encode_value_block(points))
+            )
+            cursor.execute(
+                """
+                DELETE FROM metric_values
+                WHERE metric_id = %s AND timestamp >= %s AND timestamp < %s AND value_num IS NOT NULL
+                """,
+                window
+            )
+        return {"block_start": window_start.isoformat(), "values": len(raw)}
+
+    def purge_compressed_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """
+        删除最后一条记录早于 before 的压缩块，返回删除的记录数
+
+        按整块清理，跨越保留边界的块在其最后一条记录过期后删除；每批在独立事务中完成
+        """
+        if metric_id is not None:
+            condition = "metric_id = %s AND last_timestamp < %s"
+            params: Tuple[Any, ...] = (uuid_to_bin(metric_id), before)
+        else:
+            condition = "last_timestamp < %s AND metric_id IN (SELECT id FROM metrics WHERE retention_days IS NULL)"
+            params = (before,)
+
+        deleted = 0
+        while True:
+            with self.get_conn() as conn:
+                values, more = self._delete_blocks(conn.cursor(), condition, params, batch_size)
+                deleted += values
+            if not more:
+                return deleted
+
+    def _delete_blocks(self, cursor, condition: str, params: Tuple[Any, ...], budget: int) -> Tuple[int, bool]:
+        """
+        删除满足条件的压缩块，块内记录数合计不超过 budget（至少删除一个块）
+
+        返回 (删除的记录数, 是否还有满足条件的块)
+        """
+        cursor.execute(
+            f"""
+            SELECT metric_id, block_start, value_count FROM metric_value_blocks
+            WHERE {condition}
+            ORDER BY metric_id, block_start
+            LIMIT %s
+            FOR UPDATE
+            """,
+            (*params, budget)
+        )
+        candidates = cursor.fetchall()
+        selected = []
+        values = 0
+        for metric_key, block_start, value_count in candidates:
+            if selected and values + value_count > budget:
+                break
+            selected.append((metric_key, block_start))
+            values += value_count
+        if selected:
+            cursor.executemany("DELETE FROM metric_value_blocks WHERE metric_id = %s AND block_start = %s", selected)
+        return values, len(selected) < len(candidates) or len(candidates) == budget
+
+    def _iter_blocks(
+        self,
+        cursor,
+        metric_key: bytes,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        descending: bool = False
+    ) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        按窗口顺序逐块读取可能包含 [since, until] 内记录的压缩块 (data, value_ids)
+
+        先取出满足条件的块起始时间（每个指标每个窗口一行），再按需逐块读取数据，调用方取够记录后即可停止
+        """
+        conditions = ["metric_id = %s"]
+        params: List[Any] = [metric_key]
+        if since is not None:
+            conditions.append("last_timestamp >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("block_start <= %s")
+            params.append(until)
+        cursor.execute(
+            f"""
+            SELECT block_start FROM metric_value_blocks
+            WHERE {' AND '.join(conditions)}
+            ORDER BY block_start {'DESC' if descending else 'ASC'}
+            """,
+            params
+        )
+        for (block_start,) in cursor.fetchall():
+            cursor.execute(
+                "SELECT data, value_ids FROM metric_value_blocks WHERE metric_id = %s AND block_start = %s",
+                (metric_key, block_start)
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                yield row[0], row[1]
 
     # ==================== 设施相关操作 ====================
 
@@ -122,18 +1124,30 @@ class Database:
         parent_id: Optional[str] = None,
         description: Optional[str] = None
     ) -> Dict[str, Any]:
-        """创建设施"""
+        """创建设施（由父设施的物化路径推导自身路径）"""
         facility_id = str(uuid.uuid4())
         now = datetime.utcnow()
 
         with self.get_conn() as conn:
             cursor = conn.cursor()
+            path, id_path, depth = name, f"/{facility_id}/", 0
+            if parent_id:
+                cursor.execute(
+                    "SELECT path, id_path, depth FROM facilities WHERE id = %s",
+                    (uuid_to_bin(parent_id),)
+                )
+                parent = cursor.fetchone()
+                if parent:
+                    path = f"{parent[0]}/{name}"
+                    id_path = f"{parent[1]}{facility_id}/"
+                    depth = parent[2] + 1
             cursor.execute(
                 """
-                INSERT INTO facilities (id, name, facility_type, parent_id, description, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO facilities (id, name, facility_type, parent_id, description, path, id_path, depth, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
-                (facility_id, name, facility_type, parent_id, description, now, now)
+                (uuid_to_bin(facility_id), name, facility_type, uuid_to_bin(parent_id), description,
+                 path, id_path, depth, now, now)
             )
 
         return {
@@ -142,6 +1156,9 @@ class Database:
             "facility_type": facility_type,
             "parent_id": parent_id,
             "description": description,
+            "path": path,
+            "id_path": id_path,
+            "depth": depth,
             "created_at": now.isoformat(),
             "updated_at": now.isoformat()
         }
@@ -152,7 +1169,7 @@ class Database:
             cursor = conn.cursor(dictionary=True)
             cursor.execute(
                 "SELECT * FROM facilities WHERE id = %s",
-                (facility_id,)
+                (uuid_to_bin(facility_id),)
             )
             row = cursor.fetchone()
             if row:
@@ -173,6 +1190,22 @@ class Database:
                 return self._convert_datetime(row)
             return None
 
+    def get_facilities_by_names(self, names: List[str]) -> List[Dict[str, Any]]:
+        """批量按名称获取设施"""
+        unique_names = list(dict.fromkeys(names))
+        result = []
+        if not unique_names:
+            return result
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for start in range(0, len(unique_names), BATCH_CHUNK_SIZE):
+                chunk = unique_names[start:start + BATCH_CHUNK_SIZE]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"SELECT * FROM facilities WHERE name IN ({placeholders})", chunk)
+                result.extend(self._convert_datetime(row) for row in cursor.fetchall())
+        return result
+
     def get_all_facilities(self, facility_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取所有设施"""
         with self.get_conn() as conn:
@@ -194,7 +1227,7 @@ class Database:
             cursor = conn.cursor(dictionary=True)
             cursor.execute(
                 "SELECT * FROM facilities WHERE parent_id = %s ORDER BY name",
-                (parent_id,)
+                (uuid_to_bin(parent_id),)
             )
             return [self._convert_datetime(row) for row in cursor.fetchall()]
 
@@ -220,36 +1253,122 @@ class Database:
 
         updates.append("updated_at = %s")
         params.append(datetime.utcnow())
-        params.append(facility_id)
+        params.append(uuid_to_bin(facility_id))
 
         with self.get_conn() as conn:
             cursor = conn.cursor()
+            cursor.execute(
+                "SELECT name, path, id_path FROM facilities WHERE id = %s FOR UPDATE",
+                (uuid_to_bin(facility_id),)
+            )
+            current = cursor.fetchone()
+            if not current:
+                return False
+
             cursor.execute(
                 f"UPDATE facilities SET {', '.join(updates)} WHERE id = %s",
                 params
             )
-            return cursor.rowcount > 0
 
-    def delete_facility(self, facility_id: str) -> bool:
-        """删除设施（级联删除子设施和指标）"""
+            # 重命名时同步替换自身及所有后代物化路径中的前缀
+            old_name, old_path, id_path = current
+            if name is not None and name != old_name:
+                new_path = old_path[:len(old_path) - len(old_name)] + name
+                cursor.execute(
+                    """
+                    UPDATE facilities SET path = CONCAT(%s, SUBSTRING(path, %s))
+                    WHERE id_path LIKE %s
+                    """,
+                    (new_path, len(old_path) + 1, f"{id_path}%")
+                )
+            return True
+
+    def delete_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """
+        删除设施，返回清理明细数据的删除任务
+
+        子树下的指标ID以一条 INSERT ... SELECT 记入删除任务，随后删除设施，
+        外键级联只删除子设施、指标和最新值这些小表中的行；明细与汇总由后台任务分批清理
+        """
+        now = datetime.utcnow()
         with self.get_conn() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM facilities WHERE id = %s", (facility_id,))
-            return cursor.rowcount > 0
+            cursor.execute(
+                "SELECT path, id_path FROM facilities WHERE id = %s FOR UPDATE",
+                (uuid_to_bin(facility_id),)
+            )
+            facility = cursor.fetchone()
+            if not facility:
+                return None
+
+            job_id = str(uuid.uuid4())
+            cursor.execute(
+                """
+                INSERT INTO deletion_job_metrics (job_id, metric_id)
+                SELECT %s, m.id FROM metrics m
+                JOIN facilities f ON f.id = m.facility_id
+                WHERE f.id_path LIKE %s
+                """,
+                (uuid_to_bin(job_id), f"{facility[1]}%")
+            )
+            job = new_deletion_job(job_id, "facility", facility_id, facility[0], cursor.rowcount, now)
+            self._insert_deletion_job(cursor, job, now)
+            cursor.execute("DELETE FROM facilities WHERE id = %s", (uuid_to_bin(facility_id),))
+        return job
 
     def build_facility_path(self, facility_id: str) -> str:
-        """构建设施路径（如：数据中心A/房间1/传感器X）"""
-        path_parts = []
-        current_id = facility_id
+        """获取设施路径（如：数据中心A/房间1/传感器X），读取物化路径列"""
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT path FROM facilities WHERE id = %s", (uuid_to_bin(facility_id),))
+            row = cursor.fetchone()
+            return row[0] if row else ""
 
-        while current_id:
-            facility = self.get_facility(current_id)
-            if not facility:
-                break
-            path_parts.insert(0, facility["name"])
-            current_id = facility.get("parent_id")
+    def get_facility_subtree(
+        self,
+        root_id: Optional[str] = None,
+        max_depth: Optional[int] = None,
+        root_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取设施子树
 
-        return "/".join(path_parts)
+        指定 root_id 时按物化路径前缀做一次索引范围扫描，否则读取全部设施；
+        root_type 只过滤起始节点的类型，max_depth 为相对起始节点的深度。
+        结果按 depth、name 排序，父节点总在子节点之前，同一父节点下的子设施按名称有序
+        """
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            if root_id:
+                cursor.execute("SELECT * FROM facilities WHERE id = %s", (uuid_to_bin(root_id),))
+                root = cursor.fetchone()
+                if not root or (root_type and root["facility_type"] != root_type):
+                    return []
+                conditions = ["id_path LIKE %s"]
+                params: List[Any] = [f"{root['id_path']}%"]
+                base_depth = root["depth"]
+            else:
+                conditions = ["1 = 1"]
+                params = []
+                base_depth = 0
+            if max_depth is not None:
+                conditions.append("depth <= %s")
+                params.append(base_depth + max_depth)
+
+            cursor.execute(
+                f"SELECT * FROM facilities WHERE {' AND '.join(conditions)} ORDER BY depth, name",
+                params
+            )
+            rows = [self._convert_datetime(row) for row in cursor.fetchall()]
+
+        if root_type and not root_id:
+            # id_path 的第一段即所属根设施
+            root_ids = {
+                row["id"] for row in rows
+                if row["parent_id"] is None and row["facility_type"] == root_type
+            }
+            rows = [row for row in rows if row["id_path"].split("/")[1] in root_ids]
+        return rows
 
     def get_root_facilities(self) -> List[Dict[str, Any]]:
         """获取根设施（没有父设施的设施）"""
@@ -260,6 +1379,63 @@ class Database:
             )
             return [self._convert_datetime(row) for row in cursor.fetchall()]
 
+    def create_facility_hierarchy(
+        self,
+        facilities: List[Dict[str, Any]],
+        metrics: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        在一个事务中批量创建设施层级及其指标
+
+        挂载点（本批之外的父设施）的物化路径一次查询取出，设施与指标分别按 BATCH_CHUNK_SIZE
+        分批 executemany 多行插入；父节点在前的顺序保证外键约束逐行成立
+        """
+        now = datetime.utcnow()
+        batch_ids = {facility["id"] for facility in facilities}
+        anchor_ids = list(dict.fromkeys(
+            facility["parent_id"] for facility in facilities
+            if facility.get("parent_id") and facility["parent_id"] not in batch_ids
+        ))
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            anchors = {}
+            if anchor_ids:
+                placeholders = ", ".join(["%s"] * len(anchor_ids))
+                cursor.execute(
+                    f"SELECT id, path, id_path, depth FROM facilities WHERE id IN ({placeholders}) FOR UPDATE",
+                    [uuid_to_bin(value) for value in anchor_ids]
+                )
+                anchors = {bin_to_uuid(row[0]): (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+            facility_rows, metric_rows = build_hierarchy_rows(facilities, metrics, anchors, now)
+            for start in range(0, len(facility_rows), BATCH_CHUNK_SIZE):
+                cursor.executemany(
+                    """
+                    INSERT INTO facilities (id, name, facility_type, parent_id, description, path, id_path, depth, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    [
+                        (uuid_to_bin(row["id"]), row["name"], row["facility_type"], uuid_to_bin(row["parent_id"]),
+                         row["description"], row["path"], row["id_path"], row["depth"], now, now)
+                        for row in facility_rows[start:start + BATCH_CHUNK_SIZE]
+                    ]
+                )
+            for start in range(0, len(metric_rows), BATCH_CHUNK_SIZE):
+                cursor.executemany(
+                    """
+                    INSERT INTO metrics (id, name, unit, data_type, description, facility_id, retention_days, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    [
+                        (uuid_to_bin(row["id"]), row["name"], row["unit"], row["data_type"], row["description"],
+                         uuid_to_bin(row["facility_id"]), row["retention_days"], now, now)
+                        for row in metric_rows[start:start + BATCH_CHUNK_SIZE]
+                    ]
+                )
+
+        return facility_rows, metric_rows
+
     # ==================== 指标相关操作 ====================
 
     def create_metric(
@@ -268,20 +1444,23 @@ class Database:
         facility_id: str,
         unit: Optional[str] = None,
         data_type: str = "float",
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
     ) -> Dict[str, Any]:
         """创建指标"""
         metric_id = str(uuid.uuid4())
         now = datetime.utcnow()
+        retention_days = retention_days or None
 
         with self.get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO metrics (id, name, unit, data_type, description, facility_id, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO metrics (id, name, unit, data_type, description, facility_id, retention_days, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
-                (metric_id, name, unit, data_type, description, facility_id, now, now)
+                (uuid_to_bin(metric_id), name, unit, data_type, description, uuid_to_bin(facility_id),
+                 retention_days, now, now)
             )
 
         return {
@@ -291,6 +1470,7 @@ class Database:
             "data_type": data_type,
             "description": description,
             "facility_id": facility_id,
+            "retention_days": retention_days,
             "created_at": now.isoformat(),
             "updated_at": now.isoformat()
         }
@@ -301,20 +1481,61 @@ class Database:
             cursor = conn.cursor(dictionary=True)
             cursor.execute(
                 "SELECT * FROM metrics WHERE id = %s",
-                (metric_id,)
+                (uuid_to_bin(metric_id),)
             )
             row = cursor.fetchone()
             if row:
                 return self._convert_datetime(row)
             return None
 
+    def get_metrics_by_ids(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标，返回 {指标ID: 指标} 映射"""
+        unique_ids = list(dict.fromkeys(metric_ids))
+        result = {}
+        if not unique_ids:
+            return result
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for start in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+                chunk = [uuid_to_bin(value) for value in unique_ids[start:start + BATCH_CHUNK_SIZE]]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT * FROM metrics WHERE id IN ({placeholders})",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    metric = self._convert_datetime(row)
+                    result[metric["id"]] = metric
+        return result
+
+    def get_metrics_by_facilities(self, facility_ids: List[str]) -> List[Dict[str, Any]]:
+        """批量获取多个设施的指标，按名称排序"""
+        unique_ids = list(dict.fromkeys(facility_ids))
+        result = []
+        if not unique_ids:
+            return result
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for start in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+                chunk = [uuid_to_bin(value) for value in unique_ids[start:start + BATCH_CHUNK_SIZE]]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT * FROM metrics WHERE facility_id IN ({placeholders}) ORDER BY name",
+                    chunk
+                )
+                result.extend(self._convert_datetime(row) for row in cursor.fetchall())
+        result.sort(key=lambda metric: metric["name"])
+        return result
+
     def get_metrics_by_facility(self, facility_id: str) -> List[Dict[str, Any]]:
         """获取设施的所有指标"""
         with self.get_conn() as conn:
             cursor = conn.cursor(dictionary=True)
             cursor.execute(
                 "SELECT * FROM metrics WHERE facility_id = %s ORDER BY name",
-                (facility_id,)
+                (uuid_to_bin(facility_id),)
             )
             return [self._convert_datetime(row) for row in cursor.fetchall()]
 
@@ -330,9 +1551,10 @@ class Database:
         metric_id: str,
         name: Optional[str] = None,
         unit: Optional[str] = None,
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
     ) -> bool:
-        """更新指标信息"""
+        """更新指标信息（retention_days 为 0 表示恢复使用全局保留策略）"""
         updates = []
         params = []
 
@@ -345,13 +1567,16 @@ class Database:
         if description is not None:
             updates.append("description = %s")
             params.append(description)
+        if retention_days is not None:
+            updates.append("retention_days = %s")
+            params.append(retention_days or None)
 
         if not updates:
             return False
 
         updates.append("updated_at = %s")
         params.append(datetime.utcnow())
-        params.append(metric_id)
+        params.append(uuid_to_bin(metric_id))
 
         with self.get_conn() as conn:
             cursor = conn.cursor()
@@ -361,93 +1586,648 @@ class Database:
             )
             return cursor.rowcount > 0
 
-    def delete_metric(self, metric_id: str) -> bool:
-        """删除指标"""
+    def delete_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """删除指标（级联删除最新值），返回清理明细与汇总数据的删除任务"""
+        now = datetime.utcnow()
         with self.get_conn() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM metrics WHERE id = %s", (metric_id,))
-            return cursor.rowcount > 0
+            cursor.execute("SELECT name FROM metrics WHERE id = %s FOR UPDATE", (uuid_to_bin(metric_id),))
+            metric = cursor.fetchone()
+            if not metric:
+                return None
+
+            job = new_deletion_job(str(uuid.uuid4()), "metric", metric_id, metric[0], 1, now)
+            cursor.execute(
+                "INSERT INTO deletion_job_metrics (job_id, metric_id) VALUES (%s, %s)",
+                (uuid_to_bin(job["id"]), uuid_to_bin(metric_id))
+            )
+            self._insert_deletion_job(cursor, job, now)
+            cursor.execute("DELETE FROM metrics WHERE id = %s", (uuid_to_bin(metric_id),))
+        return job
+
+    # ==================== 后台删除任务 ====================
+
+    def _insert_deletion_job(self, cursor, job: Dict[str, Any], now: datetime):
+        """写入删除任务行"""
+        cursor.execute(
+            """
+            INSERT INTO deletion_jobs (id, target_type, target_id, target_name, status, metrics_total, created_at, updated_at, finished_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (uuid_to_bin(job["id"]), job["target_type"], uuid_to_bin(job["target_id"]), job["target_name"],
+             job["status"], job["metrics_total"], now, now, now if job["finished_at"] else None)
+        )
+
+    def get_deletion_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取删除任务"""
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM deletion_jobs WHERE id = %s", (uuid_to_bin(job_id),))
+            row = cursor.fetchone()
+            return self._convert_datetime(row) if row else None
+
+    def get_active_deletion_jobs(self) -> List[Dict[str, Any]]:
+        """获取尚未完成的删除任务"""
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                "SELECT * FROM deletion_jobs WHERE status IN ('pending', 'running') ORDER BY created_at"
+            )
+            return [self._convert_datetime(row) for row in cursor.fetchall()]
+
+    def purge_deletion_job(self, job_id: str, batch_size: int = DELETION_BATCH_SIZE) -> bool:
+        """
+        清理删除任务中的下一批数据
+
+        每次取任务中的一个指标，依次从明细表和各级汇总表按 (metric_id, ...) 索引前缀 DELETE ... LIMIT，
+        合计不超过 batch_size 行；任务行以 FOR UPDATE 锁定，多个 worker 同时执行时串行推进
+        """
+        now = datetime.utcnow()
+        job_key = uuid_to_bin(job_id)
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status FROM deletion_jobs WHERE id = %s FOR UPDATE", (job_key,))
+            job = cursor.fetchone()
+            if not job or job[0] == "completed":
+                return False
+
+            cursor.execute("SELECT metric_id FROM deletion_job_metrics WHERE job_id = %s LIMIT 1", (job_key,))
+            row = cursor.fetchone()
+            if not row:
+                cursor.execute(
+                    "UPDATE deletion_jobs SET status = 'completed', updated_at = %s, finished_at = %s WHERE id = %s",
+                    (now, now, job_key)
+                )
+                return False
+
+            metric_key = row[0]
+            deleted = 0
+            for table in PURGED_METRIC_TABLES:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE metric_id = %s LIMIT %s",
+                    (metric_key, batch_size - deleted)
+                )
+                deleted += cursor.rowcount
+                if deleted >= batch_size:
+                    break
+            # 本批没有删满，说明该指标的明细与汇总已全部清理，再按块内记录数清理压缩块
+            metric_done = deleted < batch_size
+            if metric_done:
+                values, more = self._delete_blocks(cursor, "metric_id = %s", (metric_key,), batch_size - deleted)
+                deleted += values
+                metric_done = not more
+            if metric_done:
+                cursor.execute(
+                    "DELETE FROM deletion_job_metrics WHERE job_id = %s AND metric_id = %s",
+                    (job_key, metric_key)
+                )
+            cursor.execute(
+                """
+                UPDATE deletion_jobs
+                SET status = 'running', metrics_done = metrics_done + %s, rows_deleted = rows_deleted + %s, updated_at = %s
+                WHERE id = %s
+                """,
+                (int(metric_done), deleted, now, job_key)
+            )
+            return True
 
     # ==================== 指标值相关操作 ====================
 
-    def create_metric_value(
-        self,
-        metric_id: str,
-        value: str,
-        timestamp: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """创建指标值记录"""
-        value_id = str(uuid.uuid4())
-        if timestamp is None:
-            timestamp = datetime.utcnow().isoformat()
+    def create_metric_values(self, values: List[Dict[str, Any]], skip_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量创建指标值记录
+
+        所有记录在同一个事务中通过 executemany 多行插入写入，并同步累加到各级汇总表；
+        values 中每项包含 metric_id、value、data_type 以及可选的 timestamp、dedup_key、id，
+        去重键已登记过的记录（skip_existing 时还有主键已存在的记录）不写入，返回原记录
+        """
+        now = datetime.utcnow()
+        rows = []
+        results = []
+        for item in values:
+            data_type = item.get("data_type", "float")
+            value_num, value_text = encode_metric_value(item["value"], data_type)
+            # 时间有序 ID：新记录追加在主键索引末尾，避免随机插入导致的页分裂
+            value_id = item.get("id") or str(uuid7())
+            # 时间列精度为秒，先截断以保证明细与汇总表落在同一时间桶
+            timestamp = parse_timestamp(item.get("timestamp") or now).replace(microsecond=0)
+            rows.append((uuid_to_bin(value_id), uuid_to_bin(item["metric_id"]), value_num, value_text, timestamp))
+            results.append({
+                "id": value_id,
+                "metric_id": item["metric_id"],
+                "value": decode_metric_value(value_num, value_text, data_type),
+                "timestamp": timestamp.isoformat()
+            })
+        if not rows:
+            return []
 
+        first, repeats = index_dedup_keys(values)
         with self.get_conn() as conn:
             cursor = conn.cursor()
+            stored = {}
+            if skip_existing:
+                stored = self._find_value_ids(cursor, [
+                    (index, rows[index][0]) for index, item in enumerate(values) if item.get("id")
+                ])
+                first = {ident: index for ident, index in first.items() if index not in stored}
+            if first:
+                stored.update(self._claim_dedup_keys(cursor, [
+                    (index, uuid_to_bin(metric_id), key_hash, rows[index][0], rows[index][4])
+                    for (metric_id, key_hash), index in first.items()
+                ], now))
+            skipped = mark_duplicates(results, stored, repeats)
+            if skipped:
+                rows = [row for index, row in enumerate(rows) if index not in skipped]
+                if not rows:
+                    return results
+            for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+                cursor.executemany(
+                    """
+                    INSERT INTO metric_values (id, metric_id, value_num, value_text, timestamp)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    rows[start:start + BATCH_CHUNK_SIZE]
+                )
+            self._update_rollups(cursor, [(row[1], row[4], row[2]) for row in rows])
+            self._update_latest(cursor, rows)
+
+        return results
+
+    def _find_value_ids(self, cursor, ids: List[Tuple[int, bytes]]) -> Dict[int, Tuple[str, datetime]]:
+        """
+        查询本批 (下标, 记录ID) 中已写入明细表的记录，返回 {下标: (记录ID, 记录时间)}
+
+        加共享锁读取：同一 ID 的写入尚未提交时等待其提交；不存在的 ID 上的间隙锁使之后到达的
+        同一 ID 写入在本事务提交后因主键冲突失败，不会重复写入
+        """
+        positions = {value_id: index for index, value_id in ids}
+        stored = {}
+        for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+            chunk = [value_id for _, value_id in ids[start:start + BATCH_CHUNK_SIZE]]
+            placeholders = ", ".join(["%s"] * len(chunk))
             cursor.execute(
+                f"SELECT id, timestamp FROM metric_values WHERE id IN ({placeholders}) LOCK IN SHARE MODE",
+                chunk
+            )
+            for value_id, timestamp in cursor.fetchall():
+                stored[positions[bytes(value_id)]] = (bin_to_uuid(value_id), timestamp)
+        return stored
+
+    def _claim_dedup_keys(
+        self,
+        cursor,
+        claims: List[Tuple[int, bytes, bytes, bytes, datetime]],
+        now: datetime
+    ) -> Dict[int, Tuple[str, datetime]]:
+        """
+        登记本批的去重键 (下标, metric_id, key_hash, value_id, timestamp)，返回之前已登记过的键 {下标: (原记录ID, 原记录时间)}
+
+        登记与明细写入在同一事务中，主键冲突的行影响行数为 0：没有重复时只有一次多行插入，不需要先查询；
+        有重复时再按主键读取原记录。并发提交相同的键时后到的事务在主键行锁上等待，
+        先到的事务提交后读到它的记录，回滚时登记随之撤销
+        """
+        inserted = 0
+        for start in range(0, len(claims), BATCH_CHUNK_SIZE):
+            cursor.executemany(
                 """
-                INSERT INTO metric_values (id, metric_id, value, timestamp)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO metric_value_keys (metric_id, key_hash, value_id, timestamp, created_at)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE metric_id = metric_id
                 """,
-                (value_id, metric_id, value, timestamp)
+                [
+                    (metric_id, key_hash, value_id, timestamp, now)
+                    for _, metric_id, key_hash, value_id, timestamp in claims[start:start + BATCH_CHUNK_SIZE]
+                ]
             )
+            inserted += cursor.rowcount
+        if inserted == len(claims):
+            return {}
 
-        return {
-            "id": value_id,
-            "metric_id": metric_id,
-            "value": value,
-            "timestamp": timestamp
-        }
+        existing = {}
+        for start in range(0, len(claims), BATCH_CHUNK_SIZE):
+            chunk = claims[start:start + BATCH_CHUNK_SIZE]
+            placeholders = ", ".join(["(%s, %s)"] * len(chunk))
+            # 加共享锁读取最新提交的数据，而不是事务开始时的快照
+            cursor.execute(
+                f"""
+                SELECT metric_id, key_hash, value_id, timestamp FROM metric_value_keys
+                WHERE (metric_id, key_hash) IN ({placeholders})
+                LOCK IN SHARE MODE
+                """,
+                [param for _, metric_id, key_hash, _, _ in chunk for param in (metric_id, key_hash)]
+            )
+            for metric_id, key_hash, value_id, timestamp in cursor.fetchall():
+                existing[(bytes(metric_id), bytes(key_hash))] = (bytes(value_id), timestamp)
+
+        stored = {}
+        for index, metric_id, key_hash, value_id, _ in claims:
+            original_id, timestamp = existing[(metric_id, key_hash)]
+            if original_id != value_id:
+                stored[index] = (bin_to_uuid(original_id), timestamp)
+        return stored
+
+    def _update_rollups(self, cursor, entries: List[Tuple[str, datetime, Optional[float]]]):
+        """
+        将新写入的指标值 (metric_id, timestamp, value_num) 增量累加到各级汇总表
+
+        先在内存中按 (指标, 时间桶) 预聚合，再按主键顺序批量 upsert，减少锁冲突
+        """
+        for table, resolution in ROLLUP_LEVELS:
+            self._upsert_rollup_rows(cursor, table, rollup_buckets(entries, resolution))
+
+    def _upsert_rollup_rows(self, cursor, table: str, rows: List[Tuple[Any, datetime, int, int, Any, Any, Any]]):
+        """将预聚合的时间桶行 (metric_id, bucket_start, count, count_num, sum, min, max) 按主键顺序分批累加到汇总表"""
+        for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+            cursor.executemany(
+                f"""
+                INSERT INTO {table} (metric_id, bucket_start, count, count_num, sum, min, max)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    count = count + VALUES(count),
+                    count_num = count_num + VALUES(count_num),
+                    sum = IF(VALUES(sum) IS NULL, sum, IFNULL(sum, 0) + VALUES(sum)),
+                    min = LEAST(IFNULL(min, VALUES(min)), IFNULL(VALUES(min), min)),
+                    max = GREATEST(IFNULL(max, VALUES(max)), IFNULL(VALUES(max), max))
+                """,
+                rows[start:start + BATCH_CHUNK_SIZE]
+            )
+
+    def _update_latest(self, cursor, rows: List[Tuple[str, str, Optional[float], Optional[str], datetime]]):
+        """
+        用新写入的明细行 (id, metric_id, value_num, value_text, timestamp) 更新最新值表
+
+        每个指标只取本批中 (timestamp, id) 最大的一行；乱序到达的旧数据不会覆盖已有的最新值。
+        MySQL 按顺序执行赋值，timestamp 必须最后更新，使前面的条件判断使用旧值
+        """
+        newer = "(VALUES(timestamp) > timestamp OR (VALUES(timestamp) = timestamp AND VALUES(value_id) > value_id))"
+        params = latest_value_rows(rows)
+        for start in range(0, len(params), BATCH_CHUNK_SIZE):
+            cursor.executemany(
+                f"""
+                INSERT INTO metric_latest (metric_id, value_id, value_num, value_text, timestamp)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    value_num = IF({newer}, VALUES(value_num), value_num),
+                    value_text = IF({newer}, VALUES(value_text), value_text),
+                    value_id = IF({newer}, VALUES(value_id), value_id),
+                    timestamp = GREATEST(timestamp, VALUES(timestamp))
+                """,
+                params[start:start + BATCH_CHUNK_SIZE]
+            )
+
+    def rebuild_latest(self, metric_id: Optional[str] = None):
+        """根据明细数据与压缩块重建最新值表（用于最新值表上线前的历史数据回填）"""
+        if metric_id is None:
+            metric_ids = [metric["id"] for metric in self.get_all_metrics()]
+        else:
+            metric_ids = [metric_id]
+
+        for current_id in map(uuid_to_bin, metric_ids):
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM metric_latest WHERE metric_id = %s", (current_id,))
+                cursor.execute(
+                    """
+                    INSERT INTO metric_latest (metric_id, value_id, value_num, value_text, timestamp)
+                    SELECT metric_id, id, value_num, value_text, timestamp
+                    FROM metric_values
+                    WHERE metric_id = %s
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 1
+                    """,
+                    (current_id,)
+                )
+                # 最新的压缩块只在明细已全部压缩（或更早）时生效，_update_latest 只保留较新的一行
+                for block in self._iter_blocks(cursor, current_id, descending=True):
+                    value_id, timestamp, value = block_value_rows(*block)[-1]
+                    self._update_latest(cursor, [(uuid_to_bin(value_id), current_id, value, None, timestamp)])
+                    break
+
+    def rebuild_rollups(self, metric_id: Optional[str] = None):
+        """
+        根据明细数据与压缩块重建汇总表（用于汇总表上线前的历史数据回填）
+
+        不指定 metric_id 时逐个指标重建，每个指标在独立事务中完成
+        """
+        if metric_id is None:
+            metric_ids = [metric["id"] for metric in self.get_all_metrics()]
+        else:
+            metric_ids = [metric_id]
+
+        finest_table, finest_resolution = ROLLUP_LEVELS[-1]
+        for current_id in map(uuid_to_bin, metric_ids):
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                for table, _ in ROLLUP_LEVELS:
+                    cursor.execute(f"DELETE FROM {table} WHERE metric_id = %s", (current_id,))
+
+                # 最细粒度由明细聚合，其余各级由下一级汇总表聚合
+                cursor.execute(
+                    f"""
+                    INSERT INTO {finest_table} (metric_id, bucket_start, count, count_num, sum, min, max)
+                    SELECT
+                        metric_id,
+                        DATE_ADD(%s, INTERVAL (TIMESTAMPDIFF(SECOND, %s, timestamp) DIV %s) * %s SECOND) AS bucket,
+                        COUNT(*), COUNT(value_num), SUM(value_num), MIN(value_num), MAX(value_num)
+                    FROM metric_values
+                    WHERE metric_id = %s
+                    GROUP BY metric_id, bucket
+                    """,
+                    (EPOCH, EPOCH, finest_resolution, finest_resolution, current_id)
+                )
+                for block in self._iter_blocks(cursor, current_id):
+                    entries = [(current_id, timestamp, value) for _, timestamp, value in block_value_rows(*block)]
+                    self._upsert_rollup_rows(cursor, finest_table, rollup_buckets(entries, finest_resolution))
+                levels = list(reversed(ROLLUP_LEVELS))
+                for (source, _), (table, resolution) in zip(levels, levels[1:]):
+                    cursor.execute(
+                        f"""
+                        INSERT INTO {table} (metric_id, bucket_start, count, count_num, sum, min, max)
+                        SELECT
+                            metric_id,
+                            DATE_ADD(%s, INTERVAL (TIMESTAMPDIFF(SECOND, %s, bucket_start) DIV %s) * %s SECOND) AS bucket,
+                            SUM(count), SUM(count_num), SUM(sum), MIN(min), MAX(max)
+                        FROM {source}
+                        WHERE metric_id = %s
+                        GROUP BY metric_id, bucket
+                        """,
+                        (EPOCH, EPOCH, resolution, resolution, current_id)
+                    )
 
     def get_metric_values(
         self,
         metric_id: str,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        before_timestamp: Optional[datetime] = None,
+        before_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """获取指标的历史值"""
+        """
+        获取指标的历史值（按时间倒序）
+
+        指定 before_timestamp 时使用键集分页：只返回早于该时间的记录，
+        同时指定 before_id 时返回 (timestamp, id) 严格位于该位置之后的记录，
+        借助 (metric_id, timestamp) 索引直接定位，代价与页码无关。
+        明细取出 offset + limit 条后再从较新的压缩块开始逐块补充，合并排序后截取本页；
+        明细已取满时，早于其最后一条的压缩块不会进入本页，不再读取
+        """
+        conditions = ["mv.metric_id = %s"]
+        params: List[Any] = [uuid_to_bin(metric_id)]
+        if before_timestamp is not None:
+            if before_id is not None:
+                conditions.append("(mv.timestamp < %s OR (mv.timestamp = %s AND mv.id < %s))")
+                params.extend([before_timestamp, before_timestamp, uuid_to_bin(before_id)])
+            else:
+                conditions.append("mv.timestamp < %s")
+                params.append(before_timestamp)
+        need = limit + offset
+        params.append(need)
+
         with self.get_conn() as conn:
             cursor = conn.cursor(dictionary=True)
             cursor.execute(
-                """
-                SELECT * FROM metric_values
-                WHERE metric_id = %s
-                ORDER BY timestamp DESC
-                LIMIT %s OFFSET %s
+                f"""
+                SELECT mv.*, m.data_type FROM metric_values mv
+                JOIN metrics m ON m.id = mv.metric_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY mv.timestamp DESC, mv.id DESC
+                LIMIT %s
                 """,
-                (metric_id, limit, offset)
+                params
             )
-            return [self._convert_datetime(row) for row in cursor.fetchall()]
+            rows = cursor.fetchall()
+            cursor = conn.cursor()
+            cursor.execute("SELECT data_type FROM metrics WHERE id = %s", (uuid_to_bin(metric_id),))
+            metric = cursor.fetchone()
+            if metric is not None:
+                floor = rows[-1]["timestamp"] if len(rows) >= need else None
+                blocks = (
+                    (data, value_ids, metric[0])
+                    for data, value_ids in self._iter_blocks(
+                        cursor, uuid_to_bin(metric_id), floor, before_timestamp, descending=True
+                    )
+                )
+                rows.extend(select_block_page(blocks, metric_id, need, before_timestamp, before_id))
+
+        values = [self._convert_value_row(row) for row in rows]
+        values.sort(key=lambda value: (datetime.fromisoformat(value["timestamp"]), value["id"]), reverse=True)
+        return values[offset:need]
 
-    def get_latest_metric_value(self, metric_id: str) -> Optional[Dict[str, Any]]:
-        """获取指标的最新值"""
+    def iter_metric_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = EXPORT_BATCH_SIZE
+    ) -> Iterator[List[Tuple[str, datetime, Optional[float], Optional[str]]]]:
+        """
+        按 (timestamp, id) 升序逐批读取 [start, end) 范围内的明细数据（含压缩块中的记录）
+
+        明细与压缩块按 (timestamp, id) 归并：明细占用一个连接流式读取，
+        压缩块每次用一个短连接读取一块，解码后参与归并
+        """
+        raw_batches = self._iter_raw_values(metric_id, start, end, batch_size)
+        merged = heapq.merge(
+            itertools.chain.from_iterable(raw_batches),
+            self._iter_block_values(metric_id, start, end),
+            key=lambda row: (row[1], row[0])
+        )
+        try:
+            while True:
+                batch = list(itertools.islice(merged, batch_size))
+                if not batch:
+                    break
+                yield batch
+        finally:
+            # 提前结束迭代时立即归还明细查询占用的连接
+            raw_batches.close()
+
+    def _iter_block_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> Iterator[Tuple[str, datetime, float, None]]:
+        """按 (timestamp, id) 升序逐条给出压缩块中位于 [start, end) 的记录，每个块用一个短连接读取"""
+        metric_key = uuid_to_bin(metric_id)
         with self.get_conn() as conn:
-            cursor = conn.cursor(dictionary=True)
+            cursor = conn.cursor()
+            conditions = ["metric_id = %s"]
+            params: List[Any] = [metric_key]
+            if start is not None:
+                conditions.append("last_timestamp >= %s")
+                params.append(start)
+            if end is not None:
+                conditions.append("block_start < %s")
+                params.append(end)
             cursor.execute(
-                """
-                SELECT * FROM metric_values
-                WHERE metric_id = %s
-                ORDER BY timestamp DESC
-                LIMIT 1
+                f"SELECT block_start FROM metric_value_blocks WHERE {' AND '.join(conditions)} ORDER BY block_start",
+                params
+            )
+            block_starts = [row[0] for row in cursor.fetchall()]
+
+        for block_start in block_starts:
+            with self.get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT data, value_ids FROM metric_value_blocks WHERE metric_id = %s AND block_start = %s",
+                    (metric_key, block_start)
+                )
+                row = cursor.fetchone()
+            if row is None:
+                continue
+            for value_id, timestamp, value in block_value_rows(*row):
+                if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                    yield value_id, timestamp, value, None
+
+    def _iter_raw_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        batch_size: int
+    ) -> Iterator[List[Tuple[str, datetime, Optional[float], Optional[str]]]]:
+        """
+        按 (timestamp, id) 升序逐批读取 [start, end) 范围内明细表中的数据
+
+        使用无缓冲游标：结果集留在服务器端，每次 fetchmany 只读取一批，
+        借助 (metric_id, timestamp) 索引按序扫描，无需排序。迭代未读完就被关闭时，
+        连接上残留未读结果无法复用，直接断开并从连接池中丢弃
+        """
+        conditions = ["metric_id = %s"]
+        params: List[Any] = [uuid_to_bin(metric_id)]
+        if start is not None:
+            conditions.append("timestamp >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < %s")
+            params.append(end)
+
+        conn = self.pool.acquire()
+        discard = True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION net_write_timeout = %s", (self.export_write_timeout,))
+            cursor.execute(
+                f"""
+                SELECT id, timestamp, value_num, value_text FROM metric_values
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp, id
                 """,
-                (metric_id,)
+                params
             )
-            row = cursor.fetchone()
-            if row:
-                return self._convert_datetime(row)
-            return None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [(bin_to_uuid(row[0]), row[1], row[2], row[3]) for row in rows]
+            cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+            cursor.close()
+            conn.commit()
+            discard = False
+        finally:
+            if discard:
+                try:
+                    conn.shutdown()
+                except Exception:
+                    pass
+            self.pool.release(conn, discard=discard)
 
-    def _convert_datetime(self, row: Dict[str, Any]) -> Dict[str, Any]:
-        """将 datetime 对象和 UUID 对象转换为字符串"""
+    def get_latest_metric_values(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标的最新值，返回 {指标ID: 最新值}，没有数据的指标不在结果中"""
+        unique_ids = list(dict.fromkeys(metric_ids))
         result = {}
-        for key, value in row.items():
-            if isinstance(value, datetime):
-                result[key] = value.isoformat()
-            elif isinstance(value, uuid.UUID):
-                result[key] = str(value)
-            else:
-                result[key] = value
+        if not unique_ids:
+            return result
+
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for start in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+                chunk = [uuid_to_bin(value) for value in unique_ids[start:start + BATCH_CHUNK_SIZE]]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"""
+                    SELECT l.value_id AS id, l.metric_id, l.value_num, l.value_text, l.timestamp, m.data_type
+                    FROM metric_latest l
+                    JOIN metrics m ON m.id = l.metric_id
+                    WHERE l.metric_id IN ({placeholders})
+                    """,
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    value = self._convert_value_row(row)
+                    result[value["metric_id"]] = value
         return result
 
+    def aggregate_metric_values(
+        self,
+        metric_id: str,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """
+        按时间桶聚合指标值（时间范围为 [start, end)）
+
+        时间桶按 UTC 纪元对齐。查询范围按 plan_aggregate_segments 拆分，
+        与汇总粒度对齐的部分读取最粗的可用汇总表，首尾不对齐的部分逐级回退到更细的汇总表或明细，
+        每段一次 GROUP BY，明细段另外叠加压缩块中的记录，最后按时间桶合并；
+        每个有数据的时间桶返回 bucket_start、count、count_num（有数值的记录数）、sum、min、max
+        """
+        merged: Dict[int, Dict[str, Any]] = {}
+        metric_id_bin = uuid_to_bin(metric_id)
+        with self.get_conn() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for table, segment_start, segment_end in plan_aggregate_segments(start, end, bucket_seconds):
+                if table is None:
+                    cursor.execute(
+                        """
+                        SELECT
+                            TIMESTAMPDIFF(SECOND, %s, timestamp) DIV %s AS bucket_index,
+                            COUNT(*) AS count,
+                            COUNT(value_num) AS count_num,
+                            SUM(value_num) AS sum,
+                            MIN(value_num) AS min,
+                            MAX(value_num) AS max
+                        FROM metric_values
+                        WHERE metric_id = %s AND timestamp >= %s AND timestamp < %s
+                        GROUP BY bucket_index
+                        """,
+                        (EPOCH, bucket_seconds, metric_id_bin, segment_start, segment_end)
+                    )
+                else:
+                    cursor.execute(
+                        f"""
+                        SELECT
+                            TIMESTAMPDIFF(SECOND, %s, bucket_start) DIV %s AS bucket_index,
+                            SUM(count) AS count,
+                            SUM(count_num) AS count_num,
+                            SUM(sum) AS sum,
+                            MIN(min) AS min,
+                            MAX(max) AS max
+                        FROM {table}
+                        WHERE metric_id = %s AND bucket_start >= %s AND bucket_start < %s
+                        GROUP BY bucket_index
+                        """,
+                        (EPOCH, bucket_seconds, metric_id_bin, segment_start, segment_end)
+                    )
+                for row in cursor.fetchall():
+                    merge_bucket_row(merged, self._convert_bucket_row(row, bucket_seconds))
+                if table is not None:
+                    continue
+                for block in self._iter_blocks(conn.cursor(), metric_id_bin, segment_start, segment_end):
+                    block_rows = aggregate_block_rows(
+                        block_value_rows(*block), segment_start, segment_end, bucket_seconds
+                    )
+                    for row in block_rows:
+                        merge_bucket_row(merged, self._convert_bucket_row(row, bucket_seconds))
+
+        return [merged[index] for index in sorted(merged)]
 
-# 全局数据库实例
-db = Database()
+    def _convert_datetime(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """将 datetime 对象转换为字符串，BINARY(16) 的 UUID 列还原为 UUID 字符串"""
+        result = super()._convert_datetime(row)
+        for key, value in result.items():
+            if isinstance(value, (bytes, bytearray)):
+                result[key] = bin_to_uuid(value)
+        return result
@@ -0,0 +1,54 @@
+"""
+后台删除层
+分批清理已删除设施和指标遗留的明细与汇总数据
+"""
+from typing import Dict, Any, Optional
+import os
+
+from background import BackgroundManager
+from storage import Storage, DELETION_BATCH_SIZE
+
+
+class DeletionManager(BackgroundManager):
+    """
+    后台删除任务执行类
+
+    - 删除设施或指标时只删除元数据并记录删除任务，接口立即返回
+    - 这里按任务创建顺序逐批清理，每批是一个独立的短事务，批与批之间可暂停，让出锁给写入
+    - 任务进度保存在数据库中，进程重启后从剩余的指标继续
+    """
+
+    name = "Deletion"
+
+    def __init__(
+        self,
+        db: Storage,
+        batch_size: Optional[int] = None,
+        pause_seconds: Optional[float] = None
+    ):
+        super().__init__()
+        self.db = db
+        self.batch_size = batch_size or int(os.getenv("DELETION_BATCH_SIZE", str(DELETION_BATCH_SIZE)))
+        # 每批之间的暂停时间（秒）
+        if pause_seconds is None:
+            pause_seconds = float(os.getenv("DELETION_BATCH_PAUSE_SECONDS", "0.05"))
+        self.pause_seconds = pause_seconds
+
+    def run_once(self) -> Dict[str, Any]:
+        """清理所有未完成的删除任务，返回执行摘要；stop() 后在当前批次结束时返回"""
+        summary = {"completed_jobs": [], "batches": 0}
+        for job in self.db.get_active_deletion_jobs():
+            while not self.stopping:
+                if not self.db.purge_deletion_job(job["id"], self.batch_size):
+                    summary["completed_jobs"].append(job["id"])
+                    break
+                summary["batches"] += 1
+                if self.pause_seconds:
+                    # 暂停期间调用 stop() 时立即结束等待
+                    self._stopping.wait(self.pause_seconds)
+            if self.stopping:
+                break
+        return summary
+
+    def _should_report(self, summary: Dict[str, Any]) -> bool:
+        return bool(summary["completed_jobs"])
@@ -0,0 +1,206 @@
+"""
+写缓冲层
+单条指标值写入的后写（write-behind）模式：请求进入有界队列后立即确认，由后台任务批量写入数据库
+"""
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import asyncio
+import os
+import time
+
+from async_database import AsyncDatabase
+from models import MetricValueCreate, MetricValueBatchCreate
+from service import MetricService
+from spool import IngestSpool, IngestSpoolUnavailable
+from storage import uuid7
+
+
+# 可选的单条写入模式（环境变量 INGEST_MODE）
+INGEST_MODES = ("sync", "buffered")
+
+
+class IngestBufferFull(Exception):
+    """写缓冲队列已满，客户端应按 retry_after 秒后重试"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("写入队列已满，请稍后重试")
+        self.retry_after = retry_after
+
+
+class IngestBufferClosed(Exception):
+    """服务正在关闭，写缓冲不再接收新数据"""
+
+    def __init__(self, retry_after: int = 5):
+        super().__init__("服务正在关闭，暂不接收写入，请稍后重试")
+        self.retry_after = retry_after
+
+
+class IngestBuffer:
+    """
+    指标值写缓冲类
+
+    - submit 在事件循环中把读数放入有界队列，时间戳在接收时确定，不受排队延迟影响
+    - 后台任务凑满 batch_size 条或距本批第一条超过 flush_interval 秒时，
+      通过 MetricService.create_metric_values 以一次校验查询加一个事务多行写入
+    - 队列满时拒绝新数据（调用方返回 429），数据库暂时不可用时整批退避重试，积压即形成背压；
+      启用落盘缓冲（spool）时写入失败的批次和落盘缓冲尚未回放完时的批次转入落盘缓冲，不在队列中积压
+    - close 停止接收并把队列中剩余的数据全部写完
+    - 接收时不查询数据库，指标不存在、取值与类型不符等校验失败只能在写入时发现，计入 failed 并打印日志
+    """
+
+    def __init__(
+        self,
+        metric_service: MetricService,
+        async_db: AsyncDatabase,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        shutdown_timeout: Optional[float] = None,
+        spool: Optional[IngestSpool] = None
+    ):
+        self.metric_service = metric_service
+        self.async_db = async_db
+        self.spool = spool
+        self.max_size = max_size or int(os.getenv("INGEST_QUEUE_SIZE", "100000"))
+        # 与批量写入接口的单次上限一致
+        self.batch_size = min(batch_size or int(os.getenv("INGEST_BATCH_SIZE", "1000")), 10000)
+        if flush_interval is None:
+            flush_interval = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.2"))
+        self.flush_interval = flush_interval
+        # 关闭时等待排空的最长时间（秒），数据库持续不可用时超时放弃剩余数据
+        if shutdown_timeout is None:
+            shutdown_timeout = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT", "30"))
+        self.shutdown_timeout = shutdown_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "accepted": 0, "rejected": 0, "written": 0, "duplicates": 0, "failed": 0, "batches": 0, "flush_errors": 0,
+            "spooled": 0
+        }
+        # 最近一批的写入耗时（秒），用于估算队列满时的重试等待时间
+        self._last_flush_seconds = 0.0
+
+    def start(self):
+        """启动后台写入任务"""
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, value_data: MetricValueCreate) -> MetricValueCreate:
+        """将一条读数放入队列，返回补全了接收时间的读数；队列已满或正在关闭时抛出异常"""
+        if self._closing:
+            self._stats["rejected"] += 1
+            raise IngestBufferClosed()
+        if value_data.timestamp is None:
+            value_data = value_data.model_copy(update={"timestamp": datetime.utcnow()})
+        try:
+            self._queue.put_nowait(value_data)
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise IngestBufferFull(self._retry_after())
+        self._stats["accepted"] += 1
+        return value_data
+
+    def _retry_after(self) -> int:
+        """按队列积压量与最近一批的写入耗时估算排空所需的秒数（至少 1 秒）"""
+        batches = self._queue.qsize() / self.batch_size
+        return max(1, int(batches * max(self._last_flush_seconds, self.flush_interval)) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """写缓冲运行统计"""
+        return {
+            **self._stats,
+            "queued": self._queue.qsize(),
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "closing": self._closing
+        }
+
+    async def close(self):
+        """停止接收新数据，等待队列中剩余的读数全部写入（最长 shutdown_timeout 秒）"""
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._shutdown(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            print(f"Ingest buffer shutdown timed out, {self._queue.qsize()} queued values were not written")
+
+    async def _shutdown(self):
+        """放入关闭标记并等待后台任务写完其之前的全部数据"""
+        await self._queue.put(None)
+        await self._task
+
+    async def _run(self):
+        """后台写入循环：按数量或时间凑批，写入失败时退避重试"""
+        while True:
+            item = await self._queue.get()
+            # 关闭标记：close 之后不再接收新数据，它总是队列中的最后一项
+            if item is None:
+                return
+
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: List[MetricValueCreate]):
+        """写入一批读数；数据库异常时转入落盘缓冲，未启用或落盘失败时按指数退避重试，直到写入成功"""
+        # 启用落盘缓冲时预先分配记录 ID：提交结果不确定的批次转入缓冲后，回放按 ID 跳过已写入的读数
+        value_ids = [str(uuid7()) for _ in batch] if self.spool is not None else None
+        attempt = 0
+        while True:
+            # 落盘缓冲尚未回放完时直接追加到其后，保持写入顺序
+            if self.spool is not None and self.spool.active and await self._spill(batch, value_ids):
+                return
+            started = time.monotonic()
+            try:
+                result = await self.async_db.run(
+                    self.metric_service.create_metric_values,
+                    MetricValueBatchCreate(items=batch),
+                    value_ids
+                )
+            except Exception as e:
+                if self.spool is not None:
+                    self.spool.record_fallback(e)
+                    if await self._spill(batch, value_ids):
+                        return
+                attempt += 1
+                self._stats["flush_errors"] += 1
+                delay = min(2 ** attempt * 0.1, 5.0)
+                print(f"Ingest flush of {len(batch)} values failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            self._last_flush_seconds = time.monotonic() - started
+            self._stats["batches"] += 1
+            self._stats["written"] += result.succeeded - result.duplicates
+            self._stats["duplicates"] += result.duplicates
+            self._stats["failed"] += result.failed
+            if result.failed:
+                errors = [item.error for item in result.results if not item.success][:5]
+                print(f"Ingest flush dropped {result.failed} invalid values: {errors}")
+            return
+
+    async def _spill(self, batch: List[MetricValueCreate], value_ids: List[str]) -> bool:
+        """把一批读数及其预先分配的记录 ID 追加到落盘缓冲，落盘失败时返回 False"""
+        try:
+            await self.spool.append(batch, value_ids)
+        except IngestSpoolUnavailable as e:
+            print(f"Ingest spill of {len(batch)} values to spool failed: {e}")
+            return False
+        self._stats["spooled"] += len(batch)
+        return True
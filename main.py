@@ -2,14 +2,24 @@
 主应用入口
 FastAPI 应用初始化和配置
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 
-from api import facilities_router, metrics_router
+from api import facilities_router, metrics_router, deletions_router
+from async_database import AsyncDatabase
+from compaction import CompactionManager
+from deletion import DeletionManager
+from ingest import IngestBuffer, INGEST_MODES
+from pool import PoolError
+from retention import RetentionManager
+from service import FacilityService, MetricService
+from spool import IngestSpool
+from storage import create_storage
 
 
 @asynccontextmanager
@@ -17,9 +27,67 @@ async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时执行
     print("Starting Facility Management System API...")
+    # 按 DB_BACKEND 创建存储后端，创建时不会连接数据库；迁移只在版本落后时执行 DDL，且不阻塞事件循环
+    db = create_storage()
+    await asyncio.to_thread(db.migrate)
+    # 预建最少保留的连接，避免首批请求承担建连开销
+    await asyncio.to_thread(db.prewarm)
+    async_db = AsyncDatabase(db)
+    app.state.db = db
+    app.state.async_db = async_db
+    app.state.facility_service = FacilityService(db)
+    app.state.metric_service = MetricService(db)
+
+    # 单条写入模式：sync（默认，同步写入）或 buffered（进入有界队列后由后台批量写入）
+    ingest_mode = os.getenv("INGEST_MODE", "sync").lower()
+    if ingest_mode not in INGEST_MODES:
+        raise ValueError(f"不支持的写入模式：'{ingest_mode}'，可选值为 {', '.join(INGEST_MODES)}")
+    # 落盘缓冲（配置 INGEST_SPOOL_DIR 时启用）：数据库不可用时读数先写入本地文件，恢复后由后台回放
+    ingest_spool = IngestSpool(app.state.metric_service, async_db)
+    if ingest_spool.enabled:
+        await asyncio.to_thread(ingest_spool.open)
+        ingest_spool.start()
+    else:
+        ingest_spool = None
+    app.state.ingest_spool = ingest_spool
+    ingest_buffer = None
+    if ingest_mode == "buffered":
+        ingest_buffer = IngestBuffer(app.state.metric_service, async_db, spool=ingest_spool)
+        ingest_buffer.start()
+    app.state.ingest_buffer = ingest_buffer
+
+    retention_manager = RetentionManager(db)
+    retention_task = asyncio.create_task(
+        retention_manager.run_forever(int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600")))
+    )
+    # 分批清理已删除设施和指标遗留的明细与汇总数据
+    deletion_manager = DeletionManager(db)
+    deletion_task = asyncio.create_task(
+        deletion_manager.run_forever(float(os.getenv("DELETION_INTERVAL_SECONDS", "5")))
+    )
+    # 数值型指标的冷数据压缩（VALUE_COMPACTION_AFTER_DAYS 大于 0 时启用）
+    compaction_manager = CompactionManager(db)
+    background_tasks = [retention_task, deletion_task]
+    if compaction_manager.enabled:
+        background_tasks.append(asyncio.create_task(
+            compaction_manager.run_forever(float(os.getenv("COMPACTION_INTERVAL_SECONDS", "3600")))
+        ))
     yield
     # 关闭时执行
     print("Shutting down Facility Management System API...")
+    # 先停止接收并写完写缓冲中的数据，再关闭数据库
+    if ingest_buffer is not None:
+        await ingest_buffer.close()
+    # 写缓冲关闭时可能把剩余数据转入落盘缓冲，之后再停止回放；未回放的数据在下次启动后继续
+    if ingest_spool is not None:
+        await ingest_spool.close()
+    # 通知后台任务停止并等待当前批次结束，未完成的清理、删除和压缩任务在下次启动时继续
+    retention_manager.stop()
+    deletion_manager.stop()
+    compaction_manager.stop()
+    await asyncio.gather(*background_tasks)
+    async_db.shutdown()
+    db.close()
 
 
 # 创建 FastAPI 应用
@@ -37,11 +105,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.exception_handler(PoolError)
+async def pool_error_handler(request: Request, exc: PoolError):
+    """连接池耗尽时返回 503，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
+
+
 # 注册路由
 app.include_router(facilities_router)
 app.include_router(metrics_router)
+app.include_router(deletions_router)
 
 # 挂载静态文件目录
 static_dir = os.path.join(os.path.dirname(__file__), "A_web")
@@ -73,6 +153,25 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/pool", tags=["健康检查"])
+async def pool_stats(request: Request):
+    """数据库连接池统计：容量、使用中/空闲连接数、等待者数量及等待时间直方图"""
+    return request.app.state.db.pool_stats()
+
+
+@app.get("/health/ingest", tags=["健康检查"])
+async def ingest_stats(request: Request):
+    """
+    写缓冲统计：接收/拒绝/已写入/写入失败的记录数、队列积压量；未启用写缓冲时 enabled 为 false。
+    spool 为落盘缓冲统计：转入缓冲与已回放的记录数、待回放积压量，未启用时 enabled 为 false
+    """
+    ingest_buffer = request.app.state.ingest_buffer
+    ingest_spool = request.app.state.ingest_spool
+    stats = {"enabled": False} if ingest_buffer is None else {"enabled": True, **ingest_buffer.stats()}
+    stats["spool"] = {"enabled": False} if ingest_spool is None else {"enabled": True, **ingest_spool.stats()}
+    return stats
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
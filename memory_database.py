@@ -0,0 +1,652 @@
+"""
+内存数据库层
+纯内存存储后端：以带索引的字典保存设施和指标，以按时间有序的数组保存每个指标的时序数据，
+用于在没有数据库开销的情况下对业务层和接口层做性能分析与压测。进程退出后数据不保留
+"""
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Iterator, Set, Tuple
+import bisect
+import threading
+import uuid
+
+from storage import (
+    Storage, EPOCH, EXPORT_BATCH_SIZE, DELETION_BATCH_SIZE, parse_timestamp, encode_metric_value,
+    decode_metric_value, uuid7, build_hierarchy_rows, new_deletion_job, index_dedup_keys, mark_duplicates
+)
+
+
+class MemoryDatabase(Storage):
+    """
+    数据库管理类（内存存储后端）
+
+    - 设施、指标按 ID 存储，另维护名称、父设施、所属设施等二级索引
+    - 每个指标的指标值按 (timestamp, id) 升序保存在数组中：最新值为数组末尾，
+      分页与时间范围查询通过二分查找定位
+    - 返回的行字典与 MySQL 后端完全一致；所有操作在一把可重入锁内完成，可被线程池并发调用
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._facilities: Dict[str, Dict[str, Any]] = {}
+        self._facility_ids_by_name: Dict[str, List[str]] = {}
+        self._children: Dict[str, Set[str]] = {}
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        self._metric_ids_by_facility: Dict[str, Set[str]] = {}
+        # {指标ID: [(timestamp, id, value_num, value_text)]}，按 (timestamp, id) 升序
+        self._values: Dict[str, List[Tuple[datetime, str, Optional[float], Optional[str]]]] = {}
+        self._deletion_jobs: Dict[str, Dict[str, Any]] = {}
+        # {(指标ID, 去重键摘要): (原记录ID, 原记录时间, 登记时间)}
+        self._dedup_keys: Dict[Tuple[str, bytes], Tuple[str, datetime, datetime]] = {}
+
+    def migrate(self) -> List[int]:
+        """内存后端没有表结构需要迁移"""
+        return []
+
+    # ==================== 派生数据与数据保留 ====================
+
+    def rebuild_latest(self, metric_id: Optional[str] = None):
+        """最新值直接取自有序数组末尾，无需重建"""
+
+    def rebuild_rollups(self, metric_id: Optional[str] = None):
+        """聚合直接扫描有序数组中的时间范围，无需重建"""
+
+    def get_metric_retention_overrides(self) -> Dict[str, int]:
+        """获取单独配置了保留天数的指标 {指标ID: 保留天数}"""
+        with self._lock:
+            return {
+                metric_id: metric["retention_days"]
+                for metric_id, metric in self._metrics.items()
+                if metric["retention_days"] is not None
+            }
+
+    def purge_metric_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """删除早于 before 的明细数据，返回删除的记录数（有序数组直接截断头部，batch_size 不起作用）"""
+        with self._lock:
+            if metric_id is not None:
+                metric_ids = [metric_id]
+            else:
+                metric_ids = [
+                    current_id for current_id, metric in self._metrics.items()
+                    if metric["retention_days"] is None
+                ]
+            deleted = 0
+            for current_id in metric_ids:
+                series = self._values.get(current_id)
+                if not series:
+                    continue
+                cut = bisect.bisect_left(series, (before,))
+                del series[:cut]
+                deleted += cut
+            return deleted
+
+    def purge_value_dedup_keys(self, before: datetime, batch_size: int = 5000) -> int:
+        """删除早于 before 登记的指标值去重键，返回删除的键数量"""
+        with self._lock:
+            expired = [ident for ident, (_, _, created_at) in self._dedup_keys.items() if created_at < before]
+            for ident in expired:
+                del self._dedup_keys[ident]
+            return len(expired)
+
+    # ==================== 设施相关操作 ====================
+
+    def create_facility(
+        self,
+        name: str,
+        facility_type: str,
+        parent_id: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """创建设施（由父设施的物化路径推导自身路径；父设施不存在时抛出 ValueError，对应数据库的外键约束）"""
+        facility_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+
+        with self._lock:
+            path, id_path, depth = name, f"/{facility_id}/", 0
+            if parent_id:
+                parent = self._facilities.get(parent_id)
+                if not parent:
+                    raise ValueError(f"父设施不存在：ID 为 {parent_id} 的设施未找到")
+                path = f"{parent['path']}/{name}"
+                id_path = f"{parent['id_path']}{facility_id}/"
+                depth = parent["depth"] + 1
+            # 与 DATETIME 列一致，存储精度为秒
+            stored_at = now.replace(microsecond=0).isoformat()
+            self._facilities[facility_id] = {
+                "id": facility_id,
+                "name": name,
+                "facility_type": facility_type,
+                "parent_id": parent_id,
+                "description": description,
+                "path": path,
+                "id_path": id_path,
+                "depth": depth,
+                "created_at": stored_at,
+                "updated_at": stored_at
+            }
+            self._facility_ids_by_name.setdefault(name, []).append(facility_id)
+            if parent_id:
+                self._children.setdefault(parent_id, set()).add(facility_id)
+
+        return {
+            "id": facility_id,
+            "name": name,
+            "facility_type": facility_type,
+            "parent_id": parent_id,
+            "description": description,
+            "path": path,
+            "id_path": id_path,
+            "depth": depth,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+
+    def get_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取设施"""
+        with self._lock:
+            facility = self._facilities.get(facility_id)
+            return dict(facility) if facility else None
+
+    def get_facility_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """根据名称获取设施"""
+        with self._lock:
+            facility_ids = self._facility_ids_by_name.get(name)
+            return dict(self._facilities[facility_ids[0]]) if facility_ids else None
+
+    def get_facilities_by_names(self, names: List[str]) -> List[Dict[str, Any]]:
+        """批量按名称获取设施（名称索引查找）"""
+        with self._lock:
+            return [
+                dict(self._facilities[facility_id])
+                for name in dict.fromkeys(names)
+                for facility_id in self._facility_ids_by_name.get(name, ())
+            ]
+
+    def get_all_facilities(self, facility_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取所有设施（字典保持插入顺序，即创建时间顺序）"""
+        with self._lock:
+            return [
+                dict(facility) for facility in self._facilities.values()
+                if not facility_type or facility["facility_type"] == facility_type
+            ]
+
+    def get_children(self, parent_id: str) -> List[Dict[str, Any]]:
+        """获取子设施列表"""
+        with self._lock:
+            children = [dict(self._facilities[child_id]) for child_id in self._children.get(parent_id, ())]
+        children.sort(key=lambda facility: facility["name"])
+        return children
+
+    def update_facility(
+        self,
+        facility_id: str,
+        name: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> bool:
+        """更新设施信息"""
+        if name is None and description is None:
+            return False
+
+        with self._lock:
+            facility = self._facilities.get(facility_id)
+            if not facility:
+                return False
+
+            if description is not None:
+                facility["description"] = description
+            facility["updated_at"] = datetime.utcnow().replace(microsecond=0).isoformat()
+
+            # 重命名时同步替换自身及所有后代物化路径中的前缀
+            old_name, old_path = facility["name"], facility["path"]
+            if name is not None and name != old_name:
+                facility["name"] = name
+                self._facility_ids_by_name[old_name].remove(facility_id)
+                if not self._facility_ids_by_name[old_name]:
+                    del self._facility_ids_by_name[old_name]
+                self._facility_ids_by_name.setdefault(name, []).append(facility_id)
+
+                new_path = old_path[:len(old_path) - len(old_name)] + name
+                for descendant_id in self._collect_subtree(facility_id):
+                    descendant = self._facilities[descendant_id]
+                    descendant["path"] = new_path + descendant["path"][len(old_path):]
+            return True
+
+    def delete_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """删除设施（级联删除子设施、指标及指标值）；释放数组的开销很小，返回的删除任务已完成"""
+        with self._lock:
+            facility = self._facilities.get(facility_id)
+            if not facility:
+                return None
+
+            metric_ids = []
+            for current_id in self._collect_subtree(facility_id):
+                current = self._facilities.pop(current_id)
+                same_name = self._facility_ids_by_name[current["name"]]
+                same_name.remove(current_id)
+                if not same_name:
+                    del self._facility_ids_by_name[current["name"]]
+                self._children.pop(current_id, None)
+                for metric_id in self._metric_ids_by_facility.pop(current_id, ()):
+                    self._metrics.pop(metric_id, None)
+                    metric_ids.append(metric_id)
+
+            if facility["parent_id"]:
+                self._children.get(facility["parent_id"], set()).discard(facility_id)
+            return self._complete_deletion_job("facility", facility_id, facility["path"], metric_ids)
+
+    def _collect_subtree(self, facility_id: str) -> List[str]:
+        """按层级顺序收集设施自身及所有后代的ID（调用方需持有锁）"""
+        result = [facility_id]
+        for current_id in result:
+            result.extend(self._children.get(current_id, ()))
+        return result
+
+    def build_facility_path(self, facility_id: str) -> str:
+        """获取设施路径（如：数据中心A/房间1/传感器X）"""
+        with self._lock:
+            facility = self._facilities.get(facility_id)
+            return facility["path"] if facility else ""
+
+    def get_facility_subtree(
+        self,
+        root_id: Optional[str] = None,
+        max_depth: Optional[int] = None,
+        root_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取设施子树
+
+        指定 root_id 时沿子设施索引遍历，否则读取全部设施；
+        root_type 只过滤起始节点的类型，max_depth 为相对起始节点的深度，结果按 depth、name 排序
+        """
+        with self._lock:
+            if root_id:
+                root = self._facilities.get(root_id)
+                if not root or (root_type and root["facility_type"] != root_type):
+                    return []
+                facility_ids = self._collect_subtree(root_id)
+                base_depth = root["depth"]
+            else:
+                facility_ids = list(self._facilities)
+                base_depth = 0
+            rows = [
+                dict(self._facilities[facility_id]) for facility_id in facility_ids
+                if max_depth is None or self._facilities[facility_id]["depth"] <= base_depth + max_depth
+            ]
+
+        rows.sort(key=lambda row: (row["depth"], row["name"]))
+        if root_type and not root_id:
+            # id_path 的第一段即所属根设施
+            root_ids = {
+                row["id"] for row in rows
+                if row["parent_id"] is None and row["facility_type"] == root_type
+            }
+            rows = [row for row in rows if row["id_path"].split("/")[1] in root_ids]
+        return rows
+
+    def get_root_facilities(self) -> List[Dict[str, Any]]:
+        """获取根设施（没有父设施的设施）"""
+        with self._lock:
+            roots = [dict(facility) for facility in self._facilities.values() if facility["parent_id"] is None]
+        roots.sort(key=lambda facility: facility["name"])
+        return roots
+
+    def create_facility_hierarchy(
+        self,
+        facilities: List[Dict[str, Any]],
+        metrics: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """在一次持锁期间批量创建设施层级及其指标（挂载点不存在时抛出 ValueError，整批不写入）"""
+        now = datetime.utcnow()
+        batch_ids = {facility["id"] for facility in facilities}
+
+        with self._lock:
+            anchors = {}
+            for facility in facilities:
+                parent_id = facility.get("parent_id")
+                if not parent_id or parent_id in batch_ids or parent_id in anchors:
+                    continue
+                parent = self._facilities.get(parent_id)
+                if not parent:
+                    raise ValueError(f"父设施不存在：ID 为 {parent_id} 的设施未找到")
+                anchors[parent_id] = (parent["path"], parent["id_path"], parent["depth"])
+            facility_rows, metric_rows = build_hierarchy_rows(facilities, metrics, anchors, now)
+            for metric in metric_rows:
+                if metric["facility_id"] not in batch_ids and metric["facility_id"] not in self._facilities:
+                    raise ValueError(f"关联的设施不存在：ID 为 {metric['facility_id']} 的设施未找到")
+
+            stored_at = now.replace(microsecond=0).isoformat()
+            for row in facility_rows:
+                self._facilities[row["id"]] = {**row, "created_at": stored_at, "updated_at": stored_at}
+                self._facility_ids_by_name.setdefault(row["name"], []).append(row["id"])
+                if row["parent_id"]:
+                    self._children.setdefault(row["parent_id"], set()).add(row["id"])
+            for row in metric_rows:
+                self._metrics[row["id"]] = {**row, "created_at": stored_at, "updated_at": stored_at}
+                self._metric_ids_by_facility.setdefault(row["facility_id"], set()).add(row["id"])
+                self._values[row["id"]] = []
+
+        return facility_rows, metric_rows
+
+    # ==================== 指标相关操作 ====================
+
+    def create_metric(
+        self,
+        name: str,
+        facility_id: str,
+        unit: Optional[str] = None,
+        data_type: str = "float",
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """创建指标（设施不存在时抛出 ValueError，对应数据库的外键约束）"""
+        metric_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        retention_days = retention_days or None
+
+        with self._lock:
+            if facility_id not in self._facilities:
+                raise ValueError(f"关联的设施不存在：ID 为 {facility_id} 的设施未找到")
+            stored_at = now.replace(microsecond=0).isoformat()
+            self._metrics[metric_id] = {
+                "id": metric_id,
+                "name": name,
+                "unit": unit,
+                "data_type": data_type,
+                "description": description,
+                "facility_id": facility_id,
+                "retention_days": retention_days,
+                "created_at": stored_at,
+                "updated_at": stored_at
+            }
+            self._metric_ids_by_facility.setdefault(facility_id, set()).add(metric_id)
+            self._values[metric_id] = []
+
+        return {
+            "id": metric_id,
+            "name": name,
+            "unit": unit,
+            "data_type": data_type,
+            "description": description,
+            "facility_id": facility_id,
+            "retention_days": retention_days,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+
+    def get_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取指标"""
+        with self._lock:
+            metric = self._metrics.get(metric_id)
+            return dict(metric) if metric else None
+
+    def get_metrics_by_ids(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标，返回 {指标ID: 指标} 映射"""
+        with self._lock:
+            return {
+                metric_id: dict(self._metrics[metric_id])
+                for metric_id in dict.fromkeys(metric_ids)
+                if metric_id in self._metrics
+            }
+
+    def get_metrics_by_facilities(self, facility_ids: List[str]) -> List[Dict[str, Any]]:
+        """批量获取多个设施的指标，按名称排序"""
+        with self._lock:
+            result = [
+                dict(self._metrics[metric_id])
+                for facility_id in dict.fromkeys(facility_ids)
+                for metric_id in self._metric_ids_by_facility.get(facility_id, ())
+            ]
+        result.sort(key=lambda metric: metric["name"])
+        return result
+
+    def get_metrics_by_facility(self, facility_id: str) -> List[Dict[str, Any]]:
+        """获取设施的所有指标"""
+        return self.get_metrics_by_facilities([facility_id])
+
+    def get_all_metrics(self) -> List[Dict[str, Any]]:
+        """获取所有指标（字典保持插入顺序，即创建时间顺序）"""
+        with self._lock:
+            return [dict(metric) for metric in self._metrics.values()]
+
+    def update_metric(
+        self,
+        metric_id: str,
+        name: Optional[str] = None,
+        unit: Optional[str] = None,
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
+    ) -> bool:
+        """更新指标信息（retention_days 为 0 表示恢复使用全局保留策略）"""
+        updates = {
+            key: value for key, value in (("name", name), ("unit", unit), ("description", description))
+            if value is not None
+        }
+        if retention_days is not None:
+            updates["retention_days"] = retention_days or None
+        if not updates:
+            return False
+
+        with self._lock:
+            metric = self._metrics.get(metric_id)
+            if not metric:
+                return False
+            metric.update(updates)
+            metric["updated_at"] = datetime.utcnow().replace(microsecond=0).isoformat()
+            return True
+
+    def delete_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """删除指标及其指标值，返回已完成的删除任务"""
+        with self._lock:
+            metric = self._metrics.pop(metric_id, None)
+            if not metric:
+                return None
+            self._metric_ids_by_facility.get(metric["facility_id"], set()).discard(metric_id)
+            return self._complete_deletion_job("metric", metric_id, metric["name"], [metric_id])
+
+    # ==================== 后台删除任务 ====================
+
+    def _complete_deletion_job(
+        self,
+        target_type: str,
+        target_id: str,
+        target_name: str,
+        metric_ids: List[str]
+    ) -> Dict[str, Any]:
+        """立即释放指标的时序数组并记录一个已完成的删除任务（调用方需持有锁）"""
+        now = datetime.utcnow()
+        job = new_deletion_job(str(uuid.uuid4()), target_type, target_id, target_name, 0, now)
+        job["metrics_total"] = job["metrics_done"] = len(metric_ids)
+        job["rows_deleted"] = sum(len(self._values.pop(metric_id, ())) for metric_id in metric_ids)
+        self._deletion_jobs[job["id"]] = job
+        return dict(job)
+
+    def get_deletion_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取删除任务"""
+        with self._lock:
+            job = self._deletion_jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_active_deletion_jobs(self) -> List[Dict[str, Any]]:
+        """内存后端的删除任务在删除时即已完成"""
+        return []
+
+    def purge_deletion_job(self, job_id: str, batch_size: int = DELETION_BATCH_SIZE) -> bool:
+        """内存后端没有需要后台清理的数据"""
+        return False
+
+    # ==================== 指标值相关操作 ====================
+
+    def create_metric_values(self, values: List[Dict[str, Any]], skip_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量创建指标值记录
+
+        整批先完成编码与校验再写入，任一指标不存在时整批不写入（与数据库事务一致）；
+        按时间顺序到达的数据直接追加到数组末尾，乱序数据二分插入；去重键已登记过的记录
+        （skip_existing 时还有相同时间下 ID 已存在的记录）不写入，返回原记录
+        """
+        now = datetime.utcnow()
+        rows = []
+        results = []
+        for item in values:
+            data_type = item.get("data_type", "float")
+            value_num, value_text = encode_metric_value(item["value"], data_type)
+            # 时间有序 ID：新记录追加在主键索引末尾，避免随机插入导致的页分裂
+            value_id = item.get("id") or str(uuid7())
+            # 时间精度统一为秒，与数据库后端一致
+            timestamp = parse_timestamp(item.get("timestamp") or now).replace(microsecond=0)
+            rows.append((item["metric_id"], (timestamp, value_id, value_num, value_text)))
+            results.append({
+                "id": value_id,
+                "metric_id": item["metric_id"],
+                "value": decode_metric_value(value_num, value_text, data_type),
+                "timestamp": timestamp.isoformat()
+            })
+        if not rows:
+            return []
+
+        first, repeats = index_dedup_keys(values)
+        with self._lock:
+            for metric_id, _ in rows:
+                if metric_id not in self._values:
+                    raise ValueError(f"指标不存在：ID 为 {metric_id} 的指标未找到")
+            stored = {}
+            if skip_existing:
+                for index, (metric_id, entry) in enumerate(rows):
+                    if not values[index].get("id"):
+                        continue
+                    series = self._values[metric_id]
+                    position = bisect.bisect_left(series, entry[:2])
+                    if position < len(series) and series[position][:2] == entry[:2]:
+                        stored[index] = (entry[1], entry[0])
+                first = {ident: index for ident, index in first.items() if index not in stored}
+            for ident, index in first.items():
+                if ident in self._dedup_keys:
+                    stored[index] = self._dedup_keys[ident][:2]
+                else:
+                    timestamp, value_id = rows[index][1][:2]
+                    self._dedup_keys[ident] = (value_id, timestamp, now)
+            skipped = mark_duplicates(results, stored, repeats)
+            for index, (metric_id, entry) in enumerate(rows):
+                if index in skipped:
+                    continue
+                series = self._values[metric_id]
+                if not series or entry > series[-1]:
+                    series.append(entry)
+                else:
+                    bisect.insort(series, entry)
+
+        return results
+
+    def get_metric_values(
+        self,
+        metric_id: str,
+        limit: int = 100,
+        offset: int = 0,
+        before_timestamp: Optional[datetime] = None,
+        before_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """获取指标的历史值（按时间倒序，键集分页位置通过二分查找定位）"""
+        with self._lock:
+            metric = self._metrics.get(metric_id)
+            series = self._values.get(metric_id)
+            if not metric or not series:
+                return []
+            end = len(series)
+            if before_timestamp is not None:
+                # 较短的元组小于以其为前缀的元组，定位到第一个不小于分页位置的记录
+                position = (before_timestamp, before_id) if before_id is not None else (before_timestamp,)
+                end = bisect.bisect_left(series, position)
+            end -= offset
+            start = max(end - limit, 0)
+            entries = series[start:end] if end > 0 else []
+            data_type = metric["data_type"]
+
+        return [self._value_row(metric_id, entry, data_type) for entry in reversed(entries)]
+
+    def iter_metric_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = EXPORT_BATCH_SIZE
+    ) -> Iterator[List[Tuple[str, datetime, Optional[float], Optional[str]]]]:
+        """
+        按 (timestamp, id) 升序逐批读取 [start, end) 范围内的明细数据
+
+        每批只在持锁期间复制一段数组，批与批之间按上一批最后的 (timestamp, id) 重新二分定位，
+        迭代期间的并发写入不会导致重复或遗漏已有记录
+        """
+        position: Tuple = (start,) if start is not None else ()
+        while True:
+            with self._lock:
+                series = self._values.get(metric_id)
+                if not series:
+                    return
+                begin = bisect.bisect_right(series, position) if position else 0
+                stop = len(series) if end is None else bisect.bisect_left(series, (end,))
+                entries = series[begin:min(begin + batch_size, stop)]
+            if not entries:
+                return
+            yield [(entry[1], entry[0], entry[2], entry[3]) for entry in entries]
+            position = entries[-1]
+
+    def get_latest_metric_values(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标的最新值（有序数组末尾），没有数据的指标不在结果中"""
+        result = {}
+        with self._lock:
+            for metric_id in dict.fromkeys(metric_ids):
+                series = self._values.get(metric_id)
+                if series:
+                    result[metric_id] = self._value_row(
+                        metric_id, series[-1], self._metrics[metric_id]["data_type"]
+                    )
+        return result
+
+    def aggregate_metric_values(
+        self,
+        metric_id: str,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """按时间桶聚合指标值（时间范围为 [start, end)），二分定位范围后单次扫描"""
+        with self._lock:
+            series = self._values.get(metric_id) or []
+            entries = series[bisect.bisect_left(series, (start,)):bisect.bisect_left(series, (end,))]
+
+        buckets: Dict[int, Dict[str, Any]] = {}
+        for timestamp, _, value_num, _ in entries:
+            bucket_index = int((timestamp - EPOCH).total_seconds()) // bucket_seconds
+            bucket = buckets.get(bucket_index)
+            if bucket is None:
+                bucket = buckets[bucket_index] = {
+                    "bucket_index": bucket_index, "count": 0, "count_num": 0, "sum": None, "min": None, "max": None
+                }
+            bucket["count"] += 1
+            if value_num is not None:
+                bucket["count_num"] += 1
+                bucket["sum"] = value_num if bucket["sum"] is None else bucket["sum"] + value_num
+                bucket["min"] = value_num if bucket["min"] is None else min(bucket["min"], value_num)
+                bucket["max"] = value_num if bucket["max"] is None else max(bucket["max"], value_num)
+
+        return [self._convert_bucket_row(buckets[index], bucket_seconds) for index in sorted(buckets)]
+
+    def _value_row(
+        self,
+        metric_id: str,
+        entry: Tuple[datetime, str, Optional[float], Optional[str]],
+        data_type: str
+    ) -> Dict[str, Any]:
+        """将数组中的记录转换为与数据库后端相同的指标值行"""
+        timestamp, value_id, value_num, value_text = entry
+        return {
+            "id": value_id,
+            "metric_id": metric_id,
+            "timestamp": timestamp.isoformat(),
+            "value": decode_metric_value(value_num, value_text, data_type)
+        }
@@ -0,0 +1,26 @@
+"""
+UUID 列迁移脚本
+将旧版 MySQL 表中 VARCHAR(36) 的 UUID 主键与外键分批回填到 BINARY(16) 影子列，
+可在旧版本服务运行期间执行（可中断后重复执行），升级后启动时的结构迁移只需交换列
+
+用法：python migrate_ids.py [--batch-size 5000]
+"""
+import argparse
+
+from storage import create_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分批回填 BINARY(16) 的 UUID 影子列")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批回填的行数")
+    args = parser.parse_args()
+
+    # 不执行结构迁移：之后的迁移版本依赖已完成交换的 BINARY(16) 列
+    db = create_storage()
+
+    backfilled = db.backfill_binary_ids(batch_size=args.batch_size)
+    print(f"回填完成，共回填 {backfilled} 行")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+指标值迁移脚本
+将旧版 metric_values.value（TEXT）中的数据分批迁移到类型化的 value_num / value_text 列
+
+用法：python migrate_values.py [--batch-size 5000]
+"""
+import argparse
+
+from storage import create_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移旧版 TEXT 类型的指标值到类型化列")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批迁移的记录数")
+    args = parser.parse_args()
+
+    db = create_storage()
+    db.migrate()
+
+    migrated = db.migrate_legacy_values(batch_size=args.batch_size)
+    print(f"迁移完成，共迁移 {migrated} 条指标值记录")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,6 +61,7 @@ class MetricBase(BaseModel):
     unit: Optional[str] = Field(None, description="指标单位")
     data_type: str = Field(default="float", description="数据类型：float, int, string, bool")
     description: Optional[str] = Field(None, description="指标描述")
+    retention_days: Optional[int] = Field(None, ge=0, description="明细数据保留天数，为空则使用全局保留策略")
 
 
 class MetricCreate(MetricBase):
@@ -73,6 +74,7 @@ class MetricUpdate(BaseModel):
     name: Optional[str] = None
     unit: Optional[str] = None
     description: Optional[str] = None
+    retention_days: Optional[int] = Field(None, ge=0, description="明细数据保留天数，0 表示恢复使用全局保留策略")
 
 
 class MetricResponse(MetricBase):
@@ -86,11 +88,45 @@ class MetricResponse(MetricBase):
         from_attributes = True
 
 
+class FacilityImportMetric(MetricBase):
+    """批量导入中挂在设施下的指标"""
+    pass
+
+
+class FacilityImportNode(BaseModel):
+    """批量导入的设施节点（可嵌套子设施与指标）"""
+    name: str = Field(..., description="设施名称")
+    facility_type: FacilityType = Field(..., description="设施类型")
+    description: Optional[str] = Field(None, description="设施描述")
+    metrics: List[FacilityImportMetric] = Field(default_factory=list, description="该设施的指标列表")
+    children: List["FacilityImportNode"] = Field(default_factory=list, description="子设施列表")
+
+
+class FacilityImportRequest(BaseModel):
+    """批量导入设施层级的请求模型"""
+    parent_id: Optional[uuid.UUID] = Field(None, description="挂载点设施ID，为空则导入为顶级设施")
+    facilities: List[FacilityImportNode] = Field(..., min_length=1, description="要导入的设施树列表")
+
+
+class FacilityImportResponse(BaseModel):
+    """批量导入设施层级的响应模型"""
+    facilities_created: int = Field(..., description="创建的设施数量")
+    metrics_created: int = Field(..., description="创建的指标数量")
+    facilities: List[FacilityResponse] = Field(default_factory=list, description="创建的设施（父设施在前）")
+    metrics: List[MetricResponse] = Field(default_factory=list, description="创建的指标")
+
+
 class MetricValueCreate(BaseModel):
     """创建指标值的请求模型"""
     metric_id: uuid.UUID = Field(..., description="指标ID")
     value: str = Field(..., description="指标值")
     timestamp: Optional[datetime] = Field(None, description="时间戳，默认为当前时间")
+    idempotency_key: Optional[str] = Field(
+        None,
+        min_length=1,
+        max_length=128,
+        description="幂等键（可选）：同一指标下以相同幂等键重复提交时只写入一次，返回首次写入的记录"
+    )
 
 
 class MetricValueResponse(BaseModel):
@@ -104,6 +140,132 @@ class MetricValueResponse(BaseModel):
         from_attributes = True
 
 
+class MetricValueCreatedResponse(MetricValueResponse):
+    """记录指标值的响应模型"""
+    duplicate: bool = Field(False, description="是否为重复提交：为 true 时未写入新记录，返回的是首次写入的记录")
+
+
+class MetricValueAcceptedResponse(BaseModel):
+    """写缓冲模式下指标值已进入写入队列（或数据库不可用时已写入落盘缓冲）的响应模型"""
+    metric_id: uuid.UUID = Field(..., description="指标ID")
+    value: str = Field(..., description="指标值")
+    timestamp: datetime = Field(..., description="记录时间（未指定时为服务端接收时间）")
+    queued: int = Field(..., description="当前写入队列（或落盘缓冲）中等待写入的记录数")
+
+
+class MetricValueBatchCreate(BaseModel):
+    """批量创建指标值的请求模型"""
+    items: List[MetricValueCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=10000,
+        description="指标值列表（单次最多 10000 条）"
+    )
+
+
+class MetricValueBatchItemResult(BaseModel):
+    """批量写入中单条记录的处理结果"""
+    index: int = Field(..., description="该记录在请求列表中的下标")
+    success: bool = Field(..., description="是否写入成功")
+    id: Optional[uuid.UUID] = Field(None, description="写入成功时的记录ID")
+    duplicate: bool = Field(False, description="是否为重复提交（未写入新记录，id 为首次写入的记录）")
+    error: Optional[str] = Field(None, description="写入失败时的错误信息")
+
+
+class MetricValueBatchResponse(BaseModel):
+    """批量创建指标值的响应模型"""
+    total: int = Field(..., description="请求记录总数")
+    succeeded: int = Field(..., description="写入成功数量")
+    failed: int = Field(..., description="写入失败数量")
+    duplicates: int = Field(0, description="成功记录中重复提交的数量（未写入新记录）")
+    results: List[MetricValueBatchItemResult] = Field(default_factory=list, description="逐条处理结果")
+
+
+class MetricLatestQuery(BaseModel):
+    """批量查询指标最新值的请求模型"""
+    metric_ids: List[uuid.UUID] = Field(
+        ...,
+        min_length=1,
+        max_length=50000,
+        description="指标ID列表（单次最多 50000 个）"
+    )
+
+
+class ColumnarExportFormat(str, Enum):
+    """列式导出格式枚举"""
+    ARROW = "arrow"  # Arrow IPC 流
+    PARQUET = "parquet"
+
+
+class MetricColumnarExportQuery(BaseModel):
+    """多指标列式导出的请求模型（metric_ids 与 facility_id 二选一）"""
+    metric_ids: Optional[List[uuid.UUID]] = Field(
+        None,
+        min_length=1,
+        max_length=10000,
+        description="指标ID列表（单次最多 10000 个）"
+    )
+    facility_id: Optional[uuid.UUID] = Field(None, description="设施ID，导出该设施及其所有后代设施的全部指标")
+    start: Optional[datetime] = Field(None, description="起始时间（含），默认不限")
+    end: Optional[datetime] = Field(None, description="结束时间（不含），默认不限")
+    format: ColumnarExportFormat = Field(ColumnarExportFormat.ARROW, description="导出格式：arrow 或 parquet")
+
+
+class AggregateFunction(str, Enum):
+    """指标值聚合函数枚举"""
+    AVG = "avg"
+    MIN = "min"
+    MAX = "max"
+    SUM = "sum"
+    COUNT = "count"
+
+
+class MetricAggregatePoint(BaseModel):
+    """时间桶聚合结果中的一个数据点"""
+    timestamp: datetime = Field(..., description="时间桶起始时间")
+    avg: Optional[float] = Field(None, description="平均值（只计有数值的记录）")
+    min: Optional[float] = Field(None, description="最小值")
+    max: Optional[float] = Field(None, description="最大值")
+    sum: Optional[float] = Field(None, description="求和")
+    count: Optional[int] = Field(None, description="记录数")
+
+
+class MetricAggregateResponse(BaseModel):
+    """指标值时间桶聚合响应模型"""
+    metric_id: uuid.UUID = Field(..., description="指标ID")
+    start: datetime = Field(..., description="查询起始时间（含）")
+    end: datetime = Field(..., description="查询结束时间（不含）")
+    bucket: str = Field(..., description="时间桶大小，如 5m")
+    bucket_seconds: int = Field(..., description="时间桶大小（秒）")
+    functions: List[AggregateFunction] = Field(..., description="聚合函数列表")
+    points: List[MetricAggregatePoint] = Field(default_factory=list, description="聚合数据点（仅包含有数据的时间桶）")
+
+
+class DeletionJobStatus(str, Enum):
+    """删除任务状态枚举"""
+    PENDING = "pending"  # 等待后台清理
+    RUNNING = "running"  # 清理中
+    COMPLETED = "completed"  # 已完成
+
+
+class DeletionJobResponse(BaseModel):
+    """删除任务响应模型"""
+    id: uuid.UUID = Field(..., description="删除任务ID")
+    target_type: str = Field(..., description="删除对象类型：facility 或 metric")
+    target_id: uuid.UUID = Field(..., description="被删除的设施或指标ID")
+    target_name: str = Field(..., description="被删除对象的路径或名称")
+    status: DeletionJobStatus = Field(..., description="任务状态")
+    metrics_total: int = Field(..., description="需要清理数据的指标数量")
+    metrics_done: int = Field(..., description="已清理完成的指标数量")
+    rows_deleted: int = Field(..., description="已删除的明细与汇总行数")
+    created_at: datetime = Field(..., description="创建时间")
+    updated_at: datetime = Field(..., description="最近进度更新时间")
+    finished_at: Optional[datetime] = Field(None, description="完成时间")
+
+    class Config:
+        from_attributes = True
+
+
 class TreeQueryParams(BaseModel):
     """树形查询参数"""
     root_id: Optional[uuid.UUID] = Field(None, description="根节点ID，为空则查询所有")
@@ -113,3 +275,4 @@ class TreeQueryParams(BaseModel):
 
 # 更新前向引用
 FacilityTreeResponse.model_rebuild()
+FacilityImportNode.model_rebuild()
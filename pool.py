@@ -0,0 +1,248 @@
+"""
+连接池层
+线程安全的数据库连接池：可配置容量、有界等待队列、连接校验与回收，并导出运行统计
+"""
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import bisect
+import threading
+import time
+
+
+# 等待时间直方图的桶上界（毫秒）
+WAIT_HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolError(Exception):
+    """连接池错误基类"""
+
+
+class PoolTimeoutError(PoolError):
+    """等待空闲连接超时"""
+
+
+class PoolQueueFullError(PoolError):
+    """等待队列已满，请求被立即拒绝"""
+
+
+class ConnectionPool:
+    """
+    数据库连接池
+
+    - 连接按需创建，最多 max_size 个；空闲连接最少保留 min_size 个，多余的空闲超过 idle_timeout 后关闭
+    - 连接全部占用时调用方进入等待队列，最多 max_waiters 个等待者，等待超过 timeout 秒抛出 PoolTimeoutError
+    - 取出空闲连接时，存活超过 recycle 秒的连接会被重建，空闲超过 validate_after 秒的连接会先 ping 校验
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 5.0,
+        max_waiters: int = 32,
+        recycle: float = 3600.0,
+        validate_after: float = 30.0,
+        idle_timeout: float = 300.0
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("连接池容量配置无效：需满足 0 <= min_size <= max_size 且 max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self.recycle = recycle
+        self.validate_after = validate_after
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # 空闲连接：(连接, 创建时间, 最近归还时间)，后进先出，长期空闲的连接沉在队首
+        self._idle: Deque[Tuple[Any, float, float]] = deque()
+        self._created_at: Dict[int, float] = {}
+        self._size = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+
+        self._wait_histogram = [0] * (len(WAIT_HISTOGRAM_BUCKETS_MS) + 1)
+        self._wait_time_total = 0.0
+        self._counters = {
+            "acquired": 0,
+            "created": 0,
+            "recycled": 0,
+            "invalidated": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "rejected": 0
+        }
+
+    def prewarm(self):
+        """预先创建 min_size 个连接"""
+        connections = []
+        try:
+            for _ in range(self.min_size - self._size):
+                connections.append(self.acquire())
+        finally:
+            for conn in connections:
+                self.release(conn)
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """获取一个连接，必要时等待；连接使用完毕后必须调用 release 归还"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._available:
+            while True:
+                if self._closed:
+                    raise PoolError("连接池已关闭")
+                if self._idle:
+                    conn, created_at, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                if self._waiters >= self.max_waiters:
+                    self._counters["rejected"] += 1
+                    raise PoolQueueFullError(
+                        f"数据库繁忙：连接池已满且等待队列已达上限（{self.max_waiters}）"
+                    )
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeoutError(f"数据库繁忙：等待数据库连接超过 {timeout} 秒")
+                self._waiters += 1
+                try:
+                    self._available.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+        # 建立或校验连接时不持有锁
+        try:
+            if conn is None:
+                conn = self._create()
+            else:
+                conn = self._check_idle(conn, created_at, last_used)
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self._counters["acquired"] += 1
+            self._wait_time_total += waited
+            self._wait_histogram[bisect.bisect_left(WAIT_HISTOGRAM_BUCKETS_MS, waited * 1000)] += 1
+        return conn
+
+    def release(self, conn: Any, discard: bool = False):
+        """归还连接；discard 为 True 或连接已断开时直接关闭，不再复用"""
+        now = time.monotonic()
+        if not discard:
+            try:
+                discard = not conn.is_connected()
+            except Exception:
+                discard = True
+
+        to_close: List[Any] = []
+        with self._available:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self._created_at.pop(id(conn), None)
+                self._counters["discarded"] += 1
+                to_close.append(conn)
+            else:
+                self._idle.append((conn, self._created_at.get(id(conn), now), now))
+                # 收缩：空闲过久且超出最小容量的连接
+                while self._size > self.min_size and self._idle and now - self._idle[0][2] > self.idle_timeout:
+                    expired, _, _ = self._idle.popleft()
+                    self._size -= 1
+                    self._created_at.pop(id(expired), None)
+                    to_close.append(expired)
+            self._available.notify()
+
+        for expired in to_close:
+            self._close_quietly(expired)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """获取连接的上下文管理器，退出时自动归还"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """导出连接池运行统计"""
+        with self._lock:
+            histogram = {
+                f"le_{bound}ms": count
+                for bound, count in zip(WAIT_HISTOGRAM_BUCKETS_MS, self._wait_histogram)
+            }
+            histogram["gt_{}ms".format(WAIT_HISTOGRAM_BUCKETS_MS[-1])] = self._wait_histogram[-1]
+            acquired = self._counters["acquired"]
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "max_waiters": self.max_waiters,
+                "wait_time_avg_ms": round(self._wait_time_total / acquired * 1000, 3) if acquired else 0.0,
+                "wait_histogram": histogram,
+                **{f"{name}_total": value for name, value in self._counters.items()}
+            }
+
+    def close(self):
+        """关闭连接池及所有空闲连接，使用中的连接在归还时关闭"""
+        with self._available:
+            self._closed = True
+            idle = [conn for conn, _, _ in self._idle]
+            self._size -= len(idle)
+            self._idle.clear()
+            self._available.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def _create(self) -> Any:
+        conn = self._connect()
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            self._counters["created"] += 1
+        return conn
+
+    def _check_idle(self, conn: Any, created_at: float, last_used: float) -> Any:
+        """取出空闲连接时按需回收或校验，失效时重建"""
+        now = time.monotonic()
+        if now - created_at > self.recycle:
+            reason = "recycled"
+        elif now - last_used <= self.validate_after:
+            return conn
+        else:
+            try:
+                conn.ping(reconnect=False)
+                return conn
+            except Exception:
+                reason = "invalidated"
+
+        with self._lock:
+            self._counters[reason] += 1
+            self._created_at.pop(id(conn), None)
+        self._close_quietly(conn)
+        return self._create()
+
+    @staticmethod
+    def _close_quietly(conn: Any):
+        try:
+            conn.close()
+        except Exception:
+            pass
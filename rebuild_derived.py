@@ -0,0 +1,27 @@
+"""
+派生表重建脚本
+根据 metric_values 明细数据重建 1m / 1h / 1d 汇总表和指标最新值表，用于历史数据回填
+
+用法：python rebuild_derived.py [--metric-id <指标ID>]
+"""
+import argparse
+
+from storage import create_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="根据明细数据重建指标值汇总表和最新值表")
+    parser.add_argument("--metric-id", default=None, help="只重建指定指标，默认重建全部指标")
+    args = parser.parse_args()
+
+    db = create_storage()
+    db.migrate()
+
+    db.rebuild_rollups(metric_id=args.metric_id)
+    print("汇总表重建完成")
+    db.rebuild_latest(metric_id=args.metric_id)
+    print("最新值表重建完成")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+数据保留层
+按全局及单个指标的保留天数清理过期的指标明细数据与压缩块，并维护按月分区与指标值去重键
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+import os
+
+from background import BackgroundManager
+from storage import Storage, PARTITION_PREMAKE_MONTHS, DEDUP_WINDOW_HOURS
+
+
+class RetentionManager(BackgroundManager):
+    """
+    指标明细数据保留管理类
+
+    - 分区表：预建未来分区；整个分区都超出保留期时直接 DROP PARTITION
+    - 分区无法覆盖的部分（未分区表、单独配置了较短保留天数的指标）分批 DELETE
+    - 压缩块不分区，最后一条记录超出保留期的块整块删除
+    - 汇总表不受影响，明细过期后仍可查询长期聚合数据
+    - 登记超过去重窗口的指标值去重键分批删除，去重键表的大小只与窗口内的写入量有关
+    """
+
+    name = "Retention"
+
+    def __init__(
+        self,
+        db: Storage,
+        retention_days: Optional[int] = None,
+        premake_months: int = PARTITION_PREMAKE_MONTHS,
+        batch_size: int = 5000,
+        dedup_window_hours: Optional[float] = None
+    ):
+        super().__init__()
+        self.db = db
+        # 全局保留天数，0 表示永久保留
+        if retention_days is None:
+            retention_days = int(os.getenv("METRIC_RETENTION_DAYS", "0"))
+        self.retention_days = retention_days
+        self.premake_months = premake_months
+        self.batch_size = batch_size
+        # 去重键保留时长（小时），窗口内以相同去重键重试不会重复写入
+        if dedup_window_hours is None:
+            dedup_window_hours = float(os.getenv("VALUE_DEDUP_WINDOW_HOURS", str(DEDUP_WINDOW_HOURS)))
+        self.dedup_window_hours = dedup_window_hours
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """执行一轮分区维护与过期数据清理，返回执行摘要；stop() 后在当前指标清理完时返回"""
+        now = now or datetime.utcnow()
+        summary = {
+            "created_partitions": self.db.ensure_metric_value_partitions(self.premake_months),
+            "dropped_partitions": [],
+            "deleted_rows": 0,
+            "expired_dedup_keys": self.db.purge_value_dedup_keys(
+                now - timedelta(hours=self.dedup_window_hours),
+                batch_size=self.batch_size
+            )
+        }
+
+        overrides = self.db.get_metric_retention_overrides()
+        if self.retention_days:
+            # 整个分区只有在超出所有指标的保留期后才能删除
+            horizon = max([self.retention_days] + list(overrides.values()))
+            summary["dropped_partitions"] = self.db.drop_metric_value_partitions(
+                now - timedelta(days=horizon)
+            )
+            if not self.db.metric_values_partitioned or horizon > self.retention_days:
+                summary["deleted_rows"] += self.db.purge_metric_values(
+                    now - timedelta(days=self.retention_days),
+                    batch_size=self.batch_size
+                )
+            summary["deleted_rows"] += self.db.purge_compressed_values(
+                now - timedelta(days=self.retention_days),
+                batch_size=self.batch_size
+            )
+
+        for metric_id, days in overrides.items():
+            if self.stopping:
+                break
+            summary["deleted_rows"] += self.db.purge_metric_values(
+                now - timedelta(days=days),
+                metric_id=metric_id,
+                batch_size=self.batch_size
+            )
+            summary["deleted_rows"] += self.db.purge_compressed_values(
+                now - timedelta(days=days),
+                metric_id=metric_id,
+                batch_size=self.batch_size
+            )
+
+        return summary
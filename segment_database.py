@@ -0,0 +1,292 @@
+"""
+分段存储数据库层
+边缘部署使用的存储后端：设施、指标、删除任务等元数据保存在 SQLite 中，
+数值型指标的时序数据保存在按指标划分的追加写分段文件中（见 segments.py），文本型指标仍写入 SQLite
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+import os
+
+from segments import SegmentStore, SEGMENT_MAX_RECORDS, SEGMENT_UNSORTED_MAX_RECORDS, SEGMENT_MAX_PARTIAL
+from sqlite_database import SQLiteDatabase, _format_timestamp
+from storage import (
+    BATCH_CHUNK_SIZE, EPOCH, EXPORT_BATCH_SIZE, DELETION_BATCH_SIZE, NUMERIC_DATA_TYPES,
+    index_dedup_keys, mark_duplicates, parse_timestamp, merge_bucket_row,
+    encode_metric_value, decode_metric_value
+)
+
+
+def _to_seconds(value: datetime) -> int:
+    """将时间转换为 UTC 纪元秒数（向下取整）"""
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+def _ceil_seconds(value: datetime) -> int:
+    """将时间转换为 UTC 纪元秒数（向上取整），用于 [start, end) 范围的边界"""
+    return -((EPOCH - value) // timedelta(seconds=1))
+
+
+def _from_seconds(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class SegmentDatabase(SQLiteDatabase):
+    """
+    数据库管理类（SQLite + 分段文件存储后端）
+
+    - 数值型指标的写入追加到分段文件；去重键仍登记在 SQLite 中，查询、追加与登记在同一个写事务中完成，
+      写事务的写锁保证它们与其他写入串行
+    - 历史值分页、导出、聚合与最新值直接读取分段文件：最新值取自各段末尾，聚合扫描映射内存，不使用汇总表
+    - 迟到和时钟偏差造成的乱序写入进入每个指标唯一的乱序缓冲，写满后封存为有序段，未写满的段数有上限
+    - 数据保留按整段删除（段内最后一条记录过期后），删除指标时删除其全部分段文件
+    - 同时包含数值型和文本型指标的批量写入分两部分提交，不在同一个事务中
+    """
+
+    def __init__(self, path: str = None, busy_timeout: float = None, data_dir: str = None):
+        super().__init__(path, busy_timeout)
+        self.segments = SegmentStore(
+            data_dir or os.getenv("SEGMENT_DATA_DIR", "segments"),
+            max_records=int(os.getenv("SEGMENT_MAX_RECORDS", str(SEGMENT_MAX_RECORDS))),
+            fsync=os.getenv("SEGMENT_FSYNC", "false").lower() in ("1", "true", "yes", "on"),
+            unsorted_max_records=int(os.getenv("SEGMENT_UNSORTED_MAX_RECORDS", str(SEGMENT_UNSORTED_MAX_RECORDS))),
+            max_partial=int(os.getenv("SEGMENT_MAX_PARTIAL", str(SEGMENT_MAX_PARTIAL)))
+        )
+
+    def close(self):
+        """释放连接池与分段文件映射"""
+        super().close()
+        self.segments.close()
+
+    def _segmented_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """指标存在且为数值型时返回指标，其时序数据保存在分段文件中"""
+        metric = self.get_metric(metric_id)
+        if metric is not None and metric["data_type"] in NUMERIC_DATA_TYPES:
+            return metric
+        return None
+
+    # ==================== 数据保留与后台删除 ====================
+
+    def purge_metric_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """删除早于 before 的明细数据：SQLite 中的文本型记录分批删除，分段文件整段删除"""
+        deleted = super().purge_metric_values(before, metric_id=metric_id, batch_size=batch_size)
+        if metric_id is not None:
+            metrics = [metric for metric in [self._segmented_metric(metric_id)] if metric is not None]
+        else:
+            metrics = [
+                metric for metric in self.get_all_metrics()
+                if metric["data_type"] in NUMERIC_DATA_TYPES and metric["retention_days"] is None
+            ]
+        for metric in metrics:
+            deleted += self.segments.drop_before(metric["id"], _to_seconds(before))
+        return deleted
+
+    def purge_deletion_job(self, job_id: str, batch_size: int = DELETION_BATCH_SIZE) -> bool:
+        """清理删除任务中的下一批数据：先删除任务中下一个指标的全部分段文件，再分批清理 SQLite 中的数据"""
+        with self.get_conn(write=True) as conn:
+            row = conn.execute(
+                "SELECT metric_id FROM deletion_job_metrics WHERE job_id = ? LIMIT 1", (job_id,)
+            ).fetchone()
+            if row is not None:
+                deleted = self.segments.drop(row["metric_id"])
+                if deleted:
+                    conn.execute(
+                        "UPDATE deletion_jobs SET rows_deleted = rows_deleted + ? WHERE id = ?", (deleted, job_id)
+                    )
+        return super().purge_deletion_job(job_id, batch_size)
+
+    # ==================== 指标值相关操作 ====================
+
+    def create_metric_values(self, values: List[Dict[str, Any]], skip_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量创建指标值记录
+
+        数值型指标追加到分段文件，文本型指标按 SQLite 后端的方式写入；返回结果与输入顺序一致
+        """
+        numeric = [index for index, item in enumerate(values) if item.get("data_type", "float") in NUMERIC_DATA_TYPES]
+        if not numeric:
+            return super().create_metric_values(values, skip_existing)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(values)
+        text = [index for index, item in enumerate(values) if item.get("data_type", "float") not in NUMERIC_DATA_TYPES]
+        for indexes, write in ((text, super().create_metric_values), (numeric, self._append_values)):
+            if indexes:
+                for index, result in zip(indexes, write([values[index] for index in indexes], skip_existing)):
+                    results[index] = result
+        return results
+
+    def _append_values(self, values: List[Dict[str, Any]], skip_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        将数值型指标值追加到分段文件
+
+        记录 ID 由写入位置决定，因此在写事务中先查询已登记的去重键，只追加未重复的记录，再登记新的去重键。
+        调用方预先分配的 ID 无法作为记录 ID，未带去重键时改为以该 ID 登记去重键，
+        回放时与直接写入按去重键去重，skip_existing 不再需要单独处理
+        """
+        values = [
+            {**item, "dedup_key": "#" + item["id"]} if item.get("id") and item.get("dedup_key") is None else item
+            for item in values
+        ]
+        now = datetime.utcnow()
+        points = []
+        results = []
+        for item in values:
+            data_type = item.get("data_type", "float")
+            value_num, _ = encode_metric_value(item["value"], data_type)
+            # 时间精度统一为秒，与数据库后端一致
+            timestamp = parse_timestamp(item.get("timestamp") or now).replace(microsecond=0)
+            points.append((item["metric_id"], timestamp, value_num))
+            results.append({
+                "id": None,
+                "metric_id": item["metric_id"],
+                "value": decode_metric_value(value_num, None, data_type),
+                "timestamp": timestamp.isoformat()
+            })
+
+        first, repeats = index_dedup_keys(values)
+        with self.get_conn(write=True) as conn:
+            stored = self._find_dedup_keys(conn, first) if first else {}
+            skipped = set(stored) | set(repeats)
+            by_metric: Dict[str, List[int]] = {}
+            for index, (metric_id, _, _) in enumerate(points):
+                if index not in skipped:
+                    by_metric.setdefault(metric_id, []).append(index)
+            for metric_id, indexes in by_metric.items():
+                ids = self.segments.append(
+                    metric_id, [(_to_seconds(points[index][1]), points[index][2]) for index in indexes]
+                )
+                for index, value_id in zip(indexes, ids):
+                    results[index]["id"] = value_id
+            claims = [
+                (metric_id, key_hash, results[index]["id"], _format_timestamp(points[index][1]), _format_timestamp(now))
+                for (metric_id, key_hash), index in first.items()
+                if index not in stored
+            ]
+            if claims:
+                conn.executemany(
+                    """
+                    INSERT INTO metric_value_keys (metric_id, key_hash, value_id, timestamp, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    claims
+                )
+
+        mark_duplicates(results, stored, repeats)
+        return results
+
+    def _find_dedup_keys(self, conn, first: Dict[Tuple[str, bytes], int]) -> Dict[int, Tuple[str, datetime]]:
+        """查询本批中已登记过的去重键，返回 {下标: (原记录ID, 原记录时间)}"""
+        idents = list(first)
+        stored = {}
+        for start in range(0, len(idents), BATCH_CHUNK_SIZE):
+            chunk = idents[start:start + BATCH_CHUNK_SIZE]
+            placeholders = ", ".join(["(?, ?)"] * len(chunk))
+            rows = conn.execute(
+                f"""
+                SELECT metric_id, key_hash, value_id, timestamp FROM metric_value_keys
+                WHERE (metric_id, key_hash) IN (VALUES {placeholders})
+                """,
+                [param for ident in chunk for param in ident]
+            ).fetchall()
+            for row in rows:
+                index = first[(row["metric_id"], bytes(row["key_hash"]))]
+                stored[index] = (row["value_id"], parse_timestamp(row["timestamp"]))
+        return stored
+
+    def get_metric_values(
+        self,
+        metric_id: str,
+        limit: int = 100,
+        offset: int = 0,
+        before_timestamp: Optional[datetime] = None,
+        before_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """获取指标的历史值（按时间倒序，支持键集分页）；数值型指标在各段内二分定位分页位置"""
+        metric = self._segmented_metric(metric_id)
+        if metric is None:
+            return super().get_metric_values(metric_id, limit, offset, before_timestamp, before_id)
+
+        before_seconds = None
+        if before_timestamp is not None:
+            before_seconds = _to_seconds(before_timestamp)
+            if _from_seconds(before_seconds) != before_timestamp:
+                # 分页位置不是整秒时，该秒内的记录都早于分页位置
+                before_seconds, before_id = before_seconds + 1, None
+        records = self.segments.page(metric_id, limit + offset, before_seconds, before_id)
+        return [
+            self._segment_value_row(metric, value_id, seconds, value)
+            for value_id, seconds, value in records[offset:]
+        ]
+
+    def iter_metric_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = EXPORT_BATCH_SIZE
+    ) -> Iterator[List[Tuple[str, datetime, Optional[float], Optional[str]]]]:
+        """按 (timestamp, id) 升序逐批读取 [start, end) 范围内的明细数据；数值型指标直接读取分段文件，不占用数据库连接"""
+        if self._segmented_metric(metric_id) is None:
+            yield from super().iter_metric_values(metric_id, start, end, batch_size)
+            return
+
+        start_seconds = _ceil_seconds(start) if start is not None else None
+        end_seconds = _ceil_seconds(end) if end is not None else None
+        batch = []
+        for value_id, seconds, value in self.segments.scan(metric_id, start_seconds, end_seconds):
+            batch.append((value_id, _from_seconds(seconds), value, None))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def get_latest_metric_values(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标的最新值；数值型指标取各段末尾记录中最新的一条"""
+        metrics = self.get_metrics_by_ids(metric_ids)
+        segmented = {
+            metric_id for metric_id, metric in metrics.items() if metric["data_type"] in NUMERIC_DATA_TYPES
+        }
+        result = super().get_latest_metric_values(
+            [metric_id for metric_id in metric_ids if metric_id not in segmented]
+        )
+        for metric_id in segmented:
+            latest = self.segments.latest(metric_id)
+            if latest is not None:
+                result[metric_id] = self._segment_value_row(metrics[metric_id], *latest)
+        return result
+
+    def aggregate_metric_values(
+        self,
+        metric_id: str,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """按时间桶聚合指标值（时间范围为 [start, end)）；数值型指标在分段文件的映射内存上直接计算"""
+        if self._segmented_metric(metric_id) is None:
+            return super().aggregate_metric_values(metric_id, start, end, bucket_seconds)
+
+        merged: Dict[int, Dict[str, Any]] = {}
+        rows = self.segments.aggregate(
+            metric_id,
+            _ceil_seconds(start),
+            _ceil_seconds(end),
+            bucket_seconds
+        )
+        for row in rows:
+            merge_bucket_row(merged, self._convert_bucket_row(row, bucket_seconds))
+        return [merged[index] for index in sorted(merged)]
+
+    def _segment_value_row(self, metric: Dict[str, Any], value_id: str, seconds: int, value: float) -> Dict[str, Any]:
+        """将分段文件中的记录转换为与数据库后端相同的指标值行"""
+        return {
+            "id": value_id,
+            "metric_id": metric["id"],
+            "timestamp": _from_seconds(seconds).isoformat(),
+            "value": decode_metric_value(value, None, metric["data_type"])
+        }
@@ -0,0 +1,700 @@
+"""
+分段存储层
+按指标保存时序数据的追加写分段文件：每条记录为定长的 (时间戳秒数, 数值, 写入序号)，段内按时间有序，
+通过 mmap 读取并以稀疏时间索引二分定位；安装了 NumPy 时聚合与合并直接在映射内存上按列计算
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+
+try:
+    import numpy
+except ImportError:  # 可选依赖：未安装时聚合与合并逐条处理
+    numpy = None
+
+
+# 段文件格式版本号，写在文件头中，打开时校验
+SEGMENT_FORMAT_VERSION = 2
+SEGMENT_SUFFIX = ".seg"
+
+# 每个段文件的默认最大记录数（24 字节一条，约 24MB）
+SEGMENT_MAX_RECORDS = 1 << 20
+
+# 乱序缓冲的默认最大记录数，写满后排序封存为一个有序段
+SEGMENT_UNSORTED_MAX_RECORDS = 1 << 16
+
+# 每个指标未写满的有序段超过这个数量时合并
+SEGMENT_MAX_PARTIAL = 8
+
+# 稀疏时间索引的间隔：每隔这么多条记录在内存中保存一个时间戳
+INDEX_STRIDE = 1024
+
+# 文件头：魔数、格式版本号、段类型、段内最大写入序号，与记录等长
+_HEADER = struct.Struct("<6sHB7xQ")
+_MAGIC = b"MVSEG\x00"
+# 记录：时间戳（UTC 纪元秒数）、数值、写入序号（指标内唯一，决定记录 ID）
+_RECORD = struct.Struct("<qdQ")
+_TIMESTAMP = struct.Struct("<q")
+
+# 段类型：顺序追加段（时间不早于段内最后一条的写入）、有序段（封存或合并产生，只读）、乱序缓冲
+_KIND_APPEND = 0
+_KIND_SORTED = 1
+_KIND_UNSORTED = 2
+
+_UNSORTED_FILE = "unsorted" + SEGMENT_SUFFIX
+# 封存与合并的清单：先写清单再替换段文件，中途退出时下次打开按清单完成
+_MANIFEST_FILE = "manifest.json"
+_TEMP_SUFFIX = ".tmp"
+
+_SERIAL_MASK = (1 << 62) - 1
+
+if numpy is not None:
+    _RECORD_DTYPE = numpy.dtype([("timestamp", "<i8"), ("value", "<f8"), ("serial", "<u8")])
+
+
+def _series_node(metric_id: str) -> int:
+    """指标ID摘要的 12 位，写入记录 ID，降低不同指标的记录 ID 相同的概率"""
+    return int.from_bytes(hashlib.blake2b(metric_id.encode("ascii"), digest_size=2).digest(), "big") & 0xFFF
+
+
+def _value_id(node: int, seconds: int, serial: int) -> str:
+    """
+    由记录时间与写入序号生成确定性的 UUIDv8
+
+    高 48 位为记录时间的毫秒时间戳，其后依次为指标摘要和写入序号（62 位）；
+    同一指标内按字节序即按 (timestamp, 写入序号) 排序，与读取时的归并顺序一致，段封存或合并后不变
+    """
+    millis = (seconds * 1000) & ((1 << 48) - 1)
+    text = "%032x" % ((millis << 80) | (0x8 << 76) | (node << 64) | (0b10 << 62) | serial)
+    # 直接格式化，比构造 uuid.UUID 再转字符串快数倍，批量追加时每条记录都要生成
+    return f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}"
+
+
+def _value_serial(value_id: str) -> int:
+    """从记录 ID 中取出写入序号"""
+    return uuid.UUID(value_id).int & _SERIAL_MASK
+
+
+class _Segment:
+    """一个段文件：记录按 (时间戳, 写入序号) 排列（乱序缓冲除外），顺序追加段只在末尾追加"""
+
+    def __init__(self, path: str, sequence: int, kind: int):
+        self.path = path
+        self.sequence = sequence
+        self.kind = kind
+        self.count = 0
+        self.last_timestamp: Optional[int] = None
+        self.max_serial = -1
+        # 稀疏时间索引：index[k] 为第 k * INDEX_STRIDE 条记录的时间戳
+        self.index: List[int] = []
+        self._map: Optional[mmap.mmap] = None
+        self._mapped = 0
+
+    def buffer(self) -> mmap.mmap:
+        """
+        返回覆盖当前全部记录的只读映射
+
+        文件追加后重新映射；旧映射不主动关闭，仍在使用它的读取方（包括 NumPy 视图）可以继续读取，
+        不再被引用后自动释放
+        """
+        if self._map is None or self._mapped < self.count:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped = self.count
+        return self._map
+
+    def extend_index(self, points: Sequence[Tuple[int, float, int]]):
+        """登记即将追加在 count 之后的记录中位于索引间隔上的时间戳"""
+        first = -self.count % INDEX_STRIDE
+        self.index.extend(point[0] for point in points[first::INDEX_STRIDE])
+
+
+class _Series:
+    """一个指标的段集合：有序段与顺序追加段、当前追加段、乱序缓冲及其内存中的有序副本"""
+
+    def __init__(self, directory: str, node: int):
+        self.directory = directory
+        self.node = node
+        self.segments: List[_Segment] = []
+        self.active: Optional[_Segment] = None
+        self.unsorted: Optional[_Segment] = None
+        # 乱序缓冲中的记录 (timestamp, 写入序号, 数值)，按 (timestamp, 写入序号) 排列
+        self.unsorted_records: List[Tuple[int, int, float]] = []
+        self.unsorted_view: Optional["_MemoryView"] = None
+        self.next_sequence = 0
+        self.next_serial = 0
+        self.merging = False
+
+
+class _SegmentView:
+    """读取时的段快照：固定的映射与记录数，读取期间的并发追加不影响快照内容"""
+
+    __slots__ = ("buffer", "count", "index")
+
+    def __init__(self, segment: _Segment):
+        self.buffer = segment.buffer()
+        self.count = segment.count
+        self.index = segment.index
+
+    def timestamp(self, position: int) -> int:
+        return _TIMESTAMP.unpack_from(self.buffer, _HEADER.size + position * _RECORD.size)[0]
+
+    def entry(self, position: int) -> Tuple[int, int, float]:
+        """返回 (timestamp, 写入序号, 数值)"""
+        seconds, value, serial = _RECORD.unpack_from(self.buffer, _HEADER.size + position * _RECORD.size)
+        return seconds, serial, value
+
+    def search(self, seconds: int, right: bool = False) -> int:
+        """返回第一条时间戳不小于（right 时为大于）seconds 的记录位置：先在稀疏索引中定位区间，再在区间内二分"""
+        stop = (self.count + INDEX_STRIDE - 1) // INDEX_STRIDE
+        block = (bisect.bisect_right if right else bisect.bisect_left)(self.index, seconds, 0, stop)
+        low = max(block - 1, 0) * INDEX_STRIDE
+        high = min(block * INDEX_STRIDE, self.count)
+        while low < high:
+            middle = (low + high) // 2
+            current = self.timestamp(middle)
+            if current < seconds or (right and current == seconds):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def ascending(self, low: int, high: int) -> Iterator[Tuple[int, int, float]]:
+        """按位置升序给出 [low, high) 内的 (timestamp, 写入序号, 数值)"""
+        view = memoryview(self.buffer)[_HEADER.size + low * _RECORD.size:_HEADER.size + high * _RECORD.size]
+        for seconds, value, serial in _RECORD.iter_unpack(view):
+            yield seconds, serial, value
+
+    def descending(self, high: int) -> Iterator[Tuple[int, int, float]]:
+        """按位置倒序给出 [0, high) 内的 (timestamp, 写入序号, 数值)"""
+        for position in range(high - 1, -1, -1):
+            yield self.entry(position)
+
+    def array(self, low: int, high: int):
+        """[low, high) 内记录的 NumPy 结构化数组，直接引用映射内存，不复制"""
+        return numpy.frombuffer(
+            self.buffer, dtype=_RECORD_DTYPE, count=high - low, offset=_HEADER.size + low * _RECORD.size
+        )
+
+
+class _MemoryView:
+    """乱序缓冲的读取快照：内存中的有序记录，接口与 _SegmentView 相同"""
+
+    __slots__ = ("records", "count")
+
+    def __init__(self, records: List[Tuple[int, int, float]]):
+        self.records = tuple(records)
+        self.count = len(self.records)
+
+    def timestamp(self, position: int) -> int:
+        return self.records[position][0]
+
+    def entry(self, position: int) -> Tuple[int, int, float]:
+        return self.records[position]
+
+    def search(self, seconds: int, right: bool = False) -> int:
+        return (bisect.bisect_right if right else bisect.bisect_left)(
+            self.records, seconds, key=lambda record: record[0]
+        )
+
+    def ascending(self, low: int, high: int) -> Iterator[Tuple[int, int, float]]:
+        return iter(self.records[low:high])
+
+    def descending(self, high: int) -> Iterator[Tuple[int, int, float]]:
+        return reversed(self.records[:high])
+
+    def array(self, low: int, high: int):
+        return numpy.array(
+            [(seconds, value, serial) for seconds, serial, value in self.records[low:high]], dtype=_RECORD_DTYPE
+        )
+
+
+class SegmentStore:
+    """
+    分段文件存储类
+
+    - 每个指标一个目录；时间不早于当前追加段最后一条的记录追加到该段，段写满 max_records 条后开启新段
+    - 更早的记录（迟到数据、网关时钟偏差）追加到指标唯一的乱序缓冲文件，内存中保持有序；
+      缓冲写满 unsorted_max_records 条后排序封存为一个有序段
+    - 未写满的有序段超过 max_partial 个时在追加后合并为满段，每个指标未写满的段数因此有上限
+    - 记录 ID 由 (时间戳, 写入序号) 确定，写入序号保存在记录中，封存与合并不改变记录 ID
+    - 读取时对各段二分定位后按 (timestamp, 写入序号) 归并
+    - 封存与合并先写清单再替换段文件，进程异常退出后下次打开时按清单完成；不完整的记录在下次打开时截断
+    - 所有状态变更在一把锁内完成，读取只在锁内取快照，之后不持锁读取映射内存；合并在锁外写入新段
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        max_records: int = SEGMENT_MAX_RECORDS,
+        fsync: bool = False,
+        unsorted_max_records: int = SEGMENT_UNSORTED_MAX_RECORDS,
+        max_partial: int = SEGMENT_MAX_PARTIAL
+    ):
+        if not 0 < max_records <= 1 << 32:
+            raise ValueError(f"段文件最大记录数必须在 1 到 {1 << 32} 之间：{max_records}")
+        if not 0 < unsorted_max_records <= max_records:
+            raise ValueError(f"乱序缓冲最大记录数必须在 1 到 {max_records} 之间：{unsorted_max_records}")
+        self.data_dir = data_dir
+        self.max_records = max_records
+        # 每次追加后是否 fsync；默认只写入操作系统缓存，进程崩溃不丢数据，断电可能丢失最近的写入
+        self.fsync = fsync
+        self.unsorted_max_records = unsorted_max_records
+        self.max_partial = max_partial
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+        os.makedirs(data_dir, exist_ok=True)
+
+    def _series_dir(self, metric_id: str) -> str:
+        # 目录名使用规范化的 UUID，不接受其他形式的指标ID
+        return os.path.join(self.data_dir, str(uuid.UUID(metric_id)))
+
+    def _segment_path(self, directory: str, sequence: int) -> str:
+        return os.path.join(directory, f"{sequence:010d}{SEGMENT_SUFFIX}")
+
+    def _open_segment(self, path: str, sequence: int) -> Optional[_Segment]:
+        """读取段文件头与稀疏索引，截断末尾不完整的记录；文件中还没有文件头时删除并返回 None"""
+        if os.path.getsize(path) < _HEADER.size:
+            # 创建段文件时异常退出，还没有写入任何记录
+            os.remove(path)
+            return None
+        with open(path, "r+b") as f:
+            magic, version, kind, max_serial = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != SEGMENT_FORMAT_VERSION:
+                raise ValueError(f"无法识别的段文件：{path}")
+            size = os.fstat(f.fileno()).st_size
+            segment = _Segment(path, sequence, kind)
+            segment.count = (size - _HEADER.size) // _RECORD.size
+            if (size - _HEADER.size) % _RECORD.size:
+                f.truncate(_HEADER.size + segment.count * _RECORD.size)
+        segment.max_serial = max_serial if kind == _KIND_SORTED else -1
+        if segment.count and kind != _KIND_UNSORTED:
+            view = _SegmentView(segment)
+            segment.index = [view.timestamp(position) for position in range(0, segment.count, INDEX_STRIDE)]
+            segment.last_timestamp, serial, _ = view.entry(segment.count - 1)
+            # 顺序追加段的写入序号随位置递增，最后一条即最大值
+            segment.max_serial = max(segment.max_serial, serial)
+        return segment
+
+    def _load(self, metric_id: str) -> _Series:
+        """读取指标的全部段文件（调用方持有锁），结果缓存在内存中"""
+        series = self._series.get(metric_id)
+        if series is not None:
+            return series
+
+        directory = self._series_dir(metric_id)
+        series = _Series(directory, _series_node(metric_id))
+        if os.path.isdir(directory):
+            manifest = os.path.join(directory, _MANIFEST_FILE)
+            if os.path.exists(manifest):
+                with open(manifest, "r") as f:
+                    self._apply_manifest(directory, json.load(f))
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if name.endswith(_TEMP_SUFFIX):
+                    # 封存或合并写入新段时异常退出，清单尚未写入，原有的段仍然完整
+                    os.remove(path)
+                elif name == _UNSORTED_FILE:
+                    segment = self._open_segment(path, -1)
+                    if segment is not None:
+                        series.unsorted = segment
+                        series.unsorted_records = sorted(_SegmentView(segment).ascending(0, segment.count))
+                elif name.endswith(SEGMENT_SUFFIX):
+                    segment = self._open_segment(path, int(name[:-len(SEGMENT_SUFFIX)]))
+                    if segment is not None:
+                        series.segments.append(segment)
+
+        for segment in series.segments:
+            series.next_sequence = max(series.next_sequence, segment.sequence + 1)
+            series.next_serial = max(series.next_serial, segment.max_serial + 1)
+            if segment.kind == _KIND_APPEND:
+                series.active = segment
+        for _, serial, _ in series.unsorted_records:
+            series.next_serial = max(series.next_serial, serial + 1)
+        self._series[metric_id] = series
+        return series
+
+    def _create_file(self, path: str, kind: int, max_serial: int = 0, data: bytes = b""):
+        """创建新文件并写入文件头与记录"""
+        with open(path, "xb") as f:
+            f.write(_HEADER.pack(_MAGIC, SEGMENT_FORMAT_VERSION, kind, max_serial) + data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _create_segment(self, series: _Series, kind: int) -> _Segment:
+        """在指标目录下创建下一个序号的空段文件"""
+        os.makedirs(series.directory, exist_ok=True)
+        sequence = series.next_sequence
+        series.next_sequence += 1
+        segment = _Segment(self._segment_path(series.directory, sequence), sequence, kind)
+        self._create_file(segment.path, kind)
+        series.segments.append(segment)
+        return segment
+
+    def _write(self, segment: _Segment, points: List[Tuple[int, float, int]]):
+        """将 (timestamp, 数值, 写入序号) 记录一次写入段文件末尾；写入失败时截断到写入前的长度，保持记录对齐"""
+        if not points:
+            return
+        data = b"".join(map(_RECORD.pack, *zip(*points)))
+        fd = os.open(segment.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            try:
+                written = 0
+                while written < len(data):
+                    written += os.write(fd, data[written:])
+                if self.fsync:
+                    os.fsync(fd)
+            except OSError:
+                os.ftruncate(fd, _HEADER.size + segment.count * _RECORD.size)
+                raise
+        finally:
+            os.close(fd)
+        if segment.kind != _KIND_UNSORTED:
+            segment.extend_index(points)
+            segment.last_timestamp = points[-1][0]
+        segment.count += len(points)
+        segment.max_serial = max(segment.max_serial, points[-1][2])
+
+    def _apply_manifest(self, directory: str, manifest: Dict[str, Any]):
+        """
+        按清单替换段文件：新段由临时文件改名生效、删除被替换的段、按需清空乱序缓冲，最后删除清单
+
+        每一步都可以重复执行，打开时发现残留的清单直接再执行一遍
+        """
+        for sequence in manifest["add"]:
+            path = self._segment_path(directory, sequence)
+            if os.path.exists(path + _TEMP_SUFFIX):
+                os.replace(path + _TEMP_SUFFIX, path)
+        for sequence in manifest["remove"]:
+            path = self._segment_path(directory, sequence)
+            if os.path.exists(path):
+                os.remove(path)
+        if manifest.get("reset_unsorted"):
+            path = os.path.join(directory, _UNSORTED_FILE)
+            if os.path.exists(path):
+                os.truncate(path, _HEADER.size)
+        os.remove(os.path.join(directory, _MANIFEST_FILE))
+
+    def _commit(self, series: _Series, manifest: Dict[str, Any]):
+        """写入清单（fsync 后才替换段文件），再按清单替换"""
+        path = os.path.join(series.directory, _MANIFEST_FILE)
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply_manifest(series.directory, manifest)
+
+    def append(self, metric_id: str, points: Sequence[Tuple[int, float]]) -> List[str]:
+        """
+        追加指标的一批 (时间戳秒数, 数值) 记录，返回与输入顺序对应的记录 ID
+
+        批内按时间排序后分配写入序号；不早于当前追加段最后一条的记录写入追加段，其余写入乱序缓冲
+        """
+        order = sorted(range(len(points)), key=lambda index: points[index][0])
+        ids: List[Optional[str]] = [None] * len(points)
+        with self._lock:
+            series = self._load(metric_id)
+            active = series.active
+            pending: List[Tuple[int, float, int]] = []
+            late: List[Tuple[int, float, int]] = []
+            for index in order:
+                seconds, value = points[index]
+                serial = series.next_serial
+                series.next_serial += 1
+                ids[index] = _value_id(series.node, seconds, serial)
+                last = pending[-1][0] if pending else (active.last_timestamp if active is not None else None)
+                if last is not None and seconds < last:
+                    late.append((seconds, float(value), serial))
+                    continue
+                if active is None or active.count + len(pending) >= self.max_records:
+                    if active is not None:
+                        self._write(active, pending)
+                    pending = []
+                    active = series.active = self._create_segment(series, _KIND_APPEND)
+                pending.append((seconds, float(value), serial))
+            if pending:
+                self._write(active, pending)
+            if late:
+                self._append_unsorted(series, late)
+            merge = self._partial_segments(series) if not series.merging else []
+            if len(merge) > self.max_partial:
+                series.merging = True
+            else:
+                merge = []
+        if merge:
+            self._merge(metric_id, series, merge)
+        return ids
+
+    def _append_unsorted(self, series: _Series, points: List[Tuple[int, float, int]]):
+        """将早于追加段末尾的记录写入乱序缓冲（调用方持有锁），写满后排序封存为有序段"""
+        if series.unsorted is None:
+            os.makedirs(series.directory, exist_ok=True)
+            path = os.path.join(series.directory, _UNSORTED_FILE)
+            self._create_file(path, _KIND_UNSORTED)
+            series.unsorted = _Segment(path, -1, _KIND_UNSORTED)
+        position = 0
+        while position < len(points):
+            chunk = points[position:position + self.unsorted_max_records - series.unsorted.count]
+            position += len(chunk)
+            self._write(series.unsorted, chunk)
+            # 已有记录有序、新记录按时间排列，排序只需归并两段
+            series.unsorted_records.extend((seconds, serial, value) for seconds, value, serial in chunk)
+            series.unsorted_records.sort()
+            series.unsorted_view = None
+            if series.unsorted.count >= self.unsorted_max_records:
+                self._seal_unsorted(series)
+
+    def _seal_unsorted(self, series: _Series):
+        """把乱序缓冲中的记录按顺序写成一个有序段，并清空乱序缓冲（调用方持有锁）"""
+        records = series.unsorted_records
+        sequence = series.next_sequence
+        series.next_sequence += 1
+        path = self._segment_path(series.directory, sequence)
+        data = b"".join(_RECORD.pack(seconds, value, serial) for seconds, serial, value in records)
+        self._create_file(path + _TEMP_SUFFIX, _KIND_SORTED, max(serial for _, serial, _ in records), data)
+        self._commit(series, {"add": [sequence], "remove": [], "reset_unsorted": True})
+        series.segments.append(self._open_segment(path, sequence))
+        series.unsorted.count = 0
+        series.unsorted.max_serial = -1
+        series.unsorted_records = []
+        series.unsorted_view = None
+
+    def _partial_segments(self, series: _Series) -> List[_Segment]:
+        """未写满且不再追加的段，合并的候选"""
+        return [
+            segment for segment in series.segments
+            if segment is not series.active and segment.count < self.max_records
+        ]
+
+    def _merge(self, metric_id: str, series: _Series, segments: List[_Segment]):
+        """
+        将未写满的段按 (timestamp, 写入序号) 合并为满段（最后一段可能未满）
+
+        在锁外读取旧段并写入临时文件，再在锁内按清单替换；合并期间段被删除时放弃本次合并。
+        记录在调用前已经写入，合并失败只打印日志，未写满的段留到下次追加时再合并
+        """
+        sequences: List[int] = []
+        try:
+            with self._lock:
+                views = [_SegmentView(segment) for segment in segments]
+                total = sum(view.count for view in views)
+                first_sequence = series.next_sequence
+                series.next_sequence += (total + self.max_records - 1) // self.max_records
+
+            for sequence, (data, max_serial) in enumerate(self._merged_chunks(views), first_sequence):
+                sequences.append(sequence)
+                self._create_file(
+                    self._segment_path(series.directory, sequence) + _TEMP_SUFFIX, _KIND_SORTED, max_serial, data
+                )
+
+            with self._lock:
+                if self._series.get(metric_id) is series and all(segment in series.segments for segment in segments):
+                    self._commit(series, {"add": sequences, "remove": [segment.sequence for segment in segments]})
+                    merged = [
+                        self._open_segment(self._segment_path(series.directory, sequence), sequence)
+                        for sequence in sequences
+                    ]
+                    series.segments = sorted(
+                        [segment for segment in series.segments if segment not in segments] + merged,
+                        key=lambda segment: segment.sequence
+                    )
+                    sequences = []
+        except OSError as e:
+            print(f"Segment merge for metric {metric_id} failed: {e}")
+        finally:
+            # 放弃或失败的合并删除已写入的临时文件
+            for sequence in sequences:
+                path = self._segment_path(series.directory, sequence) + _TEMP_SUFFIX
+                if os.path.exists(path):
+                    os.remove(path)
+            with self._lock:
+                series.merging = False
+
+    def _merged_chunks(self, views: List[_SegmentView]) -> Iterator[Tuple[bytes, int]]:
+        """按 (timestamp, 写入序号) 归并各段记录，逐个给出每段 max_records 条的 (记录数据, 最大写入序号)"""
+        if numpy is not None:
+            records = numpy.concatenate([view.array(0, view.count) for view in views])
+            records = records[numpy.lexsort((records["serial"], records["timestamp"]))]
+            for start in range(0, len(records), self.max_records):
+                chunk = records[start:start + self.max_records]
+                yield chunk.tobytes(), int(chunk["serial"].max())
+            return
+
+        merged = heapq.merge(*(view.ascending(0, view.count) for view in views))
+        while True:
+            chunk = list(itertools.islice(merged, self.max_records))
+            if not chunk:
+                return
+            data = b"".join(_RECORD.pack(seconds, value, serial) for seconds, serial, value in chunk)
+            yield data, max(serial for _, serial, _ in chunk)
+
+    def _snapshot(self, metric_id: str) -> Tuple[int, List[Any]]:
+        """取得指标的摘要与各个非空段（含乱序缓冲）的读取快照"""
+        with self._lock:
+            series = self._load(metric_id)
+            views: List[Any] = [_SegmentView(segment) for segment in series.segments if segment.count]
+            if series.unsorted_records:
+                if series.unsorted_view is None:
+                    series.unsorted_view = _MemoryView(series.unsorted_records)
+                views.append(series.unsorted_view)
+            return series.node, views
+
+    def latest(self, metric_id: str) -> Optional[Tuple[str, int, float]]:
+        """返回 (timestamp, id) 最大的记录 (id, 时间戳秒数, 数值)：各段的最后一条中取最大者"""
+        node, views = self._snapshot(metric_id)
+        best = max((view.entry(view.count - 1) for view in views), default=None)
+        if best is None:
+            return None
+        seconds, serial, value = best
+        return _value_id(node, seconds, serial), seconds, value
+
+    def page(
+        self,
+        metric_id: str,
+        need: int,
+        before_seconds: Optional[int] = None,
+        before_id: Optional[str] = None
+    ) -> List[Tuple[str, int, float]]:
+        """
+        按 (timestamp, id) 倒序返回分页位置之前的至多 need 条记录 (id, 时间戳秒数, 数值)
+
+        分页位置为 (before_seconds, before_id)，before_id 为空时返回早于 before_seconds 的记录；
+        各段二分定位后倒序归并，只读取进入结果的记录
+        """
+        node, views = self._snapshot(metric_id)
+        before_serial = _value_serial(before_id) if before_id is not None else None
+        streams = []
+        for view in views:
+            end = view.count
+            if before_seconds is not None:
+                end = view.search(before_seconds)
+                if before_serial is not None:
+                    # 同一时刻的记录在段内按写入序号升序排列
+                    stop = view.search(before_seconds, right=True)
+                    while end < stop and view.entry(end)[1] < before_serial:
+                        end += 1
+            streams.append(view.descending(end))
+
+        return [
+            (_value_id(node, seconds, serial), seconds, value)
+            for seconds, serial, value in itertools.islice(heapq.merge(*streams, reverse=True), need)
+        ]
+
+    def scan(
+        self,
+        metric_id: str,
+        start_seconds: Optional[int] = None,
+        end_seconds: Optional[int] = None
+    ) -> Iterator[Tuple[str, int, float]]:
+        """按 (timestamp, id) 升序逐条给出 [start, end) 内的记录 (id, 时间戳秒数, 数值)"""
+        node, views = self._snapshot(metric_id)
+        streams = []
+        for view in views:
+            low = view.search(start_seconds) if start_seconds is not None else 0
+            high = view.search(end_seconds) if end_seconds is not None else view.count
+            if low < high:
+                streams.append(view.ascending(low, high))
+        for seconds, serial, value in heapq.merge(*streams):
+            yield _value_id(node, seconds, serial), seconds, value
+
+    def aggregate(
+        self,
+        metric_id: str,
+        start_seconds: int,
+        end_seconds: int,
+        bucket_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """
+        按时间桶聚合 [start, end) 内的记录，返回各段的 bucket_index/count/count_num/sum/min/max 行（段与段之间的同一时间桶由调用方合并）
+
+        段文件只保存数值型记录，count_num 与 count 相同
+
+        段内记录按时间有序，同一时间桶的记录连续：安装了 NumPy 时按桶边界分段归约，否则逐条扫描
+        """
+        rows: List[Dict[str, Any]] = []
+        for view in self._snapshot(metric_id)[1]:
+            low, high = view.search(start_seconds), view.search(end_seconds)
+            if low >= high:
+                continue
+            if numpy is not None:
+                records = view.array(low, high)
+                buckets = records["timestamp"] // bucket_seconds
+                values = records["value"]
+                starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(buckets)) + 1))
+                counts = numpy.diff(numpy.append(starts, len(buckets)))
+                rows.extend(
+                    {"bucket_index": index, "count": count, "count_num": count, "sum": total, "min": minimum, "max": maximum}
+                    for index, count, total, minimum, maximum in zip(
+                        buckets[starts].tolist(),
+                        counts.tolist(),
+                        numpy.add.reduceat(values, starts).tolist(),
+                        numpy.minimum.reduceat(values, starts).tolist(),
+                        numpy.maximum.reduceat(values, starts).tolist()
+                    )
+                )
+                continue
+            bucket = None
+            for seconds, _, value in view.ascending(low, high):
+                index = seconds // bucket_seconds
+                if bucket is None or bucket["bucket_index"] != index:
+                    bucket = {"bucket_index": index, "count": 0, "count_num": 0, "sum": 0.0, "min": value, "max": value}
+                    rows.append(bucket)
+                bucket["count"] += 1
+                bucket["count_num"] += 1
+                bucket["sum"] += value
+                bucket["min"] = min(bucket["min"], value)
+                bucket["max"] = max(bucket["max"], value)
+        return rows
+
+    def segment_count(self, metric_id: str) -> int:
+        """指标当前的段文件数（不含乱序缓冲）"""
+        with self._lock:
+            return len(self._load(metric_id).segments)
+
+    def drop_before(self, metric_id: str, before_seconds: int) -> int:
+        """删除最后一条记录早于 before_seconds 的段文件（整段删除，乱序缓冲全部过期时清空），返回删除的记录数"""
+        with self._lock:
+            series = self._load(metric_id)
+            expired = [
+                segment for segment in series.segments
+                if segment.last_timestamp is not None and segment.last_timestamp < before_seconds
+            ]
+            if series.active in expired:
+                series.active = None
+            for segment in expired:
+                os.remove(segment.path)
+                series.segments.remove(segment)
+            deleted = sum(segment.count for segment in expired)
+            if series.unsorted_records and series.unsorted_records[-1][0] < before_seconds:
+                deleted += len(series.unsorted_records)
+                os.truncate(series.unsorted.path, _HEADER.size)
+                series.unsorted.count = 0
+                series.unsorted_records = []
+                series.unsorted_view = None
+            return deleted
+
+    def drop(self, metric_id: str) -> int:
+        """删除指标的全部段文件，返回删除的记录数"""
+        with self._lock:
+            series = self._load(metric_id)
+            deleted = sum(segment.count for segment in series.segments) + len(series.unsorted_records)
+            if os.path.isdir(series.directory):
+                for name in os.listdir(series.directory):
+                    os.remove(os.path.join(series.directory, name))
+                os.rmdir(series.directory)
+            self._series.pop(metric_id, None)
+            return deleted
+
+    def close(self):
+        """释放缓存的段信息，映射在不再被引用后自动释放"""
+        with self._lock:
+            self._series.clear()
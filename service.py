@@ -2,22 +2,261 @@
 业务逻辑层
 处理设施和指标的业务逻辑，包括树形结构构建
 """
-from typing import List, Optional
-from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import base64
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
 import uuid
 
 from models import (
     FacilityCreate, FacilityUpdate, FacilityResponse, FacilityTreeResponse,
     MetricCreate, MetricUpdate, MetricResponse, MetricValueCreate, MetricValueResponse,
-    FacilityType, TreeQueryParams
+    MetricValueCreatedResponse, MetricValueBatchCreate, MetricValueBatchItemResult, MetricValueBatchResponse,
+    MetricLatestQuery, AggregateFunction, MetricAggregatePoint, MetricAggregateResponse,
+    FacilityType, TreeQueryParams, ColumnarExportFormat, MetricColumnarExportQuery,
+    FacilityImportNode, FacilityImportRequest, FacilityImportResponse, DeletionJobResponse
 )
-from database import Database
+from storage import Storage, DEDUP_WINDOW_HOURS, encode_metric_value, decode_metric_value
+
+
+# 时间桶单位（秒）
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# 单次聚合查询允许的最大时间桶数量
+MAX_AGGREGATE_BUCKETS = 10000
+
+# 历史值导出格式及其媒体类型
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# CSV 导出的列（与 MetricValueResponse 字段一致）
+EXPORT_CSV_COLUMNS = ("id", "metric_id", "timestamp", "value")
+
+# 列式导出格式的媒体类型
+COLUMNAR_EXPORT_MEDIA_TYPES = {
+    ColumnarExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ColumnarExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+# 列式导出每个记录批次（Parquet 行组）的最大行数
+COLUMNAR_BATCH_ROWS = 65536
+
+# 设施层级从上到下的类型（批量导入 CSV 时按路径层数推断设施类型）
+FACILITY_LAYERS = (FacilityType.DATACENTER, FacilityType.ROOM, FacilityType.SENSOR)
+
+# 单次批量导入允许的设施与指标总数
+MAX_IMPORT_ITEMS = 200000
+
+# 指标值去重方式（环境变量 VALUE_DEDUP_MODE）：
+# key 只对带幂等键的记录去重；timestamp 另外把客户端指定的时间戳作为去重键，同一指标同一时刻只保留一条
+VALUE_DEDUP_MODES = ("key", "timestamp")
+
+
+class NotFoundError(ValueError):
+    """请求的设施或指标不存在（接口层返回 404，其余 ValueError 为请求参数错误）"""
+
+
+def parse_bucket(bucket: str) -> int:
+    """解析时间桶大小（如 30s、5m、1h、1d），返回秒数"""
+    match = re.fullmatch(r"(\d+)([smhd])", bucket.strip())
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"时间桶格式错误：'{bucket}'，应为正整数加单位 s/m/h/d，如 5m")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+
+def parse_aggregate_functions(functions: str) -> List[AggregateFunction]:
+    """解析逗号分隔的聚合函数列表（如 avg,min,max,count）"""
+    result = []
+    for name in functions.split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        try:
+            function = AggregateFunction(name)
+        except ValueError:
+            supported = ", ".join(f.value for f in AggregateFunction)
+            raise ValueError(f"不支持的聚合函数：'{name}'，可选值为 {supported}")
+        if function not in result:
+            result.append(function)
+    if not result:
+        raise ValueError("至少需要指定一个聚合函数")
+    return result
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """将带时区的时间转换为数据库中使用的 UTC 无时区时间"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_values_cursor(value: MetricValueResponse) -> str:
+    """根据一页中最后一条记录生成下一页的分页游标"""
+    payload = json.dumps(
+        {"t": value.timestamp.isoformat(), "id": str(value.id)},
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_values_cursor(cursor: str) -> Tuple[datetime, str]:
+    """解析分页游标，返回 (时间戳, 记录ID)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), str(uuid.UUID(payload["id"]))
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("分页游标无效")
+
+
+def parse_import_csv(text: str, root_type: FacilityType = FacilityType.DATACENTER) -> List[FacilityImportNode]:
+    """
+    解析批量导入的 CSV 层级，返回设施树列表
+
+    每行以 path 列（如 数据中心A/房间1/传感器X）指定一个设施，缺失的上级设施自动补齐，
+    设施类型按层数推断，第一层为 root_type；可选列 description 为设施描述，
+    metric、unit、data_type、metric_description、retention_days 为该设施下的一个指标，
+    同一设施的多个指标写成多行
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or "path" not in [name.strip() for name in reader.fieldnames]:
+        raise ValueError("CSV 缺少 path 列")
+    first_layer = FACILITY_LAYERS.index(root_type)
+
+    nodes: Dict[str, Dict[str, Any]] = {}
+    roots: List[Dict[str, Any]] = []
+    for line, row in enumerate(reader, start=2):
+        row = {(key or "").strip(): (value or "").strip() for key, value in row.items() if isinstance(value, str)}
+        parts = [part.strip() for part in row.get("path", "").split("/")]
+        if not all(parts):
+            raise ValueError(f"第 {line} 行：设施路径 '{row.get('path', '')}' 无效")
+        if first_layer + len(parts) > len(FACILITY_LAYERS):
+            raise ValueError(f"第 {line} 行：设施路径 '{row['path']}' 层级过深，传感器下不能再有子设施")
+
+        parent = None
+        for depth, name in enumerate(parts):
+            key = "/".join(parts[:depth + 1])
+            node = nodes.get(key)
+            if node is None:
+                node = {
+                    "name": name,
+                    "facility_type": FACILITY_LAYERS[first_layer + depth],
+                    "description": None,
+                    "metrics": [],
+                    "children": []
+                }
+                nodes[key] = node
+                (parent["children"] if parent else roots).append(node)
+            parent = node
+
+        if row.get("description") and not parent["description"]:
+            parent["description"] = row["description"]
+        if row.get("metric"):
+            metric: Dict[str, Any] = {"name": row["metric"]}
+            for column, field in (("unit", "unit"), ("data_type", "data_type"), ("metric_description", "description")):
+                if row.get(column):
+                    metric[field] = row[column]
+            if row.get("retention_days"):
+                try:
+                    metric["retention_days"] = int(row["retention_days"])
+                except ValueError:
+                    raise ValueError(f"第 {line} 行：保留天数 '{row['retention_days']}' 不是整数")
+            parent["metrics"].append(metric)
+
+    if not roots:
+        raise ValueError("CSV 中没有要导入的设施")
+    return [FacilityImportNode(**root) for root in roots]
+
+
+def import_pyarrow():
+    """按需导入 pyarrow（可选依赖，只有列式导出需要），未安装时抛出 ImportError"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("列式导出需要安装 pyarrow：pip install -r requirements-optional.txt")
+    return pyarrow
+
+
+class _ChunkSink:
+    """供 pyarrow 写入的文件对象：缓存已写出的字节，每写完一个批次由调用方取走"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        """取走并清空已写出的字节"""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class RecentKeyCache:
+    """
+    最近写入的指标值去重键缓存（进程内 LRU）
+
+    命中的重试直接返回首次写入的记录，不访问数据库；未命中时由数据库的去重键主键判定，
+    缓存只是快速路径，多进程部署时各进程各自缓存。条目在去重窗口过后失效，与数据库中去重键的保留时长一致
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        """获取去重键对应的原记录，不存在或已过期时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: Tuple[str, str], result: Dict[str, Any]):
+        """记录去重键对应的原记录，超出容量时淘汰最久未使用的条目"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
 
 
 class FacilityService:
     """设施业务逻辑类"""
 
-    def __init__(self, db: Database):
+    def __init__(self, db: Storage):
         self.db = db
 
     def create_facility(self, facility_data: FacilityCreate) -> FacilityResponse:
@@ -34,18 +273,7 @@ class FacilityService:
             parent = self.db.get_facility(str(facility_data.parent_id))
             if not parent:
                 raise ValueError(f"父设施不存在：ID 为 {facility_data.parent_id} 的设施未找到")
-
-            parent_type = FacilityType(parent["facility_type"])
-
-            # 严格层级校验：房间只能属于数据中心
-            if facility_type == FacilityType.ROOM:
-                if parent_type != FacilityType.DATACENTER:
-                    raise ValueError(f"层级错误：房间只能作为数据中心的子设施，当前父设施类型为 {self._get_type_name(parent_type.value)}")
-
-            # 严格层级校验：传感器只能属于房间
-            elif facility_type == FacilityType.SENSOR:
-                if parent_type != FacilityType.ROOM:
-                    raise ValueError(f"层级错误：传感器只能作为房间的子设施，当前父设施类型为 {self._get_type_name(parent_type.value)}")
+            self._check_parent_type(facility_type, FacilityType(parent["facility_type"]))
 
         # 检查同名设施
         existing = self.db.get_facility_by_name(facility_data.name)
@@ -60,19 +288,92 @@ class FacilityService:
             description=facility_data.description
         )
 
-        # 构建路径
-        path = self.db.build_facility_path(result["id"])
-        result["path"] = path
-
         return FacilityResponse(**result)
 
+    def import_facilities(self, request: FacilityImportRequest) -> FacilityImportResponse:
+        """
+        批量导入设施层级及其指标
+
+        层级规则与同批重名在内存中校验，与已有设施的重名通过一次按名称集合查询检查，
+        全部通过后由存储层在一个事务中分批写入；任一校验失败时不写入任何数据
+        """
+        parent_id = str(request.parent_id) if request.parent_id else None
+        parent_type = None
+        if parent_id:
+            parent = self.db.get_facility(parent_id)
+            if not parent:
+                raise ValueError(f"父设施不存在：ID 为 {parent_id} 的设施未找到")
+            parent_type = FacilityType(parent["facility_type"])
+
+        facilities: List[Dict[str, Any]] = []
+        metrics: List[Dict[str, Any]] = []
+        names = set()
+
+        def collect(node: FacilityImportNode, node_parent_id: Optional[str], node_parent_type: Optional[FacilityType], path: str):
+            # 先序遍历，父设施总在子设施之前
+            path = f"{path}/{node.name}" if path else node.name
+            try:
+                if node.facility_type == FacilityType.DATACENTER and node_parent_id:
+                    raise ValueError("数据中心必须是顶级设施，不能设置父设施")
+                if node_parent_type is not None:
+                    self._check_parent_type(node.facility_type, node_parent_type)
+            except ValueError as e:
+                raise ValueError(f"设施 '{path}'：{str(e)}")
+            if node.name in names:
+                raise ValueError(f"设施名称重复：名为 '{node.name}' 的设施在导入数据中出现多次")
+            names.add(node.name)
+
+            facility_id = str(uuid.uuid4())
+            facilities.append({
+                "id": facility_id,
+                "name": node.name,
+                "facility_type": node.facility_type.value,
+                "parent_id": node_parent_id,
+                "description": node.description
+            })
+            metrics.extend({**metric.model_dump(), "facility_id": facility_id} for metric in node.metrics)
+            if len(facilities) + len(metrics) > MAX_IMPORT_ITEMS:
+                raise ValueError(f"导入数据过多：单次最多导入 {MAX_IMPORT_ITEMS} 个设施和指标")
+            for child in node.children:
+                collect(child, facility_id, node.facility_type, path)
+
+        for root in request.facilities:
+            collect(root, parent_id, parent_type, "")
+
+        # 检查与已有设施的重名（一次集合查询）
+        existing = self.db.get_facilities_by_names(list(names))
+        if existing:
+            duplicated = ", ".join(f"'{facility['name']}'" for facility in existing[:10])
+            raise ValueError(f"设施名称重复：{duplicated} 等 {len(existing)} 个设施已存在")
+
+        facility_rows, metric_rows = self.db.create_facility_hierarchy(facilities, metrics)
+        return FacilityImportResponse(
+            facilities_created=len(facility_rows),
+            metrics_created=len(metric_rows),
+            facilities=[FacilityResponse(**row) for row in facility_rows],
+            metrics=[MetricResponse(**row) for row in metric_rows]
+        )
+
+    def import_facilities_csv(self, text: str, parent_id: Optional[uuid.UUID] = None) -> FacilityImportResponse:
+        """从 CSV 批量导入设施层级及其指标（格式见 parse_import_csv），第一层设施的类型由挂载点推断"""
+        root_type = FacilityType.DATACENTER
+        if parent_id:
+            parent = self.db.get_facility(str(parent_id))
+            if not parent:
+                raise ValueError(f"父设施不存在：ID 为 {parent_id} 的设施未找到")
+            parent_layer = FACILITY_LAYERS.index(FacilityType(parent["facility_type"]))
+            if parent_layer + 1 >= len(FACILITY_LAYERS):
+                raise ValueError("层级错误：传感器下不能再有子设施")
+            root_type = FACILITY_LAYERS[parent_layer + 1]
+        return self.import_facilities(
+            FacilityImportRequest(parent_id=parent_id, facilities=parse_import_csv(text, root_type))
+        )
+
     def get_facility(self, facility_id: uuid.UUID) -> Optional[FacilityResponse]:
         """获取单个设施"""
         facility = self.db.get_facility(str(facility_id))
         if not facility:
             return None
-
-        facility["path"] = self.db.build_facility_path(str(facility_id))
         return FacilityResponse(**facility)
 
     def get_all_facilities(
@@ -82,13 +383,7 @@ class FacilityService:
         """获取所有设施列表"""
         type_str = facility_type.value if facility_type else None
         facilities = self.db.get_all_facilities(type_str)
-
-        result = []
-        for facility in facilities:
-            facility["path"] = self.db.build_facility_path(facility["id"])
-            result.append(FacilityResponse(**facility))
-
-        return result
+        return [FacilityResponse(**facility) for facility in facilities]
 
     def update_facility(
         self,
@@ -111,96 +406,68 @@ class FacilityService:
 
         return self.get_facility(facility_id)
 
-    def delete_facility(self, facility_id: uuid.UUID) -> bool:
-        """删除设施（级联删除子设施和指标）"""
-        return self.db.delete_facility(str(facility_id))
+    def delete_facility(self, facility_id: uuid.UUID) -> Optional[DeletionJobResponse]:
+        """删除设施（子设施和指标立即删除，历史数据由返回的删除任务在后台清理），设施不存在时返回 None"""
+        job = self.db.delete_facility(str(facility_id))
+        return DeletionJobResponse(**job) if job else None
+
+    def get_deletion_job(self, job_id: uuid.UUID) -> Optional[DeletionJobResponse]:
+        """获取删除任务进度"""
+        job = self.db.get_deletion_job(str(job_id))
+        return DeletionJobResponse(**job) if job else None
+
+    def get_active_deletion_jobs(self) -> List[DeletionJobResponse]:
+        """获取尚未完成的删除任务"""
+        return [DeletionJobResponse(**job) for job in self.db.get_active_deletion_jobs()]
 
     def get_facility_tree(
         self,
         params: TreeQueryParams
     ) -> List[FacilityTreeResponse]:
-        """获取设施树形结构"""
-        root_id = str(params.root_id) if params.root_id else None
+        """
+        获取设施树形结构
 
-        # 获取根节点
-        if root_id:
-            root_facilities = [self.db.get_facility(root_id)]
-        else:
-            root_facilities = self.db.get_root_facilities()
-
-        # 过滤类型
-        if params.facility_type:
-            root_facilities = [
-                f for f in root_facilities
-                if f and f["facility_type"] == params.facility_type.value
-            ]
-
-        # 构建树形结构
-        result = []
-        for facility in root_facilities:
-            if facility:
-                tree_node = self._build_tree_node(
-                    facility,
-                    params.include_metrics,
-                    params.max_depth,
-                    0
-                )
-                if tree_node:
-                    result.append(tree_node)
+        整棵子树按物化路径一次查询取出，指标按设施批量查询，在内存中组装成树，
+        查询次数与树的规模无关
+        """
+        root_id = str(params.root_id) if params.root_id else None
+        rows = self.db.get_facility_subtree(
+            root_id=root_id,
+            max_depth=params.max_depth,
+            root_type=params.facility_type.value if params.facility_type else None
+        )
 
-        return result
+        nodes = {}
+        roots = []
+        for row in rows:
+            node = {**row, "children": [], "metrics": []}
+            nodes[row["id"]] = node
+            # 结果按深度排序，父节点不在结果中的即为起始节点
+            parent = nodes.get(row["parent_id"])
+            if parent is None:
+                roots.append(node)
+            else:
+                parent["children"].append(node)
 
-    def _build_tree_node(
-        self,
-        facility: dict,
-        include_metrics: bool,
-        max_depth: Optional[int],
-        current_depth: int
-    ) -> Optional[FacilityTreeResponse]:
-        """递归构建树节点"""
-        if not facility:
-            return None
+        if params.include_metrics:
+            for metric in self.db.get_metrics_by_facilities(list(nodes)):
+                nodes[metric["facility_id"]]["metrics"].append(metric)
 
-        # 构建路径
-        facility["path"] = self.db.build_facility_path(facility["id"])
-
-        # 获取子设施
-        children = self.db.get_children(facility["id"])
-
-        # 递归构建子节点
-        child_nodes = []
-        if max_depth is None or current_depth < max_depth:
-            for child in children:
-                child_node = self._build_tree_node(
-                    child,
-                    include_metrics,
-                    max_depth,
-                    current_depth + 1
-                )
-                if child_node:
-                    child_nodes.append(child_node)
-
-        # 获取指标
-        metrics = []
-        if include_metrics:
-            metrics_data = self.db.get_metrics_by_facility(facility["id"])
-            metrics = [MetricResponse(**m) for m in metrics_data]
-
-        # 构建响应
-        return FacilityTreeResponse(
-            **facility,
-            children=child_nodes,
-            metrics=metrics
-        )
+        return [FacilityTreeResponse(**root) for root in roots]
 
     def get_facility_children(self, facility_id: uuid.UUID) -> List[FacilityResponse]:
         """获取设施的直接子设施"""
         children = self.db.get_children(str(facility_id))
-        result = []
-        for child in children:
-            child["path"] = self.db.build_facility_path(child["id"])
-            result.append(FacilityResponse(**child))
-        return result
+        return [FacilityResponse(**child) for child in children]
+
+    def _check_parent_type(self, facility_type: FacilityType, parent_type: FacilityType):
+        """严格层级校验：房间只能属于数据中心，传感器只能属于房间"""
+        if facility_type == FacilityType.ROOM:
+            if parent_type != FacilityType.DATACENTER:
+                raise ValueError(f"层级错误：房间只能作为数据中心的子设施，当前父设施类型为 {self._get_type_name(parent_type.value)}")
+        elif facility_type == FacilityType.SENSOR:
+            if parent_type != FacilityType.ROOM:
+                raise ValueError(f"层级错误：传感器只能作为房间的子设施，当前父设施类型为 {self._get_type_name(parent_type.value)}")
 
     def _get_type_name(self, type_value: str) -> str:
         """获取设施类型的中文名称"""
@@ -215,8 +482,15 @@ class FacilityService:
 class MetricService:
     """指标业务逻辑类"""
 
-    def __init__(self, db: Database):
+    def __init__(self, db: Storage):
         self.db = db
+        self.dedup_mode = os.getenv("VALUE_DEDUP_MODE", "key").lower()
+        if self.dedup_mode not in VALUE_DEDUP_MODES:
+            raise ValueError(f"不支持的去重方式：'{self.dedup_mode}'，可选值为 {', '.join(VALUE_DEDUP_MODES)}")
+        self.recent_keys = RecentKeyCache(
+            int(os.getenv("VALUE_DEDUP_CACHE_SIZE", "100000")),
+            float(os.getenv("VALUE_DEDUP_WINDOW_HOURS", str(DEDUP_WINDOW_HOURS))) * 3600
+        )
 
     def create_metric(self, metric_data: MetricCreate) -> MetricResponse:
         """创建指标"""
@@ -231,7 +505,8 @@ class MetricService:
             facility_id=str(metric_data.facility_id),
             unit=metric_data.unit,
             data_type=metric_data.data_type,
-            description=metric_data.description
+            description=metric_data.description,
+            retention_days=metric_data.retention_days
         )
 
         return MetricResponse(**result)
@@ -272,7 +547,8 @@ class MetricService:
             str(metric_id),
             name=update_data.get("name"),
             unit=update_data.get("unit"),
-            description=update_data.get("description")
+            description=update_data.get("description"),
+            retention_days=update_data.get("retention_days")
         )
 
         if not success:
@@ -280,44 +556,390 @@ class MetricService:
 
         return self.get_metric(metric_id)
 
-    def delete_metric(self, metric_id: uuid.UUID) -> bool:
-        """删除指标"""
-        return self.db.delete_metric(str(metric_id))
+    def delete_metric(self, metric_id: uuid.UUID) -> Optional[DeletionJobResponse]:
+        """删除指标（历史数据由返回的删除任务在后台清理），指标不存在时返回 None"""
+        job = self.db.delete_metric(str(metric_id))
+        return DeletionJobResponse(**job) if job else None
+
+    def _dedup_key(self, value_data: MetricValueCreate) -> Optional[str]:
+        """获取记录的去重键：优先使用幂等键，timestamp 去重方式下使用客户端指定的时间戳"""
+        if value_data.idempotency_key is not None:
+            return value_data.idempotency_key
+        if self.dedup_mode == "timestamp" and value_data.timestamp is not None:
+            # 前缀与幂等键区分，按 UTC 归一化使不同时区表示的同一时刻得到相同的键
+            return "@" + to_utc_naive(value_data.timestamp).isoformat()
+        return None
+
+    def create_metric_value(
+        self,
+        value_data: MetricValueCreate,
+        value_id: Optional[str] = None
+    ) -> MetricValueCreatedResponse:
+        """
+        创建指标值记录；带去重键的重复提交不写入新记录，返回首次写入的记录
+
+        value_id 为落盘缓冲预先分配的记录 ID，转入缓冲后回放时按该 ID 去重
+        """
+        metric_id = str(value_data.metric_id)
+        dedup_key = self._dedup_key(value_data)
+        if dedup_key is not None:
+            cached = self.recent_keys.get((metric_id, dedup_key))
+            if cached is not None:
+                return MetricValueCreatedResponse(**cached, duplicate=True)
 
-    def create_metric_value(self, value_data: MetricValueCreate) -> MetricValueResponse:
-        """创建指标值记录"""
         # 验证指标是否存在
-        metric = self.db.get_metric(str(value_data.metric_id))
+        metric = self.db.get_metric(metric_id)
         if not metric:
             raise ValueError(f"指标不存在：ID 为 {value_data.metric_id} 的指标未找到")
 
         timestamp = value_data.timestamp.isoformat() if value_data.timestamp else None
         result = self.db.create_metric_value(
-            metric_id=str(value_data.metric_id),
+            metric_id=metric_id,
             value=str(value_data.value),
-            timestamp=timestamp
+            timestamp=timestamp,
+            data_type=metric["data_type"],
+            dedup_key=dedup_key,
+            value_id=value_id
         )
+        duplicate = result.pop("duplicate", False)
+        if dedup_key is not None:
+            self.recent_keys.put((metric_id, dedup_key), result)
+
+        return MetricValueCreatedResponse(**result, duplicate=duplicate)
 
-        return MetricValueResponse(**result)
+    def create_metric_values(
+        self,
+        batch: MetricValueBatchCreate,
+        value_ids: Optional[List[Optional[str]]] = None,
+        skip_existing: bool = False
+    ) -> MetricValueBatchResponse:
+        """
+        批量创建指标值记录（一次查询校验指标，一个事务批量写入；最近写入过的去重键直接返回原记录）
+
+        value_ids 为与 batch.items 一一对应的预先分配的记录 ID（落盘缓冲使用），
+        skip_existing 为 true 时已写入过的 ID 不再写入，按重复提交返回
+        """
+        metric_ids = [str(item.metric_id) for item in batch.items]
+        dedup_keys = [self._dedup_key(item) for item in batch.items]
+
+        results: List[Optional[MetricValueBatchItemResult]] = [None] * len(batch.items)
+        for index, dedup_key in enumerate(dedup_keys):
+            if dedup_key is None:
+                continue
+            cached = self.recent_keys.get((metric_ids[index], dedup_key))
+            if cached is not None:
+                results[index] = MetricValueBatchItemResult(index=index, success=True, id=cached["id"], duplicate=True)
+
+        existing = self.db.get_metrics_by_ids([
+            metric_id for index, metric_id in enumerate(metric_ids) if results[index] is None
+        ])
+
+        pending_indexes = []
+        pending_values = []
+        for index, item in enumerate(batch.items):
+            if results[index] is not None:
+                continue
+            metric_id = metric_ids[index]
+            if metric_id not in existing:
+                results[index] = MetricValueBatchItemResult(
+                    index=index,
+                    success=False,
+                    error=f"指标不存在：ID 为 {metric_id} 的指标未找到"
+                )
+                continue
+            data_type = existing[metric_id]["data_type"]
+            try:
+                encode_metric_value(item.value, data_type)
+            except ValueError as e:
+                results[index] = MetricValueBatchItemResult(index=index, success=False, error=str(e))
+                continue
+            pending_indexes.append(index)
+            pending_values.append({
+                "metric_id": metric_id,
+                "value": str(item.value),
+                "data_type": data_type,
+                "timestamp": item.timestamp.isoformat() if item.timestamp else None,
+                "dedup_key": dedup_keys[index],
+                "id": value_ids[index] if value_ids is not None else None
+            })
+
+        created = self.db.create_metric_values(pending_values, skip_existing)
+        for index, row in zip(pending_indexes, created):
+            duplicate = row.pop("duplicate", False)
+            if dedup_keys[index] is not None:
+                self.recent_keys.put((metric_ids[index], dedup_keys[index]), row)
+            results[index] = MetricValueBatchItemResult(index=index, success=True, id=row["id"], duplicate=duplicate)
+
+        succeeded = sum(1 for result in results if result.success)
+        return MetricValueBatchResponse(
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            duplicates=sum(1 for result in results if result.duplicate),
+            results=results
+        )
 
     def get_metric_values(
         self,
         metric_id: uuid.UUID,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        before: Optional[datetime] = None,
+        before_id: Optional[str] = None
     ) -> List[MetricValueResponse]:
-        """获取指标的历史值"""
+        """
+        获取指标的历史值
+
+        before 为时间上界（不含），与 before_id 一起构成键集分页位置；
+        指定 before 时忽略 offset
+        """
         # 验证指标是否存在
         metric = self.db.get_metric(str(metric_id))
         if not metric:
             raise ValueError(f"指标不存在：ID 为 {metric_id} 的指标未找到")
 
-        values = self.db.get_metric_values(str(metric_id), limit, offset)
+        if before is not None:
+            before = to_utc_naive(before)
+            offset = 0
+
+        values = self.db.get_metric_values(
+            str(metric_id), limit, offset,
+            before_timestamp=before,
+            before_id=before_id
+        )
         return [MetricValueResponse(**v) for v in values]
 
+    def export_metric_values(
+        self,
+        metric_id: uuid.UUID,
+        export_format: str = "ndjson",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Iterator[str]:
+        """
+        导出指标 [start, end) 范围内的历史值（按时间升序，未指定范围时导出全部）
+
+        参数在调用时立即校验；返回的迭代器从存储层逐批读取，每批编码为一个文本块
+        （ndjson 每行一个 JSON 对象，csv 首块为表头），内存占用与导出总量无关
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"导出格式错误：'{export_format}'，可选值为 {', '.join(EXPORT_FORMATS)}")
+        start = to_utc_naive(start) if start else None
+        end = to_utc_naive(end) if end else None
+        if start is not None and end is not None and start >= end:
+            raise ValueError("时间范围无效：start 必须早于 end")
+
+        metric = self.db.get_metric(str(metric_id))
+        if not metric:
+            raise NotFoundError(f"指标不存在：ID 为 {metric_id} 的指标未找到")
+
+        batches = self.db.iter_metric_values(str(metric_id), start, end)
+        return self._encode_export(batches, str(metric_id), metric["data_type"], export_format)
+
+    def _encode_export(
+        self,
+        batches: Iterator[list],
+        metric_id: str,
+        data_type: str,
+        export_format: str
+    ) -> Iterator[str]:
+        """将存储层的明细批次编码为导出文本块，迭代器关闭时一并关闭存储层游标"""
+        try:
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator="\n")
+                writer.writerow(EXPORT_CSV_COLUMNS)
+                for batch in batches:
+                    writer.writerows(
+                        (value_id, metric_id, timestamp.isoformat(),
+                         decode_metric_value(value_num, value_text, data_type))
+                        for value_id, timestamp, value_num, value_text in batch
+                    )
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    # 没有任何数据时只输出表头
+                    yield buffer.getvalue()
+            else:
+                for batch in batches:
+                    yield "".join(
+                        json.dumps({
+                            "id": value_id,
+                            "metric_id": metric_id,
+                            "value": decode_metric_value(value_num, value_text, data_type),
+                            "timestamp": timestamp.isoformat()
+                        }, ensure_ascii=False) + "\n"
+                        for value_id, timestamp, value_num, value_text in batch
+                    )
+        finally:
+            batches.close()
+
+    def export_metric_values_columnar(self, query: MetricColumnarExportQuery) -> Iterator[bytes]:
+        """
+        将多个指标 [start, end) 范围内的历史值导出为 Arrow IPC 流或 Parquet 文件
+
+        列为 metric_id（字典编码）、timestamp（UTC 秒级时间戳）、value（float64，数值类型指标）
+        和 value_text（字符串类型指标），指标的名称、单位和数据类型写入 schema 元数据 metrics。
+        参数在调用时立即校验；返回的迭代器逐个指标从存储层分批读取，
+        每累积 COLUMNAR_BATCH_ROWS 行编码为一个记录批次（Parquet 行组）并输出
+        """
+        pyarrow = import_pyarrow()
+        if (query.metric_ids is None) == (query.facility_id is None):
+            raise ValueError("metric_ids 与 facility_id 必须且只能指定一个")
+        start = to_utc_naive(query.start) if query.start else None
+        end = to_utc_naive(query.end) if query.end else None
+        if start is not None and end is not None and start >= end:
+            raise ValueError("时间范围无效：start 必须早于 end")
+
+        if query.facility_id is not None:
+            facility_id = str(query.facility_id)
+            if not self.db.get_facility(facility_id):
+                raise NotFoundError(f"设施不存在：ID 为 {facility_id} 的设施未找到")
+            facility_ids = [row["id"] for row in self.db.get_facility_subtree(root_id=facility_id)]
+            metrics = self.db.get_metrics_by_facilities(facility_ids)
+        else:
+            metric_ids = list(dict.fromkeys(str(metric_id) for metric_id in query.metric_ids))
+            existing = self.db.get_metrics_by_ids(metric_ids)
+            for metric_id in metric_ids:
+                if metric_id not in existing:
+                    raise NotFoundError(f"指标不存在：ID 为 {metric_id} 的指标未找到")
+            metrics = [existing[metric_id] for metric_id in metric_ids]
+
+        return self._encode_columnar_export(pyarrow, metrics, start, end, query.format)
+
+    def _encode_columnar_export(
+        self,
+        pyarrow,
+        metrics: List[dict],
+        start: Optional[datetime],
+        end: Optional[datetime],
+        export_format: ColumnarExportFormat
+    ) -> Iterator[bytes]:
+        """逐个指标读取明细批次，按列累积后编码输出；迭代器关闭时一并关闭存储层游标"""
+        timestamp_type = pyarrow.timestamp("s", tz="UTC")
+        metadata = [
+            {key: metric.get(key) for key in ("id", "name", "unit", "data_type", "facility_id")}
+            for metric in metrics
+        ]
+        schema = pyarrow.schema([
+            pyarrow.field("metric_id", pyarrow.dictionary(pyarrow.int32(), pyarrow.string()), nullable=False),
+            pyarrow.field("timestamp", timestamp_type, nullable=False),
+            pyarrow.field("value", pyarrow.float64()),
+            pyarrow.field("value_text", pyarrow.string()),
+        ], metadata={"metrics": json.dumps(metadata, ensure_ascii=False, default=str)})
+        dictionary = pyarrow.array([metric["id"] for metric in metrics], pyarrow.string())
+
+        sink = _ChunkSink()
+        if export_format == ColumnarExportFormat.PARQUET:
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        else:
+            writer = pyarrow.ipc.new_stream(sink, schema)
+        indices: List[int] = []
+        timestamps: List[datetime] = []
+        numbers: List[Optional[float]] = []
+        texts: List[Optional[str]] = []
+
+        def write_batch():
+            writer.write_batch(pyarrow.record_batch([
+                pyarrow.DictionaryArray.from_arrays(pyarrow.array(indices, pyarrow.int32()), dictionary),
+                pyarrow.array(timestamps, timestamp_type),
+                pyarrow.array(numbers, pyarrow.float64()),
+                pyarrow.array(texts, pyarrow.string()),
+            ], schema=schema))
+            for column in (indices, timestamps, numbers, texts):
+                column.clear()
+
+        batches = None
+        try:
+            for index, metric in enumerate(metrics):
+                batches = self.db.iter_metric_values(metric["id"], start, end)
+                for batch in batches:
+                    indices.extend([index] * len(batch))
+                    timestamps.extend(row[1] for row in batch)
+                    numbers.extend(row[2] for row in batch)
+                    texts.extend(row[3] for row in batch)
+                    if len(indices) >= COLUMNAR_BATCH_ROWS:
+                        write_batch()
+                        yield sink.take()
+                batches = None
+            if indices:
+                write_batch()
+            writer.close()
+            yield sink.take()
+        finally:
+            if batches is not None:
+                batches.close()
+
+    def aggregate_metric_values(
+        self,
+        metric_id: uuid.UUID,
+        bucket: str,
+        functions: List[AggregateFunction],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> MetricAggregateResponse:
+        """
+        按时间桶聚合指标的历史值
+
+        未指定时间范围时默认查询最近 24 小时；时间桶按 UTC 纪元对齐
+        """
+        bucket_seconds = parse_bucket(bucket)
+
+        end = to_utc_naive(end) if end else datetime.utcnow()
+        start = to_utc_naive(start) if start else end - timedelta(days=1)
+        if start >= end:
+            raise ValueError("时间范围无效：start 必须早于 end")
+        if (end - start).total_seconds() / bucket_seconds > MAX_AGGREGATE_BUCKETS:
+            raise ValueError(f"时间桶数量过多：单次查询最多 {MAX_AGGREGATE_BUCKETS} 个时间桶，请增大 bucket 或缩小时间范围")
+
+        metric = self.db.get_metric(str(metric_id))
+        if not metric:
+            raise NotFoundError(f"指标不存在：ID 为 {metric_id} 的指标未找到")
+
+        buckets = self.db.aggregate_metric_values(str(metric_id), start, end, bucket_seconds)
+
+        points = []
+        for row in buckets:
+            values = {
+                AggregateFunction.COUNT: row["count"],
+                AggregateFunction.SUM: row["sum"],
+                AggregateFunction.MIN: row["min"],
+                AggregateFunction.MAX: row["max"],
+                # 平均值的分母只计有数值的记录，数值列为空的记录（如无法解析的旧数据）不参与
+                AggregateFunction.AVG: (
+                    row["sum"] / row["count_num"]
+                    if row["sum"] is not None and row["count_num"] else None
+                )
+            }
+            points.append(MetricAggregatePoint(
+                timestamp=row["bucket_start"],
+                **{function.value: values[function] for function in functions}
+            ))
+
+        return MetricAggregateResponse(
+            metric_id=metric_id,
+            start=start,
+            end=end,
+            bucket=bucket,
+            bucket_seconds=bucket_seconds,
+            functions=functions,
+            points=points
+        )
+
     def get_latest_metric_value(self, metric_id: uuid.UUID) -> Optional[MetricValueResponse]:
         """获取指标的最新值"""
         value = self.db.get_latest_metric_value(str(metric_id))
         if not value:
             return None
         return MetricValueResponse(**value)
+
+    def get_latest_metric_values(self, query: MetricLatestQuery) -> List[MetricValueResponse]:
+        """批量获取指标的最新值（按请求顺序返回，没有数据的指标会被省略）"""
+        metric_ids = [str(metric_id) for metric_id in query.metric_ids]
+        values = self.db.get_latest_metric_values(metric_ids)
+        return [
+            MetricValueResponse(**values[metric_id])
+            for metric_id in dict.fromkeys(metric_ids)
+            if metric_id in values
+        ]
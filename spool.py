@@ -0,0 +1,424 @@
+"""
+落盘缓冲层
+数据库不可用或写入超出延迟预算时，单条指标值先追加到本地缓冲文件（合并 fsync）后立即确认，
+由后台任务在数据库恢复后按写入顺序批量回放
+"""
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import json
+import os
+import zlib
+
+from async_database import AsyncDatabase
+from models import MetricValueCreate, MetricValueBatchCreate
+from service import MetricService
+from storage import uuid7
+
+
+# 缓冲文件名为 spool-<序号>.log，序号递增，回放按序号和文件内顺序进行
+_SEGMENT_PREFIX = "spool-"
+_SEGMENT_SUFFIX = ".log"
+# 回放位置文件：已回放到的 (文件序号, 文件内偏移)
+_CHECKPOINT_FILE = "checkpoint"
+
+
+class IngestSpoolUnavailable(Exception):
+    """本地缓冲已满、写入失败或正在关闭，客户端应按 retry_after 秒后重试"""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _encode_record(value_data: MetricValueCreate, value_id: Optional[str]) -> bytes:
+    """一条记录占一行：8 位十六进制 CRC32、空格、JSON（读数字段加上预先分配的记录 ID）"""
+    payload = json.dumps({**value_data.model_dump(mode="json"), "id": value_id}).encode()
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _decode_record(line: bytes) -> Optional[Tuple[MetricValueCreate, Optional[str]]]:
+    """校验并解析一行记录，返回 (读数, 记录 ID)，校验失败时返回 None"""
+    if len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        record = json.loads(payload)
+        value_id = record.pop("id", None)
+        return MetricValueCreate.model_validate(record), value_id
+    except ValueError:
+        return None
+
+
+class IngestSpool:
+    """
+    指标值落盘缓冲类
+
+    - prepare 在首次写入前补全接收时间并预先分配记录 ID（uuid7），直接写入与回放使用相同的时间戳和 ID：
+      超出延迟预算但最终写入成功的读数在回放时按主键跳过，正常写入不需要登记去重键
+    - append 把读数追加到当前缓冲文件，同一 fsync_interval 内的追加合并为一次 fsync，落盘后返回
+    - 缓冲中还有未回放的读数时 active 为 true，新读数直接进入缓冲：保持接收顺序，
+      数据库故障期间也不必每个请求都等满延迟预算
+    - 后台任务按顺序读取 batch_size 条，通过 MetricService.create_metric_values 批量写入，
+      成功后保存回放位置并删除已回放完的文件；写入失败时退避重试同一批。
+      保存回放位置前进程退出会重放最后一批，同样按记录 ID 去重
+    - 每条记录带 CRC32 校验，进程崩溃留下的不完整记录在回放时跳过并计入 corrupt
+    - 缓冲总量超过 max_bytes 时拒绝新数据（调用方返回 503）
+    """
+
+    def __init__(
+        self,
+        metric_service: MetricService,
+        async_db: AsyncDatabase,
+        directory: Optional[str] = None,
+        latency_budget: Optional[float] = None,
+        fsync_interval: Optional[float] = None,
+        segment_bytes: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        replay_interval: Optional[float] = None
+    ):
+        self.metric_service = metric_service
+        self.async_db = async_db
+        # 缓冲目录，为空时不启用落盘缓冲
+        if directory is None:
+            directory = os.getenv("INGEST_SPOOL_DIR", "")
+        self.directory = directory
+        # 单条写入等待数据库的最长时间（秒），超时后转入缓冲
+        if latency_budget is None:
+            latency_budget = float(os.getenv("INGEST_SPOOL_LATENCY_BUDGET", "0.5"))
+        self.latency_budget = latency_budget
+        # 合并 fsync 的时间窗口（秒），0 表示每次追加后立即 fsync（并发追加仍会合并）
+        if fsync_interval is None:
+            fsync_interval = float(os.getenv("INGEST_SPOOL_FSYNC_INTERVAL", "0.01"))
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes or int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+        self.max_bytes = max_bytes or int(os.getenv("INGEST_SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+        # 与批量写入接口的单次上限一致
+        self.batch_size = min(batch_size or int(os.getenv("INGEST_SPOOL_REPLAY_BATCH", "1000")), 10000)
+        # 缓冲为空时检查新数据的间隔（秒）
+        if replay_interval is None:
+            replay_interval = float(os.getenv("INGEST_SPOOL_REPLAY_INTERVAL", "1"))
+        self.replay_interval = replay_interval
+
+        # 当前追加的文件：序号、文件描述符、已写入字节数；下一个新文件的序号
+        self._seq: Optional[int] = None
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._next_seq = 0
+        # 已回放到的位置
+        self._position: Tuple[int, int] = (0, 0)
+        self._pending_records = 0
+        self._pending_bytes = 0
+        # 等待下一次 fsync 的追加、待 fsync 的文件、已切换待关闭的文件
+        self._waiters: List[asyncio.Future] = []
+        self._unsynced: set = set()
+        self._retired: List[int] = []
+        self._new_file = False
+        self._dirty = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._closing = False
+        self._sync_task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._stats = {
+            "spooled": 0, "rejected": 0, "fallbacks": 0, "fsyncs": 0, "replayed": 0, "duplicates": 0,
+            "failed": 0, "corrupt": 0, "batches": 0, "replay_errors": 0
+        }
+        self._last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @property
+    def active(self) -> bool:
+        """缓冲中是否还有未回放的数据"""
+        return self._pending_bytes > 0
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        """缓冲目录中全部文件的序号（升序）"""
+        seqs = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                number = name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]
+                if number.isdigit():
+                    seqs.append(int(number))
+        return sorted(seqs)
+
+    def open(self):
+        """
+        恢复缓冲状态：读取回放位置，删除已回放完的文件，统计未回放的记录数
+
+        上次运行的文件都视为已封闭，本次运行的追加总是写入新文件，崩溃留下的不完整记录只会出现在文件末尾
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                seq, offset = f.read().split()
+            self._position = (int(seq), int(offset))
+
+        seqs = self._segments()
+        for seq in seqs:
+            if seq < self._position[0]:
+                os.remove(self._segment_path(seq))
+                continue
+            offset = self._position[1] if seq == self._position[0] else 0
+            with open(self._segment_path(seq), "rb") as f:
+                f.seek(offset)
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    self._pending_records += chunk.count(b"\n")
+                    self._pending_bytes += len(chunk)
+        self._next_seq = max(seqs[-1] + 1 if seqs else 0, self._position[0] + 1)
+        if self._pending_records:
+            print(f"Ingest spool has {self._pending_records} values pending replay")
+
+    def start(self):
+        """启动后台 fsync 与回放任务"""
+        self._sync_task = asyncio.create_task(self._sync_loop())
+        self._replay_task = asyncio.create_task(self._replay_loop())
+
+    def prepare(self, value_data: MetricValueCreate) -> Tuple[MetricValueCreate, str]:
+        """补全接收时间并预先分配记录 ID，返回 (读数, 记录 ID)，使直接写入与缓冲回放可以按主键去重"""
+        if value_data.timestamp is None:
+            value_data = value_data.model_copy(update={"timestamp": datetime.utcnow()})
+        return value_data, str(uuid7())
+
+    def record_fallback(self, error: BaseException):
+        """记录一次因数据库异常或超出延迟预算而转入缓冲的写入"""
+        self._stats["fallbacks"] += 1
+        self._last_error = str(error) or type(error).__name__
+
+    async def append(self, items: List[MetricValueCreate], value_ids: Optional[List[Optional[str]]] = None):
+        """
+        追加一批读数及其预先分配的记录 ID，等待下一次 fsync 完成后返回；
+        缓冲已满、写入失败或正在关闭时抛出异常
+        """
+        if self._closing:
+            self._stats["rejected"] += len(items)
+            raise IngestSpoolUnavailable("服务正在关闭，暂不接收写入，请稍后重试")
+        if value_ids is None:
+            value_ids = [None] * len(items)
+        data = b"".join(_encode_record(item, value_id) for item, value_id in zip(items, value_ids))
+        if self._pending_bytes + len(data) > self.max_bytes:
+            self._stats["rejected"] += len(items)
+            raise IngestSpoolUnavailable("数据库不可用且本地缓冲已满，请稍后重试")
+
+        try:
+            if self._fd is None or self._size >= self.segment_bytes:
+                self._roll()
+            # 追加模式下单次 write 写入整批记录，回放读取时只会看到整行或末尾未写完的一行
+            written = os.write(self._fd, data)
+            if written != len(data):
+                raise OSError(f"short write ({written} of {len(data)} bytes)")
+        except OSError as e:
+            # 写了一部分的记录留在旧文件末尾，后续追加写入新文件，避免与其拼成一行
+            self._size = self.segment_bytes
+            self._stats["rejected"] += len(items)
+            raise IngestSpoolUnavailable(f"写入本地缓冲失败：{e}")
+        self._size += len(data)
+        self._pending_bytes += len(data)
+        self._pending_records += len(items)
+        self._stats["spooled"] += len(items)
+        self._unsynced.add(self._fd)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._dirty.set()
+        await waiter
+
+    def _roll(self):
+        """切换到新的缓冲文件，旧文件在下一次 fsync 后关闭"""
+        if self._fd is not None:
+            self._retired.append(self._fd)
+        self._seq = self._next_seq
+        self._next_seq += 1
+        self._fd = os.open(self._segment_path(self._seq), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+        self._new_file = True
+
+    def _sync(self, fds: set, retired: List[int], new_file: bool):
+        """fsync 本轮写入过的文件（新建文件时同时 fsync 目录），然后关闭已切换的旧文件"""
+        try:
+            for fd in fds:
+                os.fsync(fd)
+            if new_file:
+                dir_fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+        finally:
+            for fd in retired:
+                os.close(fd)
+
+    async def _sync_loop(self):
+        """后台 fsync 循环：有新的追加时等待 fsync_interval 再统一 fsync，唤醒这期间的全部追加"""
+        while True:
+            await self._dirty.wait()
+            if self.fsync_interval > 0 and not self._closing:
+                await asyncio.sleep(self.fsync_interval)
+            self._dirty.clear()
+            waiters, self._waiters = self._waiters, []
+            fds, self._unsynced = self._unsynced, set()
+            retired, self._retired = self._retired, []
+            new_file, self._new_file = self._new_file, False
+            try:
+                await asyncio.to_thread(self._sync, fds, retired, new_file)
+            except OSError as e:
+                print(f"Ingest spool fsync failed: {e}")
+                error = IngestSpoolUnavailable(f"本地缓冲落盘失败：{e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(error)
+            else:
+                self._stats["fsyncs"] += 1
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+            # 关闭前已追加的数据都完成 fsync 后退出
+            if self._closing and not self._waiters:
+                return
+
+    def _read_batch(self, position: Tuple[int, int], boundary: int) -> Dict[str, Any]:
+        """
+        从 position 开始按顺序读取最多 batch_size 条记录
+
+        序号小于 boundary 的文件已封闭，读到末尾后继续读下一个文件，末尾不完整的记录视为崩溃残留跳过；
+        正在追加的文件读到最后一个完整行为止
+        """
+        seq, offset = position
+        records: List[Tuple[MetricValueCreate, Optional[str]]] = []
+        lines = consumed = corrupt = 0
+        for file_seq in self._segments():
+            if file_seq < seq:
+                continue
+            if file_seq > seq:
+                seq, offset = file_seq, 0
+            sealed = file_seq < boundary
+            with open(self._segment_path(file_seq), "rb") as f:
+                f.seek(offset)
+                while len(records) < self.batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if not line.endswith(b"\n"):
+                        if sealed:
+                            corrupt += 1
+                            offset += len(line)
+                            consumed += len(line)
+                        break
+                    offset += len(line)
+                    consumed += len(line)
+                    lines += 1
+                    record = _decode_record(line)
+                    if record is None:
+                        corrupt += 1
+                    else:
+                        records.append(record)
+            if len(records) >= self.batch_size or not sealed:
+                break
+        return {"records": records, "position": (seq, offset), "lines": lines, "consumed": consumed, "corrupt": corrupt}
+
+    def _commit(self, position: Tuple[int, int]):
+        """保存回放位置，删除已回放完的文件"""
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{position[0]} {position[1]}")
+        os.replace(path + ".tmp", path)
+        for seq in self._segments():
+            if seq >= position[0]:
+                break
+            os.remove(self._segment_path(seq))
+
+    async def _replay_loop(self):
+        """后台回放循环：按顺序批量写入数据库，写入失败时按指数退避重试同一批"""
+        attempt = 0
+        batch = None
+        while not self._stopping.is_set():
+            if batch is None:
+                if not self.active:
+                    await self._wait(self.replay_interval)
+                    continue
+                boundary = self._seq if self._seq is not None else self._next_seq
+                batch = await asyncio.to_thread(self._read_batch, self._position, boundary)
+
+            records = batch["records"]
+            if records:
+                try:
+                    result = await self.async_db.run(
+                        self.metric_service.create_metric_values,
+                        MetricValueBatchCreate(items=[value_data for value_data, _ in records]),
+                        [value_id for _, value_id in records],
+                        skip_existing=True
+                    )
+                except Exception as e:
+                    attempt += 1
+                    self._stats["replay_errors"] += 1
+                    self._last_error = str(e) or type(e).__name__
+                    delay = min(2 ** attempt * 0.1, 5.0)
+                    print(f"Ingest spool replay of {len(records)} values failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                    await self._wait(delay)
+                    continue
+                attempt = 0
+                self._stats["batches"] += 1
+                self._stats["replayed"] += result.succeeded - result.duplicates
+                self._stats["duplicates"] += result.duplicates
+                self._stats["failed"] += result.failed
+                if result.failed:
+                    errors = [item.error for item in result.results if not item.success][:5]
+                    print(f"Ingest spool replay dropped {result.failed} invalid values: {errors}")
+            if batch["corrupt"]:
+                self._stats["corrupt"] += batch["corrupt"]
+                print(f"Ingest spool skipped {batch['corrupt']} incomplete or corrupt records")
+
+            if batch["position"] != self._position:
+                await asyncio.to_thread(self._commit, batch["position"])
+                self._position = batch["position"]
+            self._pending_bytes = max(self._pending_bytes - batch["consumed"], 0)
+            self._pending_records = max(self._pending_records - batch["lines"], 0)
+            if not batch["consumed"]:
+                # 正在追加的文件末尾只有未写完的记录，稍后再读
+                await self._wait(min(self.replay_interval, 0.1))
+            batch = None
+
+    async def _wait(self, seconds: float):
+        """等待 seconds 秒，close() 时立即返回"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """落盘缓冲运行统计"""
+        return {
+            **self._stats,
+            "active": self.active,
+            "pending_records": self._pending_records,
+            "pending_bytes": self._pending_bytes,
+            "max_bytes": self.max_bytes,
+            "latency_budget": self.latency_budget,
+            "last_error": self._last_error,
+            "closing": self._closing
+        }
+
+    async def close(self):
+        """停止接收新数据，等待已追加的数据落盘并停止回放（未回放的数据在下次启动后继续回放）"""
+        self._closing = True
+        self._stopping.set()
+        if self._replay_task is not None:
+            await self._replay_task
+        if self._sync_task is not None:
+            self._dirty.set()
+            await self._sync_task
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,1600 @@
+"""
+SQLite 数据库层
+嵌入式存储后端，无需 MySQL 服务即可运行完整 API（适用于边缘站点、本地开发与基准测试）
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from contextlib import contextmanager
+import heapq
+import itertools
+import sqlite3
+import uuid
+import os
+
+from pool import ConnectionPool
+from storage import (
+    Storage, BATCH_CHUNK_SIZE, EXPORT_BATCH_SIZE, ROLLUP_LEVELS, DELETION_BATCH_SIZE, COMPACTION_WINDOW_SECONDS,
+    new_deletion_job, index_dedup_keys, mark_duplicates, parse_timestamp, floor_timestamp,
+    plan_aggregate_segments, merge_bucket_row, encode_metric_value, decode_metric_value,
+    compute_facility_paths, build_hierarchy_rows, rollup_buckets, latest_value_rows, uuid7,
+    encode_value_block, block_value_rows, select_block_page, aggregate_block_rows
+)
+
+
+# 数据库结构版本迁移：(版本号, 说明, 迁移方法名)，新的结构变更以新版本追加到末尾
+SCHEMA_MIGRATIONS = [
+    (1, "基础表结构", "_init_schema"),
+    (2, "指标明细与汇总改由后台删除任务清理", "_init_deletion_jobs"),
+    (3, "指标值去重键表", "_init_value_dedup_keys"),
+    (4, "指标值压缩块表", "_init_value_blocks"),
+]
+
+# 每个连接缓存的预编译语句数量（sqlite3 按 SQL 文本复用已编译的语句）
+STATEMENT_CACHE_SIZE = 256
+
+# 时间以 ISO 8601 文本存储（字典序与时间先后一致），时间桶按 UTC 纪元对齐计算
+_BUCKET_START_SQL = "strftime('%Y-%m-%dT%H:%M:%S', (CAST(strftime('%s', {column}) AS INTEGER) / ?) * ?, 'unixepoch')"
+_BUCKET_INDEX_SQL = "CAST(strftime('%s', {column}) AS INTEGER) / ?"
+
+
+def _format_timestamp(value: datetime) -> str:
+    """将时间转换为 SQLite 中存储的 ISO 格式文本"""
+    return value.isoformat()
+
+
+class _SQLiteConnection(sqlite3.Connection):
+    """提供连接池所需的 is_connected / ping 接口"""
+
+    def is_connected(self) -> bool:
+        try:
+            self.total_changes
+        except sqlite3.ProgrammingError:
+            return False
+        return True
+
+    def ping(self, reconnect: bool = False):
+        self.execute("SELECT 1")
+
+
+class SQLiteDatabase(Storage):
+    """
+    数据库管理类（SQLite 存储后端）
+
+    - WAL 模式：读操作不阻塞写操作，多个连接可并发读取
+    - 写事务以 BEGIN IMMEDIATE 开始，一开始就获取写锁，避免读事务升级为写事务时的死锁；
+      锁被占用时按 busy_timeout 等待
+    - 所有语句使用参数占位符，同一连接上重复执行时复用预编译语句；批量写入在一个事务中 executemany
+    """
+
+    def __init__(self, path: str = None, busy_timeout: float = None):
+        self.path = path or os.getenv("SQLITE_PATH", "facilities.db")
+        self.busy_timeout = busy_timeout or float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+
+        self.pool = ConnectionPool(
+            self._connect,
+            min_size=1,
+            max_size=int(os.getenv("SQLITE_POOL_MAX_SIZE", "8")),
+            timeout=float(os.getenv("SQLITE_POOL_TIMEOUT", "5")),
+            max_waiters=int(os.getenv("SQLITE_POOL_MAX_WAITERS", "32"))
+        )
+        self.max_concurrency = self.pool.max_size + self.pool.max_waiters
+
+    def _connect(self):
+        """建立一个新的数据库连接并设置 WAL 等连接参数"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,  # 由 get_conn 显式管理事务
+            check_same_thread=False,  # 连接由连接池在线程间传递，同一时刻只被一个线程使用
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=_SQLiteConnection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @contextmanager
+    def get_conn(self, write: bool = False):
+        """获取数据库连接的上下文管理器，整个代码块在一个事务中执行；write 为 True 时立即获取写锁"""
+        conn = self.pool.acquire()
+        discard = False
+        try:
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            # 包括流式读取的生成器被提前关闭（GeneratorExit），不能把未结束的事务放回连接池
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                # 连接已损坏，不再放回连接池
+                discard = True
+            raise
+        finally:
+            self.pool.release(conn, discard=discard)
+
+    def migrate(self) -> List[int]:
+        """
+        执行尚未应用的结构迁移，返回本次应用的版本号
+
+        已是最新版本时只需一次查询；SQLite 的 DDL 支持事务，所有迁移在同一个写事务中完成
+        """
+        latest = SCHEMA_MIGRATIONS[-1][0]
+        with self.get_conn() as conn:
+            if self._get_schema_version(conn) >= latest:
+                return []
+
+        applied = []
+        with self.get_conn(write=True) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TEXT NOT NULL
+                )
+            """)
+            # 持有写锁后重新读取，其他进程可能已完成迁移
+            current = self._get_schema_version(conn)
+            for version, name, method in SCHEMA_MIGRATIONS:
+                if version <= current:
+                    continue
+                getattr(self, method)(conn)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, _format_timestamp(datetime.utcnow()))
+                )
+                applied.append(version)
+        return applied
+
+    def _get_schema_version(self, conn) -> int:
+        """获取已应用的最高结构版本，尚未建立版本表时返回 0"""
+        try:
+            row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+        except sqlite3.OperationalError as err:
+            if "no such table" in str(err):
+                return 0
+            raise
+        return row[0] or 0
+
+    def _init_schema(self, conn):
+        """版本 1：基础表结构（设施、指标、指标值、汇总表、最新值表及索引），兼容升级旧版本表"""
+        # 创建设施表
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS facilities (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                facility_type TEXT NOT NULL,
+                parent_id TEXT,
+                description TEXT,
+                path TEXT,
+                id_path TEXT,
+                depth INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (parent_id) REFERENCES facilities(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 旧版本的 facilities 表没有物化路径列，补充后按层级回填
+        if "id_path" not in self._get_table_columns(conn, "facilities"):
+            conn.execute("ALTER TABLE facilities ADD COLUMN path TEXT")
+            conn.execute("ALTER TABLE facilities ADD COLUMN id_path TEXT")
+            conn.execute("ALTER TABLE facilities ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+            self._backfill_facility_paths(conn)
+
+        # 创建指标表
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                unit TEXT,
+                data_type TEXT NOT NULL DEFAULT 'float',
+                description TEXT,
+                facility_id TEXT NOT NULL,
+                retention_days INTEGER,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (facility_id) REFERENCES facilities(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 旧版本的 metrics 表没有按指标配置的保留天数
+        if "retention_days" not in self._get_table_columns(conn, "metrics"):
+            conn.execute("ALTER TABLE metrics ADD COLUMN retention_days INTEGER")
+
+        # 旧版本的 metric_values 使用 TEXT NOT NULL 的 value 列，SQLite 无法修改列约束，改名后重建
+        legacy_values = "value" in self._get_table_columns(conn, "metric_values")
+        if legacy_values:
+            conn.execute("ALTER TABLE metric_values RENAME TO metric_values_legacy")
+            conn.execute("DROP INDEX IF EXISTS idx_metric_values_metric_id")
+
+        # 创建指标值表（用于存储时序数据）
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_values (
+                id TEXT PRIMARY KEY,
+                metric_id TEXT NOT NULL,
+                value_num REAL,
+                value_text TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 创建指标值汇总表（按时间粒度预聚合，随写入增量维护）
+        for table, _ in ROLLUP_LEVELS:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    metric_id TEXT NOT NULL,
+                    bucket_start TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    count_num INTEGER NOT NULL,
+                    sum REAL,
+                    min REAL,
+                    max REAL,
+                    PRIMARY KEY (metric_id, bucket_start),
+                    FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            """)
+
+        # 创建指标最新值表（写入时 upsert，最新值查询为主键查找）
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_latest (
+                metric_id TEXT PRIMARY KEY,
+                value_id TEXT NOT NULL,
+                value_num REAL,
+                value_text TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+
+        # 创建索引以提高查询性能
+        for index_sql in [
+            "CREATE INDEX IF NOT EXISTS idx_facilities_parent_id ON facilities(parent_id)",
+            "CREATE INDEX IF NOT EXISTS idx_facilities_type ON facilities(facility_type)",
+            # 物化路径前缀索引，子树查询（GLOB 前缀匹配）为一次索引范围扫描
+            "CREATE INDEX IF NOT EXISTS idx_facilities_id_path ON facilities(id_path)",
+            "CREATE INDEX IF NOT EXISTS idx_metrics_facility_id ON metrics(facility_id)",
+            # 复合索引同时服务于按指标过滤、按时间排序以及游标分页
+            "CREATE INDEX IF NOT EXISTS idx_metric_values_metric_ts ON metric_values(metric_id, timestamp)"
+        ]:
+            conn.execute(index_sql)
+
+        if legacy_values:
+            self._copy_legacy_values(conn)
+
+    def _init_deletion_jobs(self, conn):
+        """
+        版本 2：明细表与汇总表去掉级联外键，新增删除任务表
+
+        SQLite 无法删除外键约束，按新结构建表后复制数据并替换原表。
+        删除指标后其明细与汇总由后台删除任务分批清理，避免一个写事务长时间阻塞写入
+        """
+        conn.execute("""
+            CREATE TABLE metric_values_new (
+                id TEXT PRIMARY KEY,
+                metric_id TEXT NOT NULL,
+                value_num REAL,
+                value_text TEXT,
+                timestamp TEXT NOT NULL
+            )
+        """)
+        conn.execute(
+            """
+            INSERT INTO metric_values_new (id, metric_id, value_num, value_text, timestamp)
+            SELECT id, metric_id, value_num, value_text, timestamp FROM metric_values
+            """
+        )
+        conn.execute("DROP TABLE metric_values")
+        conn.execute("ALTER TABLE metric_values_new RENAME TO metric_values")
+        conn.execute("CREATE INDEX idx_metric_values_metric_ts ON metric_values(metric_id, timestamp)")
+
+        for table, _ in ROLLUP_LEVELS:
+            conn.execute(f"""
+                CREATE TABLE {table}_new (
+                    metric_id TEXT NOT NULL,
+                    bucket_start TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    count_num INTEGER NOT NULL,
+                    sum REAL,
+                    min REAL,
+                    max REAL,
+                    PRIMARY KEY (metric_id, bucket_start)
+                ) WITHOUT ROWID
+            """)
+            conn.execute(
+                f"INSERT INTO {table}_new SELECT metric_id, bucket_start, count, count_num, sum, min, max FROM {table}"
+            )
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS deletion_jobs (
+                id TEXT PRIMARY KEY,
+                target_type TEXT NOT NULL,
+                target_id TEXT NOT NULL,
+                target_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                metrics_total INTEGER NOT NULL,
+                metrics_done INTEGER NOT NULL DEFAULT 0,
+                rows_deleted INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_deletion_jobs_status ON deletion_jobs(status, created_at)")
+        # 删除任务中尚未清理完的指标，清理完一个删除一行
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS deletion_job_metrics (
+                job_id TEXT NOT NULL,
+                metric_id TEXT NOT NULL,
+                PRIMARY KEY (job_id, metric_id)
+            ) WITHOUT ROWID
+        """)
+
+    def _init_value_dedup_keys(self, conn):
+        """
+        版本 3：指标值去重键表
+
+        主键 (metric_id, key_hash) 保证以相同去重键重复提交的读数只写入一次；
+        过期的去重键（包括已删除指标遗留的键）由数据保留任务按 created_at 分批清理
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_value_keys (
+                metric_id TEXT NOT NULL,
+                key_hash BLOB NOT NULL,
+                value_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (metric_id, key_hash)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_metric_value_keys_created ON metric_value_keys(created_at)")
+
+    def _init_value_blocks(self, conn):
+        """
+        版本 4：指标值压缩块表
+
+        数值型指标已关闭时间窗口内的明细压缩为块后从 metric_values 删除，每个 (指标, 窗口) 一个块，
+        value_ids 按块内顺序保存原记录 ID；块的数据较大，使用带 rowid 的普通表，主键为独立索引
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_value_blocks (
+                metric_id TEXT NOT NULL,
+                block_start TEXT NOT NULL,
+                first_timestamp TEXT NOT NULL,
+                last_timestamp TEXT NOT NULL,
+                value_count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                value_ids BLOB NOT NULL,
+                PRIMARY KEY (metric_id, block_start)
+            )
+        """)
+
+    def _get_table_columns(self, conn, table: str) -> List[str]:
+        """获取表的列名列表"""
+        return [row["name"] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    def _backfill_facility_paths(self, conn):
+        """根据 parent_id 在内存中计算所有设施的物化路径并批量写回"""
+        rows = conn.execute("SELECT id, name, parent_id FROM facilities").fetchall()
+        paths = compute_facility_paths({row["id"]: (row["name"], row["parent_id"]) for row in rows})
+        conn.executemany(
+            "UPDATE facilities SET path = ?, id_path = ?, depth = ? WHERE id = ?",
+            [(*paths[facility_id], facility_id) for facility_id in paths]
+        )
+
+    def _copy_legacy_values(self, conn, batch_size: int = 5000):
+        """
+        将旧表 metric_values_legacy 中的文本指标值按数据类型转换后分批写入新表，并回填汇总与最新值
+
+        旧数据的时间统一转换为 UTC 无时区格式；无法按数据类型解析的值保留为文本
+        """
+        last_rowid = 0
+        while True:
+            legacy = conn.execute(
+                """
+                SELECT mv.rowid, mv.id, mv.metric_id, mv.value, mv.timestamp, m.data_type
+                FROM metric_values_legacy mv
+                JOIN metrics m ON m.id = mv.metric_id
+                WHERE mv.rowid > ?
+                ORDER BY mv.rowid
+                LIMIT ?
+                """,
+                (last_rowid, batch_size)
+            ).fetchall()
+            if not legacy:
+                break
+            last_rowid = legacy[-1]["rowid"]
+
+            rows = []
+            for row in legacy:
+                try:
+                    value_num, value_text = encode_metric_value(row["value"], row["data_type"])
+                except ValueError:
+                    value_num, value_text = None, row["value"]
+                timestamp = parse_timestamp(row["timestamp"]).replace(microsecond=0)
+                rows.append((row["id"], row["metric_id"], value_num, value_text, timestamp))
+            self._insert_value_rows(conn, rows)
+
+        conn.execute("DROP TABLE metric_values_legacy")
+
+    # ==================== 数据保留 ====================
+
+    def get_metric_retention_overrides(self) -> Dict[str, int]:
+        """获取单独配置了保留天数的指标 {指标ID: 保留天数}"""
+        with self.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT id, retention_days FROM metrics WHERE retention_days IS NOT NULL"
+            ).fetchall()
+            return {row["id"]: int(row["retention_days"]) for row in rows}
+
+    def purge_metric_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """
+        分批删除早于 before 的明细数据，返回删除的记录数
+
+        指定 metric_id 时只清理该指标，否则清理所有未单独配置保留天数的指标；
+        每批在独立的写事务中完成，避免长时间持有写锁
+        """
+        if metric_id is not None:
+            condition = "metric_id = ? AND timestamp < ?"
+            params: Tuple[Any, ...] = (metric_id, _format_timestamp(before), batch_size)
+        else:
+            condition = "timestamp < ? AND metric_id IN (SELECT id FROM metrics WHERE retention_days IS NULL)"
+            params = (_format_timestamp(before), batch_size)
+
+        deleted = 0
+        while True:
+            with self.get_conn(write=True) as conn:
+                cursor = conn.execute(
+                    f"""
+                    DELETE FROM metric_values WHERE rowid IN (
+                        SELECT rowid FROM metric_values WHERE {condition} LIMIT ?
+                    )
+                    """,
+                    params
+                )
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+
+    def purge_value_dedup_keys(self, before: datetime, batch_size: int = 5000) -> int:
+        """分批删除早于 before 登记的指标值去重键，返回删除的键数量"""
+        deleted = 0
+        while True:
+            with self.get_conn(write=True) as conn:
+                cursor = conn.execute(
+                    """
+                    DELETE FROM metric_value_keys WHERE (metric_id, key_hash) IN (
+                        SELECT metric_id, key_hash FROM metric_value_keys WHERE created_at < ? LIMIT ?
+                    )
+                    """,
+                    (_format_timestamp(before), batch_size)
+                )
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+
+    # ==================== 压缩冷存储 ====================
+
+    def compact_metric_values(
+        self,
+        metric_id: str,
+        before: datetime,
+        after: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        将指标在 [after, before) 内最早一个仍有数值型明细的已关闭时间窗口压缩为块
+
+        在一个写事务中读取窗口内的明细，与已有的块（窗口压缩后迟到的数据）合并后重新编码，再删除明细；
+        记录 ID 随块保存，压缩前后不变。value_num 为空的记录（未迁移的旧数据）保留在明细表中
+        """
+        before = floor_timestamp(before, COMPACTION_WINDOW_SECONDS)
+        conditions = "metric_id = ? AND timestamp < ? AND value_num IS NOT NULL"
+        params: List[Any] = [metric_id, _format_timestamp(before)]
+        if after is not None:
+            conditions += " AND timestamp >= ?"
+            params.append(_format_timestamp(after))
+
+        with self.get_conn(write=True) as conn:
+            row = conn.execute(
+                f"SELECT timestamp FROM metric_values WHERE {conditions} ORDER BY timestamp LIMIT 1", params
+            ).fetchone()
+            if row is None:
+                return None
+            window_start = floor_timestamp(datetime.fromisoformat(row[0]), COMPACTION_WINDOW_SECONDS)
+            window = (
+                metric_id,
+                _format_timestamp(window_start),
+                _format_timestamp(window_start + timedelta(seconds=COMPACTION_WINDOW_SECONDS))
+            )
+
+            raw = [
+                (value_id, datetime.fromisoformat(timestamp), value_num)
+                for value_id, timestamp, value_num in conn.execute(
+                    """
+                    SELECT id, timestamp, value_num FROM metric_values
+                    WHERE metric_id = ? AND timestamp >= ? AND timestamp < ? AND value_num IS NOT NULL
+                    ORDER BY timestamp, id
+                    """,
+                    window
+                )
+            ]
+            block = conn.execute(
+                "SELECT data, value_ids FROM metric_value_blocks WHERE metric_id = ? AND block_start = ?", window[:2]
+            ).fetchone()
+            points = sorted(
+                (block_value_rows(*block) if block else []) + raw,
+                key=lambda point: (point[1], point[0])
+            )
+            if not points:
+                # 窗口内已没有可压缩的记录（例如已被数据保留或删除任务清理）时不写入空块
+                return None
+            conn.execute(
+                """
+                INSERT INTO metric_value_blocks (
+                    metric_id, block_start, first_timestamp, last_timestamp, value_count, data, value_ids
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (metric_id, block_start) DO UPDATE SET
+                    first_timestamp = excluded.first_timestamp,
+                    last_timestamp = excluded.last_timestamp,
+                    value_count = excluded.value_count,
+                    data = excluded.data,
+                    value_ids = excluded.value_ids
+                """,
+                (
+                    *window[:2],
+                    _format_timestamp(points[0][1]),
+                    _format_timestamp(points[-1][1]),
+                    len(points),
+                    *encode_value_block(points)
+                )
+            )
+            conn.execute(
+                """
+                DELETE FROM metric_values
+                WHERE metric_id = ? AND timestamp >= ? AND timestamp < ? AND value_num IS NOT NULL
+                """,
+                window
+            )
+        return {"block_start": window_start.isoformat(), "values": len(raw)}
+
+    def purge_compressed_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """
+        删除最后一条记录早于 before 的压缩块，返回删除的记录数
+
+        按整块清理，跨越保留边界的块在其最后一条记录过期后删除；每批在独立的写事务中完成
+        """
+        if metric_id is not None:
+            condition = "metric_id = ? AND last_timestamp < ?"
+            params: Tuple[Any, ...] = (metric_id, _format_timestamp(before))
+        else:
+            condition = "last_timestamp < ? AND metric_id IN (SELECT id FROM metrics WHERE retention_days IS NULL)"
+            params = (_format_timestamp(before),)
+
+        deleted = 0
+        while True:
+            with self.get_conn(write=True) as conn:
+                values, more = self._delete_blocks(conn, condition, params, batch_size)
+                deleted += values
+            if not more:
+                return deleted
+
+    def _delete_blocks(self, conn, condition: str, params: Tuple[Any, ...], budget: int) -> Tuple[int, bool]:
+        """
+        删除满足条件的压缩块，块内记录数合计不超过 budget（至少删除一个块）
+
+        返回 (删除的记录数, 是否还有满足条件的块)
+        """
+        candidates = conn.execute(
+            f"""
+            SELECT metric_id, block_start, value_count FROM metric_value_blocks
+            WHERE {condition}
+            ORDER BY metric_id, block_start
+            LIMIT ?
+            """,
+            (*params, budget)
+        ).fetchall()
+        selected = []
+        values = 0
+        for metric_id, block_start, value_count in candidates:
+            if selected and values + value_count > budget:
+                break
+            selected.append((metric_id, block_start))
+            values += value_count
+        conn.executemany("DELETE FROM metric_value_blocks WHERE metric_id = ? AND block_start = ?", selected)
+        return values, len(selected) < len(candidates) or len(candidates) == budget
+
+    def _iter_blocks(
+        self,
+        conn,
+        metric_id: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        descending: bool = False
+    ) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        按窗口顺序逐块读取可能包含 [since, until] 内记录的压缩块 (data, value_ids)
+
+        先取出满足条件的块起始时间（每个指标每个窗口一行），再按需逐块读取数据，调用方取够记录后即可停止
+        """
+        conditions = ["metric_id = ?"]
+        params: List[Any] = [metric_id]
+        if since is not None:
+            conditions.append("last_timestamp >= ?")
+            params.append(_format_timestamp(since))
+        if until is not None:
+            conditions.append("block_start <= ?")
+            params.append(_format_timestamp(until))
+        block_starts = [
+            row[0] for row in conn.execute(
+                f"""
+                SELECT block_start FROM metric_value_blocks
+                WHERE {' AND '.join(conditions)}
+                ORDER BY block_start {'DESC' if descending else 'ASC'}
+                """,
+                params
+            )
+        ]
+        for block_start in block_starts:
+            row = conn.execute(
+                "SELECT data, value_ids FROM metric_value_blocks WHERE metric_id = ? AND block_start = ?",
+                (metric_id, block_start)
+            ).fetchone()
+            if row is not None:
+                yield row[0], row[1]
+
+    # ==================== 设施相关操作 ====================
+
+    def create_facility(
+        self,
+        name: str,
+        facility_type: str,
+        parent_id: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """创建设施（由父设施的物化路径推导自身路径）"""
+        facility_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+
+        with self.get_conn(write=True) as conn:
+            path, id_path, depth = name, f"/{facility_id}/", 0
+            if parent_id:
+                parent = conn.execute(
+                    "SELECT path, id_path, depth FROM facilities WHERE id = ?",
+                    (parent_id,)
+                ).fetchone()
+                if parent:
+                    path = f"{parent['path']}/{name}"
+                    id_path = f"{parent['id_path']}{facility_id}/"
+                    depth = parent["depth"] + 1
+            conn.execute(
+                """
+                INSERT INTO facilities (id, name, facility_type, parent_id, description, path, id_path, depth, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (facility_id, name, facility_type, parent_id, description, path, id_path, depth,
+                 _format_timestamp(now), _format_timestamp(now))
+            )
+
+        return {
+            "id": facility_id,
+            "name": name,
+            "facility_type": facility_type,
+            "parent_id": parent_id,
+            "description": description,
+            "path": path,
+            "id_path": id_path,
+            "depth": depth,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+
+    def get_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取设施"""
+        with self.get_conn() as conn:
+            row = conn.execute("SELECT * FROM facilities WHERE id = ?", (facility_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_facility_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """根据名称获取设施"""
+        with self.get_conn() as conn:
+            row = conn.execute("SELECT * FROM facilities WHERE name = ?", (name,)).fetchone()
+            return dict(row) if row else None
+
+    def get_facilities_by_names(self, names: List[str]) -> List[Dict[str, Any]]:
+        """批量按名称获取设施"""
+        unique_names = list(dict.fromkeys(names))
+        result = []
+        if not unique_names:
+            return result
+
+        with self.get_conn() as conn:
+            for start in range(0, len(unique_names), BATCH_CHUNK_SIZE):
+                chunk = unique_names[start:start + BATCH_CHUNK_SIZE]
+                placeholders = ", ".join(["?"] * len(chunk))
+                result.extend(
+                    dict(row) for row in conn.execute(f"SELECT * FROM facilities WHERE name IN ({placeholders})", chunk)
+                )
+        return result
+
+    def get_all_facilities(self, facility_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取所有设施"""
+        with self.get_conn() as conn:
+            if facility_type:
+                rows = conn.execute(
+                    "SELECT * FROM facilities WHERE facility_type = ? ORDER BY created_at",
+                    (facility_type,)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM facilities ORDER BY created_at").fetchall()
+            return [dict(row) for row in rows]
+
+    def get_children(self, parent_id: str) -> List[Dict[str, Any]]:
+        """获取子设施列表"""
+        with self.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM facilities WHERE parent_id = ? ORDER BY name",
+                (parent_id,)
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def update_facility(
+        self,
+        facility_id: str,
+        name: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> bool:
+        """更新设施信息"""
+        updates = []
+        params: List[Any] = []
+
+        if name is not None:
+            updates.append("name = ?")
+            params.append(name)
+        if description is not None:
+            updates.append("description = ?")
+            params.append(description)
+
+        if not updates:
+            return False
+
+        updates.append("updated_at = ?")
+        params.append(_format_timestamp(datetime.utcnow()))
+        params.append(facility_id)
+
+        with self.get_conn(write=True) as conn:
+            current = conn.execute(
+                "SELECT name, path, id_path FROM facilities WHERE id = ?",
+                (facility_id,)
+            ).fetchone()
+            if not current:
+                return False
+
+            conn.execute(f"UPDATE facilities SET {', '.join(updates)} WHERE id = ?", params)
+
+            # 重命名时同步替换自身及所有后代物化路径中的前缀
+            old_name, old_path, id_path = current["name"], current["path"], current["id_path"]
+            if name is not None and name != old_name:
+                new_path = old_path[:len(old_path) - len(old_name)] + name
+                conn.execute(
+                    "UPDATE facilities SET path = ? || substr(path, ?) WHERE id_path GLOB ?",
+                    (new_path, len(old_path) + 1, f"{id_path}*")
+                )
+            return True
+
+    def delete_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """删除设施（外键级联删除子设施、指标及最新值），子树下指标的明细与汇总记入删除任务"""
+        now = datetime.utcnow()
+        with self.get_conn(write=True) as conn:
+            facility = conn.execute(
+                "SELECT path, id_path FROM facilities WHERE id = ?", (facility_id,)
+            ).fetchone()
+            if not facility:
+                return None
+
+            job_id = str(uuid.uuid4())
+            cursor = conn.execute(
+                """
+                INSERT INTO deletion_job_metrics (job_id, metric_id)
+                SELECT ?, m.id FROM metrics m
+                JOIN facilities f ON f.id = m.facility_id
+                WHERE f.id_path GLOB ?
+                """,
+                (job_id, f"{facility['id_path']}*")
+            )
+            job = new_deletion_job(job_id, "facility", facility_id, facility["path"], cursor.rowcount, now)
+            self._insert_deletion_job(conn, job)
+            conn.execute("DELETE FROM facilities WHERE id = ?", (facility_id,))
+        return job
+
+    def build_facility_path(self, facility_id: str) -> str:
+        """获取设施路径（如：数据中心A/房间1/传感器X），读取物化路径列"""
+        with self.get_conn() as conn:
+            row = conn.execute("SELECT path FROM facilities WHERE id = ?", (facility_id,)).fetchone()
+            return row["path"] if row else ""
+
+    def get_facility_subtree(
+        self,
+        root_id: Optional[str] = None,
+        max_depth: Optional[int] = None,
+        root_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取设施子树
+
+        指定 root_id 时按物化路径前缀（GLOB，区分大小写，可使用索引）做一次索引范围扫描，否则读取全部设施；
+        root_type 只过滤起始节点的类型，max_depth 为相对起始节点的深度，结果按 depth、name 排序
+        """
+        with self.get_conn() as conn:
+            if root_id:
+                root = conn.execute("SELECT * FROM facilities WHERE id = ?", (root_id,)).fetchone()
+                if not root or (root_type and root["facility_type"] != root_type):
+                    return []
+                conditions = ["id_path GLOB ?"]
+                params: List[Any] = [f"{root['id_path']}*"]
+                base_depth = root["depth"]
+            else:
+                conditions = ["1 = 1"]
+                params = []
+                base_depth = 0
+            if max_depth is not None:
+                conditions.append("depth <= ?")
+                params.append(base_depth + max_depth)
+
+            rows = [
+                dict(row) for row in conn.execute(
+                    f"SELECT * FROM facilities WHERE {' AND '.join(conditions)} ORDER BY depth, name",
+                    params
+                ).fetchall()
+            ]
+
+        if root_type and not root_id:
+            # id_path 的第一段即所属根设施
+            root_ids = {
+                row["id"] for row in rows
+                if row["parent_id"] is None and row["facility_type"] == root_type
+            }
+            rows = [row for row in rows if row["id_path"].split("/")[1] in root_ids]
+        return rows
+
+    def get_root_facilities(self) -> List[Dict[str, Any]]:
+        """获取根设施（没有父设施的设施）"""
+        with self.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM facilities WHERE parent_id IS NULL ORDER BY name"
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def create_facility_hierarchy(
+        self,
+        facilities: List[Dict[str, Any]],
+        metrics: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """在一个写事务中批量创建设施层级及其指标（挂载点路径一次查询取出，设施与指标各一次 executemany）"""
+        now = datetime.utcnow()
+        batch_ids = {facility["id"] for facility in facilities}
+        anchor_ids = list(dict.fromkeys(
+            facility["parent_id"] for facility in facilities
+            if facility.get("parent_id") and facility["parent_id"] not in batch_ids
+        ))
+
+        with self.get_conn(write=True) as conn:
+            anchors = {}
+            if anchor_ids:
+                placeholders = ", ".join(["?"] * len(anchor_ids))
+                anchors = {
+                    row["id"]: (row["path"], row["id_path"], row["depth"])
+                    for row in conn.execute(
+                        f"SELECT id, path, id_path, depth FROM facilities WHERE id IN ({placeholders})",
+                        anchor_ids
+                    )
+                }
+            facility_rows, metric_rows = build_hierarchy_rows(facilities, metrics, anchors, now)
+
+            conn.executemany(
+                """
+                INSERT INTO facilities (id, name, facility_type, parent_id, description, path, id_path, depth, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (row["id"], row["name"], row["facility_type"], row["parent_id"], row["description"],
+                     row["path"], row["id_path"], row["depth"], _format_timestamp(now), _format_timestamp(now))
+                    for row in facility_rows
+                ]
+            )
+            conn.executemany(
+                """
+                INSERT INTO metrics (id, name, unit, data_type, description, facility_id, retention_days, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (row["id"], row["name"], row["unit"], row["data_type"], row["description"],
+                     row["facility_id"], row["retention_days"], _format_timestamp(now), _format_timestamp(now))
+                    for row in metric_rows
+                ]
+            )
+
+        return facility_rows, metric_rows
+
+    # ==================== 指标相关操作 ====================
+
+    def create_metric(
+        self,
+        name: str,
+        facility_id: str,
+        unit: Optional[str] = None,
+        data_type: str = "float",
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """创建指标"""
+        metric_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        retention_days = retention_days or None
+
+        with self.get_conn(write=True) as conn:
+            conn.execute(
+                """
+                INSERT INTO metrics (id, name, unit, data_type, description, facility_id, retention_days, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (metric_id, name, unit, data_type, description, facility_id, retention_days,
+                 _format_timestamp(now), _format_timestamp(now))
+            )
+
+        return {
+            "id": metric_id,
+            "name": name,
+            "unit": unit,
+            "data_type": data_type,
+            "description": description,
+            "facility_id": facility_id,
+            "retention_days": retention_days,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+
+    def get_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取指标"""
+        with self.get_conn() as conn:
+            row = conn.execute("SELECT * FROM metrics WHERE id = ?", (metric_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_metrics_by_ids(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标，返回 {指标ID: 指标} 映射"""
+        unique_ids = list(dict.fromkeys(metric_ids))
+        result = {}
+        if not unique_ids:
+            return result
+
+        with self.get_conn() as conn:
+            for start in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+                chunk = unique_ids[start:start + BATCH_CHUNK_SIZE]
+                placeholders = ", ".join(["?"] * len(chunk))
+                for row in conn.execute(f"SELECT * FROM metrics WHERE id IN ({placeholders})", chunk):
+                    result[row["id"]] = dict(row)
+        return result
+
+    def get_metrics_by_facilities(self, facility_ids: List[str]) -> List[Dict[str, Any]]:
+        """批量获取多个设施的指标，按名称排序"""
+        unique_ids = list(dict.fromkeys(facility_ids))
+        result = []
+        if not unique_ids:
+            return result
+
+        with self.get_conn() as conn:
+            for start in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+                chunk = unique_ids[start:start + BATCH_CHUNK_SIZE]
+                placeholders = ", ".join(["?"] * len(chunk))
+                result.extend(
+                    dict(row) for row in conn.execute(
+                        f"SELECT * FROM metrics WHERE facility_id IN ({placeholders}) ORDER BY name",
+                        chunk
+                    )
+                )
+        result.sort(key=lambda metric: metric["name"])
+        return result
+
+    def get_metrics_by_facility(self, facility_id: str) -> List[Dict[str, Any]]:
+        """获取设施的所有指标"""
+        with self.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM metrics WHERE facility_id = ? ORDER BY name",
+                (facility_id,)
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_all_metrics(self) -> List[Dict[str, Any]]:
+        """获取所有指标"""
+        with self.get_conn() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM metrics ORDER BY created_at")]
+
+    def update_metric(
+        self,
+        metric_id: str,
+        name: Optional[str] = None,
+        unit: Optional[str] = None,
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
+    ) -> bool:
+        """更新指标信息（retention_days 为 0 表示恢复使用全局保留策略）"""
+        updates = []
+        params: List[Any] = []
+
+        if name is not None:
+            updates.append("name = ?")
+            params.append(name)
+        if unit is not None:
+            updates.append("unit = ?")
+            params.append(unit)
+        if description is not None:
+            updates.append("description = ?")
+            params.append(description)
+        if retention_days is not None:
+            updates.append("retention_days = ?")
+            params.append(retention_days or None)
+
+        if not updates:
+            return False
+
+        updates.append("updated_at = ?")
+        params.append(_format_timestamp(datetime.utcnow()))
+        params.append(metric_id)
+
+        with self.get_conn(write=True) as conn:
+            cursor = conn.execute(f"UPDATE metrics SET {', '.join(updates)} WHERE id = ?", params)
+            return cursor.rowcount > 0
+
+    def delete_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """删除指标（外键级联删除最新值），明细与汇总记入删除任务"""
+        now = datetime.utcnow()
+        with self.get_conn(write=True) as conn:
+            metric = conn.execute("SELECT name FROM metrics WHERE id = ?", (metric_id,)).fetchone()
+            if not metric:
+                return None
+
+            job = new_deletion_job(str(uuid.uuid4()), "metric", metric_id, metric["name"], 1, now)
+            conn.execute(
+                "INSERT INTO deletion_job_metrics (job_id, metric_id) VALUES (?, ?)",
+                (job["id"], metric_id)
+            )
+            self._insert_deletion_job(conn, job)
+            conn.execute("DELETE FROM metrics WHERE id = ?", (metric_id,))
+        return job
+
+    # ==================== 后台删除任务 ====================
+
+    def _insert_deletion_job(self, conn, job: Dict[str, Any]):
+        """写入删除任务行"""
+        conn.execute(
+            """
+            INSERT INTO deletion_jobs (id, target_type, target_id, target_name, status, metrics_total, created_at, updated_at, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (job["id"], job["target_type"], job["target_id"], job["target_name"], job["status"],
+             job["metrics_total"], job["created_at"], job["updated_at"], job["finished_at"])
+        )
+
+    def get_deletion_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取删除任务"""
+        with self.get_conn() as conn:
+            row = conn.execute("SELECT * FROM deletion_jobs WHERE id = ?", (job_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_active_deletion_jobs(self) -> List[Dict[str, Any]]:
+        """获取尚未完成的删除任务"""
+        with self.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT * FROM deletion_jobs WHERE status IN ('pending', 'running') ORDER BY created_at"
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def purge_deletion_job(self, job_id: str, batch_size: int = DELETION_BATCH_SIZE) -> bool:
+        """
+        清理删除任务中的下一批数据
+
+        每次取任务中的一个指标，依次从明细表和各级汇总表删除合计不超过 batch_size 行，
+        每批是一个短写事务，批与批之间其他写入可以获取写锁
+        """
+        now = _format_timestamp(datetime.utcnow())
+        with self.get_conn(write=True) as conn:
+            job = conn.execute("SELECT status FROM deletion_jobs WHERE id = ?", (job_id,)).fetchone()
+            if not job or job["status"] == "completed":
+                return False
+
+            row = conn.execute(
+                "SELECT metric_id FROM deletion_job_metrics WHERE job_id = ? LIMIT 1", (job_id,)
+            ).fetchone()
+            if not row:
+                conn.execute(
+                    "UPDATE deletion_jobs SET status = 'completed', updated_at = ?, finished_at = ? WHERE id = ?",
+                    (now, now, job_id)
+                )
+                return False
+
+            metric_id = row["metric_id"]
+            deleted = conn.execute(
+                """
+                DELETE FROM metric_values WHERE rowid IN (
+                    SELECT rowid FROM metric_values WHERE metric_id = ? LIMIT ?
+                )
+                """,
+                (metric_id, batch_size)
+            ).rowcount
+            for table, _ in ROLLUP_LEVELS:
+                if deleted >= batch_size:
+                    break
+                # 汇总表为 WITHOUT ROWID，按主键前缀取出一批时间桶删除
+                deleted += conn.execute(
+                    f"""
+                    DELETE FROM {table} WHERE metric_id = ? AND bucket_start IN (
+                        SELECT bucket_start FROM {table} WHERE metric_id = ? LIMIT ?
+                    )
+                    """,
+                    (metric_id, metric_id, batch_size - deleted)
+                ).rowcount
+            # 本批没有删满，说明该指标的明细与汇总已全部清理，再按块内记录数清理压缩块
+            metric_done = deleted < batch_size
+            if metric_done:
+                values, more = self._delete_blocks(conn, "metric_id = ?", (metric_id,), batch_size - deleted)
+                deleted += values
+                metric_done = not more
+            if metric_done:
+                conn.execute(
+                    "DELETE FROM deletion_job_metrics WHERE job_id = ? AND metric_id = ?", (job_id, metric_id)
+                )
+            conn.execute(
+                """
+                UPDATE deletion_jobs
+                SET status = 'running', metrics_done = metrics_done + ?, rows_deleted = rows_deleted + ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (int(metric_done), deleted, now, job_id)
+            )
+            return True
+
+    # ==================== 指标值相关操作 ====================
+
+    def create_metric_values(self, values: List[Dict[str, Any]], skip_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量创建指标值记录
+
+        所有记录在同一个写事务中通过 executemany 写入，并同步累加到各级汇总表；
+        values 中每项包含 metric_id、value、data_type 以及可选的 timestamp、dedup_key、id，
+        去重键已登记过的记录（skip_existing 时还有主键已存在的记录）不写入，返回原记录
+        """
+        now = datetime.utcnow()
+        rows = []
+        results = []
+        for item in values:
+            data_type = item.get("data_type", "float")
+            value_num, value_text = encode_metric_value(item["value"], data_type)
+            # 时间有序 ID：新记录追加在主键索引末尾，避免随机插入导致的页分裂
+            value_id = item.get("id") or str(uuid7())
+            # 时间精度统一为秒，与 MySQL 后端一致，保证明细与汇总表落在同一时间桶
+            timestamp = parse_timestamp(item.get("timestamp") or now).replace(microsecond=0)
+            rows.append((value_id, item["metric_id"], value_num, value_text, timestamp))
+            results.append({
+                "id": value_id,
+                "metric_id": item["metric_id"],
+                "value": decode_metric_value(value_num, value_text, data_type),
+                "timestamp": timestamp.isoformat()
+            })
+        if not rows:
+            return []
+
+        first, repeats = index_dedup_keys(values)
+        with self.get_conn(write=True) as conn:
+            stored = {}
+            if skip_existing:
+                stored = self._find_value_ids(conn, [
+                    (index, rows[index][0]) for index, item in enumerate(values) if item.get("id")
+                ])
+                first = {ident: index for ident, index in first.items() if index not in stored}
+            if first:
+                stored.update(self._claim_dedup_keys(conn, [
+                    (index, metric_id, key_hash, rows[index][0], rows[index][4])
+                    for (metric_id, key_hash), index in first.items()
+                ], now))
+            skipped = mark_duplicates(results, stored, repeats)
+            if skipped:
+                rows = [row for index, row in enumerate(rows) if index not in skipped]
+            if rows:
+                self._insert_value_rows(conn, rows)
+
+        return results
+
+    def _find_value_ids(self, conn, ids: List[Tuple[int, str]]) -> Dict[int, Tuple[str, datetime]]:
+        """查询本批 (下标, 记录ID) 中已写入明细表的记录，返回 {下标: (记录ID, 记录时间)}"""
+        positions = {value_id: index for index, value_id in ids}
+        stored = {}
+        for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+            chunk = [value_id for _, value_id in ids[start:start + BATCH_CHUNK_SIZE]]
+            placeholders = ", ".join(["?"] * len(chunk))
+            rows = conn.execute(
+                f"SELECT id, timestamp FROM metric_values WHERE id IN ({placeholders})", chunk
+            ).fetchall()
+            for row in rows:
+                stored[positions[row["id"]]] = (row["id"], parse_timestamp(row["timestamp"]))
+        return stored
+
+    def _claim_dedup_keys(
+        self,
+        conn,
+        claims: List[Tuple[int, str, bytes, str, datetime]],
+        now: datetime
+    ) -> Dict[int, Tuple[str, datetime]]:
+        """
+        登记本批的去重键 (下标, metric_id, key_hash, value_id, timestamp)，返回之前已登记过的键 {下标: (原记录ID, 原记录时间)}
+
+        写事务已持有写锁，冲突的键不写入也不报错；按 total_changes 判断全部登记成功时不需要再查询
+        """
+        changes = conn.total_changes
+        conn.executemany(
+            """
+            INSERT INTO metric_value_keys (metric_id, key_hash, value_id, timestamp, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (metric_id, key_hash) DO NOTHING
+            """,
+            [
+                (metric_id, key_hash, value_id, _format_timestamp(timestamp), _format_timestamp(now))
+                for _, metric_id, key_hash, value_id, timestamp in claims
+            ]
+        )
+        if conn.total_changes - changes == len(claims):
+            return {}
+
+        existing = {}
+        for start in range(0, len(claims), BATCH_CHUNK_SIZE):
+            chunk = claims[start:start + BATCH_CHUNK_SIZE]
+            placeholders = ", ".join(["(?, ?)"] * len(chunk))
+            rows = conn.execute(
+                f"""
+                SELECT metric_id, key_hash, value_id, timestamp FROM metric_value_keys
+                WHERE (metric_id, key_hash) IN (VALUES {placeholders})
+                """,
+                [param for _, metric_id, key_hash, _, _ in chunk for param in (metric_id, key_hash)]
+            ).fetchall()
+            for row in rows:
+                existing[(row["metric_id"], bytes(row["key_hash"]))] = (row["value_id"], row["timestamp"])
+
+        stored = {}
+        for index, metric_id, key_hash, value_id, _ in claims:
+            original_id, timestamp = existing[(metric_id, key_hash)]
+            if original_id != value_id:
+                stored[index] = (original_id, parse_timestamp(timestamp))
+        return stored
+
+    def _insert_value_rows(self, conn, rows: List[Tuple[str, str, Optional[float], Optional[str], datetime]]):
+        """写入明细行 (id, metric_id, value_num, value_text, timestamp) 并更新汇总表与最新值表"""
+        conn.executemany(
+            "INSERT INTO metric_values (id, metric_id, value_num, value_text, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [(row[0], row[1], row[2], row[3], _format_timestamp(row[4])) for row in rows]
+        )
+        self._update_rollups(conn, [(row[1], row[4], row[2]) for row in rows])
+        self._update_latest(conn, rows)
+
+    def _update_rollups(self, conn, entries: List[Tuple[str, datetime, Optional[float]]]):
+        """将新写入的指标值 (metric_id, timestamp, value_num) 按时间桶预聚合后增量 upsert 到各级汇总表"""
+        for table, resolution in ROLLUP_LEVELS:
+            self._upsert_rollup_rows(conn, table, rollup_buckets(entries, resolution))
+
+    def _upsert_rollup_rows(self, conn, table: str, rows: List[Tuple[str, datetime, int, int, Any, Any, Any]]):
+        """将预聚合的时间桶行 (metric_id, bucket_start, count, count_num, sum, min, max) 累加到汇总表"""
+        conn.executemany(
+            f"""
+            INSERT INTO {table} (metric_id, bucket_start, count, count_num, sum, min, max)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (metric_id, bucket_start) DO UPDATE SET
+                count = count + excluded.count,
+                count_num = count_num + excluded.count_num,
+                sum = CASE WHEN excluded.sum IS NULL THEN sum ELSE IFNULL(sum, 0) + excluded.sum END,
+                min = MIN(IFNULL(min, excluded.min), IFNULL(excluded.min, min)),
+                max = MAX(IFNULL(max, excluded.max), IFNULL(excluded.max, max))
+            """,
+            [
+                (metric_id, _format_timestamp(bucket_start), count, count_num, total, minimum, maximum)
+                for metric_id, bucket_start, count, count_num, total, minimum, maximum in rows
+            ]
+        )
+
+    def _update_latest(self, conn, rows: List[Tuple[str, str, Optional[float], Optional[str], datetime]]):
+        """
+        用新写入的明细行 (id, metric_id, value_num, value_text, timestamp) 更新最新值表
+
+        每个指标只取本批中 (timestamp, id) 最大的一行；乱序到达的旧数据不会覆盖已有的最新值
+        """
+        conn.executemany(
+            """
+            INSERT INTO metric_latest (metric_id, value_id, value_num, value_text, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (metric_id) DO UPDATE SET
+                value_id = excluded.value_id,
+                value_num = excluded.value_num,
+                value_text = excluded.value_text,
+                timestamp = excluded.timestamp
+            WHERE excluded.timestamp > metric_latest.timestamp
+               OR (excluded.timestamp = metric_latest.timestamp AND excluded.value_id > metric_latest.value_id)
+            """,
+            [
+                (metric_id, value_id, value_num, value_text, _format_timestamp(timestamp))
+                for metric_id, value_id, value_num, value_text, timestamp in latest_value_rows(rows)
+            ]
+        )
+
+    def rebuild_latest(self, metric_id: Optional[str] = None):
+        """根据明细数据与压缩块重建最新值表"""
+        if metric_id is None:
+            metric_ids = [metric["id"] for metric in self.get_all_metrics()]
+        else:
+            metric_ids = [metric_id]
+
+        for current_id in metric_ids:
+            with self.get_conn(write=True) as conn:
+                conn.execute("DELETE FROM metric_latest WHERE metric_id = ?", (current_id,))
+                conn.execute(
+                    """
+                    INSERT INTO metric_latest (metric_id, value_id, value_num, value_text, timestamp)
+                    SELECT metric_id, id, value_num, value_text, timestamp
+                    FROM metric_values
+                    WHERE metric_id = ?
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 1
+                    """,
+                    (current_id,)
+                )
+                # 最新的压缩块只在明细已全部压缩（或更早）时生效，_update_latest 只保留较新的一行
+                for block in self._iter_blocks(conn, current_id, descending=True):
+                    value_id, timestamp, value = block_value_rows(*block)[-1]
+                    self._update_latest(conn, [(value_id, current_id, value, None, timestamp)])
+                    break
+
+    def rebuild_rollups(self, metric_id: Optional[str] = None):
+        """
+        根据明细数据与压缩块重建汇总表
+
+        不指定 metric_id 时逐个指标重建，每个指标在独立事务中完成
+        """
+        if metric_id is None:
+            metric_ids = [metric["id"] for metric in self.get_all_metrics()]
+        else:
+            metric_ids = [metric_id]
+
+        finest_table, finest_resolution = ROLLUP_LEVELS[-1]
+        for current_id in metric_ids:
+            with self.get_conn(write=True) as conn:
+                for table, _ in ROLLUP_LEVELS:
+                    conn.execute(f"DELETE FROM {table} WHERE metric_id = ?", (current_id,))
+
+                # 最细粒度由明细聚合，其余各级由下一级汇总表聚合
+                conn.execute(
+                    f"""
+                    INSERT INTO {finest_table} (metric_id, bucket_start, count, count_num, sum, min, max)
+                    SELECT metric_id, {_BUCKET_START_SQL.format(column="timestamp")} AS bucket,
+                        COUNT(*), COUNT(value_num), SUM(value_num), MIN(value_num), MAX(value_num)
+                    FROM metric_values
+                    WHERE metric_id = ?
+                    GROUP BY metric_id, bucket
+                    """,
+                    (finest_resolution, finest_resolution, current_id)
+                )
+                for block in self._iter_blocks(conn, current_id):
+                    entries = [(current_id, timestamp, value) for _, timestamp, value in block_value_rows(*block)]
+                    self._upsert_rollup_rows(conn, finest_table, rollup_buckets(entries, finest_resolution))
+                levels = list(reversed(ROLLUP_LEVELS))
+                for (source, _), (table, resolution) in zip(levels, levels[1:]):
+                    conn.execute(
+                        f"""
+                        INSERT INTO {table} (metric_id, bucket_start, count, count_num, sum, min, max)
+                        SELECT metric_id, {_BUCKET_START_SQL.format(column="bucket_start")} AS bucket,
+                            SUM(count), SUM(count_num), SUM(sum), MIN(min), MAX(max)
+                        FROM {source}
+                        WHERE metric_id = ?
+                        GROUP BY metric_id, bucket
+                        """,
+                        (resolution, resolution, current_id)
+                    )
+
+    def get_metric_values(
+        self,
+        metric_id: str,
+        limit: int = 100,
+        offset: int = 0,
+        before_timestamp: Optional[datetime] = None,
+        before_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取指标的历史值（按时间倒序，支持键集分页，借助 (metric_id, timestamp) 索引定位）
+
+        先从明细表取出 offset + limit 条，再从较新的压缩块开始逐块补充，合并排序后截取本页；
+        明细已取满时，早于其最后一条的压缩块不会进入本页，不再读取
+        """
+        conditions = ["mv.metric_id = ?"]
+        params: List[Any] = [metric_id]
+        if before_timestamp is not None:
+            before = _format_timestamp(before_timestamp)
+            if before_id is not None:
+                conditions.append("(mv.timestamp < ? OR (mv.timestamp = ? AND mv.id < ?))")
+                params.extend([before, before, before_id])
+            else:
+                conditions.append("mv.timestamp < ?")
+                params.append(before)
+        need = limit + offset
+        params.append(need)
+
+        with self.get_conn() as conn:
+            rows = [
+                dict(row) for row in conn.execute(
+                    f"""
+                    SELECT mv.*, m.data_type FROM metric_values mv
+                    JOIN metrics m ON m.id = mv.metric_id
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY mv.timestamp DESC, mv.id DESC
+                    LIMIT ?
+                    """,
+                    params
+                )
+            ]
+            metric = conn.execute("SELECT data_type FROM metrics WHERE id = ?", (metric_id,)).fetchone()
+            if metric is not None:
+                floor = datetime.fromisoformat(rows[-1]["timestamp"]) if len(rows) >= need else None
+                blocks = (
+                    (data, value_ids, metric["data_type"])
+                    for data, value_ids in self._iter_blocks(conn, metric_id, floor, before_timestamp, descending=True)
+                )
+                rows.extend(select_block_page(blocks, metric_id, need, before_timestamp, before_id))
+
+        values = [self._convert_value_row(row) for row in rows]
+        values.sort(key=lambda value: (datetime.fromisoformat(value["timestamp"]), value["id"]), reverse=True)
+        return values[offset:need]
+
+    def iter_metric_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = EXPORT_BATCH_SIZE
+    ) -> Iterator[List[Tuple[str, datetime, Optional[float], Optional[str]]]]:
+        """
+        按 (timestamp, id) 升序逐批读取 [start, end) 范围内的明细数据（含压缩块中的记录）
+
+        SQLite 游标按需逐行执行，整个迭代在一个读事务中完成（WAL 模式下不阻塞写入）；
+        压缩块在同一连接上逐块解码，与明细按 (timestamp, id) 归并
+        """
+        conditions = ["metric_id = ?"]
+        params: List[Any] = [metric_id]
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(_format_timestamp(start))
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(_format_timestamp(end))
+
+        with self.get_conn() as conn:
+            cursor = conn.execute(
+                f"""
+                SELECT id, timestamp, value_num, value_text FROM metric_values
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp, id
+                """,
+                params
+            )
+            raw_rows = (
+                (row[0], datetime.fromisoformat(row[1]), row[2], row[3])
+                for rows in iter(lambda: cursor.fetchmany(batch_size), [])
+                for row in rows
+            )
+            block_rows = (
+                (value_id, timestamp, value, None)
+                for block in self._iter_blocks(conn, metric_id, start, end)
+                for value_id, timestamp, value in block_value_rows(*block)
+                if (start is None or timestamp >= start) and (end is None or timestamp < end)
+            )
+            merged = heapq.merge(raw_rows, block_rows, key=lambda row: (row[1], row[0]))
+            try:
+                while True:
+                    batch = list(itertools.islice(merged, batch_size))
+                    if not batch:
+                        break
+                    yield batch
+            finally:
+                cursor.close()
+
+    def get_latest_metric_values(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标的最新值，返回 {指标ID: 最新值}，没有数据的指标不在结果中"""
+        unique_ids = list(dict.fromkeys(metric_ids))
+        result = {}
+        if not unique_ids:
+            return result
+
+        with self.get_conn() as conn:
+            for start in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+                chunk = unique_ids[start:start + BATCH_CHUNK_SIZE]
+                placeholders = ", ".join(["?"] * len(chunk))
+                rows = conn.execute(
+                    f"""
+                    SELECT l.value_id AS id, l.metric_id, l.value_num, l.value_text, l.timestamp, m.data_type
+                    FROM metric_latest l
+                    JOIN metrics m ON m.id = l.metric_id
+                    WHERE l.metric_id IN ({placeholders})
+                    """,
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    value = self._convert_value_row(dict(row))
+                    result[value["metric_id"]] = value
+        return result
+
+    def aggregate_metric_values(
+        self,
+        metric_id: str,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """
+        按时间桶聚合指标值（时间范围为 [start, end)）
+
+        与 MySQL 后端相同，按 plan_aggregate_segments 拆分查询范围，对齐部分读取汇总表，其余读取明细和压缩块
+        """
+        merged: Dict[int, Dict[str, Any]] = {}
+        with self.get_conn() as conn:
+            for table, segment_start, segment_end in plan_aggregate_segments(start, end, bucket_seconds):
+                if table is None:
+                    sql = f"""
+                        SELECT
+                            {_BUCKET_INDEX_SQL.format(column="timestamp")} AS bucket_index,
+                            COUNT(*) AS count,
+                            COUNT(value_num) AS count_num,
+                            SUM(value_num) AS sum,
+                            MIN(value_num) AS min,
+                            MAX(value_num) AS max
+                        FROM metric_values
+                        WHERE metric_id = ? AND timestamp >= ? AND timestamp < ?
+                        GROUP BY bucket_index
+                    """
+                else:
+                    sql = f"""
+                        SELECT
+                            {_BUCKET_INDEX_SQL.format(column="bucket_start")} AS bucket_index,
+                            SUM(count) AS count,
+                            SUM(count_num) AS count_num,
+                            SUM(sum) AS sum,
+                            MIN(min) AS min,
+                            MAX(max) AS max
+                        FROM {table}
+                        WHERE metric_id = ? AND bucket_start >= ? AND bucket_start < ?
+                        GROUP BY bucket_index
+                    """
+                rows = conn.execute(
+                    sql,
+                    (bucket_seconds, metric_id, _format_timestamp(segment_start), _format_timestamp(segment_end))
+                ).fetchall()
+                for row in rows:
+                    merge_bucket_row(merged, self._convert_bucket_row(dict(row), bucket_seconds))
+                if table is not None:
+                    continue
+                for block in self._iter_blocks(conn, metric_id, segment_start, segment_end):
+                    block_rows = aggregate_block_rows(
+                        block_value_rows(*block), segment_start, segment_end, bucket_seconds
+                    )
+                    for row in block_rows:
+                        merge_bucket_row(merged, self._convert_bucket_row(row, bucket_seconds))
+
+        return [merged[index] for index in sorted(merged)]
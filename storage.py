@@ -0,0 +1,865 @@
+"""
+存储层接口
+定义设施、指标及指标值存储后端的统一接口，以及各后端共用的数值编码、时间桶与聚合辅助函数
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Iterator, Set, Tuple
+import hashlib
+import math
+import os
+import secrets
+import threading
+import time
+import uuid
+
+from compression import encode_block, decode_block
+
+
+# IN 列表与批量写入的单批最大条数，避免 SQL 语句超过 max_allowed_packet
+BATCH_CHUNK_SIZE = 1000
+
+# 导出明细数据时每批读取的记录数
+EXPORT_BATCH_SIZE = 5000
+
+# 时间桶聚合的对齐原点，所有时间桶按 UTC 纪元对齐
+EPOCH = datetime(1970, 1, 1)
+
+# 指标值汇总表及其时间粒度（秒），按从粗到细排列
+ROLLUP_LEVELS = (
+    ("metric_rollups_1d", 86400),
+    ("metric_rollups_1h", 3600),
+    ("metric_rollups_1m", 60),
+)
+
+# 按月分区时预先创建的未来分区数量
+PARTITION_PREMAKE_MONTHS = 3
+
+# 以数值列（value_num）存储的指标数据类型，其余类型按文本存储在 value_text 列
+NUMERIC_DATA_TYPES = ("float", "int", "bool")
+
+# 后台删除任务每批删除的最大记录数
+DELETION_BATCH_SIZE = 5000
+
+# 压缩冷存储的时间窗口（秒）：每个数值型指标每个 UTC 自然日的明细压缩为一个块
+COMPACTION_WINDOW_SECONDS = 86400
+
+# 指标值去重键的默认保留时长（小时），超过后相同去重键的重试会被当作新记录写入
+DEDUP_WINDOW_HOURS = 24
+
+# 可选的存储后端（环境变量 DB_BACKEND）
+STORAGE_BACKENDS = ("mysql", "sqlite", "memory", "segment")
+
+_BOOL_TRUE_VALUES = {"true", "1", "yes", "on"}
+_BOOL_FALSE_VALUES = {"false", "0", "no", "off"}
+
+# UUIDv7 生成状态：[上一个 ID 的毫秒时间戳, 同一毫秒内的序号]
+_uuid7_lock = threading.Lock()
+_uuid7_state = [0, 0]
+
+
+def uuid7() -> uuid.UUID:
+    """
+    生成时间有序的 UUIDv7（RFC 9562）
+
+    高 48 位为毫秒级 Unix 时间戳，随后 12 位（rand_a）作为同一毫秒内的递增序号，其余为随机数。
+    同一进程内生成的 ID 严格递增（时钟回拨或序号用尽时沿用并推进上一个时间戳），
+    按字节序即按生成先后排序，作为聚簇主键时新记录总是追加在索引末尾
+    """
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1_000_000
+        last_ms, sequence = _uuid7_state
+        if now_ms > last_ms:
+            # 序号从随机值的低半区开始，既难以猜测又给同一毫秒内的后续 ID 留出空间
+            sequence = secrets.randbits(11)
+        else:
+            now_ms = last_ms
+            sequence += 1
+            if sequence > 0xFFF:
+                now_ms += 1
+                sequence = 0
+        _uuid7_state[:] = [now_ms, sequence]
+    value = (
+        (now_ms & 0xFFFFFFFFFFFF) << 80
+        | 0x7 << 76
+        | sequence << 64
+        | 0b10 << 62
+        | secrets.randbits(62)
+    )
+    return uuid.UUID(int=value)
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """将 ISO 格式字符串或 datetime 转换为 UTC 无时区时间"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def floor_timestamp(value: datetime, resolution: int) -> datetime:
+    """将时间向下对齐到 resolution 秒的整数倍（以 UTC 纪元为原点）"""
+    seconds = int((value - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def plan_aggregate_segments(
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int,
+    levels: Tuple[Tuple[str, int], ...] = ROLLUP_LEVELS
+) -> List[Tuple[Optional[str], datetime, datetime]]:
+    """
+    为时间范围 [start, end) 规划聚合查询的数据来源
+
+    返回 (汇总表名, 起始, 结束) 列表，表名为 None 表示读取明细表。
+    选取粒度能整除时间桶的最粗汇总表覆盖对齐的中间部分，首尾剩余部分递归使用更细的级别
+    """
+    if start >= end:
+        return []
+    for index, (table, resolution) in enumerate(levels):
+        if bucket_seconds % resolution:
+            continue
+        inner_start = floor_timestamp(start, resolution)
+        if inner_start < start:
+            inner_start += timedelta(seconds=resolution)
+        inner_end = floor_timestamp(end, resolution)
+        if inner_start >= inner_end:
+            continue
+        finer = levels[index + 1:]
+        return (
+            plan_aggregate_segments(start, inner_start, bucket_seconds, finer)
+            + [(table, inner_start, inner_end)]
+            + plan_aggregate_segments(inner_end, end, bucket_seconds, finer)
+        )
+    return [(None, start, end)]
+
+
+def merge_bucket_row(merged: Dict[int, Dict[str, Any]], row: Dict[str, Any]):
+    """将一个分段查询得到的时间桶合并到结果中"""
+    existing = merged.get(row["bucket_index"])
+    if existing is None:
+        merged[row["bucket_index"]] = row
+        return
+    existing["count"] += row["count"]
+    existing["count_num"] += row["count_num"]
+    for key, combine in (("sum", lambda a, b: a + b), ("min", min), ("max", max)):
+        if row[key] is not None:
+            existing[key] = row[key] if existing[key] is None else combine(existing[key], row[key])
+
+
+def encode_metric_value(value: str, data_type: str) -> Tuple[Optional[float], Optional[str]]:
+    """
+    按指标数据类型将指标值转换为存储形式
+
+    返回 (value_num, value_text)，数值类型只填充 value_num，string 等类型只填充 value_text；
+    取值与数据类型不匹配时抛出 ValueError
+    """
+    text = str(value).strip()
+    if data_type == "float":
+        try:
+            number = float(text)
+        except ValueError:
+            raise ValueError(f"指标值类型错误：'{value}' 不是合法的 float 数值")
+        if not math.isfinite(number):
+            raise ValueError(f"指标值类型错误：不支持非有限数值 '{value}'")
+        return number, None
+    if data_type == "int":
+        try:
+            number = float(text)
+        except ValueError:
+            number = None
+        if number is None or not math.isfinite(number) or not number.is_integer():
+            raise ValueError(f"指标值类型错误：'{value}' 不是合法的 int 数值")
+        return number, None
+    if data_type == "bool":
+        lowered = text.lower()
+        if lowered in _BOOL_TRUE_VALUES:
+            return 1.0, None
+        if lowered in _BOOL_FALSE_VALUES:
+            return 0.0, None
+        raise ValueError(f"指标值类型错误：'{value}' 不是合法的 bool 值（true/false）")
+    return None, str(value)
+
+
+def decode_metric_value(value_num: Optional[float], value_text: Optional[str], data_type: Optional[str]) -> str:
+    """将存储形式还原为接口返回的字符串指标值"""
+    if value_num is None:
+        return value_text if value_text is not None else ""
+    if data_type == "int":
+        return str(int(value_num))
+    if data_type == "bool":
+        return "true" if value_num else "false"
+    return repr(float(value_num))
+
+
+def compute_facility_paths(
+    facilities: Dict[str, Tuple[str, Optional[str]]]
+) -> Dict[str, Tuple[str, str, int]]:
+    """根据 {设施ID: (名称, 父设施ID)} 计算每个设施的物化路径 {设施ID: (path, id_path, depth)}"""
+    computed: Dict[str, Tuple[str, str, int]] = {}
+
+    def resolve(facility_id: str) -> Tuple[str, str, int]:
+        # 自顶向下的层级很浅，递归深度等于设施层数
+        if facility_id not in computed:
+            name, parent_id = facilities[facility_id]
+            if parent_id and parent_id in facilities:
+                parent_path, parent_id_path, parent_depth = resolve(parent_id)
+                computed[facility_id] = (
+                    f"{parent_path}/{name}", f"{parent_id_path}{facility_id}/", parent_depth + 1
+                )
+            else:
+                computed[facility_id] = (name, f"/{facility_id}/", 0)
+        return computed[facility_id]
+
+    for facility_id in facilities:
+        resolve(facility_id)
+    return computed
+
+
+def build_hierarchy_rows(
+    facilities: List[Dict[str, Any]],
+    metrics: List[Dict[str, Any]],
+    anchors: Dict[str, Tuple[str, str, int]],
+    now: datetime
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    为批量导入的设施层级和指标生成待写入的行字典，返回 (设施行列表, 指标行列表)
+
+    facilities 按父节点在前的顺序排列，物化路径沿父节点依次推导；
+    parent_id 为本批之外的已有设施时，从 anchors {设施ID: (path, id_path, depth)} 取其路径
+    """
+    computed: Dict[str, Tuple[str, str, int]] = {}
+    facility_rows = []
+    for facility in facilities:
+        facility_id, name, parent_id = facility["id"], facility["name"], facility.get("parent_id")
+        parent = (computed.get(parent_id) or anchors.get(parent_id)) if parent_id else None
+        if parent:
+            computed[facility_id] = (f"{parent[0]}/{name}", f"{parent[1]}{facility_id}/", parent[2] + 1)
+        else:
+            computed[facility_id] = (name, f"/{facility_id}/", 0)
+        path, id_path, depth = computed[facility_id]
+        facility_rows.append({
+            "id": facility_id,
+            "name": name,
+            "facility_type": facility["facility_type"],
+            "parent_id": parent_id,
+            "description": facility.get("description"),
+            "path": path,
+            "id_path": id_path,
+            "depth": depth,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        })
+
+    metric_rows = [{
+        "id": str(uuid.uuid4()),
+        "name": metric["name"],
+        "unit": metric.get("unit"),
+        "data_type": metric.get("data_type", "float"),
+        "description": metric.get("description"),
+        "facility_id": metric["facility_id"],
+        "retention_days": metric.get("retention_days") or None,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat()
+    } for metric in metrics]
+    return facility_rows, metric_rows
+
+
+def new_deletion_job(
+    job_id: str,
+    target_type: str,
+    target_id: str,
+    target_name: str,
+    metrics_total: int,
+    now: datetime
+) -> Dict[str, Any]:
+    """生成删除任务行：没有需要清理的指标时直接完成，否则等待后台分批清理"""
+    return {
+        "id": job_id,
+        "target_type": target_type,
+        "target_id": target_id,
+        "target_name": target_name,
+        "status": "pending" if metrics_total else "completed",
+        "metrics_total": metrics_total,
+        "metrics_done": 0,
+        "rows_deleted": 0,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+        "finished_at": None if metrics_total else now.isoformat()
+    }
+
+
+def dedup_key_hash(key: str) -> bytes:
+    """将客户端提供的去重键压缩为定长 16 字节摘要，与指标ID一起构成去重键表的主键"""
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def index_dedup_keys(values: List[Dict[str, Any]]) -> Tuple[Dict[Tuple[str, bytes], int], Dict[int, int]]:
+    """
+    找出批次中带去重键（dedup_key）的记录
+
+    返回 ({(metric_id, 去重键摘要): 首次出现的下标}, {批次内重复记录的下标: 首次出现的下标})
+    """
+    first: Dict[Tuple[str, bytes], int] = {}
+    repeats: Dict[int, int] = {}
+    for index, item in enumerate(values):
+        key = item.get("dedup_key")
+        if key is None:
+            continue
+        ident = (item["metric_id"], dedup_key_hash(key))
+        if ident in first:
+            repeats[index] = first[ident]
+        else:
+            first[ident] = index
+    return first, repeats
+
+
+def mark_duplicates(
+    results: List[Dict[str, Any]],
+    stored: Dict[int, Tuple[str, datetime]],
+    repeats: Dict[int, int]
+) -> Set[int]:
+    """
+    将重复提交的记录的结果改为原记录，返回不需要写入的记录下标
+
+    stored 为 {下标: (原记录ID, 原记录时间)}，对应之前的写入已登记过的去重键；
+    repeats 为批次内的重复记录 {下标: 首次出现的下标}
+    """
+    for index, (value_id, timestamp) in stored.items():
+        results[index].update(id=value_id, timestamp=timestamp.isoformat(), duplicate=True)
+    for index, first in repeats.items():
+        results[index] = {**results[first], "duplicate": True}
+    return set(stored) | set(repeats)
+
+
+def encode_value_block(rows: List[Tuple[str, datetime, float]]) -> Tuple[bytes, bytes]:
+    """
+    将按 (timestamp, id) 升序排列的 (id, timestamp, value_num) 列表编码为压缩块，返回 (块数据, 记录ID)
+
+    时间与数值按压缩编码（时间精度为秒）；原记录 ID 按相同顺序每条 16 字节拼接保存，
+    压缩后记录 ID 不变，分页游标与去重键登记的记录 ID 仍然有效
+    """
+    data = encode_block([(int((timestamp - EPOCH).total_seconds()), value) for _, timestamp, value in rows])
+    return data, b"".join(uuid.UUID(value_id).bytes for value_id, _, _ in rows)
+
+
+def block_value_rows(data: bytes, value_ids: bytes) -> List[Tuple[str, datetime, float]]:
+    """解码压缩块，返回按 (timestamp, id) 升序排列的 (id, timestamp, value_num) 列表"""
+    points = decode_block(bytes(data))
+    value_ids = bytes(value_ids)
+    if len(value_ids) != 16 * len(points):
+        raise ValueError("压缩块记录ID数据不完整")
+    return [
+        (str(uuid.UUID(bytes=value_ids[16 * index:16 * index + 16])), EPOCH + timedelta(seconds=seconds), value)
+        for index, (seconds, value) in enumerate(points)
+    ]
+
+
+def select_block_page(
+    blocks: Iterator[Tuple[bytes, bytes, str]],
+    metric_id: str,
+    need: int,
+    before_timestamp: Optional[datetime] = None,
+    before_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    从按时间倒序给出的压缩块 (data, value_ids, data_type) 中取出分页位置之前的至多 need 条记录，按 (timestamp, id) 倒序
+
+    返回与明细查询结构相同的行（value_num / value_text / data_type），由调用方与明细行合并后统一转换；
+    blocks 按需逐块读取，取够 need 条后不再读取更早的块
+    """
+    rows: List[Dict[str, Any]] = []
+    for data, value_ids, data_type in blocks:
+        for value_id, timestamp, value in reversed(block_value_rows(data, value_ids)):
+            if before_timestamp is not None:
+                if timestamp > before_timestamp:
+                    continue
+                if timestamp == before_timestamp and (before_id is None or value_id >= before_id):
+                    continue
+            rows.append({
+                "id": value_id,
+                "metric_id": metric_id,
+                "value_num": value,
+                "value_text": None,
+                "timestamp": timestamp,
+                "data_type": data_type
+            })
+            if len(rows) >= need:
+                return rows
+    return rows
+
+
+def aggregate_block_rows(
+    rows: List[Tuple[str, datetime, float]],
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int
+) -> List[Dict[str, Any]]:
+    """
+    按时间桶聚合压缩块中位于 [start, end) 的记录，返回与明细分组查询结构相同的 bucket_index/count/count_num/sum/min/max 行
+
+    压缩块只保存数值型记录，count_num 与 count 相同
+    """
+    buckets: Dict[int, Dict[str, Any]] = {}
+    for _, timestamp, value in rows:
+        if timestamp < start or timestamp >= end:
+            continue
+        index = int((timestamp - EPOCH).total_seconds()) // bucket_seconds
+        bucket = buckets.get(index)
+        if bucket is None:
+            buckets[index] = {"bucket_index": index, "count": 1, "count_num": 1, "sum": value, "min": value, "max": value}
+            continue
+        bucket["count"] += 1
+        bucket["count_num"] += 1
+        bucket["sum"] += value
+        bucket["min"] = min(bucket["min"], value)
+        bucket["max"] = max(bucket["max"], value)
+    return list(buckets.values())
+
+
+def rollup_buckets(
+    entries: List[Tuple[str, datetime, Optional[float]]],
+    resolution: int
+) -> List[Tuple[str, datetime, int, int, Optional[float], Optional[float], Optional[float]]]:
+    """
+    将指标值 (metric_id, timestamp, value_num) 按 (指标, 时间桶) 预聚合
+
+    返回按主键排序的 (metric_id, bucket_start, count, count_num, sum, min, max) 列表
+    """
+    buckets: Dict[Tuple[str, datetime], List[Any]] = {}
+    for metric_id, timestamp, value_num in entries:
+        key = (metric_id, floor_timestamp(timestamp, resolution))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, int(value_num is not None), value_num, value_num, value_num]
+            continue
+        bucket[0] += 1
+        if value_num is not None:
+            bucket[1] += 1
+            bucket[2] = value_num if bucket[2] is None else bucket[2] + value_num
+            bucket[3] = value_num if bucket[3] is None else min(bucket[3], value_num)
+            bucket[4] = value_num if bucket[4] is None else max(bucket[4], value_num)
+    return [(key[0], key[1], *buckets[key]) for key in sorted(buckets)]
+
+
+def latest_value_rows(
+    rows: List[Tuple[str, str, Optional[float], Optional[str], datetime]]
+) -> List[Tuple[str, str, Optional[float], Optional[str], datetime]]:
+    """
+    从明细行 (id, metric_id, value_num, value_text, timestamp) 中为每个指标选出 (timestamp, id) 最大的一行
+
+    返回按指标ID排序的 (metric_id, value_id, value_num, value_text, timestamp) 列表
+    """
+    latest: Dict[str, Tuple] = {}
+    for row in rows:
+        current = latest.get(row[1])
+        if current is None or (row[4], row[0]) > (current[4], current[0]):
+            latest[row[1]] = row
+    return [
+        (metric_id, value_id, value_num, value_text, timestamp)
+        for metric_id, (value_id, _, value_num, value_text, timestamp) in sorted(latest.items())
+    ]
+
+
+class Storage(ABC):
+    """
+    存储后端接口
+
+    业务层只依赖这里定义的方法。所有后端返回相同结构的行字典：
+    ID 为字符串，时间为 ISO 格式字符串，指标值按数据类型还原为字符串 value 字段
+    """
+
+    # 指标明细表是否按时间分区（只有 MySQL 后端支持）
+    metric_values_partitioned = False
+    # 连接池，没有连接池的后端为 None
+    pool = None
+    # 并发执行存储调用的线程数
+    max_concurrency = 8
+
+    @abstractmethod
+    def migrate(self) -> List[int]:
+        """执行尚未应用的结构迁移，返回本次应用的版本号"""
+
+    def prewarm(self):
+        """预建连接池中最少保留的连接，没有连接池的后端不做任何事"""
+        if self.pool is not None:
+            self.pool.prewarm()
+
+    def close(self):
+        """释放后端持有的连接等资源"""
+        if self.pool is not None:
+            self.pool.close()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """连接池运行统计，没有连接池的后端返回空字典"""
+        return self.pool.stats() if self.pool is not None else {}
+
+    # ==================== 结构迁移与派生数据 ====================
+
+    def migrate_legacy_values(self, batch_size: int = 5000) -> int:
+        """将旧版文本指标值迁移到类型化列，返回本次迁移的记录数；没有旧数据的后端返回 0"""
+        return 0
+
+    def backfill_binary_ids(self, batch_size: int = 5000) -> int:
+        """将旧版 VARCHAR(36) 的 UUID 列分批回填到 BINARY(16) 影子列，返回本次回填的行数；不需要转换的后端返回 0"""
+        return 0
+
+    @abstractmethod
+    def rebuild_latest(self, metric_id: Optional[str] = None):
+        """根据明细数据重建最新值"""
+
+    @abstractmethod
+    def rebuild_rollups(self, metric_id: Optional[str] = None):
+        """根据明细数据重建各级汇总"""
+
+    # ==================== 分区与数据保留 ====================
+
+    def ensure_metric_value_partitions(self, months_ahead: int = PARTITION_PREMAKE_MONTHS) -> List[str]:
+        """预先创建未来的分区，返回新建的分区名；不支持分区的后端返回空列表"""
+        return []
+
+    def drop_metric_value_partitions(self, before: datetime) -> List[str]:
+        """删除早于 before 的整个分区，返回被删除的分区名；不支持分区的后端返回空列表"""
+        return []
+
+    @abstractmethod
+    def get_metric_retention_overrides(self) -> Dict[str, int]:
+        """获取单独配置了保留天数的指标 {指标ID: 保留天数}"""
+
+    @abstractmethod
+    def purge_metric_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """分批删除早于 before 的明细数据，返回删除的记录数"""
+
+    @abstractmethod
+    def purge_value_dedup_keys(self, before: datetime, batch_size: int = 5000) -> int:
+        """分批删除早于 before 登记的指标值去重键，返回删除的键数量"""
+
+    # ==================== 压缩冷存储 ====================
+
+    def compact_metric_values(
+        self,
+        metric_id: str,
+        before: datetime,
+        after: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        将指标在 [after, before) 内最早一个仍有数值型明细的已关闭时间窗口压缩为块（窗口见 COMPACTION_WINDOW_SECONDS）
+
+        返回 {"block_start": 窗口起始时间, "values": 本次压缩的明细条数}，没有需要压缩的窗口时返回 None；
+        不支持压缩存储的后端返回 None
+        """
+        return None
+
+    def purge_compressed_values(
+        self,
+        before: datetime,
+        metric_id: Optional[str] = None,
+        batch_size: int = 5000
+    ) -> int:
+        """
+        删除最后一条记录早于 before 的压缩块，返回删除的记录数；不支持压缩存储的后端返回 0
+
+        指定 metric_id 时只清理该指标，否则清理所有未单独配置保留天数的指标
+        """
+        return 0
+
+    # ==================== 设施相关操作 ====================
+
+    @abstractmethod
+    def create_facility(
+        self,
+        name: str,
+        facility_type: str,
+        parent_id: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """创建设施"""
+
+    @abstractmethod
+    def get_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取设施"""
+
+    @abstractmethod
+    def get_facility_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """根据名称获取设施"""
+
+    @abstractmethod
+    def get_facilities_by_names(self, names: List[str]) -> List[Dict[str, Any]]:
+        """批量按名称获取设施（一次集合查询，用于批量导入前的重名检查）"""
+
+    @abstractmethod
+    def get_all_facilities(self, facility_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取所有设施（按创建时间排序）"""
+
+    @abstractmethod
+    def get_children(self, parent_id: str) -> List[Dict[str, Any]]:
+        """获取子设施列表（按名称排序）"""
+
+    @abstractmethod
+    def update_facility(
+        self,
+        facility_id: str,
+        name: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> bool:
+        """更新设施信息，重命名时同步更新所有后代的物化路径"""
+
+    @abstractmethod
+    def delete_facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        """
+        删除设施，设施不存在时返回 None
+
+        设施、子设施和指标在一个小事务中立即删除，随即不可见；子树下所有指标的明细与汇总数据
+        记入返回的删除任务，由 purge_deletion_job 在后台分批清理
+        """
+
+    @abstractmethod
+    def build_facility_path(self, facility_id: str) -> str:
+        """获取设施路径（如：数据中心A/房间1/传感器X）"""
+
+    @abstractmethod
+    def get_facility_subtree(
+        self,
+        root_id: Optional[str] = None,
+        max_depth: Optional[int] = None,
+        root_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """获取设施子树，按 depth、name 排序"""
+
+    @abstractmethod
+    def get_root_facilities(self) -> List[Dict[str, Any]]:
+        """获取根设施（没有父设施的设施）"""
+
+    @abstractmethod
+    def create_facility_hierarchy(
+        self,
+        facilities: List[Dict[str, Any]],
+        metrics: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        在一个事务中批量创建设施层级及其指标，返回 (设施行列表, 指标行列表)
+
+        facilities 按父节点在前的顺序排列，每项包含调用方生成的 id 以及 name、facility_type、
+        parent_id、description，parent_id 可指向本批中的设施或已有设施；
+        metrics 每项包含 name、facility_id、unit、data_type、description、retention_days。
+        层级与重名由业务层预先校验，这里只负责计算物化路径并分批写入，任何一步失败整批回滚
+        """
+
+    # ==================== 指标相关操作 ====================
+
+    @abstractmethod
+    def create_metric(
+        self,
+        name: str,
+        facility_id: str,
+        unit: Optional[str] = None,
+        data_type: str = "float",
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """创建指标"""
+
+    @abstractmethod
+    def get_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取指标"""
+
+    @abstractmethod
+    def get_metrics_by_ids(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标，返回 {指标ID: 指标} 映射"""
+
+    @abstractmethod
+    def get_metrics_by_facilities(self, facility_ids: List[str]) -> List[Dict[str, Any]]:
+        """批量获取多个设施的指标，按名称排序"""
+
+    @abstractmethod
+    def get_metrics_by_facility(self, facility_id: str) -> List[Dict[str, Any]]:
+        """获取设施的所有指标（按名称排序）"""
+
+    @abstractmethod
+    def get_all_metrics(self) -> List[Dict[str, Any]]:
+        """获取所有指标（按创建时间排序）"""
+
+    @abstractmethod
+    def update_metric(
+        self,
+        metric_id: str,
+        name: Optional[str] = None,
+        unit: Optional[str] = None,
+        description: Optional[str] = None,
+        retention_days: Optional[int] = None
+    ) -> bool:
+        """更新指标信息（retention_days 为 0 表示恢复使用全局保留策略）"""
+
+    @abstractmethod
+    def delete_metric(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """删除指标并返回清理其明细与汇总数据的删除任务，指标不存在时返回 None"""
+
+    # ==================== 后台删除任务 ====================
+
+    @abstractmethod
+    def get_deletion_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取删除任务"""
+
+    @abstractmethod
+    def get_active_deletion_jobs(self) -> List[Dict[str, Any]]:
+        """获取尚未完成的删除任务（按创建时间排序）"""
+
+    @abstractmethod
+    def purge_deletion_job(self, job_id: str, batch_size: int = DELETION_BATCH_SIZE) -> bool:
+        """
+        清理删除任务中的下一批数据（最多 batch_size 行，在独立的短事务中完成）
+
+        任务的数据已全部清理时将其标记为完成并返回 False
+        """
+
+    # ==================== 指标值相关操作 ====================
+
+    def create_metric_value(
+        self,
+        metric_id: str,
+        value: str,
+        timestamp: Optional[str] = None,
+        data_type: str = "float",
+        dedup_key: Optional[str] = None,
+        value_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """创建指标值记录（按指标数据类型存储到类型化列）"""
+        return self.create_metric_values([{
+            "metric_id": metric_id,
+            "value": value,
+            "data_type": data_type,
+            "timestamp": timestamp,
+            "dedup_key": dedup_key,
+            "id": value_id
+        }])[0]
+
+    @abstractmethod
+    def create_metric_values(self, values: List[Dict[str, Any]], skip_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量创建指标值记录，并同步维护汇总与最新值
+
+        values 中每项包含 metric_id、value、data_type 以及可选的 timestamp、dedup_key、id。
+        同一指标下已登记过的 dedup_key（包括批次内的重复）不再写入，结果为原记录的 ID 与时间，
+        并带有 duplicate 标记；去重键与明细在同一事务中登记，由唯一主键保证并发重试只写入一次。
+        id 为调用方预先分配的记录 ID（uuid7），未提供时由存储层生成；skip_existing 为 true 时
+        按主键跳过已写入过的 id（落盘缓冲回放），结果同样为原记录并带有 duplicate 标记
+        """
+
+    @abstractmethod
+    def get_metric_values(
+        self,
+        metric_id: str,
+        limit: int = 100,
+        offset: int = 0,
+        before_timestamp: Optional[datetime] = None,
+        before_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """获取指标的历史值（按 (timestamp, id) 倒序，支持键集分页）"""
+
+    @abstractmethod
+    def iter_metric_values(
+        self,
+        metric_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = EXPORT_BATCH_SIZE
+    ) -> Iterator[List[Tuple[str, datetime, Optional[float], Optional[str]]]]:
+        """
+        按 (timestamp, id) 升序逐批读取 [start, end) 范围内的明细数据（含压缩块中的记录），用于导出
+
+        每批为 (id, timestamp, value_num, value_text) 元组列表，不做行字典转换；
+        整个迭代过程只保持一个结果集，内存占用与导出的总行数无关。
+        迭代期间占用一个数据库连接，未读完就结束时应调用 close() 释放
+        """
+
+    def get_latest_metric_value(self, metric_id: str) -> Optional[Dict[str, Any]]:
+        """获取指标的最新值"""
+        values = self.get_latest_metric_values([metric_id])
+        return values.get(metric_id)
+
+    @abstractmethod
+    def get_latest_metric_values(self, metric_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取指标的最新值，返回 {指标ID: 最新值}，没有数据的指标不在结果中"""
+
+    @abstractmethod
+    def aggregate_metric_values(
+        self,
+        metric_id: str,
+        start: datetime,
+        end: datetime,
+        bucket_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """按时间桶聚合指标值（时间范围为 [start, end)，时间桶按 UTC 纪元对齐）"""
+
+    # ==================== 行转换 ====================
+
+    def _convert_bucket_row(self, row: Dict[str, Any], bucket_seconds: int) -> Dict[str, Any]:
+        """将聚合查询的分桶行转换为统一格式"""
+        bucket_index = int(row["bucket_index"])
+        bucket_start = EPOCH + timedelta(seconds=bucket_index * bucket_seconds)
+        return {
+            "bucket_index": bucket_index,
+            "bucket_start": bucket_start.isoformat(),
+            "count": int(row["count"]),
+            "count_num": int(row["count_num"]),
+            "sum": float(row["sum"]) if row["sum"] is not None else None,
+            "min": float(row["min"]) if row["min"] is not None else None,
+            "max": float(row["max"]) if row["max"] is not None else None
+        }
+
+    def _convert_value_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """将指标值行的类型化列还原为字符串 value 字段"""
+        result = self._convert_datetime(row)
+        data_type = result.pop("data_type", None)
+        value_num = result.pop("value_num", None)
+        value_text = result.pop("value_text", None)
+        legacy_value = result.pop("value", None)
+        if value_num is None and value_text is None and legacy_value is not None:
+            # 尚未迁移的旧数据
+            result["value"] = legacy_value
+        else:
+            result["value"] = decode_metric_value(value_num, value_text, data_type)
+        return result
+
+    def _convert_datetime(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """将 datetime 对象和 UUID 对象转换为字符串"""
+        result = {}
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                result[key] = value.isoformat()
+            elif isinstance(value, uuid.UUID):
+                result[key] = str(value)
+            else:
+                result[key] = value
+        return result
+
+
+def create_storage(backend: Optional[str] = None) -> Storage:
+    """
+    按配置创建存储后端（不会立即连接数据库）
+
+    backend 默认读取环境变量 DB_BACKEND：mysql（默认）、sqlite、memory（纯内存，用于性能分析与压测）
+    或 segment（SQLite 元数据 + 分段文件时序存储，用于没有 MySQL 的边缘部署）；
+    各后端按需导入，使用 SQLite 时无需安装 MySQL 驱动
+    """
+    backend = (backend or os.getenv("DB_BACKEND", "mysql")).lower()
+    if backend == "mysql":
+        from database import Database
+        return Database()
+    if backend == "sqlite":
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase()
+    if backend == "memory":
+        from memory_database import MemoryDatabase
+        return MemoryDatabase()
+    if backend == "segment":
+        from segment_database import SegmentDatabase
+        return SegmentDatabase()
+    raise ValueError(f"不支持的存储后端：'{backend}'，可选值为 {', '.join(STORAGE_BACKENDS)}")
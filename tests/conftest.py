@@ -0,0 +1,125 @@
+"""
+测试公共配置
+直接导入仓库根目录下的模块；需要存储的测试在内存后端和 SQLite 临时库上运行，配置 MYSQL_TEST_DATABASE 后同时在 MySQL 测试库上运行
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MYSQL_TEST_DATABASE = os.getenv("MYSQL_TEST_DATABASE")
+
+import main
+from memory_database import MemoryDatabase
+from service import FacilityService, MetricService
+
+
+@pytest.fixture(scope="session", params=["memory", "sqlite", "mysql"])
+def backend(request):
+    """存储后端名称"""
+    if request.param == "mysql" and not MYSQL_TEST_DATABASE:
+        pytest.skip("未配置 MYSQL_TEST_DATABASE，跳过 MySQL 后端的测试")
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def persistent_storage(backend, tmp_path_factory):
+    """迁移到最新结构、在整个测试会话中复用的数据库后端；内存后端每个测试单独创建，此处为 None"""
+    if backend == "memory":
+        yield None
+        return
+    if backend == "mysql":
+        from database import Database
+        storage = Database(database=MYSQL_TEST_DATABASE)
+    else:
+        from sqlite_database import SQLiteDatabase
+        storage = SQLiteDatabase(path=str(tmp_path_factory.mktemp("sqlite") / "facilities.db"))
+    storage.migrate()
+    yield storage
+    storage.close()
+
+
+def _clear_tables(storage, backend):
+    """清空所有数据表（保留结构版本记录）"""
+    with storage.get_conn() as conn:
+        cursor = conn.cursor()
+        if backend == "mysql":
+            cursor.execute("SHOW TABLES")
+            tables = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+        else:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            tables = [row[0] for row in cursor.fetchall()]
+            cursor.execute("PRAGMA defer_foreign_keys = ON")
+        for table in tables:
+            if table != "schema_migrations":
+                cursor.execute(f"DELETE FROM {table}" if backend == "sqlite" else f"TRUNCATE TABLE {table}")
+        if backend == "mysql":
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+
+
+@pytest.fixture
+def db(backend, persistent_storage):
+    """空的测试存储后端：内存、SQLite 临时库，配置 MYSQL_TEST_DATABASE 后还包括 MySQL 测试库"""
+    if persistent_storage is None:
+        storage = MemoryDatabase()
+        storage.migrate()
+        return storage
+    _clear_tables(persistent_storage, backend)
+    return persistent_storage
+
+
+@pytest.fixture
+def facility_service(db):
+    return FacilityService(db)
+
+
+@pytest.fixture
+def metric_service(db):
+    return MetricService(db)
+
+
+class ApiClient:
+    """同步调用接口的测试客户端：应用 lifespan 和所有请求在同一个事件循环中执行"""
+
+    def __init__(self, app):
+        self._app = app
+        self._loop = asyncio.new_event_loop()
+        self._lifespan = app.router.lifespan_context(app)
+        self._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver")
+
+    def __enter__(self):
+        self._loop.run_until_complete(self._lifespan.__aenter__())
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._loop.run_until_complete(self._client.aclose())
+            self._loop.run_until_complete(self._lifespan.__aexit__(*exc_info))
+        finally:
+            self._loop.close()
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self._loop.run_until_complete(self._client.request(method, url, **kwargs))
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("DELETE", url, **kwargs)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """使用当前测试存储后端的接口客户端；存储后端由测试夹具管理，应用关闭时不释放"""
+    monkeypatch.setattr(main, "create_storage", lambda: db)
+    monkeypatch.setattr(db, "close", lambda: None)
+    with ApiClient(main.app) as api_client:
+        yield api_client
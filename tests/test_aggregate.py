@@ -0,0 +1,117 @@
+"""
+按时间桶聚合指标历史值测试
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import (
+    AggregateFunction, FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+)
+from service import NotFoundError, parse_aggregate_functions
+
+
+BASE = datetime(2024, 1, 1, 12)
+ALL_FUNCTIONS = list(AggregateFunction)
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="temperature", facility_id=facility.id))
+
+
+def _write(metric_service, metric, points):
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(value), timestamp=BASE + timedelta(seconds=seconds))
+        for seconds, value in points
+    ]))
+
+
+def test_buckets_are_epoch_aligned(metric, metric_service):
+    _write(metric_service, metric, [(0, 1.0), (30, 3.0), (59, 5.0), (60, 10.0), (185, -2.0)])
+
+    result = metric_service.aggregate_metric_values(
+        metric.id, "1m", ALL_FUNCTIONS, BASE, BASE + timedelta(minutes=5)
+    )
+
+    assert result.bucket_seconds == 60
+    assert [point.timestamp for point in result.points] == [
+        BASE, BASE + timedelta(minutes=1), BASE + timedelta(minutes=3)
+    ]
+    first, second, third = result.points
+    assert (first.count, first.sum, first.min, first.max, first.avg) == (3, 9.0, 1.0, 5.0, 3.0)
+    assert (second.count, second.avg) == (1, 10.0)
+    assert (third.count, third.min, third.max) == (1, -2.0, -2.0)
+
+
+def test_range_is_half_open(metric, metric_service):
+    _write(metric_service, metric, [(0, 1.0), (60, 2.0), (120, 4.0)])
+
+    result = metric_service.aggregate_metric_values(
+        metric.id, "1h", [AggregateFunction.COUNT, AggregateFunction.SUM],
+        BASE + timedelta(seconds=1), BASE + timedelta(seconds=120)
+    )
+
+    assert [(point.count, point.sum) for point in result.points] == [(1, 2.0)]
+    assert result.points[0].avg is None
+
+
+def test_avg_ignores_values_without_number(db, metric, metric_service):
+    _write(metric_service, metric, [(0, 2.0), (1, 4.0)])
+    # 数值列为空的记录（如无法按数据类型解析而保留为文本的旧数据）
+    db.create_metric_values([{
+        "metric_id": str(metric.id), "value": "n/a", "data_type": "string", "timestamp": BASE.isoformat()
+    }])
+
+    result = metric_service.aggregate_metric_values(
+        metric.id, "1m", ALL_FUNCTIONS, BASE, BASE + timedelta(minutes=1)
+    )
+
+    point = result.points[0]
+    assert (point.count, point.sum, point.avg) == (3, 6.0, 3.0)
+
+
+def test_string_metric_counts_without_avg(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    metric = metric_service.create_metric(MetricCreate(name="state", data_type="string", facility_id=facility.id))
+    _write(metric_service, metric, [(0, "on"), (1, "off")])
+
+    result = metric_service.aggregate_metric_values(
+        metric.id, "1m", ALL_FUNCTIONS, BASE, BASE + timedelta(minutes=1)
+    )
+
+    point = result.points[0]
+    assert (point.count, point.sum, point.avg) == (2, None, None)
+
+
+def test_invalid_requests(metric, metric_service):
+    with pytest.raises(NotFoundError):
+        metric_service.aggregate_metric_values(uuid.uuid4(), "1m", ALL_FUNCTIONS, BASE, BASE + timedelta(hours=1))
+    for bucket, start, end in [
+        ("5x", BASE, BASE + timedelta(hours=1)),
+        ("0m", BASE, BASE + timedelta(hours=1)),
+        ("1m", BASE, BASE),
+        ("1s", BASE, BASE + timedelta(days=1)),
+    ]:
+        with pytest.raises(ValueError) as error:
+            metric_service.aggregate_metric_values(metric.id, bucket, ALL_FUNCTIONS, start, end)
+        assert not isinstance(error.value, NotFoundError)
+
+
+def test_parse_aggregate_functions():
+    assert parse_aggregate_functions(" AVG, max,avg ") == [AggregateFunction.AVG, AggregateFunction.MAX]
+    for functions in ("", "median"):
+        with pytest.raises(ValueError):
+            parse_aggregate_functions(functions)
+
+
+def test_api_maps_missing_metric_to_404(metric, client):
+    params = {"start": BASE.isoformat(), "end": (BASE + timedelta(hours=1)).isoformat(), "bucket": "1m"}
+
+    assert client.get(f"/api/metrics/{uuid.uuid4()}/values/aggregate", params=params).status_code == 404
+    assert client.get(
+        f"/api/metrics/{metric.id}/values/aggregate", params={**params, "bucket": "5x"}
+    ).status_code == 400
+    assert client.get(f"/api/metrics/{metric.id}/values/aggregate", params=params).status_code == 200
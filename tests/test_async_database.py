@@ -0,0 +1,35 @@
+"""
+异步数据库层测试
+"""
+import asyncio
+import threading
+
+from async_database import AsyncDatabase
+from database import Database
+
+
+def test_executor_sized_to_pool_capacity():
+    # 创建 Database 不会连接数据库
+    database = Database()
+    async_db = AsyncDatabase(database)
+    try:
+        assert async_db._executor._max_workers == database.pool.max_size + database.pool.max_waiters
+    finally:
+        async_db.shutdown()
+
+
+def test_calls_run_off_event_loop_thread(db):
+    async_db = AsyncDatabase(db)
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        worker_thread = await async_db.run(threading.get_ident)
+        facilities = await async_db.get_all_facilities()
+        return loop_thread, worker_thread, facilities
+
+    try:
+        loop_thread, worker_thread, facilities = asyncio.run(scenario())
+    finally:
+        async_db.shutdown()
+    assert worker_thread != loop_thread
+    assert facilities == []
@@ -0,0 +1,67 @@
+"""
+后台周期任务停止测试
+"""
+import asyncio
+import time
+
+from background import BackgroundManager
+
+
+class CountingManager(BackgroundManager):
+    name = "Counting"
+
+    def __init__(self, fail_first: bool = False, duration: float = 0.0):
+        super().__init__()
+        self.runs = 0
+        self.fail_first = fail_first
+        self.duration = duration
+
+    def run_once(self):
+        self.runs += 1
+        time.sleep(self.duration)
+        if self.fail_first and self.runs == 1:
+            raise RuntimeError("boom")
+        return {"runs": self.runs}
+
+
+def test_stop_ends_interval_wait():
+    manager = CountingManager()
+
+    async def run():
+        task = asyncio.create_task(manager.run_forever(3600))
+        await asyncio.sleep(0.1)
+        manager.stop()
+        await asyncio.wait_for(task, timeout=5)
+
+    asyncio.run(run())
+    assert manager.stopping
+    assert manager.runs == 1
+
+
+def test_stop_waits_for_running_round():
+    manager = CountingManager(duration=0.3)
+
+    async def run():
+        task = asyncio.create_task(manager.run_forever(3600))
+        await asyncio.sleep(0.05)
+        manager.stop()
+        await asyncio.wait_for(task, timeout=5)
+        return task
+
+    task = asyncio.run(run())
+    assert task.done() and not task.cancelled()
+    assert manager.runs == 1
+
+
+def test_failed_round_does_not_end_loop(capsys):
+    manager = CountingManager(fail_first=True)
+
+    async def run():
+        task = asyncio.create_task(manager.run_forever(0.01))
+        while manager.runs < 2:
+            await asyncio.sleep(0.01)
+        manager.stop()
+        await asyncio.wait_for(task, timeout=5)
+
+    asyncio.run(run())
+    assert "Counting run failed: boom" in capsys.readouterr().out
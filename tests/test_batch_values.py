@@ -0,0 +1,66 @@
+"""
+批量写入指标值测试
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from models import (
+    FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+)
+
+
+BASE = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(
+        FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER)
+    )
+    return metric_service.create_metric(MetricCreate(name="temperature", facility_id=facility.id))
+
+
+def test_batch_size_limits():
+    item = MetricValueCreate(metric_id=uuid.uuid4(), value="1")
+    with pytest.raises(ValidationError):
+        MetricValueBatchCreate(items=[])
+    with pytest.raises(ValidationError):
+        MetricValueBatchCreate(items=[item] * 10001)
+    assert len(MetricValueBatchCreate(items=[item] * 10000).items) == 10000
+
+
+def test_batch_writes_known_metrics_and_reports_unknown(metric, metric_service):
+    missing = uuid.uuid4()
+    batch = MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value="1.5", timestamp=BASE),
+        MetricValueCreate(metric_id=missing, value="2.5", timestamp=BASE),
+        MetricValueCreate(metric_id=metric.id, value="3.5", timestamp=BASE + timedelta(seconds=1)),
+    ])
+
+    response = metric_service.create_metric_values(batch)
+
+    assert (response.total, response.succeeded, response.failed) == (3, 2, 1)
+    assert [result.index for result in response.results] == [0, 1, 2]
+    assert [result.success for result in response.results] == [True, False, True]
+    assert str(missing) in response.results[1].error
+    assert response.results[1].id is None
+
+    values = metric_service.get_metric_values(metric.id, limit=10)
+    assert {value.id for value in values} == {response.results[0].id, response.results[2].id}
+    assert sorted(value.value for value in values) == ["1.5", "3.5"]
+
+
+def test_batch_spanning_several_chunks(metric, metric_service):
+    batch = MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(index), timestamp=BASE + timedelta(seconds=index))
+        for index in range(2500)
+    ])
+
+    response = metric_service.create_metric_values(batch)
+
+    assert response.succeeded == 2500
+    assert len({result.id for result in response.results}) == 2500
+    assert len(metric_service.get_metric_values(metric.id, limit=3000)) == 2500
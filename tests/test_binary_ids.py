@@ -0,0 +1,62 @@
+"""
+MySQL UUID 列转换为 BINARY(16) 的启动检查测试（不需要数据库）
+"""
+import pytest
+
+from database import Database
+
+
+class RowsCursor:
+    """执行任意语句后 fetchall 返回预设行的游标"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(" ".join(sql.split()))
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database()
+    swapped = []
+    columns = {"metrics": [("id", False), ("facility_id", False)]}
+    monkeypatch.setattr(database, "_pending_binary_id_columns", lambda cursor: columns)
+    monkeypatch.setattr(database, "_shadowed_binary_id_tables", lambda cursor, pending: pending)
+    monkeypatch.setattr(database, "_swap_binary_id_columns", lambda cursor, pending, shadowed: swapped.append(pending))
+    database.swapped = swapped
+    return database
+
+
+def test_startup_refuses_to_swap_unfinished_backfill(database, monkeypatch):
+    monkeypatch.setattr(database, "_unfinished_binary_id_tables", lambda cursor, shadowed: ["metrics"])
+
+    with pytest.raises(RuntimeError, match="migrate_ids.py"):
+        database._migrate_binary_ids(RowsCursor([]))
+    assert database.swapped == []
+
+
+def test_startup_swaps_after_backfill(database, monkeypatch):
+    monkeypatch.setattr(database, "_unfinished_binary_id_tables", lambda cursor, shadowed: [])
+
+    database._migrate_binary_ids(RowsCursor([]))
+
+    assert database.swapped == [{"metrics": [("id", False), ("facility_id", False)]}]
+
+
+@pytest.mark.parametrize("existing, rows, unfinished", [
+    (["id", "facility_id"], [], ["metrics"]),
+    (["id", "id_bin", "facility_id", "facility_id_bin"], [(1,)], ["metrics"]),
+    (["id", "id_bin", "facility_id", "facility_id_bin"], [], []),
+])
+def test_unfinished_tables(monkeypatch, existing, rows, unfinished):
+    database = Database()
+    monkeypatch.setattr(database, "_get_table_columns", lambda cursor, table: existing)
+
+    assert database._unfinished_binary_id_tables(
+        RowsCursor(rows), {"metrics": [("id", False), ("facility_id", False)]}
+    ) == unfinished
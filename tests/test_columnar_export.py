@@ -0,0 +1,98 @@
+"""
+多指标列式导出测试
+"""
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import service
+from models import (
+    ColumnarExportFormat, FacilityCreate, FacilityType, MetricColumnarExportQuery, MetricCreate,
+    MetricValueCreate, MetricValueBatchCreate
+)
+from service import NotFoundError
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.ipc
+import pyarrow.parquet
+
+
+BASE = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def tree(facility_service, metric_service):
+    datacenter = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    room = facility_service.create_facility(
+        FacilityCreate(name="room", facility_type=FacilityType.ROOM, parent_id=datacenter.id)
+    )
+    temperature = metric_service.create_metric(MetricCreate(name="temp", unit="C", facility_id=room.id))
+    status = metric_service.create_metric(MetricCreate(name="status", data_type="string", facility_id=datacenter.id))
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        *(MetricValueCreate(metric_id=temperature.id, value=str(20 + index), timestamp=BASE + timedelta(minutes=index))
+          for index in range(5)),
+        MetricValueCreate(metric_id=status.id, value="ok", timestamp=BASE),
+    ]))
+    return datacenter, temperature, status
+
+
+def _read(chunks, export_format):
+    data = b"".join(chunks)
+    if export_format == ColumnarExportFormat.PARQUET:
+        return pyarrow.parquet.read_table(io.BytesIO(data))
+    return pyarrow.ipc.open_stream(data).read_all()
+
+
+@pytest.mark.parametrize("export_format", list(ColumnarExportFormat))
+def test_export_metric_list(tree, metric_service, export_format, monkeypatch):
+    _, temperature, status = tree
+    # 小批次，覆盖多个记录批次
+    monkeypatch.setattr(service, "COLUMNAR_BATCH_ROWS", 2)
+
+    table = _read(metric_service.export_metric_values_columnar(MetricColumnarExportQuery(
+        metric_ids=[temperature.id, status.id], format=export_format
+    )), export_format)
+
+    rows = table.to_pylist()
+    assert [row["metric_id"] for row in rows] == [str(temperature.id)] * 5 + [str(status.id)]
+    assert [row["value"] for row in rows] == [20.0, 21.0, 22.0, 23.0, 24.0, None]
+    assert rows[-1]["value_text"] == "ok"
+    assert rows[0]["timestamp"].replace(tzinfo=None) == BASE
+    metadata = json.loads(table.schema.metadata[b"metrics"])
+    assert [metric["name"] for metric in metadata] == ["temp", "status"]
+
+
+def test_export_facility_subtree_with_range(tree, metric_service):
+    datacenter, temperature, _ = tree
+
+    table = _read(metric_service.export_metric_values_columnar(MetricColumnarExportQuery(
+        facility_id=datacenter.id, start=BASE + timedelta(minutes=1), end=BASE + timedelta(minutes=3)
+    )), ColumnarExportFormat.ARROW)
+
+    assert table.column("metric_id").to_pylist() == [str(temperature.id)] * 2
+
+
+def test_invalid_columnar_requests(tree, metric_service):
+    datacenter, temperature, _ = tree
+    with pytest.raises(NotFoundError):
+        metric_service.export_metric_values_columnar(MetricColumnarExportQuery(metric_ids=[uuid.uuid4()]))
+    with pytest.raises(NotFoundError):
+        metric_service.export_metric_values_columnar(MetricColumnarExportQuery(facility_id=uuid.uuid4()))
+    with pytest.raises(ValueError):
+        metric_service.export_metric_values_columnar(
+            MetricColumnarExportQuery(metric_ids=[temperature.id], facility_id=datacenter.id)
+        )
+
+
+def test_missing_pyarrow_returns_501(tree, client, monkeypatch):
+    _, temperature, _ = tree
+
+    def missing():
+        raise ImportError("列式导出需要安装 pyarrow")
+
+    monkeypatch.setattr(service, "import_pyarrow", missing)
+    response = client.post("/api/metrics/values/export", json={"metric_ids": [str(temperature.id)]})
+    assert response.status_code == 501
@@ -0,0 +1,140 @@
+"""
+冷数据压缩测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from compaction import CompactionManager
+
+
+BASE = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def compact_db(db, backend):
+    """支持压缩存储的后端（内存后端不压缩明细）"""
+    if backend == "memory":
+        pytest.skip("内存后端不支持压缩存储")
+    return db
+
+
+@pytest.fixture
+def metric(db):
+    facility = db.create_facility("dc", "datacenter")
+    return db.create_metric("temperature", facility["id"], data_type="float")
+
+
+def _write(db, metric_id):
+    """写入 5 条读数，其中两条时间相同"""
+    readings = [(0, "1.0"), (0, "1.5"), (1, "2.0"), (2, "3.0"), (3, "4.0")]
+    return [
+        db.create_metric_value(metric_id, value, BASE + timedelta(seconds=offset), dedup_key=f"k{index}")
+        for index, (offset, value) in enumerate(readings)
+    ]
+
+
+def _compact_all(db, metric_id):
+    result = db.compact_metric_values(metric_id, BASE + timedelta(days=2))
+    assert result is not None
+    assert db.compact_metric_values(metric_id, BASE + timedelta(days=2)) is None
+    return result
+
+
+def test_compaction_keeps_value_ids(compact_db, metric):
+    db = compact_db
+    written = _write(db, metric["id"])
+    before = db.get_metric_values(metric["id"], limit=10)
+
+    assert _compact_all(db, metric["id"])["values"] == 5
+    after = db.get_metric_values(metric["id"], limit=10)
+
+    assert after == before
+    assert {row["id"] for row in after} == {row["id"] for row in written}
+    exported = [row[0] for batch in db.iter_metric_values(metric["id"]) for row in batch]
+    assert exported == [row["id"] for row in reversed(before)]
+
+
+def test_keyset_page_across_compaction(compact_db, metric):
+    db = compact_db
+    _write(db, metric["id"])
+    first_page = db.get_metric_values(metric["id"], limit=2)
+    assert [row["value"] for row in first_page] == ["4.0", "3.0"]
+    cursor = first_page[-1]
+    expected = db.get_metric_values(
+        metric["id"], limit=10,
+        before_timestamp=datetime.fromisoformat(cursor["timestamp"]), before_id=cursor["id"]
+    )
+
+    _compact_all(db, metric["id"])
+    second_page = db.get_metric_values(
+        metric["id"], limit=10,
+        before_timestamp=datetime.fromisoformat(cursor["timestamp"]), before_id=cursor["id"]
+    )
+
+    assert second_page == expected
+    assert [row["value"] for row in second_page] == ["2.0", "1.5", "1.0"]
+
+
+def test_retry_after_compaction_returns_stored_value(compact_db, metric):
+    db = compact_db
+    written = _write(db, metric["id"])
+    _compact_all(db, metric["id"])
+
+    retried = db.create_metric_value(metric["id"], "1.0", BASE, dedup_key="k0")
+
+    assert retried["duplicate"] is True
+    assert retried["id"] == written[0]["id"]
+    history = {row["id"]: row["value"] for row in db.get_metric_values(metric["id"], limit=10)}
+    assert history[retried["id"]] == "1.0"
+    assert len(history) == 5
+
+
+def test_late_values_merge_into_existing_block(compact_db, metric):
+    db = compact_db
+    written = _write(db, metric["id"])
+    _compact_all(db, metric["id"])
+
+    late = db.create_metric_value(metric["id"], "0.5", BASE - timedelta(seconds=1))
+    assert _compact_all(db, metric["id"])["values"] == 1
+
+    rows = db.get_metric_values(metric["id"], limit=10)
+    assert [row["value"] for row in rows] == ["4.0", "3.0", "2.0", "1.5", "1.0", "0.5"]
+    assert {row["id"] for row in rows} == {row["id"] for row in written} | {late["id"]}
+
+
+def test_aggregate_merges_blocks(compact_db, metric):
+    db = compact_db
+    _write(db, metric["id"])
+    # 按秒分桶，查询读取明细与压缩块
+    before = db.aggregate_metric_values(metric["id"], BASE, BASE + timedelta(seconds=10), 1)
+
+    _compact_all(db, metric["id"])
+    after = db.aggregate_metric_values(metric["id"], BASE, BASE + timedelta(seconds=10), 1)
+
+    assert after == before
+    assert [(row["count"], row["count_num"], row["sum"]) for row in after] == [
+        (2, 2, 2.5), (1, 1, 2.0), (1, 1, 3.0), (1, 1, 4.0)
+    ]
+
+
+def test_manager_compacts_numeric_metrics(db, backend, metric):
+    _write(db, metric["id"])
+    text_metric = db.create_metric("status", metric["facility_id"], data_type="string")
+    db.create_metric_value(text_metric["id"], "ok", BASE, data_type="string")
+
+    summary = CompactionManager(db, after_days=1, pause_seconds=0).run_once(now=BASE + timedelta(days=3))
+
+    # 内存后端不支持压缩存储，压缩任务不做任何事
+    expected = (0, 0) if backend == "memory" else (1, 5)
+    assert (summary["blocks"], summary["values"]) == expected
+    assert len(db.get_metric_values(metric["id"], limit=10)) == 5
+    assert len(db.get_metric_values(text_metric["id"], limit=10)) == 1
+
+
+def test_manager_stops_between_windows(db, metric):
+    manager = CompactionManager(db, after_days=1, pause_seconds=0)
+    manager.stop()
+
+    assert manager.run_once(now=BASE + timedelta(days=3)) == {"blocks": 0, "values": 0}
+    assert not CompactionManager(db, after_days=0).enabled
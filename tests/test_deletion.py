@@ -0,0 +1,93 @@
+"""
+设施与指标的后台分批删除测试
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from deletion import DeletionManager
+from models import (
+    DeletionJobStatus, FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+)
+
+
+BASE = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def tree(facility_service, metric_service):
+    datacenter = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    room = facility_service.create_facility(
+        FacilityCreate(name="room", facility_type=FacilityType.ROOM, parent_id=datacenter.id)
+    )
+    metrics = [
+        metric_service.create_metric(MetricCreate(name=name, facility_id=facility.id))
+        for name, facility in (("power", datacenter), ("temp", room))
+    ]
+    for metric in metrics:
+        metric_service.create_metric_values(MetricValueBatchCreate(items=[
+            MetricValueCreate(metric_id=metric.id, value=str(index), timestamp=BASE + timedelta(minutes=index))
+            for index in range(5)
+        ]))
+    return datacenter, metrics
+
+
+def _remaining_values(db, metric):
+    return sum(len(batch) for batch in db.iter_metric_values(str(metric.id), None, None))
+
+
+def test_delete_facility_hides_subtree_and_purges_in_batches(db, tree, facility_service, metric_service):
+    datacenter, metrics = tree
+
+    job = facility_service.delete_facility(datacenter.id)
+
+    assert (job.target_type, job.target_id, job.metrics_total) == ("facility", datacenter.id, 2)
+    assert facility_service.get_all_facilities() == []
+    assert all(metric_service.get_metric(metric.id) is None for metric in metrics)
+
+    summary = DeletionManager(db, batch_size=2, pause_seconds=0).run_once()
+
+    job = facility_service.get_deletion_job(job.id)
+    assert job.status == DeletionJobStatus.COMPLETED
+    assert job.metrics_done == 2 and job.finished_at is not None
+    assert all(_remaining_values(db, metric) == 0 for metric in metrics)
+    assert facility_service.get_active_deletion_jobs() == []
+    assert summary["completed_jobs"] in ([], [str(job.id)])
+
+
+def test_stopped_manager_leaves_job_for_next_run(db, backend, tree, facility_service):
+    if backend == "memory":
+        pytest.skip("内存后端删除时立即释放数据，任务直接完成")
+    datacenter, metrics = tree
+    job = facility_service.delete_facility(datacenter.id)
+
+    manager = DeletionManager(db, batch_size=2, pause_seconds=0)
+    manager.stop()
+    assert manager.run_once() == {"completed_jobs": [], "batches": 0}
+    assert [active.id for active in facility_service.get_active_deletion_jobs()] == [job.id]
+
+    DeletionManager(db, batch_size=2, pause_seconds=0).run_once()
+    assert facility_service.get_deletion_job(job.id).status == DeletionJobStatus.COMPLETED
+
+
+def test_delete_metric_without_values_completes_immediately(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    metric = metric_service.create_metric(MetricCreate(name="idle", facility_id=facility.id))
+
+    job = metric_service.delete_metric(metric.id)
+
+    assert job.target_type == "metric"
+    assert metric_service.delete_metric(metric.id) is None
+    assert facility_service.delete_facility(uuid.uuid4()) is None
+
+
+def test_delete_endpoints(tree, client):
+    datacenter, _ = tree
+
+    response = client.delete(f"/api/facilities/{datacenter.id}")
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert client.get(f"/api/deletions/{job_id}").status_code == 200
+    assert client.get(f"/api/deletions/{uuid.uuid4()}").status_code == 404
+    assert client.delete(f"/api/facilities/{datacenter.id}").status_code == 404
@@ -0,0 +1,77 @@
+"""
+指标历史值流式导出测试
+"""
+import csv
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+from service import NotFoundError
+
+
+BASE = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="up", data_type="int", facility_id=facility.id))
+
+
+@pytest.fixture
+def written(metric, metric_service):
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(index), timestamp=BASE + timedelta(minutes=index))
+        for index in range(7)
+    ]))
+    return [str(index) for index in range(7)]
+
+
+def test_ndjson_export_in_time_order(db, metric, metric_service, written, monkeypatch):
+    # 小批次，覆盖跨批次读取
+    iterate = db.iter_metric_values
+    monkeypatch.setattr(db, "iter_metric_values", lambda *args: iterate(*args, batch_size=3))
+
+    text = "".join(metric_service.export_metric_values(metric.id, "ndjson"))
+
+    rows = [json.loads(line) for line in text.splitlines()]
+    assert [row["value"] for row in rows] == written
+    assert rows[0]["metric_id"] == str(metric.id)
+    assert rows[0]["timestamp"] == BASE.isoformat()
+
+
+def test_csv_export_with_range(metric, metric_service, written):
+    text = "".join(metric_service.export_metric_values(
+        metric.id, "csv", BASE + timedelta(minutes=2), BASE + timedelta(minutes=5)
+    ))
+
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == ["id", "metric_id", "timestamp", "value"]
+    assert [row[3] for row in rows[1:]] == ["2", "3", "4"]
+
+
+def test_csv_export_without_values_has_header(metric, metric_service):
+    assert "".join(metric_service.export_metric_values(metric.id, "csv")) == "id,metric_id,timestamp,value\n"
+
+
+def test_invalid_export_requests(metric, metric_service):
+    with pytest.raises(NotFoundError):
+        metric_service.export_metric_values(uuid.uuid4(), "ndjson")
+    for export_format, start, end in [("xml", None, None), ("csv", BASE, BASE)]:
+        with pytest.raises(ValueError) as error:
+            metric_service.export_metric_values(metric.id, export_format, start, end)
+        assert not isinstance(error.value, NotFoundError)
+
+
+def test_export_endpoint_streams(metric, written, client):
+    response = client.get(f"/api/metrics/{metric.id}/values/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert len(response.text.splitlines()) == len(written) + 1
+
+    assert client.get(f"/api/metrics/{uuid.uuid4()}/values/export").status_code == 404
+    assert client.get(f"/api/metrics/{metric.id}/values/export", params={"format": "xml"}).status_code == 400
@@ -0,0 +1,98 @@
+"""
+设施层级批量导入测试
+"""
+import pytest
+
+from models import FacilityCreate, FacilityImportRequest, FacilityType, TreeQueryParams
+from service import parse_import_csv
+
+
+def _request(**kwargs):
+    return FacilityImportRequest(**{
+        "facilities": [{
+            "name": "dc",
+            "facility_type": "datacenter",
+            "metrics": [{"name": "power", "unit": "kW"}],
+            "children": [{
+                "name": "room",
+                "facility_type": "room",
+                "children": [
+                    {"name": "s1", "facility_type": "sensor", "metrics": [{"name": "temp"}, {"name": "rh"}]},
+                    {"name": "s2", "facility_type": "sensor"},
+                ],
+            }],
+        }],
+        **kwargs
+    })
+
+
+def test_import_nested_hierarchy(facility_service):
+    response = facility_service.import_facilities(_request())
+
+    assert (response.facilities_created, response.metrics_created) == (4, 3)
+    # 父设施在前
+    assert [facility.name for facility in response.facilities] == ["dc", "room", "s1", "s2"]
+    tree = facility_service.get_facility_tree(TreeQueryParams(include_metrics=True))
+    assert len(tree) == 1
+    room = tree[0].children[0]
+    assert [child.name for child in room.children] == ["s1", "s2"]
+    assert sorted(metric.name for metric in room.children[0].metrics) == ["rh", "temp"]
+    assert facility_service.db.build_facility_path(str(response.facilities[2].id)) == "dc/room/s1"
+
+
+def test_import_validates_before_writing(facility_service):
+    facility_service.create_facility(FacilityCreate(name="s2", facility_type=FacilityType.DATACENTER))
+
+    with pytest.raises(ValueError, match="s2"):
+        facility_service.import_facilities(_request())
+    # 任一校验失败时不写入任何数据
+    assert [facility.name for facility in facility_service.get_all_facilities()] == ["s2"]
+
+    bad_layer = FacilityImportRequest(facilities=[{
+        "name": "dc2", "facility_type": "datacenter",
+        "children": [{"name": "x", "facility_type": "sensor"}],
+    }])
+    with pytest.raises(ValueError):
+        facility_service.import_facilities(bad_layer)
+
+
+def test_import_under_parent(facility_service):
+    datacenter = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+
+    response = facility_service.import_facilities(FacilityImportRequest(
+        parent_id=datacenter.id, facilities=[{"name": "room", "facility_type": "room"}]
+    ))
+
+    assert response.facilities[0].parent_id == datacenter.id
+
+
+def test_parse_import_csv():
+    text = (
+        "path,description,metric,unit,data_type\n"
+        "dc/room/s1,first sensor,temp,C,float\n"
+        "dc/room/s1,,up,,bool\n"
+        "dc/room2,,,,\n"
+    )
+
+    roots = parse_import_csv(text)
+
+    assert [root.name for root in roots] == ["dc"]
+    assert [child.name for child in roots[0].children] == ["room", "room2"]
+    sensor = roots[0].children[0].children[0]
+    assert (sensor.facility_type, sensor.description) == (FacilityType.SENSOR, "first sensor")
+    assert [(metric.name, metric.data_type) for metric in sensor.metrics] == [("temp", "float"), ("up", "bool")]
+    for text in ("name\ndc\n", "path\ndc/room/s1/x\n", "path\ndc//s1\n"):
+        with pytest.raises(ValueError):
+            parse_import_csv(text)
+
+
+def test_csv_import_endpoint(db, client):
+    response = client.post(
+        "/api/facilities/import/csv",
+        content="path,metric\ndc/room/s1,temp\n".encode("utf-8-sig"),
+        headers={"Content-Type": "text/csv"}
+    )
+
+    assert response.status_code == 201
+    assert response.json()["facilities_created"] == 3
+    assert client.post("/api/facilities/import/csv", content=b"name\ndc\n").status_code == 400
@@ -0,0 +1,55 @@
+"""
+设施物化路径维护测试
+"""
+import pytest
+
+from models import FacilityCreate, FacilityType, FacilityUpdate, TreeQueryParams
+
+
+@pytest.fixture
+def hierarchy(facility_service):
+    dc = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    room = facility_service.create_facility(FacilityCreate(name="room", facility_type=FacilityType.ROOM, parent_id=dc.id))
+    sensor = facility_service.create_facility(
+        FacilityCreate(name="sensor", facility_type=FacilityType.SENSOR, parent_id=room.id)
+    )
+    other = facility_service.create_facility(FacilityCreate(name="dc-2", facility_type=FacilityType.DATACENTER))
+    return dc, room, sensor, other
+
+
+def _paths(facility_service):
+    return {facility.name: facility.path for facility in facility_service.get_all_facilities()}
+
+
+def test_paths_are_stored_on_create(facility_service, hierarchy):
+    dc, room, sensor, _ = hierarchy
+
+    assert sensor.path == "dc/room/sensor"
+    assert facility_service.get_facility(room.id).path == "dc/room"
+    assert [child.path for child in facility_service.get_facility_children(room.id)] == ["dc/room/sensor"]
+    assert _paths(facility_service) == {
+        "dc": "dc", "room": "dc/room", "sensor": "dc/room/sensor", "dc-2": "dc-2"
+    }
+
+
+def test_rename_rewrites_descendant_paths(facility_service, hierarchy):
+    dc, room, sensor, _ = hierarchy
+
+    facility_service.update_facility(room.id, FacilityUpdate(name="hall"))
+    facility_service.update_facility(dc.id, FacilityUpdate(description="only description"))
+
+    assert _paths(facility_service) == {
+        "dc": "dc", "hall": "dc/hall", "sensor": "dc/hall/sensor", "dc-2": "dc-2"
+    }
+    tree = facility_service.get_facility_tree(TreeQueryParams(root_id=room.id))
+    assert tree[0].children[0].path == "dc/hall/sensor"
+
+
+def test_delete_removes_subtree(facility_service, hierarchy):
+    dc, room, sensor, other = hierarchy
+
+    assert facility_service.delete_facility(dc.id)
+
+    assert _paths(facility_service) == {"dc-2": "dc-2"}
+    assert facility_service.get_facility(sensor.id) is None
+    assert [node.name for node in facility_service.get_facility_tree(TreeQueryParams())] == ["dc-2"]
@@ -0,0 +1,79 @@
+"""
+设施树查询测试
+"""
+import uuid
+
+import pytest
+
+from models import FacilityCreate, FacilityType, MetricCreate, TreeQueryParams
+
+
+@pytest.fixture
+def hierarchy(facility_service, metric_service):
+    """dc-a/{room-a1/{sensor-1, sensor-2}, room-a2}，dc-b/room-b1"""
+    def create(name, facility_type, parent=None):
+        return facility_service.create_facility(FacilityCreate(
+            name=name, facility_type=facility_type, parent_id=parent.id if parent else None
+        ))
+
+    facilities = {}
+    facilities["dc-a"] = create("dc-a", FacilityType.DATACENTER)
+    facilities["dc-b"] = create("dc-b", FacilityType.DATACENTER)
+    facilities["room-a2"] = create("room-a2", FacilityType.ROOM, facilities["dc-a"])
+    facilities["room-a1"] = create("room-a1", FacilityType.ROOM, facilities["dc-a"])
+    facilities["room-b1"] = create("room-b1", FacilityType.ROOM, facilities["dc-b"])
+    facilities["sensor-2"] = create("sensor-2", FacilityType.SENSOR, facilities["room-a1"])
+    facilities["sensor-1"] = create("sensor-1", FacilityType.SENSOR, facilities["room-a1"])
+    metric_service.create_metric(MetricCreate(name="temperature", facility_id=facilities["sensor-1"].id))
+    metric_service.create_metric(MetricCreate(name="power", facility_id=facilities["dc-a"].id))
+    return facilities
+
+
+def _shape(nodes):
+    return [(node.name, _shape(node.children)) for node in nodes]
+
+
+def _find(nodes, name):
+    for node in nodes:
+        if node.name == name:
+            return node
+        found = _find(node.children, name)
+        if found:
+            return found
+    return None
+
+
+def test_full_tree(facility_service, hierarchy):
+    tree = facility_service.get_facility_tree(TreeQueryParams())
+
+    assert _shape(tree) == [
+        ("dc-a", [("room-a1", [("sensor-1", []), ("sensor-2", [])]), ("room-a2", [])]),
+        ("dc-b", [("room-b1", [])]),
+    ]
+    assert _find(tree, "sensor-1").path == "dc-a/room-a1/sensor-1"
+    assert [metric.name for metric in _find(tree, "sensor-1").metrics] == ["temperature"]
+    assert [metric.name for metric in _find(tree, "dc-a").metrics] == ["power"]
+
+
+def test_subtree_keeps_ancestor_path(facility_service, hierarchy):
+    tree = facility_service.get_facility_tree(TreeQueryParams(root_id=hierarchy["room-a1"].id))
+
+    assert _shape(tree) == [("room-a1", [("sensor-1", []), ("sensor-2", [])])]
+    assert tree[0].path == "dc-a/room-a1"
+    assert tree[0].children[1].path == "dc-a/room-a1/sensor-2"
+
+
+def test_depth_type_and_metric_options(facility_service, hierarchy):
+    shallow = facility_service.get_facility_tree(TreeQueryParams(max_depth=1, include_metrics=False))
+    assert _shape(shallow) == [
+        ("dc-a", [("room-a1", []), ("room-a2", [])]),
+        ("dc-b", [("room-b1", [])]),
+    ]
+    assert _find(shallow, "dc-a").metrics == []
+
+    rooms = facility_service.get_facility_tree(TreeQueryParams(facility_type=FacilityType.ROOM))
+    assert rooms == []
+
+
+def test_unknown_root_returns_empty(facility_service, hierarchy):
+    assert facility_service.get_facility_tree(TreeQueryParams(root_id=uuid.uuid4())) == []
@@ -0,0 +1,93 @@
+"""
+指标值幂等写入测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+from retention import RetentionManager
+from service import MetricService
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="temp", facility_id=facility.id))
+
+
+def test_retry_with_same_key_returns_original(db, metric, metric_service):
+    first = metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="k1"))
+    retried = metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="2", idempotency_key="k1"))
+
+    assert (first.duplicate, retried.duplicate) == (False, True)
+    assert retried.id == first.id
+    assert len(metric_service.get_metric_values(metric.id, limit=10)) == 1
+
+
+def test_duplicate_detected_by_storage_without_cache(db, metric, metric_service):
+    first = metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="k1"))
+
+    # 新的服务实例没有进程内缓存，由数据库中的去重键判定
+    retried = MetricService(db).create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="k1"))
+
+    assert retried.duplicate and retried.id == first.id
+    assert len(metric_service.get_metric_values(metric.id, limit=10)) == 1
+
+
+def test_batch_counts_duplicates(db, metric, metric_service):
+    metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="a"))
+
+    response = metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="a"),
+        MetricValueCreate(metric_id=metric.id, value="2", idempotency_key="b"),
+        MetricValueCreate(metric_id=metric.id, value="2", idempotency_key="b"),
+        MetricValueCreate(metric_id=metric.id, value="3")
+    ]))
+
+    assert (response.succeeded, response.duplicates) == (4, 2)
+    assert response.results[1].id == response.results[2].id
+    assert len(metric_service.get_metric_values(metric.id, limit=10)) == 3
+
+
+def test_timestamp_dedup_mode(db, metric, monkeypatch):
+    monkeypatch.setenv("VALUE_DEDUP_MODE", "timestamp")
+    service = MetricService(db)
+    timestamp = datetime(2024, 1, 1, 8, 0, 0)
+
+    first = service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", timestamp=timestamp))
+    retried = service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", timestamp=timestamp))
+
+    assert retried.duplicate and retried.id == first.id
+
+
+def test_invalid_dedup_mode_rejected(db, monkeypatch):
+    monkeypatch.setenv("VALUE_DEDUP_MODE", "content")
+    with pytest.raises(ValueError):
+        MetricService(db)
+
+
+def test_retention_purges_expired_keys(db, metric, metric_service):
+    metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="k1"))
+
+    summary = RetentionManager(db, retention_days=0, dedup_window_hours=1).run_once(
+        now=datetime.utcnow() + timedelta(hours=2)
+    )
+
+    assert summary["expired_dedup_keys"] == 1
+    # 去重键过期后以相同的键重试会写入新记录
+    retried = MetricService(db).create_metric_value(MetricValueCreate(metric_id=metric.id, value="1", idempotency_key="k1"))
+    assert not retried.duplicate
+    assert len(metric_service.get_metric_values(metric.id, limit=10)) == 2
+
+
+def test_idempotency_key_header(client, metric):
+    payload = {"metric_id": str(metric.id), "value": "1"}
+    headers = {"Idempotency-Key": "req-1"}
+
+    first = client.post("/api/metrics/values", json=payload, headers=headers)
+    retried = client.post("/api/metrics/values", json=payload, headers=headers)
+
+    assert (first.status_code, retried.status_code) == (201, 200)
+    assert retried.json()["id"] == first.json()["id"]
+    assert retried.json()["duplicate"] is True
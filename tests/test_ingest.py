@@ -0,0 +1,100 @@
+"""
+单条指标值写缓冲测试
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import main
+from async_database import AsyncDatabase
+from ingest import IngestBuffer, IngestBufferClosed, IngestBufferFull
+from models import FacilityCreate, FacilityType, MetricCreate, MetricValueCreate
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="temp", facility_id=facility.id))
+
+
+def _run_buffer(db, metric_service, scenario, **kwargs):
+    """在事件循环中启动写缓冲执行 scenario，结束后关闭写缓冲并返回统计"""
+    async def main():
+        async_db = AsyncDatabase(db)
+        buffer = IngestBuffer(metric_service, async_db, **kwargs)
+        buffer.start()
+        try:
+            await scenario(buffer)
+        finally:
+            await buffer.close()
+            async_db.shutdown()
+        return buffer.stats()
+
+    return asyncio.run(main())
+
+
+def test_buffered_values_are_written_in_batches(db, metric, metric_service):
+    async def scenario(buffer):
+        for index in range(25):
+            buffer.submit(MetricValueCreate(metric_id=metric.id, value=str(index)))
+        # 无效指标值在写入时丢弃，不影响同批其他数据
+        buffer.submit(MetricValueCreate(metric_id=metric.id, value="bad"))
+
+    stats = _run_buffer(db, metric_service, scenario, batch_size=10, flush_interval=0.01)
+
+    assert (stats["accepted"], stats["written"], stats["failed"], stats["queued"]) == (26, 25, 1, 0)
+    assert stats["batches"] >= 3
+    assert len(metric_service.get_metric_values(metric.id, limit=100)) == 25
+
+
+def test_submit_stamps_receive_time(db, metric, metric_service):
+    accepted = []
+
+    async def scenario(buffer):
+        accepted.append(buffer.submit(MetricValueCreate(metric_id=metric.id, value="1")))
+
+    before = datetime.utcnow()
+    _run_buffer(db, metric_service, scenario)
+
+    assert before <= accepted[0].timestamp <= datetime.utcnow()
+
+
+def test_full_queue_rejects_and_closed_buffer_refuses(db, metric, metric_service):
+    errors = []
+
+    async def scenario(buffer):
+        # 后台任务尚未取走数据前队列容量为 2
+        buffer.submit(MetricValueCreate(metric_id=metric.id, value="1"))
+        buffer.submit(MetricValueCreate(metric_id=metric.id, value="2"))
+        with pytest.raises(IngestBufferFull) as error:
+            buffer.submit(MetricValueCreate(metric_id=metric.id, value="3"))
+        errors.append(error.value)
+        await buffer.close()
+        with pytest.raises(IngestBufferClosed):
+            buffer.submit(MetricValueCreate(metric_id=metric.id, value="4"))
+
+    stats = _run_buffer(db, metric_service, scenario, max_size=2)
+
+    assert errors[0].retry_after >= 1
+    assert (stats["written"], stats["rejected"]) == (2, 2)
+
+
+def test_buffered_endpoint_status_codes(db, metric, client, monkeypatch):
+    # 未启动后台任务，队列只进不出
+    buffer = IngestBuffer(None, None, max_size=1)
+    monkeypatch.setattr(main.app.state, "ingest_buffer", buffer)
+    body = {"metric_id": str(metric.id), "value": "1.5"}
+
+    accepted = client.post("/api/metrics/values", json=body)
+    assert accepted.status_code == 202
+    assert accepted.json()["queued"] == 1
+
+    rejected = client.post("/api/metrics/values", json=body)
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+    asyncio.run(buffer.close())
+    closing = client.post("/api/metrics/values", json=body)
+    assert closing.status_code == 503
+    assert "Retry-After" in closing.headers
@@ -0,0 +1,76 @@
+"""
+指标最新值维护测试
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import (
+    FacilityCreate, FacilityType, MetricCreate, MetricLatestQuery, MetricValueCreate, MetricValueBatchCreate
+)
+
+
+BASE = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def facility(facility_service):
+    return facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+
+
+@pytest.fixture
+def metric(facility_service, metric_service, facility):
+    return metric_service.create_metric(MetricCreate(name="temperature", facility_id=facility.id))
+
+
+def _write(metric_service, metric, value, seconds):
+    return metric_service.create_metric_value(
+        MetricValueCreate(metric_id=metric.id, value=value, timestamp=BASE + timedelta(seconds=seconds))
+    )
+
+
+def test_late_values_do_not_replace_latest(metric, metric_service):
+    _write(metric_service, metric, "1", 10)
+    newest = _write(metric_service, metric, "2", 20)
+    _write(metric_service, metric, "3", 15)
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(seconds), timestamp=BASE + timedelta(seconds=seconds))
+        for seconds in (5, 19, 12)
+    ]))
+
+    assert metric_service.get_latest_metric_value(metric.id).id == newest.id
+
+
+def test_same_timestamp_breaks_ties_by_id(metric, metric_service):
+    written = [_write(metric_service, metric, str(index), 10) for index in range(5)]
+
+    latest = metric_service.get_latest_metric_value(metric.id)
+
+    assert latest.id == max(written, key=lambda value: str(value.id)).id
+    assert latest.id == metric_service.get_metric_values(metric.id, limit=1)[0].id
+
+
+def test_batch_query_keeps_request_order(facility, metric, metric_service):
+    other = metric_service.create_metric(MetricCreate(name="humidity", facility_id=facility.id))
+    empty = metric_service.create_metric(MetricCreate(name="empty", facility_id=facility.id))
+    _write(metric_service, metric, "1", 0)
+    _write(metric_service, other, "2", 0)
+
+    values = metric_service.get_latest_metric_values(MetricLatestQuery(
+        metric_ids=[other.id, uuid.uuid4(), empty.id, metric.id, other.id]
+    ))
+
+    assert [value.metric_id for value in values] == [other.id, metric.id]
+    assert [value.value for value in values] == ["2.0", "1.0"]
+
+
+def test_rebuild_latest_from_history(db, metric, metric_service):
+    for seconds in (3, 9, 6):
+        _write(metric_service, metric, str(seconds), seconds)
+    expected = metric_service.get_latest_metric_value(metric.id)
+
+    db.rebuild_latest(str(metric.id))
+
+    assert metric_service.get_latest_metric_value(metric.id) == expected
+    assert expected.value == "9.0"
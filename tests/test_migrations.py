@@ -0,0 +1,84 @@
+"""
+结构迁移测试
+"""
+import sys
+
+import pytest
+
+from database import Database, SCHEMA_MIGRATIONS
+from pool import ConnectionPool
+
+
+class ScriptedCursor:
+    """按 SQL 关键字返回预设结果的游标，记录执行过的语句"""
+
+    def __init__(self, results, executed):
+        self.results = results
+        self.executed = executed
+        self.last = None
+
+    def execute(self, sql, params=None):
+        self.executed.append(" ".join(sql.split()))
+        self.last = next((key for key in self.results if key in sql), None)
+
+    def fetchone(self):
+        return self.results.get(self.last)
+
+    def fetchall(self):
+        return []
+
+
+class ScriptedConnection:
+    def __init__(self, results, executed):
+        self.results = results
+        self.executed = executed
+
+    def cursor(self):
+        return ScriptedCursor(self.results, self.executed)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def scripted_database(results):
+    executed = []
+    database = Database()
+    database.pool = ConnectionPool(lambda: ScriptedConnection(results, executed))
+    return database, executed
+
+
+def test_up_to_date_schema_runs_no_ddl():
+    database, executed = scripted_database({"MAX(version)": (SCHEMA_MIGRATIONS[-1][0],)})
+
+    assert database.migrate() == []
+    assert not any("GET_LOCK" in sql or "CREATE" in sql for sql in executed)
+
+
+def test_lock_timeout_aborts_migration():
+    database, executed = scripted_database({"MAX(version)": (0,), "GET_LOCK": (0,)})
+
+    with pytest.raises(RuntimeError):
+        database.migrate()
+    # 未拿到锁时既不执行 DDL，也不释放别人持有的锁
+    assert not any("CREATE" in sql or "RELEASE_LOCK" in sql for sql in executed)
+
+
+def test_migrated_schema_is_current(persistent_storage):
+    db = persistent_storage
+    if db is None:
+        pytest.skip("内存后端没有表结构")
+    with db.get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        # 各后端维护各自的迁移列表
+        assert cursor.fetchone()[0] == sys.modules[type(db).__module__].SCHEMA_MIGRATIONS[-1][0]
+    assert db.migrate() == []
@@ -0,0 +1,117 @@
+"""
+连接池测试（使用假连接，不需要数据库）
+"""
+import threading
+
+import pytest
+
+from pool import ConnectionPool, PoolQueueFullError, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.pings = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if not self.connected:
+            raise ConnectionError("lost")
+
+    def close(self):
+        self.closed = True
+        self.connected = False
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    return ConnectionPool(connect, **kwargs), created
+
+
+def test_prewarm_creates_min_size_connections():
+    pool, created = make_pool(min_size=3, max_size=5)
+    pool.prewarm()
+    stats = pool.stats()
+    assert len(created) == 3
+    assert stats["size"] == 3 and stats["idle"] == 3 and stats["in_use"] == 0
+
+
+def test_idle_connection_is_reused():
+    pool, created = make_pool(max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert len(created) == 1
+
+
+def test_timeout_when_exhausted():
+    pool, _ = make_pool(max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.stats()["timeouts_total"] == 1
+
+
+def test_rejects_when_wait_queue_full():
+    pool, _ = make_pool(max_size=1, max_waiters=0)
+    conn = pool.acquire()
+    with pytest.raises(PoolQueueFullError):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.stats()["rejected_total"] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool, created = make_pool(max_size=1, timeout=5)
+    conn = pool.acquire()
+    result = {}
+
+    def waiter():
+        result["conn"] = pool.acquire()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    pool.release(conn)
+    thread.join(5)
+    assert result["conn"] is conn
+    assert len(created) == 1
+
+
+def test_broken_connection_is_discarded_on_release():
+    pool, created = make_pool(max_size=1)
+    conn = pool.acquire()
+    conn.connected = False
+    pool.release(conn)
+    assert pool.stats()["size"] == 0
+    assert pool.acquire() is not conn
+    assert len(created) == 2
+
+
+def test_stale_idle_connection_is_validated_and_replaced():
+    pool, created = make_pool(max_size=1, validate_after=-1)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.connected = False
+    replacement = pool.acquire()
+    assert replacement is not conn and conn.closed
+    assert pool.stats()["invalidated_total"] == 1
+
+
+def test_close_closes_idle_connections():
+    pool, created = make_pool(min_size=2, max_size=2)
+    pool.prewarm()
+    pool.close()
+    assert all(conn.closed for conn in created)
+    assert pool.stats()["size"] == 0
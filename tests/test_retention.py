@@ -0,0 +1,90 @@
+"""
+明细数据保留测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import (
+    AggregateFunction, FacilityCreate, FacilityType, MetricCreate, MetricUpdate,
+    MetricValueCreate, MetricValueBatchCreate
+)
+from retention import RetentionManager
+
+
+NOW = datetime(2024, 6, 15, 12)
+
+
+@pytest.fixture
+def facility(facility_service):
+    return facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+
+
+def _metric_with_history(metric_service, facility, name, retention_days=None):
+    metric = metric_service.create_metric(
+        MetricCreate(name=name, facility_id=facility.id, retention_days=retention_days)
+    )
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(days), timestamp=NOW - timedelta(days=days))
+        for days in (1, 5, 20, 40)
+    ]))
+    return metric
+
+
+def _ages(metric_service, metric):
+    return sorted(int(value.value.split(".")[0]) for value in metric_service.get_metric_values(metric.id))
+
+
+def test_global_and_per_metric_retention(db, facility, metric_service):
+    default = _metric_with_history(metric_service, facility, "default")
+    short = _metric_with_history(metric_service, facility, "short", retention_days=3)
+    restored = _metric_with_history(metric_service, facility, "restored", retention_days=3)
+    # 0 表示恢复全局保留策略
+    metric_service.update_metric(restored.id, MetricUpdate(retention_days=0))
+
+    summary = RetentionManager(db, retention_days=30, batch_size=1).run_once(now=NOW)
+
+    assert summary["deleted_rows"] == 5
+    assert _ages(metric_service, default) == [1, 5, 20]
+    assert _ages(metric_service, short) == [1]
+    assert _ages(metric_service, restored) == [1, 5, 20]
+
+
+def test_retention_keeps_rollups(db, backend, facility, metric_service):
+    if backend == "memory":
+        pytest.skip("内存后端没有汇总表，聚合直接扫描明细")
+    metric = _metric_with_history(metric_service, facility, "default")
+
+    RetentionManager(db, retention_days=10).run_once(now=NOW)
+
+    result = metric_service.aggregate_metric_values(
+        metric.id, "1d", [AggregateFunction.COUNT], NOW - timedelta(days=41), NOW
+    )
+    assert sum(point.count for point in result.points) == 4
+
+
+def test_zero_retention_keeps_everything(db, facility, metric_service):
+    metric = _metric_with_history(metric_service, facility, "default")
+
+    summary = RetentionManager(db, retention_days=0).run_once(now=NOW)
+
+    assert summary["deleted_rows"] == 0
+    assert _ages(metric_service, metric) == [1, 5, 20, 40]
+
+
+def test_stop_skips_remaining_metrics(db, facility, metric_service, monkeypatch):
+    for index in range(3):
+        _metric_with_history(metric_service, facility, f"m{index}", retention_days=3)
+    manager = RetentionManager(db, retention_days=0)
+    purged = []
+    purge = db.purge_metric_values
+
+    def purge_then_stop(*args, **kwargs):
+        purged.append(kwargs.get("metric_id"))
+        manager.stop()
+        return purge(*args, **kwargs)
+
+    monkeypatch.setattr(db, "purge_metric_values", purge_then_stop)
+    manager.run_once(now=NOW)
+
+    assert len(purged) == 1
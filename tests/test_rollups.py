@@ -0,0 +1,95 @@
+"""
+汇总表维护与聚合查询拆分测试
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import (
+    AggregateFunction, FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+)
+from service import parse_bucket
+from storage import plan_aggregate_segments
+
+
+BASE = datetime(2024, 1, 1)
+ALL_FUNCTIONS = list(AggregateFunction)
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="temperature", facility_id=facility.id))
+
+
+@pytest.fixture
+def written(metric, metric_service):
+    """三天内的随机读数 (时间, 数值)，分单条与批量两种方式写入"""
+    rng = random.Random(5)
+    points = [
+        (BASE + timedelta(seconds=rng.randrange(3 * 86400), microseconds=rng.randrange(1000000)), rng.randrange(-50, 50))
+        for _ in range(600)
+    ]
+    for timestamp, value in points[:20]:
+        metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value=str(value), timestamp=timestamp))
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(value), timestamp=timestamp)
+        for timestamp, value in points[20:]
+    ]))
+    # 写入时时间截断到秒
+    return [(timestamp.replace(microsecond=0), float(value)) for timestamp, value in points]
+
+
+def _expected(points, start, end, bucket_seconds):
+    buckets = {}
+    for timestamp, value in points:
+        if start <= timestamp < end:
+            index = int((timestamp - datetime(1970, 1, 1)).total_seconds()) // bucket_seconds
+            buckets.setdefault(index, []).append(value)
+    return [
+        (len(values), sum(values), min(values), max(values))
+        for _, values in sorted(buckets.items())
+    ]
+
+
+def _actual(metric_service, metric, start, end, bucket):
+    result = metric_service.aggregate_metric_values(metric.id, bucket, ALL_FUNCTIONS, start, end)
+    return [(point.count, point.sum, point.min, point.max) for point in result.points]
+
+
+@pytest.mark.parametrize("start, end, bucket", [
+    (BASE, BASE + timedelta(days=3), "1d"),
+    (BASE + timedelta(hours=5, seconds=17), BASE + timedelta(days=2, hours=3, minutes=7, seconds=3), "1h"),
+    (BASE + timedelta(minutes=7, seconds=30), BASE + timedelta(hours=20, seconds=45), "15m"),
+    (BASE + timedelta(seconds=11), BASE + timedelta(hours=2), "90s"),
+    (BASE + timedelta(hours=1), BASE + timedelta(days=2, hours=1), "2d"),
+])
+def test_rollups_match_raw_values(metric, metric_service, written, start, end, bucket):
+    expected = _expected(written, start, end, parse_bucket(bucket))
+    assert _actual(metric_service, metric, start, end, bucket) == pytest.approx(expected)
+
+
+def test_rebuild_reproduces_incremental_rollups(db, metric, metric_service, written):
+    start, end = BASE + timedelta(minutes=3), BASE + timedelta(days=3)
+    before = _actual(metric_service, metric, start, end, "1h")
+
+    db.rebuild_rollups(str(metric.id))
+
+    assert _actual(metric_service, metric, start, end, "1h") == before
+
+
+def test_plan_uses_coarsest_aligned_rollup():
+    start = BASE + timedelta(minutes=30, seconds=5)
+    end = BASE + timedelta(days=2, hours=1, minutes=2)
+
+    assert plan_aggregate_segments(start, end, 86400) == [
+        (None, start, BASE + timedelta(minutes=31)),
+        ("metric_rollups_1m", BASE + timedelta(minutes=31), BASE + timedelta(hours=1)),
+        ("metric_rollups_1h", BASE + timedelta(hours=1), BASE + timedelta(days=1)),
+        ("metric_rollups_1d", BASE + timedelta(days=1), BASE + timedelta(days=2)),
+        ("metric_rollups_1h", BASE + timedelta(days=2), BASE + timedelta(days=2, hours=1)),
+        ("metric_rollups_1m", BASE + timedelta(days=2, hours=1), end),
+    ]
+    # 时间桶不是汇总粒度的整数倍时只能读取明细
+    assert plan_aggregate_segments(start, end, 45) == [(None, start, end)]
@@ -0,0 +1,213 @@
+"""
+分段文件存储测试
+"""
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import segments
+from segment_database import SegmentDatabase
+from segments import SegmentStore
+
+
+METRIC_ID = str(uuid.UUID(int=1))
+
+
+def _open(path, **options):
+    options.setdefault("max_records", 256)
+    options.setdefault("unsorted_max_records", 32)
+    options.setdefault("max_partial", 2)
+    return SegmentStore(str(path), **options)
+
+
+def _series_files(path):
+    directory = os.path.join(str(path), METRIC_ID)
+    return sorted(name for name in os.listdir(directory) if name.endswith(segments.SEGMENT_SUFFIX))
+
+
+def _expected(written):
+    """按 (timestamp, id) 升序排列的 (id, 时间戳秒数, 数值)"""
+    return sorted(written, key=lambda row: (row[1], row[0]))
+
+
+def _append_each(store, points):
+    written = []
+    for seconds, value in points:
+        value_id = store.append(METRIC_ID, [(seconds, value)])[0]
+        written.append((value_id, seconds, value))
+    return written
+
+
+def _reference_aggregate(rows, start, end, bucket_seconds):
+    buckets = {}
+    for _, seconds, value in rows:
+        if start <= seconds < end:
+            bucket = buckets.setdefault(seconds // bucket_seconds, [0, 0.0, value, value])
+            bucket[0] += 1
+            bucket[1] += value
+            bucket[2] = min(bucket[2], value)
+            bucket[3] = max(bucket[3], value)
+    return buckets
+
+
+def _merged_aggregate(store, start, end, bucket_seconds):
+    buckets = {}
+    for row in store.aggregate(METRIC_ID, start, end, bucket_seconds):
+        bucket = buckets.setdefault(row["bucket_index"], [0, 0.0, row["min"], row["max"]])
+        bucket[0] += row["count"]
+        bucket[1] += row["sum"]
+        bucket[2] = min(bucket[2], row["min"])
+        bucket[3] = max(bucket[3], row["max"])
+    return buckets
+
+
+def test_round_trip(tmp_path):
+    store = _open(tmp_path)
+    points = [(1000 + index // 3, float(index)) for index in range(1000)]
+    ids = store.append(METRIC_ID, points)
+    written = [(value_id, seconds, value) for value_id, (seconds, value) in zip(ids, points)]
+    expected = _expected(written)
+
+    assert len(set(ids)) == len(ids)
+    assert list(store.scan(METRIC_ID)) == expected
+    assert list(store.scan(METRIC_ID, 1100, 1200)) == [row for row in expected if 1100 <= row[1] < 1200]
+    assert store.page(METRIC_ID, 10) == list(reversed(expected))[:10]
+    assert store.latest(METRIC_ID) == expected[-1]
+    assert len(_series_files(tmp_path)) == 4
+
+    reopened = _open(tmp_path)
+    assert list(reopened.scan(METRIC_ID)) == expected
+    assert reopened.latest(METRIC_ID) == expected[-1]
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    store = _open(tmp_path)
+    written = _append_each(store, [(1000 + index, float(index)) for index in range(10)])
+    written += _append_each(store, [(900, -1.0)])
+    store.close()
+
+    directory = os.path.join(str(tmp_path), METRIC_ID)
+    for name in _series_files(tmp_path):
+        with open(os.path.join(directory, name), "ab") as f:
+            f.write(b"\x01" * 10)
+
+    reopened = _open(tmp_path)
+    assert list(reopened.scan(METRIC_ID)) == _expected(written)
+    written += _append_each(reopened, [(2000, 99.0), (950, -2.0)])
+    assert list(reopened.scan(METRIC_ID)) == _expected(written)
+    assert len({row[0] for row in written}) == len(written)
+
+
+def test_out_of_order_writes_keep_segment_count_bounded(tmp_path):
+    store = _open(tmp_path)
+    points = []
+    for index in range(1000):
+        # 两个网关交替上报，其中一个的时钟慢 1 秒
+        points.append((10000 + index, float(index)))
+        points.append((10000 + index - 1, -float(index)))
+    written = _append_each(store, points)
+    expected = _expected(written)
+
+    partial = [
+        segment for segment in store._load(METRIC_ID).segments
+        if segment.count < store.max_records and segment is not store._load(METRIC_ID).active
+    ]
+    assert len(partial) <= store.max_partial
+    assert store.segment_count(METRIC_ID) <= len(points) // store.max_records + store.max_partial + 2
+
+    assert list(store.scan(METRIC_ID)) == expected
+    assert store.page(METRIC_ID, 50) == list(reversed(expected))[:50]
+    assert store.latest(METRIC_ID) == expected[-1]
+    assert _merged_aggregate(store, 10100, 10900, 60) == pytest.approx(
+        _reference_aggregate(written, 10100, 10900, 60)
+    )
+
+    reopened = _open(tmp_path)
+    assert list(reopened.scan(METRIC_ID)) == expected
+
+
+def test_keyset_page_across_seal_and_merge(tmp_path):
+    store = _open(tmp_path)
+    rng = random.Random(7)
+    written = _append_each(store, [(rng.randrange(1000, 1100), float(index)) for index in range(40)])
+    first_page = store.page(METRIC_ID, 5)
+    cursor = first_page[-1]
+
+    written += _append_each(store, [(rng.randrange(900, 1100), float(index)) for index in range(500)])
+    second_page = store.page(METRIC_ID, 1000, cursor[1], cursor[0])
+
+    expected = [row for row in reversed(_expected(written)) if (row[1], row[0]) < (cursor[1], cursor[0])]
+    assert second_page == expected
+    assert {row[0] for row in first_page}.isdisjoint(row[0] for row in second_page)
+
+
+def test_interrupted_seal_is_completed_on_open(tmp_path, monkeypatch):
+    store = _open(tmp_path)
+    written = _append_each(store, [(1000 + index, float(index)) for index in range(5)])
+    written += _append_each(store, [(500 + index, float(index)) for index in range(31)])
+
+    def crash(self, directory, manifest):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(SegmentStore, "_apply_manifest", crash)
+    with pytest.raises(RuntimeError):
+        store.append(METRIC_ID, [(531, 31.0)])
+    written.append((segments._value_id(store._load(METRIC_ID).node, 531, 36), 531, 31.0))
+    monkeypatch.undo()
+
+    reopened = _open(tmp_path)
+    assert list(reopened.scan(METRIC_ID)) == _expected(written)
+    assert not os.path.exists(os.path.join(str(tmp_path), METRIC_ID, "manifest.json"))
+
+
+def test_drop_before_and_drop(tmp_path):
+    store = _open(tmp_path)
+    written = _append_each(store, [(1000 + index, float(index)) for index in range(600)])
+    written += _append_each(store, [(100, -1.0)])
+
+    deleted = store.drop_before(METRIC_ID, 1300)
+    remaining = list(store.scan(METRIC_ID))
+    assert deleted + len(remaining) == len(written)
+    assert all(seconds >= 1256 for _, seconds, _ in remaining)
+
+    assert store.drop(METRIC_ID) == len(remaining)
+    assert list(store.scan(METRIC_ID)) == []
+    assert not os.path.exists(os.path.join(str(tmp_path), METRIC_ID))
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_aggregate_with_and_without_numpy(tmp_path, monkeypatch, use_numpy):
+    if use_numpy and segments.numpy is None:
+        pytest.skip("未安装 NumPy")
+    if not use_numpy:
+        monkeypatch.setattr(segments, "numpy", None)
+    store = _open(tmp_path)
+    written = _append_each(store, [(1000 + index, float(index % 7)) for index in range(300)])
+
+    rows = store.aggregate(METRIC_ID, 1000, 1300, 60)
+
+    # 段文件只保存数值，count_num 与 count 相同
+    assert all(row["count_num"] == row["count"] for row in rows)
+    assert _merged_aggregate(store, 1000, 1300, 60) == pytest.approx(_reference_aggregate(written, 1000, 1300, 60))
+
+
+def test_segment_backend_aggregate(tmp_path):
+    db = SegmentDatabase(path=str(tmp_path / "facilities.db"), data_dir=str(tmp_path / "segments"))
+    db.migrate()
+    try:
+        facility = db.create_facility("dc", "datacenter")
+        metric = db.create_metric("temperature", facility["id"], data_type="float")
+        base = datetime(2024, 1, 1)
+        for offset, value in enumerate(["1.0", "2.0", "6.0"]):
+            db.create_metric_value(metric["id"], value, base + timedelta(seconds=offset))
+
+        rows = db.aggregate_metric_values(metric["id"], base, base + timedelta(minutes=1), 60)
+
+        assert [(row["count"], row["count_num"], row["sum"], row["min"], row["max"]) for row in rows] == [
+            (3, 3, 9.0, 1.0, 6.0)
+        ]
+    finally:
+        db.close()
@@ -0,0 +1,135 @@
+"""
+指标值落盘缓冲测试
+"""
+import asyncio
+import os
+
+import pytest
+
+import spool
+from async_database import AsyncDatabase
+from models import FacilityCreate, FacilityType, MetricCreate, MetricValueCreate
+from service import MetricService
+from spool import IngestSpool, IngestSpoolUnavailable
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="temp", facility_id=facility.id))
+
+
+async def _drain(ingest_spool):
+    """等待缓冲中的数据全部回放"""
+    for _ in range(500):
+        if not ingest_spool.active:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("落盘缓冲未在预期时间内回放完")
+
+
+def _run_spool(db, metric_service, directory, scenario, **kwargs):
+    """在事件循环中打开并启动落盘缓冲执行 scenario，结束后关闭并返回统计"""
+    kwargs.setdefault("fsync_interval", 0)
+    kwargs.setdefault("replay_interval", 0.01)
+
+    async def main():
+        async_db = AsyncDatabase(db)
+        ingest_spool = IngestSpool(metric_service, async_db, directory=str(directory), **kwargs)
+        ingest_spool.open()
+        ingest_spool.start()
+        try:
+            await scenario(ingest_spool)
+        finally:
+            await ingest_spool.close()
+            async_db.shutdown()
+        return ingest_spool.stats()
+
+    return asyncio.run(main())
+
+
+def test_spooled_values_are_replayed(db, metric, metric_service, tmp_path):
+    async def scenario(ingest_spool):
+        items = [ingest_spool.prepare(MetricValueCreate(metric_id=metric.id, value=str(index))) for index in range(5)]
+        await ingest_spool.append([value_data for value_data, _ in items], [value_id for _, value_id in items])
+        await _drain(ingest_spool)
+
+    stats = _run_spool(db, metric_service, tmp_path, scenario)
+
+    assert (stats["spooled"], stats["replayed"], stats["pending_records"]) == (5, 5, 0)
+    assert len(metric_service.get_metric_values(metric.id, limit=10)) == 5
+    # 已回放完的文件在下一批写入后删除，回放位置保存在 checkpoint 中
+    assert os.path.exists(tmp_path / "checkpoint")
+
+
+def test_replay_skips_values_already_written(db, metric, metric_service, tmp_path):
+    async def scenario(ingest_spool):
+        value_data, value_id = ingest_spool.prepare(MetricValueCreate(metric_id=metric.id, value="1"))
+        # 超出延迟预算但最终提交成功的写入
+        metric_service.create_metric_value(value_data, value_id)
+        await ingest_spool.append([value_data], [value_id])
+        await _drain(ingest_spool)
+
+    stats = _run_spool(db, metric_service, tmp_path, scenario)
+
+    assert (stats["replayed"], stats["duplicates"]) == (0, 1)
+    assert len(metric_service.get_metric_values(metric.id, limit=10)) == 1
+
+
+class UnavailableMetricService(MetricService):
+    """数据库不可用：批量写入总是失败"""
+
+    def create_metric_values(self, *args, **kwargs):
+        raise ConnectionError("database unavailable")
+
+
+def test_pending_values_survive_restart(db, metric, metric_service, tmp_path):
+    async def write(ingest_spool):
+        value_data, value_id = ingest_spool.prepare(MetricValueCreate(metric_id=metric.id, value="1"))
+        await ingest_spool.append([value_data], [value_id])
+        while not ingest_spool.stats()["replay_errors"]:
+            await asyncio.sleep(0.01)
+
+    stats = _run_spool(db, UnavailableMetricService(db), tmp_path, write)
+    assert (stats["spooled"], stats["replayed"], stats["pending_records"]) == (1, 0, 1)
+    assert stats["last_error"] == "database unavailable"
+    # 崩溃时留下的不完整记录在重启后跳过
+    with open(tmp_path / "spool-999999999999.log", "wb") as f:
+        f.write(spool._encode_record(MetricValueCreate(metric_id=metric.id, value="2"), None)[:20])
+
+    stats = _run_spool(db, metric_service, tmp_path, _drain)
+
+    assert (stats["replayed"], stats["corrupt"]) == (1, 1)
+    assert [row.value for row in metric_service.get_metric_values(metric.id, limit=10)] == ["1.0"]
+
+
+def test_full_spool_rejects(db, metric, metric_service, tmp_path):
+    async def scenario(ingest_spool):
+        with pytest.raises(IngestSpoolUnavailable):
+            await ingest_spool.append([MetricValueCreate(metric_id=metric.id, value="1")])
+
+    stats = _run_spool(db, metric_service, tmp_path, scenario, max_bytes=10)
+
+    assert (stats["spooled"], stats["rejected"]) == (0, 1)
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    """启用落盘缓冲（须在 client 之前请求）"""
+    directory = tmp_path / "spool"
+    monkeypatch.setenv("INGEST_SPOOL_DIR", str(directory))
+    monkeypatch.setenv("INGEST_SPOOL_FSYNC_INTERVAL", "0")
+    return directory
+
+
+def test_endpoint_spools_when_database_fails(spool_dir, db, metric, client, monkeypatch):
+    def unavailable(self, value_data, value_id=None):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(MetricService, "create_metric_value", unavailable)
+    response = client.post("/api/metrics/values", json={"metric_id": str(metric.id), "value": "1.5"})
+
+    assert response.status_code == 202
+    stats = client.get("/health/ingest").json()["spool"]
+    assert stats["enabled"] and stats["fallbacks"] == 1
+    assert stats["last_error"] == "database unavailable"
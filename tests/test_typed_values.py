@@ -0,0 +1,60 @@
+"""
+按指标数据类型存储指标值测试
+"""
+from datetime import datetime
+
+import pytest
+
+from models import (
+    FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+)
+
+
+BASE = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def facility(facility_service):
+    return facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+
+
+def _metric(metric_service, facility, data_type):
+    return metric_service.create_metric(MetricCreate(name=data_type, data_type=data_type, facility_id=facility.id))
+
+
+@pytest.mark.parametrize("data_type, value, expected", [
+    ("float", "0.1", "0.1"),
+    ("float", " 2 ", "2.0"),
+    ("int", "42", "42"),
+    ("int", "42.0", "42"),
+    ("bool", "yes", "true"),
+    ("bool", "0", "false"),
+    ("string", " ok ", " ok "),
+])
+def test_values_round_trip_by_data_type(facility, metric_service, data_type, value, expected):
+    metric = _metric(metric_service, facility, data_type)
+
+    created = metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value=value, timestamp=BASE))
+
+    assert created.value == expected
+    assert metric_service.get_metric_values(metric.id)[0].value == expected
+
+
+@pytest.mark.parametrize("data_type, value", [
+    ("float", "abc"),
+    ("float", "nan"),
+    ("int", "1.5"),
+    ("bool", "maybe"),
+])
+def test_mismatched_values_are_rejected(facility, metric_service, data_type, value):
+    metric = _metric(metric_service, facility, data_type)
+
+    with pytest.raises(ValueError):
+        metric_service.create_metric_value(MetricValueCreate(metric_id=metric.id, value=value, timestamp=BASE))
+
+    response = metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=value, timestamp=BASE)
+    ]))
+    assert response.failed == 1
+    assert "类型错误" in response.results[0].error
+    assert metric_service.get_metric_values(metric.id) == []
@@ -0,0 +1,40 @@
+"""
+UUIDv7 指标值 ID 测试
+"""
+import time
+import uuid
+from datetime import datetime
+
+from models import FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+from storage import uuid7
+
+
+def test_uuid7_layout():
+    before_ms = time.time_ns() // 1_000_000
+    value = uuid7()
+    after_ms = time.time_ns() // 1_000_000
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before_ms <= value.int >> 80 <= after_ms
+
+
+def test_uuid7_strictly_increasing():
+    values = [uuid7() for _ in range(10000)]
+
+    assert values == sorted(values, key=lambda value: value.bytes)
+    assert len(set(values)) == len(values)
+
+
+def test_metric_values_get_uuid7_ids(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    metric = metric_service.create_metric(MetricCreate(name="temp", facility_id=facility.id))
+
+    response = metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(index), timestamp=datetime(2024, 1, 1, 0, index))
+        for index in range(5)
+    ]))
+
+    ids = [uuid.UUID(str(result.id)) for result in response.results]
+    assert all(value_id.version == 7 for value_id in ids)
+    assert ids == sorted(ids, key=lambda value_id: value_id.bytes)
@@ -0,0 +1,86 @@
+"""
+预先分配记录 ID 的写入与回放去重测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from memory_database import MemoryDatabase
+from segment_database import SegmentDatabase
+from sqlite_database import SQLiteDatabase
+from storage import uuid7
+
+
+BASE = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture(params=["sqlite", "memory", "segment"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        database = SQLiteDatabase(str(tmp_path / "test.db"))
+    elif request.param == "memory":
+        database = MemoryDatabase()
+    else:
+        database = SegmentDatabase(str(tmp_path / "test.db"), data_dir=str(tmp_path / "segments"))
+    database.migrate()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def metric(db):
+    facility = db.create_facility("dc", "datacenter")
+    return db.create_metric("temperature", facility["id"], data_type="float")
+
+
+def _values(metric_id, value_ids):
+    return [
+        {
+            "metric_id": metric_id,
+            "value": str(float(index)),
+            "data_type": "float",
+            "timestamp": (BASE + timedelta(seconds=index)).isoformat(),
+            "id": value_id
+        }
+        for index, value_id in enumerate(value_ids)
+    ]
+
+
+def _totals(db, metric_id):
+    buckets = db.aggregate_metric_values(metric_id, BASE, BASE + timedelta(hours=1), 3600)
+    return sum(bucket["count"] for bucket in buckets), sum(bucket["sum"] for bucket in buckets)
+
+
+def test_replay_skips_written_ids(db, metric):
+    value_ids = [str(uuid7()) for _ in range(4)]
+    written = db.create_metric_values(_values(metric["id"], value_ids[:2]))
+    assert not any(row.get("duplicate") for row in written)
+
+    replayed = db.create_metric_values(_values(metric["id"], value_ids), skip_existing=True)
+
+    assert [row.get("duplicate", False) for row in replayed] == [True, True, False, False]
+    assert [row["id"] for row in replayed[:2]] == [row["id"] for row in written]
+    assert len(db.get_metric_values(metric["id"], limit=10)) == 4
+    assert _totals(db, metric["id"]) == (4, 6.0)
+
+
+def test_replay_twice_writes_once(db, metric):
+    values = _values(metric["id"], [str(uuid7()) for _ in range(3)])
+    first = db.create_metric_values(values, skip_existing=True)
+    second = db.create_metric_values(values, skip_existing=True)
+
+    assert [row["id"] for row in second] == [row["id"] for row in first]
+    assert all(row["duplicate"] for row in second)
+    assert _totals(db, metric["id"]) == (3, 3.0)
+
+
+def test_client_key_still_deduplicates_on_replay(db, metric):
+    values = _values(metric["id"], [str(uuid7())])
+    values[0]["dedup_key"] = "reading-1"
+    first = db.create_metric_values(values)
+    # 客户端重试同一幂等键时分配到的是新的记录 ID，仍按幂等键去重
+    retry = db.create_metric_values([{**values[0], "id": str(uuid7())}], skip_existing=True)
+
+    assert retry[0]["duplicate"]
+    assert retry[0]["id"] == first[0]["id"]
+    assert _totals(db, metric["id"]) == (1, 0.0)
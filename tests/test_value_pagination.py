@@ -0,0 +1,63 @@
+"""
+指标历史值游标分页测试
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import FacilityCreate, FacilityType, MetricCreate, MetricValueCreate, MetricValueBatchCreate
+from service import decode_values_cursor, encode_values_cursor
+
+
+BASE = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def metric(facility_service, metric_service):
+    facility = facility_service.create_facility(FacilityCreate(name="dc", facility_type=FacilityType.DATACENTER))
+    return metric_service.create_metric(MetricCreate(name="temperature", facility_id=facility.id))
+
+
+@pytest.fixture
+def written(metric, metric_service):
+    """每个时间戳写入 3 条，按 (timestamp, id) 倒序返回全部记录"""
+    metric_service.create_metric_values(MetricValueBatchCreate(items=[
+        MetricValueCreate(metric_id=metric.id, value=str(index), timestamp=BASE + timedelta(seconds=index // 3))
+        for index in range(30)
+    ]))
+    values = metric_service.get_metric_values(metric.id, limit=1000)
+    assert len(values) == 30
+    return values
+
+
+def test_values_are_ordered_by_timestamp_then_id(written):
+    keys = [(value.timestamp, str(value.id)) for value in written]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_cursor_pages_cover_history_once(metric, metric_service, written):
+    pages = []
+    before = before_id = None
+    while True:
+        page = metric_service.get_metric_values(metric.id, limit=4, before=before, before_id=before_id)
+        pages.append(page)
+        if len(page) < 4:
+            break
+        before, before_id = decode_values_cursor(encode_values_cursor(page[-1]))
+
+    # 分页边界落在同一时间戳的记录之间时也不重复、不遗漏
+    assert [value.id for page in pages for value in page] == [value.id for value in written]
+
+
+def test_before_ignores_offset(metric, metric_service, written):
+    before = BASE + timedelta(seconds=5)
+
+    page = metric_service.get_metric_values(metric.id, limit=100, offset=50, before=before)
+
+    assert [value.id for value in page] == [value.id for value in written if value.timestamp < before]
+
+
+def test_invalid_cursor_is_rejected():
+    for cursor in ("not-a-cursor", "eyJ0IjoxfQ"):
+        with pytest.raises(ValueError):
+            decode_values_cursor(cursor)